@@ -0,0 +1,178 @@
+"""Bounded async channels for PCSJ producer/consumer pipelines."""
+
+import asyncio
+from collections import deque
+from typing import Any, List, Tuple
+
+class ChannelClosed(Exception):
+    pass
+
+def _wake_next(waiters: deque):
+    # Hand the wakeup to the first waiter that is still interested
+    while waiters:
+        waiter = waiters.popleft()
+        if not waiter.done():
+            waiter.set_result(None)
+            return
+
+async def _wait(waiters: List[deque]):
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+    for queue in waiters:
+        queue.append(waiter)
+    try:
+        await waiter
+    except asyncio.CancelledError:
+        # A wakeup that raced with cancellation must not be lost
+        if waiter.done() and not waiter.cancelled():
+            for queue in waiters:
+                _wake_next(queue)
+        raise
+    finally:
+        for queue in waiters:
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                pass
+
+class Channel:
+    # A FIFO with at most `capacity` buffered items. send() waits while the
+    # buffer is full, which is what keeps a fast producer from running ahead.
+    def __init__(self, capacity: int = 1):
+        if capacity < 1:
+            raise ValueError(f"Channel capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self._buffer = deque()
+        self._closed = False
+        self._getters = deque()
+        self._putters = deque()
+        self._tasks = set() # Forwarding tasks started by merge()/fanOut()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __repr__(self):
+        state = "closed" if self._closed else "open"
+        return f"Channel({len(self._buffer)}/{self.capacity}, {state})"
+
+    def isClosed(self) -> bool:
+        return self._closed
+
+    def trySend(self, value: Any) -> bool:
+        if self._closed:
+            raise ChannelClosed("send on closed channel")
+        if len(self._buffer) >= self.capacity:
+            return False
+        self._buffer.append(value)
+        _wake_next(self._getters)
+        return True
+
+    def tryReceive(self) -> Tuple[bool, Any]:
+        if not self._buffer:
+            if self._closed:
+                raise ChannelClosed("receive on closed and drained channel")
+            return False, None
+        value = self._buffer.popleft()
+        _wake_next(self._putters)
+        if self._buffer:
+            _wake_next(self._getters)
+        return True, value
+
+    async def send(self, value: Any):
+        while not self.trySend(value):
+            await _wait([self._putters])
+        if len(self._buffer) < self.capacity:
+            _wake_next(self._putters)
+
+    async def receive(self) -> Any:
+        while True:
+            ok, value = self.tryReceive()
+            if ok:
+                return value
+            await _wait([self._getters])
+
+    def close(self):
+        # Buffered items can still be received; further sends fail
+        if self._closed:
+            return
+        self._closed = True
+        for waiters in (self._getters, self._putters):
+            while waiters:
+                _wake_next(waiters)
+
+    async def __aiter__(self):
+        # `for await (item of channel)` ends once the channel is closed and drained
+        while True:
+            try:
+                yield await self.receive()
+            except ChannelClosed:
+                return
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+async def select(*channels: Channel) -> Tuple[Channel, Any]:
+    # Receive from whichever channel is ready first. Raises ChannelClosed only
+    # when every channel is closed and drained.
+    if not channels:
+        raise ValueError("select() needs at least one channel")
+    start = 0
+    while True:
+        closed = 0
+        for offset in range(len(channels)):
+            channel = channels[(start + offset) % len(channels)]
+            try:
+                ok, value = channel.tryReceive()
+            except ChannelClosed:
+                closed += 1
+                continue
+            if ok:
+                # The wakeup may have come from another channel, whose item is
+                # still buffered: pass it on to that channel's next receiver
+                for other in channels:
+                    if other is not channel and other._buffer:
+                        _wake_next(other._getters)
+                return channel, value
+        if closed == len(channels):
+            raise ChannelClosed("select on closed channels")
+        await _wait([channel._getters for channel in channels if not channel._closed])
+        start = (start + 1) % len(channels) # Rotate so one busy channel can't starve the rest
+
+def merge(*channels: Channel, capacity: int = 1) -> Channel:
+    # Fan-in: one output fed by every input, closed after the last input closes
+    output = Channel(capacity)
+    remaining = [len(channels)]
+
+    async def forward(source: Channel):
+        try:
+            async for item in source:
+                await output.send(item)
+        finally:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                output.close()
+
+    if not channels:
+        output.close()
+    for source in channels:
+        output._spawn(forward(source))
+    return output
+
+def fanOut(source: Channel, count: int, capacity: int = 1) -> List[Channel]:
+    # Fan-out: each item goes to whichever output has room first, so a slow
+    # consumer only slows its own share of the work
+    outputs = [Channel(capacity) for _ in range(count)]
+
+    async def forward(output: Channel):
+        try:
+            async for item in source:
+                await output.send(item)
+        finally:
+            output.close()
+
+    for output in outputs:
+        output._spawn(forward(output))
+    return outputs
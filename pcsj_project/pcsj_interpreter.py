@@ -5,6 +5,15 @@ import json
 import inspect
 from typing import Dict, Any, List, Union, Callable
 
+from pcsj_channels import Channel, ChannelClosed, select, merge, fanOut
+from pcsj_parallel import spawn, parallel_map, parallel_for
+from pcsj_schema import build_schema_class
+from pcsj_sql import Cursor, Database, SQLError, SQLiteDatabase, parse
+
+# Streaming sources hand control back to the event loop every this many items
+STREAM_YIELD_EVERY = 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
 # --- Mock Standard Library and Built-ins for PCSJ ---
 class PCSJBuiltins:
     def __init__(self, env: Dict[str, Any]):
@@ -34,6 +43,18 @@ class PCSJBuiltins:
             await asyncio.sleep(ms / 1000)
         self._env['sleep'] = sleep
 
+        # Bounded channels for async producer/consumer pipelines
+        self._env['Channel'] = Channel
+        self._env['ChannelClosed'] = ChannelClosed
+        self._env['select'] = select
+        self._env['merge'] = merge
+        self._env['fanOut'] = fanOut
+
+        # Process-pool offload for CPU-bound pure functions
+        self._env['spawn'] = spawn
+        self._env['parallelMap'] = parallel_map
+        self._env['parallel_for'] = parallel_for # Target of `parallel for` loops
+
         # Mock File I/O
         def readFile(filename: str) -> str:
             if filename in self._mock_files:
@@ -54,7 +75,53 @@ class PCSJBuiltins:
             except Exception as e:
                 raise Exception(f"Error writing file '{filename}': {e}")
         self._env['writeFile'] = writeFile
-        
+
+        # Mock fs module. lines()/chunks() are async generators, so a
+        # `for await` loop only ever holds one line or chunk in memory and
+        # the file is read no faster than the consumer pulls from it.
+        builtins = self
+        class MockFS:
+            async def readFile(self, filename: str) -> str:
+                return readFile(filename)
+            async def writeFile(self, filename: str, data: str):
+                writeFile(filename, data)
+            async def appendFile(self, filename: str, data: str):
+                builtins._mock_files[filename] = builtins._mock_files.get(filename, '') + data
+                with open(filename, 'a') as f:
+                    f.write(data)
+            async def lines(self, filename: str):
+                if filename in builtins._mock_files:
+                    for line in builtins._mock_files[filename].splitlines():
+                        yield line
+                    return
+                try:
+                    f = open(filename, 'r')
+                except FileNotFoundError:
+                    raise Exception(f"File not found: {filename}")
+                with f:
+                    for i, line in enumerate(f):
+                        yield line.rstrip('\n')
+                        if i % STREAM_YIELD_EVERY == 0:
+                            await asyncio.sleep(0) # Let other tasks run on long files
+            async def chunks(self, filename: str, size: int = STREAM_CHUNK_SIZE):
+                if filename in builtins._mock_files:
+                    data = builtins._mock_files[filename]
+                    for start in range(0, len(data), size):
+                        yield data[start:start + size]
+                    return
+                try:
+                    f = open(filename, 'r')
+                except FileNotFoundError:
+                    raise Exception(f"File not found: {filename}")
+                with f:
+                    while True:
+                        chunk = f.read(size)
+                        if not chunk:
+                            break
+                        yield chunk
+                        await asyncio.sleep(0)
+        self._env['fs'] = MockFS()
+
         # Array/List methods (Higher-Order Functions)
         def map_func(arr: list, func: Callable) -> list:
             return [func(item) for item in arr]
@@ -67,12 +134,19 @@ class PCSJBuiltins:
             return res
         
         # Add these to the list prototype for dot notation access
-        list.map = map_func
-        list.filter = filter_func
-        list.reduce = reduce_func
-        
-        # String methods
-        str.toUpperCase = lambda s: s.upper()
+        # (CPython refuses new attributes on built-in types, so this is best effort)
+        prototype_methods = [
+            (list, 'map', map_func),
+            (list, 'filter', filter_func),
+            (list, 'reduce', reduce_func),
+            # String methods
+            (str, 'toUpperCase', lambda s: s.upper()),
+        ]
+        for owner, method_name, method_func in prototype_methods:
+            try:
+                setattr(owner, method_name, method_func)
+            except TypeError:
+                pass
 
         # Generic math functions (e.g., from math_lib)
         self._env['max'] = max
@@ -87,12 +161,20 @@ class PCSJBuiltins:
 
 # --- Core PCSJ Interpreter Logic ---
 class PCSJInterpreter:
-    def __init__(self, base_path: str = './'):
+    def __init__(self, base_path: str = './', database_path: str = None, sql_backend: str = 'native'):
         self.base_path = base_path
         self.env: Dict[str, Any] = {}
         self.builtins = PCSJBuiltins(self.env)
         self.defined_schemas: Dict[str, type] = {}
         self.defined_classes: Dict[str, type] = {}
+        self._parallel_loop_count = 0
+        # Column store behind `table` declarations and embedded SQL statements;
+        # kept in a durable file across runs when a database path is given.
+        # The 'sqlite' backend runs the same statements on sqlite3 instead.
+        if sql_backend not in ('native', 'sqlite'):
+            raise ValueError(f"Unknown SQL backend '{sql_backend}' (expected 'native' or 'sqlite')")
+        self.database = (SQLiteDatabase if sql_backend == 'sqlite' else Database)(database_path)
+        self.env['sql_database'] = self.database
 
         # Register core types for the interpreter
         self._register_core_types()
@@ -100,32 +182,21 @@ class PCSJInterpreter:
     def _register_core_types(self):
         # Base class for all PCSJ objects
         class PCSJObject:
+            # Empty slots so schema subclasses can drop the per-instance __dict__;
+            # regular PCSJ classes don't declare slots and keep theirs.
+            __slots__ = ()
+
             def __repr__(self):
-                attrs = ', '.join(f"{k}={getattr(self, k)!r}" for k in self.__dict__)
+                names = self.__dict__ if hasattr(self, '__dict__') else getattr(self, '__slots__', ())
+                attrs = ', '.join(f"{k}={getattr(self, k, None)!r}" for k in names)
                 return f"{self.__class__.__name__}({attrs})"
 
         self.defined_classes['object'] = PCSJObject # Register base object type
 
-        # Python class representing a PCSJ schema
+        # Python class representing a PCSJ schema: a __slots__ class whose
+        # __init__/from_dict/from_dicts/from_columns are generated per schema
         def create_schema_class(schema_name: str, fields: Dict[str, Any]) -> type:
-            def __init__(self_obj, *args):
-                if len(args) != len(fields):
-                    raise TypeError(f"Schema '{schema_name}' constructor expected {len(fields)} arguments, got {len(args)}")
-                for i, (field_name, field_type) in enumerate(fields.items()):
-                    setattr(self_obj, field_name, args[i]) # No type checking here for simplicity
-
-            # For SQL-like mapping, allow dict-like init
-            @classmethod
-            def from_dict(cls, data: Dict[str, Any]):
-                instance = cls.__new__(cls) # Create instance without calling __init__
-                for field_name in fields:
-                    setattr(instance, field_name, data.get(field_name)) # Set attributes from dict
-                return instance
-
-            return type(schema_name, (PCSJObject,), {
-                '__init__': __init__,
-                'from_dict': from_dict
-            })
+            return build_schema_class(schema_name, fields, PCSJObject)
 
         self.env['schema_creator'] = create_schema_class # Helper to create schema classes
 
@@ -183,6 +254,21 @@ class PCSJInterpreter:
             # Remove schema definition from code to avoid re-execution errors
             code = code.replace(f"schema {schema_name} {{ {fields_str} }}", "")
 
+        # 1b. Table Declarations
+        # `table name { id: int PRIMARY KEY, ... };` creates column storage
+        for table_decl in list(self._find_table_definitions(code)):
+            # A durable database already holds the tables of earlier runs
+            declared = parse(table_decl)
+            existing = self.database.tables.get(declared.name)
+            if existing is None:
+                self.database.execute(table_decl)
+            elif existing.definitions != declared.columns:
+                raise SQLError(f"Table '{existing.name}' in the database file was declared with other columns")
+            code = code.replace(table_decl, "")
+
+        # 1c. Embedded SQL statements become calls into the table engine
+        code = self._convert_sql_statements(code)
+
         # 2. Simulate Class Definitions (very simplified)
         # We need to manually define the classes in Python that match PCSJ
         # This is where a real parser/compiler is needed for full automation.
@@ -229,6 +315,16 @@ class PCSJInterpreter:
                 self.body = body
             async def json(self):
                 return json.loads(self.body)
+            # Streaming access to the body for `for await` loops
+            async def chunks(self, size: int = STREAM_CHUNK_SIZE):
+                for start in range(0, len(self.body), size):
+                    yield self.body[start:start + size]
+                    await asyncio.sleep(0)
+            async def lines(self):
+                for line in self.body.splitlines():
+                    yield line
+            def __aiter__(self):
+                return self.chunks()
 
         current_env['http_lib'] = type('http_lib', (object,), {
             'get': lambda url: MockHttpResponse("200 OK", f'{{"id": "prod123", "name": "Mock Product", "price": 99.99, "stock": 10, "available": true}}')
@@ -286,11 +382,32 @@ class PCSJInterpreter:
         # Native Interop - already handled by builtins.py()
 
         # SQL-like query simulation
-        def select_query(data_source: List[Dict[str, Any]], conditions: Callable[[Dict[str, Any]], bool], schema_class: type = None) -> List[Any]:
-            results = [item for item in data_source if conditions(item)]
+        # Rows are filtered as the result is read; a one-shot source is listed
+        # first, since the cursor may need to filter it again.
+        def select_query(data_source: List[Dict[str, Any]], conditions: Callable[[Dict[str, Any]], bool], schema_class: type = None) -> Cursor:
+            if not isinstance(data_source, (list, tuple)):
+                data_source = list(data_source)
             if schema_class:
-                return [schema_class.from_dict(item) for item in results]
-            return results
+                return Cursor(lambda: map(schema_class.from_dict, filter(conditions, data_source)))
+            return Cursor(lambda: filter(conditions, data_source))
+
+        # Streaming variant for `for await (row of stream_query(...))`: rows are
+        # filtered and mapped one at a time instead of building the full list.
+        async def stream_query(data_source, conditions: Callable[[Dict[str, Any]], bool], schema_class: type = None):
+            is_async_source = hasattr(data_source, '__aiter__')
+            source = data_source if is_async_source else iter(data_source)
+            if is_async_source:
+                async for item in source:
+                    if conditions(item):
+                        yield schema_class.from_dict(item) if schema_class else item
+                return
+            for i, item in enumerate(source):
+                if conditions(item):
+                    yield schema_class.from_dict(item) if schema_class else item
+                if i % STREAM_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+        current_env['select_query'] = select_query
+        current_env['stream_query'] = stream_query
 
         # This is where we manually replace the SQL-like syntax.
         # A real parser would convert "SELECT * FROM users WHERE ..." into a callable form.
@@ -308,14 +425,19 @@ class PCSJInterpreter:
         # A real parser would generate this Python code from the SQL-like AST.
         if sql_query_start in python_executable_code:
             python_sql_equivalent = """
-availableProducts = [
-    current_env['ProductSchema'].from_dict(p) for p in current_env['productsDb'] 
-    if p.get('available') == True
-]
+availableProducts = current_env['ProductSchema'].from_dicts(
+    p for p in current_env['productsDb'] if p.get('available') == True
+)
 """
             python_executable_code = python_executable_code.replace(sql_query_start, python_sql_equivalent)
 
 
+        # Async generators and for-await loops must be converted before plain for-of
+        python_executable_code = self._convert_async_iteration(python_executable_code)
+
+        # `parallel for` bodies become functions, also ahead of plain for-of
+        python_executable_code = self._convert_parallel_for(python_executable_code)
+
         # For-of loop conversion (simple regex replacement)
         python_executable_code = self._convert_for_of_loop(python_executable_code)
         
@@ -340,7 +462,8 @@ availableProducts = [
             if "(async () => {" in python_executable_code and "await" in python_executable_code:
                 # Wrap the code in an async function and run it
                 # This is a hack to allow top-level await in exec
-                wrapped_code = f"async def _pcsj_main_wrapper_():\n    {python_executable_code.replace('print(', 'await current_env[\'print\'](').replace('await sleep(', 'await current_env[\'sleep\'](').replace('await current_env[\'http_lib\'].get(', 'await current_env[\'http_lib\'].get(').replace('await response.json()', 'await response.json()').replace('await user.greet()', 'await user.greet()').replace('await performRiskyOperation()', 'await current_env[\'performRiskyOperation\']()').replace('await fetchProductData(', 'await current_env[\'fetchProductData\'](').replace('await data.json()', 'await data.json()').replace('await main()', 'await current_env[\'main\']()').replace('await fetchData', 'await current_env[\'fetchData\']').replace('await data.json()', 'await data.json()').replace('(async () => {', '    # Removed original IIFE wrapper\n    # The actual code of IIFE is moved here\n    ').replace('})();', '')}"
+                iife_body = python_executable_code.replace('print(', 'await current_env[\'print\'](').replace('await sleep(', 'await current_env[\'sleep\'](').replace('await current_env[\'http_lib\'].get(', 'await current_env[\'http_lib\'].get(').replace('await response.json()', 'await response.json()').replace('await user.greet()', 'await user.greet()').replace('await performRiskyOperation()', 'await current_env[\'performRiskyOperation\']()').replace('await fetchProductData(', 'await current_env[\'fetchProductData\'](').replace('await data.json()', 'await data.json()').replace('await main()', 'await current_env[\'main\']()').replace('await fetchData', 'await current_env[\'fetchData\']').replace('await data.json()', 'await data.json()').replace('(async () => {', '    # Removed original IIFE wrapper\n    # The actual code of IIFE is moved here\n    ').replace('})();', '')
+                wrapped_code = f"async def _pcsj_main_wrapper_():\n    {iife_body}"
                 
                 # Further refine the wrapper to handle specific calls that need `await`
                 wrapped_code = wrapped_code.replace("await current_env['print']", "current_env['print']") # print is not async
@@ -370,6 +493,31 @@ availableProducts = [
             fields_content = match.group(2)
             yield schema_name, fields_content
 
+    def _find_table_definitions(self, code: str):
+        import re
+        # Whole declarations, so they can be handed to the SQL parser and removed from the code
+        for match in re.finditer(r'^[ \t]*table\s+\w+\s*\{[^}]*\}\s*;?', code, re.MULTILINE):
+            yield match.group().strip()
+
+    def _convert_sql_statements(self, code: str) -> str:
+        import re
+        # From: UPDATE accounts SET balance = balance - amount WHERE id = fromId;
+        # To:   sql_database.execute('UPDATE accounts SET ...', locals())
+        # Names that are not columns (fromId, amount) are read from the PCSJ locals.
+        # From: query rich = SELECT name FROM employees WHERE salary > minimum;
+        # To:   rich = sql_database.execute('SELECT name FROM ...', locals())
+        # CTEs may precede the `query` keyword: WITH t AS (SELECT ...) query x = SELECT ... FROM t;
+        query_pattern = r'^([ \t]*)(WITH\b[^;]*?)?\bquery\s+(\w+)\s*=\s*(SELECT\b[^;]*);'
+        def replace_query(match):
+            sql = ' '.join(f"{match.group(2) or ''} {match.group(4)}".split())
+            return f"{match.group(1)}{match.group(3)} = sql_database.execute({sql!r}, locals())"
+        code = re.sub(query_pattern, replace_query, code, flags=re.MULTILINE)
+        pattern = r'^([ \t]*)((?:INSERT\s+INTO|COPY|UPDATE|DELETE\s+FROM|CREATE\s+(?:UNIQUE\s+)?INDEX|DROP\s+INDEX|(?:CREATE|REFRESH|DROP)\s+MATERIALIZED\s+VIEW|ANALYZE|BEGIN|START\s+TRANSACTION|COMMIT|ROLLBACK)\b[^;]*);'
+        def replace(match):
+            sql = ' '.join(match.group(2).split())
+            return f"{match.group(1)}sql_database.execute({sql!r}, locals())"
+        return re.sub(pattern, replace, code, flags=re.MULTILINE)
+
     def _convert_pcsj_to_python_exec(self, pcsj_code: str) -> str:
         # This function performs a very basic line-by-line conversion
         # It's NOT a parser, and can break with complex PCSJ syntax.
@@ -444,6 +592,43 @@ availableProducts = [
         line = re.sub(r'\.\.\.([a-zA-Z_]\w*)', r'*\1', line) # Convert ...numbers to *numbers
         return line
 
+    def _convert_async_iteration(self, code: str) -> str:
+        import re
+        # From: async function* numbers(n) {    To: async def numbers(n) {
+        # A body containing `yield` makes the Python function an async generator.
+        code = re.sub(r'async\s+function\s*\*\s*(\w+)\s*\(', r'async def \1(', code)
+        # From: for await (const line of fs.lines("data.txt")) { ... }
+        # To:   async for line in fs.lines("data.txt"): ...
+        return re.sub(r'for\s+await\s*\(\s*(?:const\s+|let\s+|var\s+)?(\w+)\s+of\s+(.+)\)\s*[:{]?[ \t]*$',
+                      r'async for \1 in \2:', code, flags=re.MULTILINE)
+
+    def _convert_parallel_for(self, code: str) -> str:
+        import re
+        # From: parallel for (item of items) { body }
+        # To:   def _pcsj_parallel_body_0(item): body
+        #       parallel_for(_pcsj_parallel_body_0, items)
+        # The body has to be a function so it can be shipped to worker processes;
+        # it only sees copies of outer variables, so assignments don't come back.
+        header = re.compile(r'^(\s*)parallel\s+for\s*\(\s*(?:const\s+|let\s+|var\s+)?(\w+)\s+of\s+(.+)\)\s*[:{]?\s*$')
+        lines = []
+        pending = [] # (indent, call) for loops whose body is still open
+        for line in code.split('\n'):
+            indent = len(line) - len(line.lstrip())
+            while pending and line.strip() and indent <= pending[-1][0]:
+                lines.append(pending.pop()[1])
+            match = header.match(line)
+            if not match:
+                lines.append(line)
+                continue
+            prefix, var, source = match.groups()
+            body_name = f"_pcsj_parallel_body_{self._parallel_loop_count}"
+            self._parallel_loop_count += 1
+            lines.append(f"{prefix}def {body_name}({var}):")
+            pending.append((len(prefix), f"{prefix}parallel_for({body_name}, {source.strip()})"))
+        while pending:
+            lines.append(pending.pop()[1])
+        return '\n'.join(lines)
+
     def _convert_for_of_loop(self, code: str) -> str:
         import re
         # From: for (item of items) { ... }
@@ -479,11 +664,19 @@ availableProducts = [
 
 async def main():
     # Get the path to the .pcsj file from command line arguments
-    if len(sys.argv) < 2:
-        print("Usage: python pcsj_interpreter.py <path_to_your_pcsj_file.pcsj>")
+    # `--database=PATH` keeps the script's tables in a durable database file;
+    # `--sql-backend=sqlite` runs embedded SQL on sqlite3 rather than the native engine;
+    # `--parallel-workers=N` lets the native engine scan large tables in N processes
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not arguments:
+        print("Usage: python pcsj_interpreter.py [--database=PATH] [--sql-backend=native|sqlite] [--parallel-workers=N] <path_to_your_pcsj_file.pcsj>")
         return
 
-    pcsj_file_path = sys.argv[1]
+    pcsj_file_path = arguments[0]
+    database_path = options.get('database')
+    if database_path:
+        database_path = os.path.abspath(database_path)
 
     # Change to the directory of the .pcsj file for relative imports
     original_cwd = os.getcwd()
@@ -492,7 +685,9 @@ async def main():
         os.chdir(file_dir)
         pcsj_file_path = os.path.basename(pcsj_file_path) # Adjust path for open()
 
-    interpreter = PCSJInterpreter()
+    interpreter = PCSJInterpreter(database_path=database_path, sql_backend=options.get('sql-backend', 'native'))
+    if 'parallel-workers' in options and isinstance(interpreter.database, Database):
+        interpreter.database.settings['parallel_workers'] = int(options['parallel-workers'])
 
     print(f"\\nRunning PyCppSQLJS file: {pcsj_file_path}\\n")
 
@@ -508,10 +703,9 @@ async def main():
     except Exception as e:
         print(f"An error occurred during interpretation: {e}")
     finally:
+        interpreter.database.close()
         # Restore original working directory
         os.chdir(original_cwd)
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
-
-</rewritten_file>
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+"""Process-pool offload for CPU-bound PCSJ functions (`spawn`, `parallel for`)."""
+
+import array
+import asyncio
+import hashlib
+import inspect
+import marshal
+import os
+import pickle
+import types
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional
+
+# typed arrays and bytes at least this large travel through shared memory instead of pickle
+SHARED_MEMORY_THRESHOLD = 1 << 20
+PICKLE_PROTOCOL = 5
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+# --- Shipping functions -------------------------------------------------------
+# PCSJ functions are created by exec() inside the interpreter env, so pickle
+# cannot import them by reference. Instead the marshalled code object and the
+# globals it reads are shipped, and workers rebuild the function once per key.
+
+class FunctionPackage:
+    def __init__(self, key: str, payload: bytes):
+        self.key = key
+        self.payload = payload
+
+def _global_names(code: types.CodeType, names: set):
+    names.update(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _global_names(const, names)
+    return names
+
+def _describe_function(fn: Callable, builtin_names: set, seen: Dict[str, Any]) -> Dict[str, Any]:
+    if fn.__closure__:
+        # Pure functions only: captured variables are copied by value
+        closure = [cell.cell_contents for cell in fn.__closure__]
+    else:
+        closure = None
+    shipped = {}
+    for name in _global_names(fn.__code__, set()):
+        if name in builtin_names or name in seen or name not in fn.__globals__:
+            continue
+        value = fn.__globals__[name]
+        if isinstance(value, types.FunctionType):
+            seen[name] = None # Guards against mutual recursion
+            shipped[name] = ('function', _describe_function(value, builtin_names, seen))
+            continue
+        try:
+            shipped[name] = ('value', pickle.dumps(value, protocol=PICKLE_PROTOCOL))
+        except Exception:
+            pass # Left undefined in the worker; using it raises NameError there
+    return {
+        'code': marshal.dumps(fn.__code__),
+        'name': fn.__name__,
+        'defaults': fn.__defaults__,
+        'closure': closure,
+        'globals': shipped,
+    }
+
+def package_function(fn: Callable) -> FunctionPackage:
+    if not isinstance(fn, types.FunctionType):
+        raise TypeError(f"spawn() expects a PCSJ function, got {type(fn).__name__}")
+    # Seeding `seen` with the function itself keeps recursive calls from re-shipping it
+    description = _describe_function(fn, _builtin_names(), {fn.__name__: None})
+    payload = pickle.dumps(description, protocol=PICKLE_PROTOCOL)
+    return FunctionPackage(hashlib.sha1(payload).hexdigest(), payload)
+
+_builtin_env_names: Optional[set] = None
+
+def _builtin_names() -> set:
+    # Names every worker already has from its pre-warmed builtin env
+    global _builtin_env_names
+    if _builtin_env_names is None:
+        from pcsj_interpreter import PCSJBuiltins
+        _builtin_env_names = set(PCSJBuiltins({})._env)
+    return _builtin_env_names
+
+# --- Shared-memory typed arrays -----------------------------------------------
+
+# Python 3.13 can attach to a segment without registering it for cleanup
+_ATTACH = {'track': False} if 'track' in inspect.signature(shared_memory.SharedMemory).parameters else {}
+
+class SharedArray:
+    # Stand-in for a large array.array, bytes or bytearray while it crosses
+    # the process boundary
+    def __init__(self, values: Any):
+        self.kind = type(values)
+        if self.kind is not array.array:
+            values = memoryview(values).cast('B')
+        nbytes = max(1, len(values) * values.itemsize)
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.shm.buf[:len(values) * values.itemsize] = values.tobytes() if self.kind is array.array else values
+        self.name = self.shm.name
+        self.typecode = values.typecode if self.kind is array.array else 'B'
+        self.length = len(values)
+
+    def __getstate__(self):
+        return {'name': self.name, 'typecode': self.typecode, 'length': self.length, 'kind': self.kind}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = None
+
+    def open(self):
+        # Worker side: (typed view of the array, segment to close when done).
+        # The parent owns the segment. Workers share its resource tracker
+        # (see get_pool), so where attaching registers the segment, it is
+        # already registered there, and the parent's unlink clears it.
+        shm = shared_memory.SharedMemory(name=self.name, **_ATTACH)
+        view = shm.buf.cast('B')[:self.length * array.array(self.typecode).itemsize]
+        return view.cast(self.typecode), shm
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+def _shareable(value: Any) -> bool:
+    if isinstance(value, array.array):
+        return len(value) * value.itemsize >= SHARED_MEMORY_THRESHOLD
+    return isinstance(value, (bytes, bytearray)) and len(value) >= SHARED_MEMORY_THRESHOLD
+
+def _share_args(args: tuple) -> tuple:
+    return tuple(SharedArray(value) if _shareable(value) else value for value in args)
+
+def _release_args(args: tuple):
+    for value in args:
+        if isinstance(value, SharedArray):
+            value.release()
+
+# --- Worker side --------------------------------------------------------------
+
+_worker_env: Dict[str, Any] = {}
+_worker_functions: Dict[str, Callable] = {}
+
+def _init_worker():
+    # Pre-warm each worker with the PCSJ builtin environment
+    from pcsj_interpreter import PCSJBuiltins
+    PCSJBuiltins(_worker_env)
+
+def _build_function(description: Dict[str, Any], env: Dict[str, Any]) -> Callable:
+    for name, (kind, value) in description['globals'].items():
+        if kind == 'function':
+            env[name] = _build_function(value, env)
+        else:
+            env[name] = pickle.loads(value)
+    closure = None
+    if description['closure'] is not None:
+        closure = tuple(types.CellType(value) for value in description['closure'])
+    code = marshal.loads(description['code'])
+    fn = types.FunctionType(code, env, description['name'], description['defaults'], closure)
+    env.setdefault(description['name'], fn)
+    return fn
+
+def _load_function(package: FunctionPackage) -> Callable:
+    fn = _worker_functions.get(package.key)
+    if fn is None:
+        env = dict(_worker_env)
+        fn = _build_function(pickle.loads(package.payload), env)
+        _worker_functions[package.key] = fn
+    return fn
+
+def _open_args(args: tuple):
+    # Typed arrays are read in place; bytes are copied out of the segment,
+    # since functions expect a bytes object rather than a view
+    opened, handles = [], []
+    for value in args:
+        if isinstance(value, SharedArray):
+            view, shm = value.open()
+            handles.append(shm)
+            opened.append(view if value.kind is array.array else value.kind(view))
+        else:
+            opened.append(value)
+    return tuple(opened), handles
+
+def _close_handles(handles: list):
+    for shm in handles:
+        try:
+            shm.close()
+        except BufferError:
+            pass # fn kept a view of the array; the mapping goes away with it
+
+def _result(value: Any) -> Any:
+    # A view of a shared array cannot be pickled back
+    return array.array(value.format, value) if isinstance(value, memoryview) else value
+
+def _run_call(package: FunctionPackage, args: tuple) -> Any:
+    fn = _load_function(package)
+    opened, handles = _open_args(args)
+    try:
+        return _result(fn(*opened))
+    finally:
+        del opened
+        _close_handles(handles)
+
+def _run_chunk(package: FunctionPackage, items: tuple) -> List[Any]:
+    # One task per chunk, so the code package is sent once per chunk, not per item
+    fn = _load_function(package)
+    opened, handles = _open_args(items)
+    try:
+        return [_result(fn(item)) for item in opened]
+    finally:
+        del opened
+        _close_handles(handles)
+
+def _ping(_):
+    return os.getpid()
+
+# --- Parent side --------------------------------------------------------------
+
+def get_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    if workers is None and _pool is not None:
+        return _pool
+    workers = workers or os.cpu_count() or 1
+    if _pool is not None and _pool_workers != workers:
+        shutdown_pool()
+    if _pool is None:
+        # Workers use the resource tracker running when they start: this
+        # one, rather than one of their own that would unlink the parent's
+        # shared segments when the worker exits
+        resource_tracker.ensure_running()
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        _pool_workers = workers
+        # Start every worker now rather than on the first call
+        list(_pool.map(_ping, range(workers)))
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+def spawn(fn: Callable, *args: Any):
+    # Run fn(*args) in a worker process. Inside async code the result is
+    # awaitable; otherwise a concurrent.futures.Future is returned.
+    package = package_function(fn)
+    shared_args = _share_args(args)
+    future = get_pool().submit(_run_call, package, shared_args)
+    future.add_done_callback(lambda _: _release_args(shared_args))
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return future
+    return asyncio.wrap_future(future)
+
+def parallel_map(fn: Callable, items, workers: Optional[int] = None, chunk_size: Optional[int] = None) -> List[Any]:
+    items = list(items)
+    if not items:
+        return []
+    pool = get_pool(workers)
+    if chunk_size is None:
+        # A few chunks per worker keeps them busy without per-item overhead
+        chunk_size = max(1, len(items) // (_pool_workers * 4))
+    package = package_function(fn)
+    # Large typed arrays and bytes among the items go through shared memory
+    chunks = [_share_args(tuple(items[i:i + chunk_size])) for i in range(0, len(items), chunk_size)]
+    futures = []
+    try:
+        futures.extend(pool.submit(_run_chunk, package, chunk) for chunk in chunks)
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+    finally:
+        for future in futures:
+            future.cancel()
+        for chunk in chunks:
+            _release_args(chunk)
+
+def parallel_for(body: Callable, items, workers: Optional[int] = None):
+    # Target of the `parallel for` statement; the body's return values are discarded
+    parallel_map(body, items, workers)
@@ -0,0 +1,205 @@
+"""Code-generated classes for PCSJ `schema` declarations."""
+
+import keyword
+from operator import itemgetter, methodcaller
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+# Attributes every generated schema class defines (see build_schema_class)
+_RESERVED_NAMES = frozenset({'validator', 'from_dict', 'from_dicts', 'from_columns', '_pcsj_fields'})
+
+def _check_field_names(schema_name: str, fields: Dict[str, Any]):
+    for field_name in fields:
+        if not field_name.isidentifier() or keyword.iskeyword(field_name):
+            raise TypeError(f"Schema '{schema_name}' field '{field_name}' is not a valid identifier")
+        # A `__name` slot would be mangled, and the generated methods assign it unmangled
+        if field_name in _RESERVED_NAMES or field_name.startswith('__'):
+            raise TypeError(f"Schema '{schema_name}' field '{field_name}' is reserved for the schema class")
+
+def _schema_source(schema_name: str, names: Sequence[str]) -> str:
+    # The methods are generated with one statement per field instead of looping
+    # over `fields` with setattr(); result mapping runs them once per row.
+    count = len(names)
+
+    def assign(indent: str, value: str) -> str:
+        return '\n'.join(f'{indent}self.{name} = {value.format(name=name, i=i)}'
+                         for i, name in enumerate(names)) or f'{indent}pass'
+
+    unpack_target = ''.join(f'self.{name}, ' for name in names)
+    # Positional loop variables, so a field called `result` can't clobber a local
+    column_vars = ''.join(f'_{i}, ' for i in range(count)) or '_'
+    return f'''
+def __init__(self, *args):
+    if len(args) != {count}:
+        raise TypeError(f"Schema '{schema_name}' constructor expected {count} arguments, got {{len(args)}}")
+    {f"{unpack_target}= args" if count else "pass"}
+
+def from_dict(cls, data):
+    self = _new(cls)
+    get = data.get
+{assign('    ', 'get({name!r})')}
+    return self
+
+def from_dicts(cls, rows, validate=False):
+    # Like the validator, takes sequences in field order when the first row is one
+    rows = _validator.validate_rows(rows) if validate else rows if isinstance(rows, list) else list(rows)
+    if rows and not isinstance(rows[0], _Mapping):
+        return _from_values(cls, rows)
+    result = []
+    append = result.append
+    for data in rows:
+        self = _new(cls)
+        get = data.get
+{assign('        ', 'get({name!r})')}
+        append(self)
+    return result
+
+def _from_values(cls, rows):
+    result = []
+    append = result.append
+    for data in rows:
+        if len(data) != {count}:
+            raise TypeError(f"Schema '{schema_name}' row expected {count} values, got {{len(data)}}")
+        self = _new(cls)
+        {f"{unpack_target}= data" if count else "pass"}
+        append(self)
+    return result
+
+def from_columns(cls, columns, validate=False):
+    if validate:
+        _validator.validate_columns(columns)
+    result = []
+    append = result.append
+    for {column_vars} in _zip_columns(columns, _names):
+        self = _new(cls)
+{assign('        ', '_{i}')}
+        append(self)
+    return result
+'''
+
+def _zip_columns(columns: Mapping[str, Sequence[Any]], names: Sequence[str]) -> Iterable[tuple]:
+    # Missing columns read as None, like a missing key in from_dict()
+    present = [columns[name] for name in names if name in columns]
+    length = len(present[0]) if present else 0
+    for column in present:
+        if len(column) != length:
+            raise ValueError("from_columns() needs columns of equal length")
+    missing = [None] * length
+    return zip(*(columns.get(name, missing) for name in names)) if names else iter(())
+
+# --- Validation ---------------------------------------------------------------
+# NULL (None) is accepted for every field. `float` fields also take ints, and
+# bool never passes as int even though it is a subclass.
+
+_ACCEPTED_TYPES = {
+    str: (str,),
+    int: (int,),
+    float: (float, int),
+    bool: (bool,),
+}
+
+class SchemaValidationError(TypeError):
+    def __init__(self, schema_name: str, errors: List[Tuple[int, str, Any]]):
+        self.schema_name = schema_name
+        self.errors = errors # (row index, field name, offending value), in row order
+        shown = '; '.join(f"row {row} field '{field}': got {type(value).__name__} {value!r}"
+                          for row, field, value in errors[:5])
+        more = f" (and {len(errors) - 5} more)" if len(errors) > 5 else ""
+        super().__init__(f"Schema '{schema_name}' validation failed for {len(errors)} value(s): {shown}{more}")
+
+def _type_check_source(var: str, py_type: type) -> str:
+    # Cheapest test first: the exact class, which is what almost every value has
+    accepted = _ACCEPTED_TYPES[py_type]
+    fast = ' and '.join(f'{var}.__class__ is not {t.__name__}' for t in accepted)
+    slow = f'not isinstance({var}, ({", ".join(t.__name__ for t in accepted)},))'
+    if bool not in accepted:
+        slow = f'({var}.__class__ is bool or {slow})'
+    return f'{fast} and {var} is not None and {slow}'
+
+class SchemaValidator:
+    # Compiled once per schema. check_* validate a single row with generated
+    # straight-line code; validate_rows/validate_columns sweep whole columns
+    # with map(type, ...) and only walk a column in Python if it has a bad value.
+    def __init__(self, schema_name: str, fields: Dict[str, Any]):
+        self.schema_name = schema_name
+        self.checked = [(i, name, _ACCEPTED_TYPES[t]) for i, (name, t) in enumerate(fields.items())
+                        if t in _ACCEPTED_TYPES]
+        namespace: Dict[str, Any] = {}
+        exec(compile(self._source(fields), f'<validator {schema_name}>', 'exec'), namespace)
+        self.check_values: Callable[[Sequence[Any]], List[Tuple[str, Any]]] = namespace['check_values']
+        self.check_dict: Callable[[Mapping[str, Any]], List[Tuple[str, Any]]] = namespace['check_dict']
+        self.check_object: Callable[[Any], List[Tuple[str, Any]]] = namespace['check_object']
+
+    def _source(self, fields: Dict[str, Any]) -> str:
+        def body(read: Callable[[int, str], str]) -> str:
+            lines = ['    bad = []']
+            for i, name, _ in self.checked:
+                lines.append(f'    v = {read(i, name)}')
+                lines.append(f'    if {_type_check_source("v", fields[name])}:')
+                lines.append(f'        bad.append(({name!r}, v))')
+            lines.append('    return bad')
+            return '\n'.join(lines)
+        return '\n\n'.join([
+            'def check_values(row):\n' + body(lambda i, name: f'row[{i}]'),
+            'def check_dict(row):\n    get = row.get\n' + body(lambda i, name: f'get({name!r})'),
+            'def check_object(obj):\n' + body(lambda i, name: f'getattr(obj, {name!r}, None)'),
+        ]) + '\n'
+
+    def _column_errors(self, name: str, accepted: tuple, column: Callable[[], Iterable[Any]]) -> List[Tuple[int, str, Any]]:
+        allowed = set(accepted) | {type(None)}
+        if set(map(type, column())) <= allowed:
+            return []
+        return [(row, name, value) for row, value in enumerate(column())
+                if value is not None and (type(value) is bool and bool not in accepted or not isinstance(value, accepted))]
+
+    def _raise_if(self, errors: List[Tuple[int, str, Any]]):
+        if errors:
+            order = {name: i for i, name, _ in self.checked}
+            errors.sort(key=lambda error: (error[0], order[error[1]]))
+            raise SchemaValidationError(self.schema_name, errors)
+
+    def validate_rows(self, rows: Iterable[Any]) -> List[Any]:
+        # Rows are dicts or sequences in field order; returns them as a list
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return rows
+        by_key = isinstance(rows[0], Mapping)
+        errors = []
+        for i, name, accepted in self.checked:
+            getter = methodcaller('get', name) if by_key else itemgetter(i)
+            errors.extend(self._column_errors(name, accepted, lambda: map(getter, rows)))
+        self._raise_if(errors)
+        return rows
+
+    def validate_columns(self, columns: Mapping[str, Sequence[Any]]):
+        errors = []
+        for _, name, accepted in self.checked:
+            if name in columns:
+                errors.extend(self._column_errors(name, accepted, lambda: iter(columns[name])))
+        self._raise_if(errors)
+
+    def validate(self, row: Any):
+        if isinstance(row, Mapping):
+            bad = self.check_dict(row)
+        elif isinstance(row, (list, tuple)):
+            bad = self.check_values(row)
+        else:
+            bad = self.check_object(row)
+        if bad:
+            raise SchemaValidationError(self.schema_name, [(0, name, value) for name, value in bad])
+
+def build_schema_class(schema_name: str, fields: Dict[str, Any], base: type = object) -> type:
+    _check_field_names(schema_name, fields)
+    names = tuple(fields)
+    validator = SchemaValidator(schema_name, fields)
+    namespace = {'_new': object.__new__, '_zip_columns': _zip_columns, '_names': names, '_validator': validator,
+                 '_Mapping': Mapping}
+    exec(compile(_schema_source(schema_name, names), f'<schema {schema_name}>', 'exec'), namespace)
+    return type(schema_name, (base,), {
+        '__slots__': names,
+        '_pcsj_fields': dict(fields),
+        'validator': validator,
+        '__init__': namespace['__init__'],
+        'from_dict': classmethod(namespace['from_dict']),
+        'from_dicts': classmethod(namespace['from_dicts']),
+        'from_columns': classmethod(namespace['from_columns']),
+    })
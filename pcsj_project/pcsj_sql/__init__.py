@@ -0,0 +1,10 @@
+"""Embedded SQL engine for PyCppSQLJS tables."""
+
+from .cursor import Cursor
+from .database import Database, PreparedStatement
+from .errors import IntegrityError, SerializationError, SQLError, SQLSyntaxError
+from .parser import parse
+from .sqlite import SQLiteDatabase
+from .storage import Column, Table
+
+__all__ = ['Database', 'PreparedStatement', 'Cursor', 'SQLiteDatabase', 'Table', 'Column', 'parse', 'SQLError', 'SQLSyntaxError', 'IntegrityError', 'SerializationError']
@@ -0,0 +1,145 @@
+"""Access paths: which index, if any, can narrow a WHERE clause."""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .expressions import constant
+from .nodes import Between, BinaryOp, InList, Name
+from .storage import Table
+
+# `5 < col` is `col > 5` seen from the column
+_FLIPPED = {'=': '=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+def conjuncts(expr: Any) -> List[Any]:
+    if isinstance(expr, BinaryOp) and expr.op == 'AND':
+        return conjuncts(expr.left) + conjuncts(expr.right)
+    return [expr]
+
+def column_of(name: Name, table: Table, alias: Optional[str]) -> Optional[str]:
+    if len(name.parts) == 1 and name.column in table.columns:
+        return name.column
+    if len(name.parts) == 2 and name.qualifier in (table.name, alias) and name.column in table.columns:
+        return name.column
+    return None
+
+def references_columns(expr: Any, table: Table, alias: Optional[str]) -> bool:
+    # True if the expression reads a column of `table` (not just host variables)
+    if isinstance(expr, Name):
+        return column_of(expr, table, alias) is not None
+    if isinstance(expr, list):
+        return any(references_columns(item, table, alias) for item in expr)
+    if hasattr(expr, '__dataclass_fields__'):
+        return any(references_columns(getattr(expr, f), table, alias) for f in expr.__dataclass_fields__)
+    return False
+
+def restrictions(table: Table, alias: Optional[str], where: Any) -> Dict[str, List[Tuple[str, Any]]]:
+    # column -> [(op, value expression)] for the conjuncts an index can serve:
+    # comparisons against constants, BETWEEN and IN lists
+    found: Dict[str, List[Tuple[str, Any]]] = {}
+    if where is None:
+        return found
+
+    def constant_side(expr):
+        return not references_columns(expr, table, alias)
+
+    for term in conjuncts(where):
+        if isinstance(term, BinaryOp) and term.op in _FLIPPED:
+            for column_side, value_side, op in ((term.left, term.right, term.op), (term.right, term.left, _FLIPPED[term.op])):
+                column = column_of(column_side, table, alias) if isinstance(column_side, Name) else None
+                if column and constant_side(value_side):
+                    found.setdefault(column, []).append((op, value_side))
+                    break
+        elif isinstance(term, Between) and not term.negated and isinstance(term.operand, Name):
+            column = column_of(term.operand, table, alias)
+            if column and constant_side(term.low) and constant_side(term.high):
+                found.setdefault(column, []).extend([('>=', term.low), ('<=', term.high)])
+        elif isinstance(term, InList) and not term.negated and isinstance(term.operand, Name):
+            column = column_of(term.operand, table, alias)
+            if column and constant_side(term.items):
+                found.setdefault(column, []).append(('IN', term.items))
+    return found
+
+@dataclass
+class IndexProbe:
+    # Equality values for the leading index columns, then an optional range
+    # (or an IN list) on the next one. The full WHERE is still applied to
+    # every row returned, so a probe only has to be a superset.
+    index: Any
+    equal: List[Any] = field(default_factory=list)
+    low: Optional[Tuple[str, Any]] = None
+    high: Optional[Tuple[str, Any]] = None
+    any_of: Optional[List[Any]] = None
+
+    @property
+    def score(self) -> tuple:
+        exact = len(self.equal) == len(self.index.columns)
+        return (exact and self.index.unique, len(self.equal) + (self.any_of is not None),
+                self.low is not None or self.high is not None, self.index.kind == 'hash')
+
+    def describe(self) -> str:
+        parts = [f"{column} = ?" for column in self.index.columns[:len(self.equal)]]
+        next_column = self.index.columns[len(self.equal)] if len(self.equal) < len(self.index.columns) else None
+        if self.any_of is not None:
+            parts.append(f"{next_column} IN (...)")
+        for bound in (self.low, self.high):
+            if bound is not None:
+                parts.append(f"{next_column} {bound[0]} ?")
+        return f"{self.index.name} ({' AND '.join(parts)})"
+
+    def rids(self, params: Any = None, value: Optional[Callable[[Any], Any]] = None,
+             descending: bool = False) -> List[int]:
+        # `value` evaluates the probe expressions; by default they may only
+        # use literals, parameters and host variables
+        if value is None:
+            value = lambda expr: constant(expr, params)
+        index = self.index
+        prefix = [value(expr) for expr in self.equal]
+        if self.any_of is not None:
+            found: Dict[int, None] = {}
+            for item in self.any_of:
+                key = prefix + [value(item)]
+                found.update(dict.fromkeys(index.lookup(tuple(key) if len(key) > 1 else key[0])))
+            return list(found)
+        if len(prefix) == len(index.columns):
+            rids = index.lookup(tuple(prefix) if len(prefix) > 1 else prefix[0])
+            return rids[::-1] if descending else rids
+        low = value(self.low[1]) if self.low else None
+        high = value(self.high[1]) if self.high else None
+        if (self.low and low is None) or (self.high and high is None):
+            return [] # a comparison with NULL matches nothing
+        return index.range(prefix, low, high,
+                           low_inclusive=not self.low or self.low[0] == '>=',
+                           high_inclusive=not self.high or self.high[0] == '<=', descending=descending)
+
+def probe_for(index: Any, found: Dict[str, List[Tuple[str, Any]]]) -> Optional[IndexProbe]:
+    probe = IndexProbe(index)
+    for column in index.columns:
+        terms = found.get(column, [])
+        equal = next((value for op, value in terms if op == '='), None)
+        if equal is not None:
+            probe.equal.append(equal)
+            continue
+        if index.kind == 'hash':
+            # Hash indexes answer whole-key equality only (optionally via IN on the last column)
+            in_list = next((value for op, value in terms if op == 'IN'), None)
+            if in_list is not None and column == index.columns[-1]:
+                probe.any_of = in_list
+                return probe
+            return None
+        in_list = next((value for op, value in terms if op == 'IN'), None)
+        if in_list is not None:
+            probe.any_of = in_list
+            return probe
+        probe.low = next(((op, value) for op, value in terms if op in ('>', '>=')), None)
+        probe.high = next(((op, value) for op, value in terms if op in ('<', '<=')), None)
+        break
+    if not probe.equal and probe.any_of is None and probe.low is None and probe.high is None:
+        return None
+    return probe
+
+def best_probe(table: Table, alias: Optional[str], where: Any) -> Optional[IndexProbe]:
+    found = restrictions(table, alias, where)
+    if not found:
+        return None
+    probes = [probe for probe in (probe_for(index, found) for index in table.indexes.values()) if probe is not None]
+    return max(probes, key=lambda probe: probe.score, default=None)
@@ -0,0 +1,147 @@
+"""Streaming readers for COPY ... FROM.
+
+A CSV or JSON Lines file is read a batch of rows at a time and turned into
+columns, which `Table.insert_columns` appends in one go. CSV fields are
+converted column by column with the parser of the column's PCSJ type;
+JSON values go through the same coercion as INSERT. Memory use depends on
+the batch size, not on the size of the file.
+"""
+
+import csv
+import json
+import os
+from array import array
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .errors import SQLError
+
+# Rows read from the file per batch
+COPY_BATCH_ROWS = 65536
+
+_TRUE = {'true', 't', 'yes', 'y', 'on', '1'}
+_FALSE = {'false', 'f', 'no', 'n', 'off', '0'}
+# Exact spellings looked up before trying _parse_bool
+_BOOL_TEXTS = {**{text: True for text in _TRUE}, **{text: False for text in _FALSE},
+               'True': True, 'TRUE': True, 'False': False, 'FALSE': False}
+
+def _parse_int(text: str) -> int:
+    try:
+        return int(text)
+    except ValueError:
+        value = float(text)
+        if not value.is_integer():
+            raise
+        return int(value)
+
+def _parse_bool(text: str) -> bool:
+    lowered = text.strip().lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    raise ValueError(text)
+
+# Converters from CSV text per PCSJ type (other types keep the text): a fast
+# one for the whole column, and a lenient one for values it rejects
+_PARSERS = {'int': (int, _parse_int), 'float': (float, float), 'bool': (_BOOL_TEXTS.__getitem__, _parse_bool)}
+
+def copy_format(path: str, options: Dict[str, Any]) -> str:
+    # FORMAT if given, else from the file name: JSON Lines for .jsonl and .ndjson, CSV otherwise
+    if 'format' in options:
+        return options['format']
+    return 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+def read_copy(path: str, table: Any, columns: Optional[Sequence[str]], options: Dict[str, Any],
+              batch_rows: int = COPY_BATCH_ROWS) -> Iterator[Dict[str, Sequence[Any]]]:
+    # Batches of the file's rows as {column: values}
+    if columns is not None:
+        for name in columns:
+            table.column(name)
+    try:
+        file = open(path, newline='', encoding='utf-8')
+    except OSError as error:
+        raise SQLError(f"COPY cannot read '{path}': {error.strerror}")
+    with file:
+        if copy_format(path, options) == 'jsonl':
+            yield from _read_jsonl(file, table, columns, batch_rows)
+        else:
+            yield from _read_csv(file, table, columns, options, batch_rows)
+
+def _read_csv(file: Any, table: Any, columns: Optional[Sequence[str]], options: Dict[str, Any],
+              batch_rows: int) -> Iterator[Dict[str, Sequence[Any]]]:
+    reader = csv.reader(file, delimiter=options.get('delimiter', ','))
+    null = options.get('null', '')
+    names = list(columns) if columns is not None else table.column_names
+    if options.get('header'):
+        header = next(reader, None)
+        if columns is None and header is not None:
+            names = [name.strip() for name in header]
+            for name in names:
+                table.column(name)
+    line = 2 if options.get('header') else 1
+    while True:
+        batch = list(islice(reader, batch_rows))
+        if not batch:
+            return
+        if set(map(len, batch)) != {len(names)}:
+            for number, row in enumerate(batch, line):
+                if len(row) != len(names):
+                    raise SQLError(f"COPY {table.name}: line {number} has {len(row)} fields, expected {len(names)}")
+        yield {name: _convert(table.columns[name], texts, null, line)
+               for name, texts in zip(names, zip(*batch))}
+        line += len(batch)
+
+def _convert(column: Any, texts: Sequence[str], null: str, line: int) -> Sequence[Any]:
+    # One CSV column of a batch in the column's type; `null` stands for NULL
+    has_nulls = null in texts
+    if column.definition.type not in _PARSERS:
+        return [None if text == null else text for text in texts] if has_nulls else list(texts)
+    fast, lenient = _PARSERS[column.definition.type]
+    if not has_nulls:
+        try:
+            return array(column.typecode, map(fast, texts))
+        except (KeyError, ValueError, OverflowError):
+            pass
+    values = []
+    for number, text in enumerate(texts, line):
+        if text == null:
+            values.append(None)
+            continue
+        try:
+            values.append(lenient(text))
+        except ValueError:
+            raise SQLError(f"COPY: column '{column.name}' expects {column.definition.type}, "
+                           f"got {text!r} on line {number}")
+    return values
+
+def _read_jsonl(file: Any, table: Any, columns: Optional[Sequence[str]],
+                batch_rows: int) -> Iterator[Dict[str, Sequence[Any]]]:
+    # One JSON object per line (keys are column names), or one array in
+    # `columns` order (table order without a column list); blank lines are skipped
+    names = list(columns) if columns is not None else table.column_names
+    known = set(names)
+    line = 1
+    while True:
+        lines = list(islice(file, batch_rows))
+        if not lines:
+            return
+        rows: List[Any] = []
+        for number, text in enumerate(lines, line):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as error:
+                raise SQLError(f"COPY {table.name}: invalid JSON on line {number}: {error}")
+            if isinstance(row, dict):
+                unknown = row.keys() - known
+                if unknown:
+                    raise SQLError(f"COPY {table.name}: unknown column '{sorted(unknown)[0]}' on line {number}")
+            elif not isinstance(row, list) or len(row) != len(names):
+                raise SQLError(f"COPY {table.name}: line {number} is not an object or an array of {len(names)} values")
+            rows.append(row)
+        line += len(lines)
+        if rows:
+            yield {name: [row.get(name) if isinstance(row, dict) else row[position] for row in rows]
+                   for position, name in enumerate(names)}
@@ -0,0 +1,46 @@
+"""The statement cache behind `Database.execute`.
+
+Prepared statements are kept by SQL text and evicted least recently used
+first. Each statement is stored under its normalized text (tokens separated
+by single spaces) and under the exact text it was last run with, so a call
+site that runs the same text again skips even tokenizing, while texts that
+only differ in layout or comments share one parsed statement.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Cache entries (texts) a database keeps unless its `statement_cache_size` setting changes
+DEFAULT_CACHE_SIZE = 512
+# Longer texts (typically INSERTs with many VALUES rows) are parsed every
+# time instead: they are rarely run again, and would crowd out the rest
+MAX_CACHED_LENGTH = 8192
+
+class StatementCache:
+    def __init__(self):
+        self.entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Cached plans made again because the catalog, the planner settings or
+        # the size of a table they read changed
+        self.invalidations = 0
+
+    def get(self, sql: str) -> Optional[Any]:
+        entry = self.entries.get(sql)
+        if entry is not None:
+            self.entries.move_to_end(sql)
+            self.hits += 1
+        return entry
+
+    def put(self, sql: str, entry: Any, capacity: int):
+        self.entries[sql] = entry
+        self.entries.move_to_end(sql)
+        while len(self.entries) > capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations,
+                'entries': len(self.entries)}
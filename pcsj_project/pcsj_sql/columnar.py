@@ -0,0 +1,271 @@
+"""A read-only columnar file format for PCSJ tables, opened through mmap.
+
+`write_table` stores the live rows of a table column by column:
+
+- int, float and bool columns as fixed-width values back to back;
+- string columns as UTF-8 bytes back to back, plus n + 1 offsets into them;
+- any other column as one pickled list;
+- NULL flags, one byte per row, for columns that hold NULLs;
+- for every PRIMARY KEY, UNIQUE and FOREIGN KEY column, the row ids sorted
+  by that column (NULLs first), which serve as its index.
+
+A footer holds the schema, where each segment starts, and the statistics
+ANALYZE would gather. Segments start at multiples of 8 bytes.
+
+`MappedTable` maps such a file and reads its segments through memoryviews,
+so opening it reads only the footer, and a query pages in just the columns
+it touches. Typed columns are sliced into batches without copying.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from itertools import accumulate, islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .errors import SQLError
+from .index import encode_component
+from .stats import analyze_table
+from .storage import Column, Table
+
+MAGIC = b'PCSJCOL1'
+# Footer length, followed by MAGIC again at the very end of the file
+_TRAILER = struct.Struct('<Q')
+_ALIGN = 8
+
+def _constraint_columns(table: Table) -> List[str]:
+    return [d.name for d in table.definitions if d.primary_key or d.unique or d.references]
+
+def write_table(table: Table, path: str):
+    # Store the live rows of `table` in `path`; row ids are renumbered from 0
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(MAGIC)
+
+        def segment(data: Any) -> tuple:
+            file.write(b'\0' * (-file.tell() % _ALIGN))
+            offset = file.tell()
+            file.write(data)
+            return offset, file.tell() - offset
+
+        columns: Dict[str, Dict[str, Any]] = {}
+        values_of: Dict[str, List[Any]] = {}
+        for name in table.column_names:
+            column = table.columns[name]
+            values = values_of[name] = list(table.column_values(name))
+            if column.typecode is not None:
+                meta = {'data': segment(array(column.typecode, [0 if v is None else v for v in values]))}
+            elif column.definition.type == 'string':
+                encoded = [b'' if v is None else v.encode('utf-8') for v in values]
+                offsets = array('q', accumulate(map(len, encoded), initial=0))
+                meta = {'offsets': segment(offsets), 'data': segment(b''.join(encoded))}
+            else:
+                meta = {'pickle': segment(pickle.dumps(values, pickle.HIGHEST_PROTOCOL))}
+            meta['nulls'] = segment(bytes(v is None for v in values)) if None in values else None
+            columns[name] = meta
+        rows = len(table)
+        live = segment(b'\1' * rows)
+        ordered = {}
+        for name in _constraint_columns(table):
+            values = values_of[name]
+            order = sorted(range(rows), key=lambda rid: encode_component(values[rid]))
+            ordered[name] = (segment(array('q', order)), sum(v is None for v in values))
+        footer = pickle.dumps({
+            'name': table.name,
+            'definitions': table.definitions,
+            'rows': rows,
+            'columns': columns,
+            'live': live,
+            'ordered': ordered,
+            'stats': analyze_table(table),
+        }, pickle.HIGHEST_PROTOCOL)
+        file.write(footer)
+        file.write(_TRAILER.pack(len(footer)) + MAGIC)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+class StringSegment:
+    # A string column: UTF-8 bytes back to back, cut at n + 1 offsets.
+    # Strings are decoded when read.
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, rid: Any) -> Any:
+        if isinstance(rid, slice):
+            return [self[i] for i in range(*rid.indices(len(self)))]
+        offsets = self.offsets
+        return str(self.data[offsets[rid]:offsets[rid + 1]], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        offsets, data = self.offsets, self.data
+        return (str(data[start:end], 'utf-8') for start, end in zip(offsets, islice(offsets, 1, None)))
+
+class PickledSegment:
+    # A column of other values, unpickled on first read
+    def __init__(self, data: memoryview, rows: int):
+        self.data = data
+        self.rows = rows
+        self._values: Optional[List[Any]] = None
+
+    @property
+    def values(self) -> List[Any]:
+        if self._values is None:
+            self._values = pickle.loads(self.data)
+        return self._values
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, rid: Any) -> Any:
+        return self.values[rid]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.values)
+
+class MappedColumn(Column):
+    def __init__(self, definition: Any, meta: Dict[str, Any], view: Any, rows: int):
+        super().__init__(definition)
+        self.mapped_bytes = sum(meta[key][1] for key in ('data', 'offsets', 'pickle', 'nulls') if meta.get(key))
+        if self.typecode is not None:
+            self.data = view(meta['data']).cast(self.typecode)
+        elif 'offsets' in meta:
+            self.data = StringSegment(view(meta['offsets']).cast('q'), view(meta['data']))
+        else:
+            self.data = PickledSegment(view(meta['pickle']), rows)
+        self.nulls = view(meta['nulls']) if meta['nulls'] else None
+
+    def nbytes(self) -> int:
+        return self.mapped_bytes
+
+class SortedIndex:
+    # The index of a PRIMARY KEY, UNIQUE or FOREIGN KEY column of a mapped
+    # table: its row ids sorted by the column, NULLs first, searched in the
+    # file. Serves the same probes and ordered scans as a one-column
+    # OrderedIndex.
+    kind = 'ordered'
+
+    def __init__(self, name: str, table_name: str, columns: Sequence[str], unique: bool,
+                 rids: memoryview, nulls: int, column: Column):
+        self.name = name
+        self.table_name = table_name
+        self.columns = tuple(columns)
+        self.unique = unique
+        self.rids = rids
+        # Row ids of NULLs come first and are never found by a probe
+        self.nulls = nulls
+        self.column = column
+
+    def __len__(self) -> int:
+        return len(self.rids)
+
+    def __repr__(self) -> str:
+        kind = 'unique ' if self.unique else ''
+        return f"SortedIndex({self.name}: {kind}{self.table_name}({', '.join(self.columns)}))"
+
+    def key(self, row: Dict[str, Any]) -> tuple:
+        return tuple(encode_component(row[name]) for name in self.columns)
+
+    def _value(self, key: Any) -> Any:
+        # A raw value, a one-element tuple of it, or an encoded key
+        if isinstance(key, tuple):
+            key = key[0] if key else None
+            if isinstance(key, tuple):
+                key = key[1] if len(key) == 2 else None
+        return key
+
+    def _bound(self, value: Any, after: bool) -> int:
+        # Position of the first row id whose value is >= `value` (> when `after`)
+        rids, get = self.rids, self.column.get
+        low, high = self.nulls, len(rids)
+        while low < high:
+            middle = (low + high) // 2
+            found = get(rids[middle])
+            if found < value or after and found == value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _between(self, start: int, end: int, descending: bool = False) -> List[int]:
+        rids = self.rids[start:max(start, end)].tolist()
+        return rids[::-1] if descending else rids
+
+    def lookup(self, key: Any) -> List[int]:
+        value = self._value(key)
+        if value is None:
+            return []
+        try:
+            return self._between(self._bound(value, False), self._bound(value, True))
+        except TypeError:
+            return []
+
+    def __contains__(self, key: Any) -> bool:
+        return bool(self.lookup(key))
+
+    def prefix(self, values: Sequence[Any]) -> List[int]:
+        return self.lookup(values[0]) if values else self.scan()
+
+    def range(self, prefix: Sequence[Any] = (), low: Any = None, high: Any = None,
+              low_inclusive: bool = True, high_inclusive: bool = True, descending: bool = False) -> List[int]:
+        if prefix:
+            rids = self.lookup(prefix[0]) if len(prefix) == 1 else []
+            return rids[::-1] if descending else rids
+        try:
+            start = self.nulls if low is None else self._bound(low, not low_inclusive)
+            end = len(self.rids) if high is None else self._bound(high, high_inclusive)
+        except TypeError:
+            return []
+        return self._between(start, end, descending)
+
+    def scan(self, descending: bool = False) -> List[int]:
+        return self._between(0, len(self.rids), descending)
+
+class MappedTable(Table):
+    # A table read from a columnar file (see write_table). Rows cannot be
+    # changed; CREATE INDEX builds its indexes in memory as usual.
+    def __init__(self, path: str, name: Optional[str] = None, catalog: Any = None):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+        size = len(buffer)
+        if size < 2 * len(MAGIC) + _TRAILER.size or buffer[:len(MAGIC)] != MAGIC or buffer[size - len(MAGIC):] != MAGIC:
+            raise SQLError(f"'{path}' is not a PCSJ table file")
+        (length,) = _TRAILER.unpack_from(buffer, size - len(MAGIC) - _TRAILER.size)
+        end = size - len(MAGIC) - _TRAILER.size
+        footer = pickle.loads(buffer[end - length:end])
+        super().__init__(name or footer['name'], footer['definitions'], catalog)
+        self.path = os.path.abspath(path)
+
+        def view(segment: tuple) -> memoryview:
+            offset, length = segment
+            return buffer[offset:offset + length]
+
+        rows = footer['rows']
+        for definition in self.definitions:
+            self.columns[definition.name] = MappedColumn(definition, footer['columns'][definition.name], view, rows)
+        self.live = view(footer['live'])
+        self.live_count = rows
+        # The constraint indexes made above are empty; the file has sorted row ids for them
+        for index_name, index in list(self.indexes.items()):
+            column = index.columns[0]
+            segment, nulls = footer['ordered'][column]
+            self.indexes[index_name] = SortedIndex(index_name, self.name, index.columns, index.unique,
+                                                   view(segment).cast('q'), nulls, self.columns[column])
+        if self.primary_key is not None:
+            self.primary_index = self.indexes[f"{self.name}_pkey"]
+        self.stats = footer['stats']
+
+    def __repr__(self) -> str:
+        return f"MappedTable({self.name}, {self.live_count} rows, {self.path})"
+
+    def _read_only(self, *args: Any, **kwargs: Any):
+        raise SQLError(f"Table '{self.name}' is read-only (mapped from '{self.path}')")
+
+    insert = insert_columns = update = delete = restore = _read_only
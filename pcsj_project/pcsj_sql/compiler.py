@@ -0,0 +1,389 @@
+"""Compilation of bound expressions into Python functions.
+
+An expression tree is turned into Python source once, compiled, and run as
+a single comprehension over a batch (or a plain function of one row), so
+the per-row cost is ordinary bytecode instead of a walk over the tree.
+
+The source is specialized per call site:
+- NULL checks are only generated for columns that can hold NULLs. Typed
+  storage slices never do, and list columns are scanned once per batch.
+- Parameters, PCSJ host variables and outer-query values become closure
+  constants, and checks for the ones that are not NULL are dropped.
+- Literals are inlined, and LIKE patterns become compiled regexes.
+
+Uncorrelated scalar and EXISTS subqueries are constants too. Expressions
+with other subqueries or aggregates are not compiled; callers fall back to
+`evaluate` for those.
+"""
+
+import math
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .expressions import SCALAR_FUNCTIONS, _like_regex, evaluate, in_list, truthy
+from .nodes import (
+    Between, BinaryOp, ColumnRef, FuncCall, InList, IsNull, Like, Literal, Name, OuterRef, Param, SubPlan, UnaryOp,
+)
+
+_COMPARISONS = {'=': '==', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+_ARITHMETIC = {'+', '-', '*'}
+
+class Uncompilable(Exception):
+    pass
+
+def _and3(left: Any, right: Any):
+    if left is not None and not truthy(left) or right is not None and not truthy(right):
+        return False
+    return None if left is None or right is None else True
+
+def _or3(left: Any, right: Any):
+    if truthy(left) or truthy(right):
+        return True
+    return None if left is None or right is None else False
+
+def _not3(value: Any):
+    return None if value is None else not truthy(value)
+
+def _like(value: Any, pattern: Any):
+    if value is None or pattern is None:
+        return None
+    return _like_regex(pattern).match(str(value)) is not None
+
+# Names the generated code can call
+_GLOBALS: Dict[str, Any] = {
+    '_and3': _and3, '_or3': _or3, '_not3': _not3, '_like': _like, '_in_list': in_list, '_truthy': truthy,
+}
+for _name, _function in SCALAR_FUNCTIONS.items():
+    _GLOBALS[f"_fn_{_name}"] = _function
+
+def constant_nodes(expr: Any) -> List[Any]:
+    # Nodes that become closure constants, in generation order
+    found: List[Any] = []
+    def visit(node: Any):
+        kind = type(node)
+        if kind in (Param, Name, OuterRef) or kind is Literal and _inline(node.value) is None \
+                or kind is Like and type(node.pattern) is Literal or kind is SubPlan and _constant_subplan(node):
+            found.append(node)
+            if kind is Like:
+                visit(node.operand)
+            return
+        if kind is BinaryOp:
+            visit(node.left)
+            visit(node.right)
+        elif kind is UnaryOp or kind is IsNull:
+            visit(node.operand)
+        elif kind is FuncCall:
+            for arg in node.args:
+                visit(arg)
+        elif kind is InList:
+            visit(node.operand)
+            for item in node.items:
+                visit(item)
+        elif kind is Between:
+            visit(node.operand)
+            visit(node.low)
+            visit(node.high)
+        elif kind is Like:
+            visit(node.operand)
+            visit(node.pattern)
+    visit(expr)
+    return found
+
+def column_slots(expr: Any) -> List[int]:
+    slots: List[int] = []
+    def visit(node: Any):
+        if type(node) is ColumnRef:
+            if node.index not in slots:
+                slots.append(node.index)
+        elif hasattr(node, '__dataclass_fields__'):
+            for name in node.__dataclass_fields__:
+                value = getattr(node, name)
+                for item in value if isinstance(value, list) else [value]:
+                    visit(item)
+    visit(expr)
+    return sorted(slots)
+
+def _constant_subplan(node: SubPlan) -> bool:
+    # Uncorrelated scalar and EXISTS subqueries have one value per statement
+    return not node.correlated and node.kind != 'in'
+
+def _simple(code: str) -> bool:
+    # Names, row[i] and short literals can be repeated without re-evaluating anything
+    return code.isidentifier() or code.replace('_', '').replace('[', '').replace(']', '').isalnum()
+
+def _any_null(tested: List[str]) -> str:
+    return ' or '.join(f"{code} is None" for code in tested)
+
+def _inline(value: Any) -> Optional[str]:
+    # Source text for a literal that can be written into the code
+    if value is None or isinstance(value, (bool, str)):
+        return repr(value)
+    if isinstance(value, int):
+        return repr(value)
+    if isinstance(value, float) and math.isfinite(value):
+        return repr(value)
+    return None
+
+class _Generator:
+    # Builds the source of one expression. Every method returns
+    # (code, nullable, boolean): whether the value can be NULL, and whether
+    # it is always True/False/None (so Python truthiness matches truthy()).
+    def __init__(self, column: Callable[[int], str], nullable_slots: Sequence[int],
+                 constants: Dict[int, Tuple[str, bool]]):
+        self.column = column
+        self.nullable_slots = set(nullable_slots)
+        self.constants = constants # id(node) -> (name, nullable)
+        self.temps = 0
+
+    def temp(self) -> str:
+        self.temps += 1
+        return f"_t{self.temps}"
+
+    def guard(self, parts: List[Tuple[str, bool]]) -> Tuple[List[str], List[str]]:
+        # For operands that may be NULL: the expressions to test against None
+        # (binding non-trivial code to a temporary there) and the names to
+        # use for the operands afterwards
+        names, tested = [], []
+        for code, nullable in parts:
+            if nullable and not _simple(code):
+                name = self.temp()
+                tested.append(f"({name} := {code})")
+                names.append(name)
+            else:
+                if nullable:
+                    tested.append(code)
+                names.append(code)
+        return names, tested
+
+    def bind(self, code: str) -> Tuple[str, str]:
+        # (first use, later uses) of code needed more than once
+        if _simple(code):
+            return code, code
+        name = self.temp()
+        return f"({name} := {code})", name
+
+    def value(self, expr: Any) -> Tuple[str, bool, bool]:
+        kind = type(expr)
+        if kind is ColumnRef:
+            return self.column(expr.index), expr.index in self.nullable_slots, False
+        if kind is Literal:
+            text = _inline(expr.value)
+            if text is not None:
+                return text, expr.value is None, isinstance(expr.value, bool) or expr.value is None
+        if id(expr) in self.constants and kind is not Like:
+            name, nullable = self.constants[id(expr)]
+            return name, nullable, False
+        if kind is BinaryOp:
+            return self.binary(expr)
+        if kind is UnaryOp:
+            code, nullable, boolean = self.value(expr.operand)
+            if expr.op == 'NOT':
+                if boolean and not nullable:
+                    return f"(not {code})", False, True
+                return f"_not3({code})", nullable, True
+            if not nullable:
+                return f"(-{code})", False, False
+            (name,), tested = self.guard([(code, nullable)])
+            return f"(None if {tested[0]} is None else -{name})", True, False
+        if kind is FuncCall and expr.name in SCALAR_FUNCTIONS and not expr.star:
+            args = ', '.join(self.value(arg)[0] for arg in expr.args)
+            return f"_fn_{expr.name}({args})", True, False
+        if kind is IsNull:
+            code, nullable, _ = self.value(expr.operand)
+            if not nullable:
+                return ('True' if expr.negated else 'False'), False, True
+            return f"({code} is {'not ' if expr.negated else ''}None)", False, True
+        if kind is Between:
+            parts = [self.value(expr.operand)[:2], self.value(expr.low)[:2], self.value(expr.high)[:2]]
+            (value, low, high), tested = self.guard(parts)
+            test = f"{low} <= {value} <= {high}"
+            if expr.negated:
+                test = f"not ({test})"
+            if not tested:
+                return f"({test})", False, True
+            return f"(None if {_any_null(tested)} else {test})", True, True
+        if kind is InList:
+            code, nullable, _ = self.value(expr.operand)
+            values = [self.value(item) for item in expr.items]
+            items = [item for item, _, _ in values]
+            if any(item_nullable for _, item_nullable, _ in values):
+                # A NULL item makes a miss unknown, which `in` can't express
+                return f"_in_list(({', '.join(items)},), {expr.negated}, {code})", True, True
+            literal = all(type(item) is Literal and _inline(item.value) is not None for item in expr.items)
+            collection = ('{' if literal else '(') + ', '.join(items) + (',' if len(items) == 1 and not literal else '') \
+                + ('}' if literal else ')')
+            if not nullable:
+                return f"({code} {'not in' if expr.negated else 'in'} {collection})", False, True
+            (name,), tested = self.guard([(code, nullable)])
+            return f"(None if {tested[0]} is None else {name} {'not in' if expr.negated else 'in'} {collection})", True, True
+        if kind is Like:
+            code, nullable, _ = self.value(expr.operand)
+            if id(expr) in self.constants:
+                regex, pattern_null = self.constants[id(expr)]
+                if pattern_null:
+                    return 'None', True, True
+                test = f"{regex}.match(str({{}})) is {'' if expr.negated else 'not '}None"
+                if not nullable:
+                    return f"({test.format(code)})", False, True
+                (name,), tested = self.guard([(code, nullable)])
+                return f"(None if {tested[0]} is None else {test.format(name)})", True, True
+            pattern = self.value(expr.pattern)[0]
+            call = f"_like({code}, {pattern})"
+            return (f"_not3({call})" if expr.negated else call), True, True
+        raise Uncompilable(type(expr).__name__)
+
+    def binary(self, expr: BinaryOp) -> Tuple[str, bool, bool]:
+        op = expr.op
+        left, right = self.value(expr.left), self.value(expr.right)
+        if op in ('AND', 'OR'):
+            if left[2] and right[2] and not left[1] and not right[1]:
+                return f"({left[0]} {op.lower()} {right[0]})", False, True
+            # The right side is only evaluated when it can change the result
+            first, name = self.bind(left[0])
+            if op == 'AND':
+                decided = f"False if {first} is not None and not _truthy({name})" if left[1] \
+                    else f"False if not _truthy({first})"
+            else:
+                decided = f"True if _truthy({first})"
+            return f"({decided} else _{op.lower()}3({name}, {right[0]}))", True, True
+        if op in _COMPARISONS or op in _ARITHMETIC or op == '||':
+            (a, b), tested = self.guard([left[:2], right[:2]])
+            if op == '||':
+                result = f"format({a}, '') + format({b}, '')"
+            else:
+                result = f"{a} {_COMPARISONS.get(op, op)} {b}"
+            if not tested:
+                return f"({result})", False, op in _COMPARISONS
+            return f"(None if {_any_null(tested)} else {result})", True, op in _COMPARISONS
+        if op in ('/', '%'):
+            # NULL for a NULL operand or a zero divisor
+            (a,), tested = self.guard([left[:2]])
+            first, b = self.bind(right[0])
+            checks = [f"{first} is None or {b} == 0" if right[1] else f"{first} == 0"]
+            if tested:
+                checks.insert(0, _any_null(tested))
+            return f"(None if {' or '.join(checks)} else {a} {op} {b})", True, False
+        raise Uncompilable(op)
+
+    def predicate(self, expr: Any) -> str:
+        # Code whose Python truthiness equals truthy() of the SQL value
+        kind = type(expr)
+        if kind is BinaryOp and expr.op in ('AND', 'OR'):
+            return f"({self.predicate(expr.left)} {expr.op.lower()} {self.predicate(expr.right)})"
+        if kind is BinaryOp and expr.op in _COMPARISONS:
+            left, right = self.value(expr.left), self.value(expr.right)
+            names, tested = self.guard([left[:2], right[:2]])
+            tests = [f"{code} is not None" for code in tested]
+            return '(' + ' and '.join(tests + [f"{names[0]} {_COMPARISONS[expr.op]} {names[1]}"]) + ')'
+        if kind is UnaryOp and expr.op == 'NOT':
+            code, nullable, boolean = self.value(expr.operand)
+            if boolean:
+                return f"({code} is False)" if nullable else f"(not {code})"
+            return f"_truthy(_not3({code}))"
+        code, _, boolean = self.value(expr)
+        return code if boolean else f"_truthy({code})"
+
+class CompiledExpressions:
+    # Compiled functions for bound expressions. `cache` (shared for a whole
+    # statement) holds the generated code per expression, use and
+    # specialization; constants are read again each time a function is made.
+    def __init__(self, env: Any, params: Any = None, cache: Optional[Dict[tuple, Any]] = None):
+        self.env = env
+        self.params = params
+        self.cache: Dict[tuple, Any] = {} if cache is None else cache
+
+    def _constants(self, expr: Any) -> Tuple[List[Any], List[Any]]:
+        nodes = constant_nodes(expr)
+        values = []
+        for node in nodes:
+            kind = type(node)
+            if kind is Like:
+                pattern = evaluate(node.pattern, self.env, self.params)
+                values.append(None if pattern is None else _like_regex(pattern))
+            elif kind is Literal:
+                values.append(node.value)
+            elif kind is Param:
+                values.append(evaluate(node, self.env, self.params))
+            else: # Name, OuterRef or SubPlan, resolved like the interpreter does
+                values.append(self.env(node))
+        return nodes, values
+
+    def _factory(self, expr: Any, mode: str, nullable_slots: Tuple[int, ...], nodes: List[Any],
+                 values: List[Any], slots: List[int]):
+        null_constants = tuple(value is None for value in values)
+        key = (id(expr), mode, nullable_slots, null_constants)
+        factory = self.cache.get(key)
+        if factory is not None:
+            return factory
+        constants = {id(node): (f"_k{i}", value is None) for i, (node, value) in enumerate(zip(nodes, values))}
+        if mode.startswith('row'):
+            generator = _Generator(lambda i: f"row[{i}]", nullable_slots, constants)
+        else:
+            generator = _Generator(lambda i: f"_v{i}", nullable_slots, constants)
+        body = generator.predicate(expr) if mode in ('row-check', 'row-filter', 'batch-predicate') \
+            else generator.value(expr)[0]
+        names = ', '.join(f"_c{i}" for i in slots)
+        if len(slots) == 1:
+            loop = f"_v{slots[0]} in _c{slots[0]}"
+            indexed = f"_i, _v{slots[0]} in enumerate(_c{slots[0]})"
+        else:
+            values_tuple = ', '.join(f"_v{i}" for i in slots)
+            loop = f"({values_tuple}) in zip({names})"
+            indexed = f"_i, ({values_tuple}) in enumerate(zip({names}))"
+        if mode in ('row', 'row-check'):
+            inner = f"    def run(row):\n        return {body}\n"
+        elif mode == 'row-filter':
+            inner = f"    def run(rows):\n        return (row for row in rows if {body})\n"
+        elif mode == 'batch-predicate':
+            inner = f"    def run({names}):\n        return [_i for {indexed} if {body}]\n"
+        else:
+            inner = f"    def run({names}):\n        return [{body} for {loop}]\n"
+        source = f"def make({', '.join(f'_k{i}' for i in range(len(nodes)))}):\n{inner}    return run\n"
+        namespace = dict(_GLOBALS)
+        exec(compile(source, f"<sql expression {mode}>", 'exec'), namespace)
+        factory = self.cache[key] = namespace['make']
+        factory.source = source
+        return factory
+
+    def _compile(self, expr: Any, mode: str, nullable_slots: Tuple[int, ...], slots: List[int]):
+        failed = (id(expr), 'failed')
+        if failed in self.cache:
+            return None
+        try:
+            nodes, values = self._constants(expr)
+            return self._factory(expr, mode, nullable_slots, nodes, values, slots)(*values)
+        except Uncompilable:
+            self.cache[failed] = True
+            return None
+
+    def row_function(self, expr: Any) -> Optional[Callable[[tuple], Any]]:
+        # row -> value; every column may be NULL
+        return self._compile(expr, 'row', tuple(column_slots(expr)), [])
+
+    def row_check(self, expr: Any) -> Optional[Callable[[tuple], Any]]:
+        # row -> whether `expr` is true for it
+        return self._compile(expr, 'row-check', tuple(column_slots(expr)), [])
+
+    def row_filter(self, expr: Any) -> Optional[Callable[[Any], Any]]:
+        # rows -> the rows for which `expr` is true
+        return self._compile(expr, 'row-filter', tuple(column_slots(expr)), [])
+
+    def _batch(self, expr: Any, batch: Any, mode: str):
+        slots = column_slots(expr)
+        if not slots:
+            return None
+        columns = [batch.columns[i] for i in slots]
+        # NumPy columns become lists, so no NumPy scalars reach the results
+        columns = [column if isinstance(column, (list, array)) else column.tolist() for column in columns]
+        nullable = tuple(i for i, column in zip(slots, columns) if not isinstance(column, array) and None in column)
+        run = self._compile(expr, mode, nullable, slots)
+        if run is None:
+            return None
+        return run(*columns)
+
+    def batch_column(self, expr: Any, batch: Any) -> Optional[list]:
+        # One value per row, or None when the expression cannot be compiled
+        return self._batch(expr, batch, 'batch')
+
+    def batch_selection(self, expr: Any, batch: Any) -> Optional[List[int]]:
+        return self._batch(expr, batch, 'batch-predicate')
@@ -0,0 +1,138 @@
+"""Lazy query results.
+
+A `Cursor` is what a SELECT returns: a read-only sequence whose rows are
+produced by the query's operators only as they are read. Iterating it once
+streams the result; `LIMIT`, `result[0]` and `break` stop the query early.
+
+Rows already produced are kept, up to `CURSOR_KEEP_ROWS`, so a small result
+can be iterated again, indexed or measured at no extra cost. Past that an
+iteration drops the rows behind it, which keeps memory flat however large
+the result, and a later use that needs them runs the query again.
+
+Running a query again only gives the same rows if its tables have not
+changed, and a query still being read must not see later changes either.
+So before a table changes, every cursor that reads it and is not finished
+reads the rest of its rows (see `Database.materialize_cursors`).
+"""
+
+from itertools import islice
+from typing import Any, Callable, Collection, Iterable, Iterator, List, Optional, Sequence
+
+# Rows a cursor keeps before an iteration starts dropping the ones it has passed
+CURSOR_KEEP_ROWS = 10000
+# Rows an iteration takes from the query at a time
+_CHUNK_ROWS = 1024
+
+class Cursor(Sequence):
+    def __init__(self, run: Callable[[], Iterable[Any]], tables: Collection[str] = ()):
+        # `run` starts the query and returns its rows; it may be called again
+        self._run = run
+        # Names of the tables the query reads
+        self.tables = tables
+        # Rows of the current run from position `_offset` on
+        self._rows: List[Any] = []
+        self._offset = 0
+        self._source: Optional[Iterator[Any]] = None
+        self.complete = False
+
+    def _restart(self):
+        self._source = iter(self._run())
+        self._rows = []
+        self._offset = 0
+        self.complete = False
+
+    def _fill(self, count: Optional[int] = None):
+        # Produce rows until the first `count` are available (all when None),
+        # starting over if some of them were dropped
+        if self._offset or self._source is None and not self.complete:
+            self._restart()
+        rows, source = self._rows, self._source
+        if count is None:
+            if not self.complete:
+                rows.extend(source)
+                self.complete = True
+                self._source = None
+            return
+        while len(rows) < count and not self.complete:
+            try:
+                rows.append(next(source))
+            except StopIteration:
+                self.complete = True
+                self._source = None
+
+    def _pull(self):
+        # The next chunk of rows of the current run
+        rows = self._rows
+        count = len(rows)
+        rows.extend(islice(self._source, _CHUNK_ROWS))
+        if len(rows) - count < _CHUNK_ROWS:
+            self.complete = True
+            self._source = None
+
+    @property
+    def settled(self) -> bool:
+        # Every row is kept, so later changes to the tables cannot reach it
+        return self.complete and not self._offset
+
+    def materialize(self) -> List[Any]:
+        # Every row, kept from now on
+        self._fill()
+        return self._rows
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._offset or self._source is None and not self.complete:
+            self._restart()
+        if not self._rows and not self.complete:
+            self._pull()
+        if self.complete:
+            # The whole result is kept (the common case for small results)
+            return iter(self._rows)
+        return self._stream()
+
+    def _stream(self) -> Iterator[Any]:
+        position = 0
+        while True:
+            index = position - self._offset
+            if index < 0:
+                # Rows this iteration still needs were dropped: run the query again
+                self._restart()
+                index = position
+            rows = self._rows
+            if index >= len(rows):
+                if self.complete:
+                    return
+                if self._source is None:
+                    self._restart()
+                else:
+                    self._pull()
+                continue
+            # A copy, since other readers of the cursor may change `rows`
+            chunk = rows[index:]
+            yield from chunk
+            position += len(chunk)
+            if len(rows) > CURSOR_KEEP_ROWS and not self.complete and rows is self._rows:
+                # Past the limit, forget the rows behind this iteration
+                passed = position - self._offset
+                del rows[:passed]
+                self._offset += passed
+
+    def __len__(self) -> int:
+        return len(self.materialize())
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice) or index < 0:
+            return self.materialize()[index]
+        self._fill(index + 1)
+        return self._rows[index]
+
+    def __bool__(self) -> bool:
+        self._fill(1)
+        return bool(self._rows)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Cursor):
+            other = other.materialize()
+        return self.materialize() == other if isinstance(other, list) else NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.materialize())
@@ -0,0 +1,821 @@
+"""The PCSJ SQL database: table catalog and statement execution."""
+
+import keyword
+import time
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import replace
+from functools import partial
+from itertools import starmap
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .access import best_probe, column_of
+from .bulk import read_copy
+from .cache import DEFAULT_CACHE_SIZE, MAX_CACHED_LENGTH, StatementCache
+from .columnar import MappedTable, write_table
+from .cursor import Cursor
+from .errors import SerializationError, SQLError
+from .expressions import constant, evaluate, host_value, truthy
+from .index import HashIndex, OrderedIndex
+from .mvcc import Snapshot, Transaction
+from .nodes import (
+    Analyze, Begin, ColumnDef, Commit, Copy, CreateIndex, CreateTable, CreateView, Delete, DropIndex, DropView,
+    Explain, Insert, Name, RefreshView, Rollback, Select, TableRef, Update,
+)
+from .operators import ExecutionContext, Operator, input_rows
+from .parallel import PARALLEL_MIN_ROWS
+from .parser import normalize, parse
+from .planner import plan_query, walk
+from .spill import DEFAULT_WORK_MEM
+from .stats import TableStats, analyze_table
+from .storage import Table
+from .vector import DEFAULT_BATCH_SIZE
+from .views import MaterializedView, delta_table, row_changes
+from .wal import (
+    DEFAULT_CHECKPOINT_SIZE, DEFAULT_GROUP_DELAY, DEFAULT_GROUP_SIZE, WAL_SUFFIX, WriteAheadLog, changes,
+    read_checkpoint, read_log, write_checkpoint,
+)
+
+class Row:
+    # Base of the generated result-row classes
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return f"Row({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Row):
+            return self.as_tuple() == other.as_tuple()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.as_tuple())
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def build_row_class(names: Sequence[str]) -> type:
+    # A Row subclass with a slot per result column, filled by a generated
+    # __init__. A column name that is a Python keyword (`class`) cannot be
+    # written as an attribute, so its slot is set through its descriptor.
+    # Names that would hide Row's methods are refused by the parser.
+    cls = type('Row', (Row,), {'__slots__': tuple(names)})
+    targets, setters = [], []
+    for i, name in enumerate(names):
+        if keyword.iskeyword(name):
+            targets.append(f'_{i}')
+            setters.append(f'    _slots[{i}](self, _{i})\n')
+        else:
+            targets.append(f'self.{name}')
+    body = f"    {', '.join(targets)}, = args\n" if targets else '    pass\n'
+    namespace = {'_slots': [cls.__dict__[name].__set__ for name in names]}
+    exec(compile('def __init__(self, *args):\n' + body + ''.join(setters), '<result row>', 'exec'), namespace)
+    cls.__init__ = namespace['__init__']
+    return cls
+
+class PreparedStatement:
+    # A parsed statement that runs without being parsed again. The plan of a
+    # SELECT, or the index probe of an UPDATE or DELETE, is made on first
+    # execution and reused, with the code compiled for its expressions, until
+    # the catalog or the planner settings change or a table it reads grows or
+    # shrinks about fourfold.
+    def __init__(self, database: 'Database', statement: Any):
+        self.database = database
+        self.statement = statement
+        # Tables whose size the plan depends on; only queries have plans
+        self.tables = sorted({node.name for node in walk(statement) if isinstance(node, TableRef)}) \
+            if isinstance(statement, (Select, Update, Delete)) else []
+        self.plan: Any = None
+        # What the plan was made for (see Database._plan_state); None before the first plan
+        self.planned_for: Optional[tuple] = None
+        # Generated code for the plan's expressions, kept across executions
+        self.compiled: Dict[tuple, Any] = {}
+
+    def execute(self, params: Any = None, parallel_workers: Optional[int] = None) -> Any:
+        return self.database.execute_prepared(self, params, parallel_workers)
+
+class Database:
+    def __init__(self, path: Optional[str] = None):
+        # With a path the database is durable: it is recovered from that file
+        # and its write-ahead log, and every commit is logged (see wal.py)
+        self.path = path
+        self.wal: Optional[WriteAheadLog] = None
+        self.tables: Dict[str, Table] = {}
+        # The transaction of the running task, so async functions that
+        # interleave their statements each have their own (see mvcc.py)
+        self._transaction: ContextVar[Optional[Transaction]] = ContextVar('pcsj_sql_transaction', default=None)
+        # BEGIN ... COMMIT transactions still open, in any task
+        self.open_transactions: Set[Transaction] = set()
+        # Number of the last commit: snapshots see every commit up to theirs
+        self.last_commit = 0
+        # Committed transactions whose row versions some open snapshot may still need, oldest first
+        self.retained: Deque[Transaction] = deque()
+        # Secondary indexes from CREATE INDEX: index name -> table name
+        self.index_tables: Dict[str, str] = {}
+        # Materialized views by name (their rows are also in `tables`), and
+        # the incrementally maintained ones by the names of the tables they read
+        self.views: Dict[str, MaterializedView] = {}
+        self.dependents: Dict[str, List[MaterializedView]] = {}
+        # Changes to one table that views read, not yet applied to them:
+        # (row, +1 or -1) pairs (see views.py)
+        self.pending_table: Optional[Table] = None
+        self.pending_changes: List[Tuple[tuple, int]] = []
+        # ANALYZE results used by the planner, per table
+        self.stats: Dict[str, TableStats] = {}
+        # Result-row classes per column list, so repeated queries reuse them
+        self.row_classes: Dict[Tuple[str, ...], type] = {}
+        # Query results that may still read their tables (see cursor.py), and
+        # the length past which the list is next cleared of finished ones
+        self.cursors: List['weakref.ref[Cursor]'] = []
+        self._cursors_limit = 32
+        # Planner switches, mainly for comparing plans: a disabled join method
+        # is only chosen when nothing else can run the join
+        self.settings: Dict[str, Any] = {
+            'enable_nestloop': True, 'enable_hashjoin': True,
+            'enable_mergejoin': True, 'enable_indexnestloop': True,
+            # Rows per column batch in the executor
+            'batch_size': DEFAULT_BATCH_SIZE,
+            # Bytes of group state a Hash Aggregate keeps in memory before
+            # spilling to temporary files (None: no limit)
+            'work_mem': DEFAULT_WORK_MEM,
+            # Texts kept by the statement cache of `execute` (0 turns it off)
+            'statement_cache_size': DEFAULT_CACHE_SIZE,
+            # How commits reach the write-ahead log: 'commit', 'group' or 'off'
+            'wal_sync': 'commit',
+            'wal_group_size': DEFAULT_GROUP_SIZE,
+            'wal_group_delay': DEFAULT_GROUP_DELAY,
+            # Bytes of write-ahead log after which a checkpoint is written
+            'checkpoint_size': DEFAULT_CHECKPOINT_SIZE,
+            # Worker processes a large single-table scan or aggregation is
+            # split across (0 or 1: none), for tables of at least
+            # parallel_min_rows live rows (see parallel.py)
+            'parallel_workers': 0,
+            'parallel_min_rows': PARALLEL_MIN_ROWS,
+        }
+        self.statement_cache = StatementCache()
+        # Bumped by every schema, index or statistics change, which
+        # invalidates the plans of prepared statements
+        self.catalog_version = 0
+        if path is not None:
+            self._recover(path)
+
+    def create_table(self, name: str, columns: Sequence[ColumnDef]) -> Table:
+        if name in self.tables:
+            raise SQLError(f"Table '{name}' already exists")
+        table = self._add_table(Table(name, columns, catalog=self))
+        self._log(('create_table', name, list(columns)))
+        return table
+
+    def attach_table(self, path: str, name: Optional[str] = None) -> MappedTable:
+        # Open a file written by save_table as a read-only table (see columnar.py)
+        if name is not None and name in self.tables:
+            raise SQLError(f"Table '{name}' already exists")
+        table = MappedTable(path, name, catalog=self)
+        if table.name in self.tables:
+            raise SQLError(f"Table '{table.name}' already exists")
+        self._add_table(table)
+        self.stats[table.name] = table.stats
+        self._log(('attach_table', table.path, table.name))
+        return table
+
+    def save_table(self, name: str, path: str):
+        # Write a table's live rows to a columnar file for attach_table
+        write_table(self.table(name), path)
+
+    def _add_table(self, table: Table) -> Table:
+        name = table.name
+        for column, parent, parent_column in table.foreign_keys:
+            parent_table = self.tables.get(parent) if parent != name else table
+            if parent_table is None:
+                raise SQLError(f"FOREIGN KEY {name}.{column} references unknown table '{parent}'")
+            if parent_table.index_on([parent_column], unique=True) is None:
+                raise SQLError(f"FOREIGN KEY {name}.{column} must reference a PRIMARY KEY or UNIQUE column of '{parent}'")
+            parent_table.referenced_by.append((name, column))
+        self.tables[name] = table
+        self.catalog_version += 1
+        return table
+
+    def table(self, name: str) -> Table:
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise SQLError(f"Unknown table '{name}'")
+
+    def create_index(self, name: str, table_name: str, column_names: Sequence[str],
+                     unique: bool = False, using: str = 'ordered'):
+        table = self.table(table_name)
+        if table_name in self.views:
+            raise SQLError(f"Cannot create an index on materialized view '{table_name}'")
+        if name in self.index_tables or any(name in t.indexes for t in self.tables.values()):
+            raise SQLError(f"Index '{name}' already exists")
+        index_class = OrderedIndex if using == 'ordered' else HashIndex
+        index = table.add_index(index_class(name, table_name, column_names, unique))
+        self.index_tables[name] = table_name
+        self.catalog_version += 1
+        self._log(('create_index', name, table_name, list(column_names), unique, using))
+        return index
+
+    def drop_index(self, name: str):
+        if name not in self.index_tables:
+            raise SQLError(f"Unknown index '{name}' (constraint indexes cannot be dropped)")
+        table = self.table(self.index_tables.pop(name))
+        del table.indexes[name]
+        self.catalog_version += 1
+        self._log(('drop_index', name))
+
+    def create_view(self, name: str, select: Select, params: Any = None) -> MaterializedView:
+        # Run `select` into a materialized view; the values of host variables
+        # and parameters it reads are kept with it (see views.py)
+        if name in self.tables:
+            raise SQLError(f"Table '{name}' already exists")
+        if self.transaction is not None or self.open_transactions:
+            # Changes not yet committed would reach the view without their undo
+            raise SQLError("Cannot create a materialized view while a transaction is open")
+        view = MaterializedView(self, name, select, params)
+        self._add_table(view.table)
+        self.views[name] = view
+        for table_name in view.reads():
+            self.dependents.setdefault(table_name, []).append(view)
+        self._log(('create_view', name, select, view.params))
+        return view
+
+    def refresh_view(self, name: str):
+        self._view(name).refresh(self)
+
+    def drop_view(self, name: str):
+        view = self._view(name)
+        del self.views[name], self.tables[name]
+        for table_name in view.reads():
+            self.dependents[table_name].remove(view)
+            if not self.dependents[table_name]:
+                del self.dependents[table_name]
+        self.stats.pop(name, None)
+        self.catalog_version += 1
+        self._log(('drop_view', name))
+
+    def _view(self, name: str) -> MaterializedView:
+        try:
+            return self.views[name]
+        except KeyError:
+            raise SQLError(f"Unknown materialized view '{name}'")
+
+    def _target(self, name: str) -> Table:
+        # The table a statement changes; views only change with their tables
+        if name in self.views:
+            raise SQLError(f"Cannot change materialized view '{name}'")
+        return self.table(name)
+
+    def maintain_views(self):
+        # Apply the pending changes to the views that read their table
+        table, pending = self.pending_table, self.pending_changes
+        if not pending:
+            return
+        self.pending_table, self.pending_changes = None, []
+        delta = delta_table(table, pending)
+        for view in self.dependents.get(table.name, ()):
+            view.apply_changes(self, table, delta)
+
+    def _capture(self, entries: Sequence[tuple]):
+        # Keep the changes of a table that views read until the statement ends
+        table = entries[0][1]
+        if self.pending_changes and self.pending_table is not table:
+            # A join view must see each table's changes with the others unchanged
+            self.maintain_views()
+        self.pending_table = table
+        self.pending_changes.extend(row_changes(entries))
+
+    # --- Transactions -----------------------------------------------------------
+
+    @property
+    def transaction(self) -> Optional[Transaction]:
+        # The open transaction of the running task, or of its running statement
+        transaction = self._transaction.get()
+        return transaction if transaction is not None and transaction.open else None
+
+    @property
+    def in_transaction(self) -> bool:
+        transaction = self.transaction
+        return transaction is not None and transaction.explicit
+
+    @property
+    def undo_log(self) -> Optional[list]:
+        # Undo records of the current transaction; None when nothing can be rolled back
+        transaction = self.transaction
+        return transaction.undo_log if transaction is not None else None
+
+    def begin(self):
+        if self.in_transaction:
+            raise SQLError("A transaction is already in progress")
+        transaction = Transaction(self.last_commit, explicit=True, versioned=True)
+        self.open_transactions.add(transaction)
+        self._transaction.set(transaction)
+
+    def commit(self):
+        if not self.in_transaction:
+            raise SQLError("COMMIT without BEGIN TRANSACTION")
+        if self.pending_changes:
+            self.maintain_views()
+        self._commit(self.transaction)
+
+    def rollback(self):
+        if not self.in_transaction:
+            raise SQLError("ROLLBACK without BEGIN TRANSACTION")
+        transaction = self.transaction
+        self._undo_to(transaction, 0)
+        self._close(transaction)
+
+    def _commit(self, transaction: Transaction):
+        redo = None
+        if transaction.undo_log:
+            self.last_commit += 1
+            transaction.commit_number = self.last_commit
+            if transaction.versioned:
+                self.retained.append(transaction)
+            if self.wal is not None:
+                redo = changes(transaction.undo_log)
+        self._close(transaction)
+        if redo:
+            self._log(('commit', redo))
+
+    def _close(self, transaction: Transaction):
+        transaction.open = False
+        self.open_transactions.discard(transaction)
+        # Versions every open snapshot sees past are no longer needed
+        retained = self.retained
+        if not retained:
+            return
+        horizon = min((t.snapshot for t in self.open_transactions), default=self.last_commit)
+        while retained and retained[0].commit_number <= horizon:
+            done = retained.popleft()
+            for entry in done.undo_log:
+                table, rid = entry[1], entry[2]
+                versions = table.versions.get(rid)
+                if versions is None:
+                    continue
+                last = max((i for i, (writer, _) in enumerate(versions) if writer is done), default=-1)
+                del versions[:last + 1]
+                if not versions:
+                    del table.versions[rid]
+                    table.moved.discard(rid)
+            done.undo_log = []
+
+    def _undo_to(self, transaction: Transaction, mark: int):
+        log = transaction.undo_log
+        while len(log) > mark:
+            entry = log.pop()
+            table, rid = entry[1], entry[2]
+            table.undo(entry)
+            versions = table.versions.get(rid) if transaction.versioned else None
+            if versions and versions[-1][0] is transaction:
+                versions.pop()
+                if not versions:
+                    del table.versions[rid]
+                    table.moved.discard(rid)
+
+    def record(self, entry: tuple):
+        # Called by tables after every change. The change can be undone until
+        # its transaction ends, and while other transactions are open the row
+        # as it was before is kept for their snapshots.
+        if entry[1].name in self.dependents:
+            self._capture([entry])
+        transaction = self.transaction
+        if transaction is None:
+            # Table methods called directly: the change is committed as it is made
+            if self.wal is not None and entry[1].logged:
+                self._log(('commit', changes([entry])))
+            if self.pending_changes:
+                self.maintain_views()
+            return
+        transaction.undo_log.append(entry)
+        if transaction.versioned:
+            action, table, rid = entry[:3]
+            if action == 'insert':
+                before = None
+            elif action == 'update':
+                row = table.row_dict(rid)
+                row.update(entry[3])
+                before = tuple(row[name] for name in table.column_names)
+                if any(name in index.columns for index in table.indexes.values() for name in entry[3]):
+                    table.moved.add(rid)
+            else:
+                before = table.get(rid)
+                table.moved.add(rid)
+            table.versions.setdefault(rid, []).append((transaction, before))
+
+    def record_many(self, entries: Iterable[tuple]):
+        # record() for a batch of changes, logged as one commit when made
+        # outside a transaction; `entries` is only read if anything needs it
+        transaction = self.transaction
+        if transaction is not None and transaction.versioned:
+            # record() also takes each change for the views
+            for entry in entries:
+                self.record(entry)
+            return
+        if self.dependents:
+            entries = list(entries)
+            if entries and entries[0][1].name in self.dependents:
+                self._capture(entries)
+        if transaction is None:
+            if self.wal is not None:
+                redo = changes(list(entries))
+                if redo:
+                    self._log(('commit', redo))
+            if self.pending_changes:
+                self.maintain_views()
+        else:
+            transaction.undo_log.extend(entries)
+
+    def check_write(self, table: Table, rid: int, modify: bool = True):
+        # Raise SerializationError unless the current transaction may build on
+        # the newest version of the row: it must not belong to another open
+        # transaction, and one that is changed must not have been committed
+        # after the current transaction's snapshot
+        versions = table.versions.get(rid)
+        if not versions:
+            return
+        writer = versions[-1][0]
+        transaction = self.transaction
+        if writer is transaction:
+            return
+        if writer.commit_number is None:
+            raise SerializationError(f"Row {rid} of table '{table.name}' is being changed by a concurrent transaction")
+        if modify and transaction is not None and writer.commit_number > transaction.snapshot:
+            raise SerializationError(f"Row {rid} of table '{table.name}' was changed by a transaction that committed "
+                                     "after this one started")
+
+    def check_pending_keys(self, table: Table, row: Dict[str, Any], indexes: Sequence[Any], rid: Optional[int] = None):
+        # Raise SerializationError if a row that another open transaction
+        # deleted or changed held one of the keys `row` needs: rolling that
+        # transaction back would bring the key back
+        transaction = self.transaction
+        keys = [(index, index.key(row)) for index in indexes]
+        for other, versions in table.versions.items():
+            if other == rid:
+                continue
+            for writer, before in versions:
+                if writer is transaction or writer.commit_number is not None or before is None:
+                    continue
+                values = dict(zip(table.column_names, before))
+                for index, key in keys:
+                    if index.key(values) == key:
+                        raise SerializationError(f"Key {key!r} of table '{table.name}' is held by a concurrent transaction")
+
+    # --- Durability -------------------------------------------------------------
+
+    def _recover(self, path: str):
+        # Load the last checkpoint, then replay the log records written after it
+        header, tables = read_checkpoint(path)
+        lsn = 0
+        if header is not None:
+            lsn = header['lsn']
+            for state in tables:
+                if 'mapped' in state:
+                    self.attach_table(state['mapped'], state['name']).indexes.update(state['indexes'])
+                else:
+                    self.create_table(state['name'], state['definitions']).load(state)
+            self.index_tables = dict(header['index_tables'])
+            for view in header.get('views', ()):
+                self.create_view(*view)
+        records, length = read_log(path + WAL_SUFFIX)
+        for record in records:
+            if record[0] > lsn:
+                self._replay(record)
+                lsn = record[0]
+        self.wal = WriteAheadLog(path + WAL_SUFFIX, lsn, length)
+
+    def _replay(self, record: tuple):
+        kind = record[1]
+        if kind == 'create_table':
+            self.create_table(*record[2:])
+        elif kind == 'attach_table':
+            self.attach_table(*record[2:])
+        elif kind == 'create_index':
+            self.create_index(*record[2:])
+        elif kind == 'drop_index':
+            self.drop_index(record[2])
+        elif kind == 'create_view':
+            self.create_view(*record[2:])
+        elif kind == 'drop_view':
+            self.drop_view(record[2])
+        else:
+            # Replayed as one transaction, so views take the commit's changes together
+            token = self._transaction.set(Transaction(self.last_commit))
+            try:
+                for change in record[2]:
+                    action, table, rid = change[0], self.tables[change[1]], change[2]
+                    if action == 'insert':
+                        table.restore(rid, change[3])
+                        if table.name in self.dependents:
+                            self.record(('insert', table, rid))
+                    elif action == 'update':
+                        table.update(rid, change[3])
+                    else:
+                        table.delete(rid)
+                self.maintain_views()
+            finally:
+                self._transaction.reset(token)
+
+    def _log(self, record: tuple):
+        # Append to the write-ahead log of a durable database, and write a
+        # checkpoint once the log is big enough and no transaction is open
+        wal = self.wal
+        if wal is None:
+            return
+        settings = self.settings
+        wal.append(record, settings['wal_sync'], settings['wal_group_size'], settings['wal_group_delay'])
+        if wal.size >= settings['checkpoint_size'] and self.transaction is None and not self.open_transactions:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # Write every table to the database file and empty the write-ahead log
+        if self.wal is None:
+            raise SQLError("CHECKPOINT needs a database opened with a path")
+        if self.transaction is not None or self.open_transactions:
+            raise SQLError("Cannot write a checkpoint while a transaction is open")
+        self.wal.flush()
+        write_checkpoint(self.path, self, self.wal.lsn)
+        self.wal.reset()
+
+    def close(self):
+        # Make every commit durable; with no transaction open, also write a
+        # checkpoint so the next open has no log to replay
+        if self.wal is None:
+            return
+        if self.transaction is None and not self.open_transactions:
+            self.checkpoint()
+        self.wal.close()
+        self.wal = None
+
+    # --- Statements -------------------------------------------------------------
+
+    def execute(self, sql: str, params: Any = None, parallel_workers: Optional[int] = None) -> Any:
+        # `params` is a list for `?` placeholders, or a mapping for `:name`
+        # placeholders and PCSJ host variables referenced by bare name.
+        # `parallel_workers` overrides the session setting for one query.
+        return self.execute_prepared(self.prepare(sql), params, parallel_workers)
+
+    def prepare(self, sql: str) -> PreparedStatement:
+        # The parsed statement for `sql`, from the statement cache if it is there
+        cache = self.statement_cache
+        if len(sql) > MAX_CACHED_LENGTH:
+            cache.misses += 1
+            return PreparedStatement(self, parse(sql))
+        prepared = cache.get(sql)
+        if prepared is None:
+            capacity = self.settings['statement_cache_size']
+            key = normalize(sql)
+            prepared = cache.get(key) if key != sql else None
+            if prepared is None:
+                cache.misses += 1
+                prepared = PreparedStatement(self, parse(sql))
+                cache.put(key, prepared, capacity)
+            if key != sql:
+                cache.put(sql, prepared, capacity)
+        return prepared
+
+    def execute_prepared(self, prepared: PreparedStatement, params: Any = None,
+                         parallel_workers: Optional[int] = None) -> Any:
+        statement = prepared.statement
+        if self.pending_changes:
+            # Changes made through Table methods inside a transaction
+            self.maintain_views()
+        handler = getattr(self, f"_execute_{type(statement).__name__.lower()}")
+        if isinstance(statement, (Select, Update, Delete)):
+            handler = partial(handler, prepared=prepared)
+        if isinstance(statement, (Select, Explain)) and parallel_workers is not None:
+            handler = partial(handler, workers=parallel_workers)
+        if isinstance(statement, (Begin, Commit, Rollback, CreateTable, CreateIndex, DropIndex, CreateView, DropView,
+                                  Select, Explain, Analyze)):
+            return handler(statement, params)
+        # Each statement is atomic: on error its own changes are undone.
+        # Outside BEGIN ... COMMIT it runs as a transaction of its own.
+        transaction = self.transaction if self.in_transaction else None
+        if transaction is None:
+            transaction = Transaction(self.last_commit, versioned=bool(self.open_transactions))
+            token = self._transaction.set(transaction)
+        mark = len(transaction.undo_log)
+        try:
+            result = handler(statement, params)
+            if self.pending_changes:
+                self.maintain_views()
+        except Exception:
+            self.pending_table, self.pending_changes = None, []
+            self._undo_to(transaction, mark)
+            if not transaction.explicit:
+                self._close(transaction)
+            raise
+        finally:
+            if not transaction.explicit:
+                self._transaction.reset(token)
+        if not transaction.explicit:
+            self._commit(transaction)
+        return result
+
+    def _execute_begin(self, statement: Begin, params: Any):
+        self.begin()
+
+    def _execute_commit(self, statement: Commit, params: Any):
+        self.commit()
+
+    def _execute_rollback(self, statement: Rollback, params: Any):
+        self.rollback()
+
+    def _execute_createtable(self, statement: CreateTable, params: Any) -> Table:
+        return self.create_table(statement.name, statement.columns)
+
+    def _execute_createindex(self, statement: CreateIndex, params: Any):
+        return self.create_index(statement.name, statement.table, statement.columns,
+                                 statement.unique, statement.using)
+
+    def _execute_dropindex(self, statement: DropIndex, params: Any):
+        self.drop_index(statement.name)
+
+    def _execute_createview(self, statement: CreateView, params: Any) -> MaterializedView:
+        return self.create_view(statement.name, statement.select, params)
+
+    def _execute_refreshview(self, statement: RefreshView, params: Any):
+        self.refresh_view(statement.name)
+
+    def _execute_dropview(self, statement: DropView, params: Any):
+        self.drop_view(statement.name)
+
+    def analyze(self, table_name: Optional[str] = None):
+        # Refresh planner statistics: row count, distinct values and a histogram per column
+        names = [self.table(table_name).name] if table_name else list(self.tables)
+        for name in names:
+            self.stats[name] = analyze_table(self.tables[name])
+        self.catalog_version += 1
+
+    def plan(self, sql: str, params: Any = None) -> Operator:
+        statement = parse(sql)
+        if isinstance(statement, Explain):
+            statement = statement.statement
+        if not isinstance(statement, Select):
+            raise SQLError("Only SELECT statements have query plans")
+        return plan_query(self, statement, params)
+
+    def row_class(self, names: Sequence[str]) -> type:
+        key = tuple(names)
+        cls = self.row_classes.get(key)
+        if cls is None:
+            cls = self.row_classes[key] = build_row_class(key)
+        return cls
+
+    def _plan_state(self, prepared: PreparedStatement, workers: Optional[int] = None) -> tuple:
+        # Tables are compared by size class (factors of four), so a plan
+        # survives ordinary inserts and deletes but not a table outgrowing it
+        sizes = tuple((len(self.tables[name]).bit_length() + 1) // 2 if name in self.tables else None
+                      for name in prepared.tables)
+        return self.catalog_version, tuple(self.settings.items()), sizes, workers
+
+    def _prepared_plan(self, prepared: Optional[PreparedStatement], make: Any, workers: Optional[int] = None) -> Any:
+        # The cached plan of `prepared`, or a new one from `make()` when there
+        # is none yet or it was made for another catalog, settings, sizes or
+        # number of workers
+        if prepared is None:
+            return make()
+        state = self._plan_state(prepared, workers)
+        if prepared.planned_for != state:
+            if prepared.planned_for is not None:
+                self.statement_cache.invalidations += 1
+            prepared.plan = make()
+            prepared.planned_for = state
+            # Compiled code is keyed by expression identity, which a new plan reuses
+            prepared.compiled = {}
+        return prepared.plan
+
+    def _execute_select(self, statement: Select, params: Any, prepared: Optional[PreparedStatement] = None,
+                        workers: Optional[int] = None) -> Cursor:
+        # The rows are produced as the result is read (see cursor.py)
+        plan = self._prepared_plan(prepared, lambda: plan_query(self, statement, params, workers), workers)
+        cls = self.row_class([name for _, name in plan.layout])
+        compiled = prepared.compiled if prepared is not None else {}
+        reader = self._snapshot().reader
+        batch_size, work_mem = self.settings['batch_size'], self.settings['work_mem']
+        # Host variables keep the values they had now; `locals()` returns
+        # the same dict, refreshed, every time it is called
+        if isinstance(params, (dict, list)):
+            params = params.copy()
+
+        def run() -> Iterator:
+            ctx = ExecutionContext(params, False, batch_size, work_mem)
+            ctx.snapshot = Snapshot(reader)
+            ctx.compiled = compiled
+            return starmap(cls, input_rows(plan, ctx))
+        tables = prepared.tables if prepared is not None else \
+            {node.name for node in walk(statement) if isinstance(node, TableRef)}
+        cursor = Cursor(run, tables)
+        cursors = self.cursors
+        cursors.append(weakref.ref(cursor))
+        if len(cursors) > self._cursors_limit:
+            self.materialize_cursors(None)
+        return cursor
+
+    def materialize_cursors(self, table_name: Optional[str]):
+        # Before `table_name` changes, results still reading it take all
+        # their rows; results gone or holding all of theirs are forgotten
+        live = []
+        for ref in self.cursors:
+            cursor = ref()
+            if cursor is None:
+                continue
+            if table_name in cursor.tables:
+                cursor.materialize()
+            if not cursor.settled:
+                live.append(ref)
+        self.cursors = live
+        self._cursors_limit = max(32, 2 * len(live))
+
+    def query_rows(self, select: Select, params: Any = None, tables: Optional[Dict[str, Table]] = None) -> Iterator[tuple]:
+        # The rows of `select` as tuples, as the current statement sees the
+        # tables; `tables` stands in for catalog tables (see views.py)
+        plan = plan_query(self, select, params, tables=tables)
+        return input_rows(plan, self._context(params))
+
+    def _context(self, params: Any, analyze: bool = False) -> ExecutionContext:
+        ctx = ExecutionContext(params, analyze, self.settings['batch_size'], self.settings['work_mem'])
+        ctx.snapshot = self._snapshot()
+        return ctx
+
+    def _snapshot(self) -> Snapshot:
+        # Outside a transaction a statement sees everything committed so far
+        transaction = self.transaction
+        return Snapshot(transaction if transaction is not None else Transaction(self.last_commit))
+
+    def _execute_explain(self, statement: Explain, params: Any, workers: Optional[int] = None) -> str:
+        if not isinstance(statement.statement, Select):
+            raise SQLError("EXPLAIN supports SELECT statements")
+        plan = plan_query(self, statement.statement, params, workers)
+        if not statement.analyze:
+            return '\n'.join(plan.explain())
+        start = time.perf_counter()
+        count = sum(map(len, plan.execute_batches(self._context(params, analyze=True))))
+        elapsed = (time.perf_counter() - start) * 1000
+        return '\n'.join(plan.explain(analyze=True) + [f"Execution time: {elapsed:.3f} ms ({count} rows)"])
+
+    def _execute_analyze(self, statement: Analyze, params: Any):
+        self.analyze(statement.table)
+
+    def _execute_insert(self, statement: Insert, params: Any) -> int:
+        table = self._target(statement.table)
+        rows = [[constant(expr, params) for expr in row] for row in statement.rows]
+        table.insert_many(rows, statement.columns)
+        return len(rows)
+
+    def _execute_copy(self, statement: Copy, params: Any) -> int:
+        # Stream a CSV or JSON Lines file into the table in batches (see bulk.py)
+        table = self._target(statement.table)
+        path = constant(statement.path, params)
+        if not isinstance(path, str):
+            raise SQLError("COPY FROM expects a file name")
+        count = 0
+        for batch in read_copy(path, table, statement.columns, statement.options):
+            count += len(table.insert_columns(batch))
+        return count
+
+    def _execute_update(self, statement: Update, params: Any,
+                        prepared: Optional[PreparedStatement] = None) -> int:
+        table = self._target(statement.table)
+        for column, _ in statement.assignments:
+            table.column(column)
+        view = self._snapshot().table(table)
+        rids = self._matching_rids(table, view, statement.alias, statement.where, params, prepared)
+        for rid in rids:
+            resolve = self._row_resolver(view, statement.alias, rid, params)
+            table.update(rid, {column: evaluate(expr, resolve, params) for column, expr in statement.assignments})
+        return len(rids)
+
+    def _execute_delete(self, statement: Delete, params: Any,
+                        prepared: Optional[PreparedStatement] = None) -> int:
+        table = self._target(statement.table)
+        view = self._snapshot().table(table)
+        rids = self._matching_rids(table, view, statement.alias, statement.where, params, prepared)
+        for rid in rids:
+            table.delete(rid)
+        return len(rids)
+
+    def _row_resolver(self, table: Any, alias: Optional[str], rid: int, params: Any):
+        def resolve(name: Name):
+            column = column_of(name, table, alias)
+            if column is None:
+                return host_value(name, params)
+            return table.columns[column].get(rid)
+        return resolve
+
+    def _matching_rids(self, table: Table, view: Any, alias: Optional[str], where: Any, params: Any,
+                       prepared: Optional[PreparedStatement] = None) -> List[int]:
+        # Rows of `view` (the table as the statement's snapshot sees it),
+        # collected up front so the statement never sees its own changes
+        if where is None:
+            return list(view.rids())
+        probe = self._prepared_plan(prepared, lambda: best_probe(table, alias, where))
+        if probe is not None and view is not table:
+            probe = replace(probe, index=view.indexes[probe.index.name])
+        # `WHERE id = x` or `WHERE created >= x`: probe an index instead of scanning
+        candidates = probe.rids(params) if probe is not None else view.rids()
+        return [rid for rid in candidates
+                if truthy(evaluate(where, self._row_resolver(view, alias, rid, params), params))]
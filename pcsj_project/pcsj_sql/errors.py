@@ -0,0 +1,14 @@
+"""Exceptions raised by the PCSJ SQL engine."""
+
+class SQLError(Exception):
+    pass
+
+class SQLSyntaxError(SQLError):
+    pass
+
+class IntegrityError(SQLError):
+    pass
+
+class SerializationError(SQLError):
+    # A concurrent transaction changed the same rows first; roll back and retry
+    pass
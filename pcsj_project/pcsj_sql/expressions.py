@@ -0,0 +1,171 @@
+"""Evaluation of SQL expression trees with SQL NULL semantics."""
+
+import datetime
+import math
+import re
+from typing import Any, Callable, Dict, Optional
+
+from .errors import SQLError
+from .nodes import (
+    Between, BinaryOp, ColumnRef, FuncCall, InList, IsNull, Like, Literal, Name, OuterRef, Param, SubPlan, UnaryOp,
+)
+
+def _compare(op: str, left: Any, right: Any):
+    if left is None or right is None:
+        return None
+    if op == '=':
+        return left == right
+    if op == '!=':
+        return left != right
+    if op == '<':
+        return left < right
+    if op == '<=':
+        return left <= right
+    if op == '>':
+        return left > right
+    return left >= right
+
+def _arithmetic(op: str, left: Any, right: Any):
+    if left is None or right is None:
+        return None
+    if op == '+':
+        return left + right
+    if op == '-':
+        return left - right
+    if op == '*':
+        return left * right
+    if op == '/':
+        if right == 0:
+            return None
+        return left / right
+    if op == '%':
+        return left % right if right != 0 else None
+    return f"{left}{right}" # ||
+
+def _to_date(value: Any) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+def _like_regex(pattern: str):
+    return re.compile('^' + ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern) + '$', re.S)
+
+SCALAR_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    'UPPER': lambda s: None if s is None else str(s).upper(),
+    'LOWER': lambda s: None if s is None else str(s).lower(),
+    'LENGTH': lambda s: None if s is None else len(s),
+    'ABS': lambda x: None if x is None else abs(x),
+    'ROUND': lambda x, digits=0: None if x is None else round(x, int(digits)),
+    'FLOOR': lambda x: None if x is None else math.floor(x),
+    'CEIL': lambda x: None if x is None else math.ceil(x),
+    'COALESCE': lambda *args: next((a for a in args if a is not None), None),
+    'NULLIF': lambda a, b: None if a == b else a,
+    'DATEDIFF': lambda end, start: None if end is None or start is None else (_to_date(end) - _to_date(start)).days,
+}
+
+AGGREGATE_FUNCTIONS = {'COUNT', 'SUM', 'AVG', 'MIN', 'MAX'}
+
+def truthy(value: Any) -> bool:
+    # WHERE keeps a row only when the predicate is true, not NULL
+    return value is not None and value is not False and value != 0
+
+def in_list(items: Any, negated: bool, value: Any) -> Optional[bool]:
+    # With no match, a NULL item leaves the answer unknown rather than false
+    if value is None:
+        return None
+    if value in items:
+        return not negated
+    if None in items:
+        return None
+    return negated
+
+# Nodes whose value comes from the current row (or an enclosing one) rather
+# than from the expression itself
+_RESOLVED = frozenset({Name, ColumnRef, OuterRef, SubPlan})
+
+def evaluate(expr: Any, resolve: Callable[[Any], Any], params: Any = None) -> Any:
+    # `resolve` maps a Name (or a bound ColumnRef/OuterRef/SubPlan) to its value for the current row
+    kind = type(expr)
+    if kind is Literal:
+        return expr.value
+    if kind in _RESOLVED:
+        return resolve(expr)
+    if kind is BinaryOp:
+        op = expr.op
+        if op == 'AND':
+            left = evaluate(expr.left, resolve, params)
+            if left is not None and not truthy(left):
+                return False
+            right = evaluate(expr.right, resolve, params)
+            if right is not None and not truthy(right):
+                return False
+            return None if left is None or right is None else True
+        if op == 'OR':
+            left = evaluate(expr.left, resolve, params)
+            if truthy(left):
+                return True
+            right = evaluate(expr.right, resolve, params)
+            if truthy(right):
+                return True
+            return None if left is None or right is None else False
+        left = evaluate(expr.left, resolve, params)
+        right = evaluate(expr.right, resolve, params)
+        if op in ('+', '-', '*', '/', '%', '||'):
+            return _arithmetic(op, left, right)
+        return _compare(op, left, right)
+    if kind is UnaryOp:
+        value = evaluate(expr.operand, resolve, params)
+        if value is None:
+            return None
+        return not truthy(value) if expr.op == 'NOT' else -value
+    if kind is Param:
+        try:
+            return params[expr.name]
+        except (KeyError, IndexError, TypeError):
+            raise SQLError(f"No value bound for parameter {expr.name!r}")
+    if kind is FuncCall:
+        function = SCALAR_FUNCTIONS.get(expr.name)
+        if function is None and expr.name in AGGREGATE_FUNCTIONS:
+            raise SQLError(f"Aggregate {expr.name}() is not allowed here")
+        if function is None:
+            raise SQLError(f"Unknown function {expr.name}()")
+        return function(*(evaluate(arg, resolve, params) for arg in expr.args))
+    if kind is InList:
+        value = evaluate(expr.operand, resolve, params)
+        if value is None:
+            return None
+        return in_list([evaluate(item, resolve, params) for item in expr.items], expr.negated, value)
+    if kind is Between:
+        value = evaluate(expr.operand, resolve, params)
+        low = evaluate(expr.low, resolve, params)
+        high = evaluate(expr.high, resolve, params)
+        if value is None or low is None or high is None:
+            return None
+        inside = low <= value <= high
+        return not inside if expr.negated else inside
+    if kind is IsNull:
+        is_null = evaluate(expr.operand, resolve, params) is None
+        return not is_null if expr.negated else is_null
+    if kind is Like:
+        value = evaluate(expr.operand, resolve, params)
+        pattern = evaluate(expr.pattern, resolve, params)
+        if value is None or pattern is None:
+            return None
+        matched = _like_regex(pattern).match(str(value)) is not None
+        return not matched if expr.negated else matched
+    raise SQLError(f"Cannot evaluate {type(expr).__name__} here")
+
+def host_value(name: Name, params: Any) -> Any:
+    # A name that is not a column refers to a PCSJ variable, e.g. `fromId` or `user.id`
+    if params is None or isinstance(params, (list, tuple)) or name.parts[0] not in params:
+        raise SQLError(f"Unknown column or variable '{name}'")
+    value = params[name.parts[0]]
+    for part in name.parts[1:]:
+        value = value[part] if isinstance(value, dict) else getattr(value, part)
+    return value
+
+def constant(expr: Any, params: Any = None) -> Any:
+    # Evaluate an expression that may only use literals, parameters and host variables
+    return evaluate(expr, lambda name: host_value(name, params), params)
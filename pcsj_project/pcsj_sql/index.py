@@ -0,0 +1,275 @@
+"""Indexes over table columns."""
+
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .errors import IntegrityError
+
+class HashIndex:
+    # Maps a column value (or a tuple for multi-column keys) to row ids.
+    # Unique indexes keep one rid per key, which is what PRIMARY KEY, UNIQUE
+    # and the parent side of FOREIGN KEY checks need for O(1) probes.
+    kind = 'hash'
+
+    def __init__(self, name: str, table_name: str, columns: Sequence[str], unique: bool = False):
+        self.name = name
+        self.table_name = table_name
+        self.columns = tuple(columns)
+        self.unique = unique
+        self.entries: Dict[Any, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self) -> str:
+        kind = 'unique ' if self.unique else ''
+        return f"HashIndex({self.name}: {kind}{self.table_name}({', '.join(self.columns)}))"
+
+    def key(self, row: Dict[str, Any]) -> Any:
+        if len(self.columns) == 1:
+            return row[self.columns[0]]
+        return tuple(row[name] for name in self.columns)
+
+    def check(self, key: Any, rid: Optional[int] = None):
+        # Raise if adding `key` for `rid` would break uniqueness
+        if not self.unique or key is None or (isinstance(key, tuple) and None in key):
+            return
+        existing = self.entries.get(key)
+        if existing is not None and existing != rid:
+            raise IntegrityError(f"Duplicate key {key!r} for {self.table_name}({', '.join(self.columns)})")
+
+    def check_many(self, keys: Sequence[Any]):
+        # check() for a batch of new rows, whose keys must also differ from each other
+        if not self.unique:
+            return
+        if len(self.columns) == 1:
+            present = [key for key in keys if key is not None]
+        else:
+            present = [key for key in keys if None not in key]
+        distinct = set(present)
+        if len(distinct) == len(present) and self.entries.keys().isdisjoint(distinct):
+            return
+        # There is a duplicate; find the first one for the message
+        entries, seen = self.entries, set()
+        for key in present:
+            if key in entries or key in seen:
+                raise IntegrityError(f"Duplicate key {key!r} for {self.table_name}({', '.join(self.columns)})")
+            seen.add(key)
+
+    def add(self, key: Any, rid: int):
+        if key is None or (isinstance(key, tuple) and None in key):
+            return # NULLs are never equal to anything, so they are not indexed
+        if self.unique:
+            self.check(key, rid)
+            self.entries[key] = rid
+        else:
+            self.entries.setdefault(key, []).append(rid)
+
+    def add_many(self, keys: Sequence[Any], rids: Sequence[int]):
+        # add() for a batch that passed check_many()
+        pairs = zip(keys, rids)
+        if len(self.columns) > 1:
+            pairs = ((key, rid) for key, rid in pairs if None not in key)
+        elif None in keys:
+            pairs = ((key, rid) for key, rid in pairs if key is not None)
+        if self.unique:
+            self.entries.update(pairs)
+        else:
+            entries = self.entries
+            for key, rid in pairs:
+                found = entries.get(key)
+                if found is None:
+                    entries[key] = [rid]
+                else:
+                    found.append(rid)
+
+    def remove(self, key: Any, rid: int):
+        if self.unique:
+            if self.entries.get(key) == rid:
+                del self.entries[key]
+            return
+        rids = self.entries.get(key)
+        if rids is not None:
+            try:
+                rids.remove(rid)
+            except ValueError:
+                return
+            if not rids:
+                del self.entries[key]
+
+    def lookup(self, key: Any) -> List[int]:
+        found = self.entries.get(key)
+        if found is None:
+            return []
+        return [found] if self.unique else list(found)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.entries
+
+    def build(self, items: Iterable[Tuple[Any, int]]):
+        for key, rid in items:
+            self.add(key, rid)
+
+# Ordered index keys are tuples of encoded components: (0,) for NULL and
+# (1, value) otherwise, so NULLs sort first and never get compared to values.
+# _HIGH sorts after every component and closes ranges over key prefixes.
+_NULL = (0,)
+_FIRST_VALUE = (1,)
+_HIGH = (2,)
+_NULL_KEY = (_NULL,)
+
+def encode_component(value: Any) -> tuple:
+    return _NULL if value is None else (1, value)
+
+class OrderedIndex:
+    # A sorted array of keys with a parallel array of row ids, searched with
+    # bisect. Serves equality on any prefix of its columns, a range on the
+    # column after that prefix, and rows in key order for ORDER BY.
+    kind = 'ordered'
+
+    def __init__(self, name: str, table_name: str, columns: Sequence[str], unique: bool = False):
+        self.name = name
+        self.table_name = table_name
+        self.columns = tuple(columns)
+        self.unique = unique
+        self.keys: List[tuple] = []
+        self.rids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __repr__(self) -> str:
+        kind = 'unique ' if self.unique else ''
+        return f"OrderedIndex({self.name}: {kind}{self.table_name}({', '.join(self.columns)}))"
+
+    def key(self, row: Dict[str, Any]) -> tuple:
+        return tuple(encode_component(row[name]) for name in self.columns)
+
+    def _encode(self, key: Any) -> tuple:
+        # Accept raw values (a scalar for one column, a tuple otherwise) or encoded keys
+        if not isinstance(key, tuple) or len(self.columns) == 1 and not (key and isinstance(key[0], tuple)):
+            key = (key,)
+        return tuple(part if isinstance(part, tuple) else encode_component(part) for part in key)
+
+    def check(self, key: Any, rid: Optional[int] = None):
+        if not self.unique:
+            return
+        key = self._encode(key)
+        if _NULL in key:
+            return
+        for existing in self._equal(key):
+            if existing != rid:
+                values = tuple(part[1] for part in key)
+                raise IntegrityError(f"Duplicate key {values if len(values) > 1 else values[0]!r} for {self.table_name}({', '.join(self.columns)})")
+
+    def _encode_many(self, keys: Sequence[Any]) -> List[tuple]:
+        # _encode() for raw keys of a batch
+        if len(self.columns) == 1:
+            return [_NULL_KEY if key is None else ((1, key),) for key in keys]
+        return [tuple([_NULL if part is None else (1, part) for part in key]) for key in keys]
+
+    def check_many(self, keys: Sequence[Any]):
+        # check() for a batch of new rows, whose keys must also differ from each other
+        if not self.unique:
+            return
+        seen = set()
+        for key in self._encode_many(keys):
+            if _NULL in key:
+                continue
+            if key in seen:
+                values = tuple(part[1] for part in key)
+                raise IntegrityError(f"Duplicate key {values if len(values) > 1 else values[0]!r} for {self.table_name}({', '.join(self.columns)})")
+            self.check(key)
+            seen.add(key)
+
+    def add(self, key: Any, rid: int):
+        key = self._encode(key)
+        self.check(key, rid)
+        position = bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.rids.insert(position, rid)
+
+    def add_many(self, keys: Sequence[Any], rids: Sequence[int]):
+        # add() for a batch that passed check_many(): a few keys are inserted
+        # one by one, more are sorted and merged in one pass
+        keys = self._encode_many(keys)
+        if len(keys) * 8 < len(self.keys):
+            for key, rid in zip(keys, rids):
+                position = bisect_right(self.keys, key)
+                self.keys.insert(position, key)
+                self.rids.insert(position, rid)
+            return
+        added = sorted(zip(keys, rids))
+        pairs = list(heapq.merge(zip(self.keys, self.rids), added))
+        self.keys = [key for key, _ in pairs]
+        self.rids = [rid for _, rid in pairs]
+
+    def remove(self, key: Any, rid: int):
+        key = self._encode(key)
+        start = bisect_left(self.keys, key)
+        end = bisect_right(self.keys, key, start)
+        for position in range(start, end):
+            if self.rids[position] == rid:
+                del self.keys[position]
+                del self.rids[position]
+                return
+
+    def build(self, items: Iterable[Tuple[Any, int]]):
+        pairs = sorted([(self._encode(key), rid) for key, rid in items] + list(zip(self.keys, self.rids)))
+        self.keys = [key for key, _ in pairs]
+        self.rids = [rid for _, rid in pairs]
+        if self.unique:
+            for previous, current in zip(self.keys, self.keys[1:]):
+                if previous == current and _NULL not in current:
+                    raise IntegrityError(f"Duplicate key for unique index {self.name}")
+
+    def _equal(self, key: tuple) -> List[int]:
+        start = bisect_left(self.keys, key)
+        return self.rids[start:bisect_left(self.keys, key + (_HIGH,), start)]
+
+    def lookup(self, key: Any) -> List[int]:
+        key = self._encode(key)
+        if _NULL in key:
+            return []
+        return self._equal(key)
+
+    def __contains__(self, key: Any) -> bool:
+        return bool(self.lookup(key))
+
+    def prefix(self, values: Sequence[Any]) -> List[int]:
+        # Rows whose leading columns equal `values`, whatever the rest holds
+        base = tuple(encode_component(value) for value in values)
+        if _NULL in base:
+            return []
+        return self._equal(base)
+
+    def range(self, prefix: Sequence[Any] = (), low: Any = None, high: Any = None,
+              low_inclusive: bool = True, high_inclusive: bool = True, descending: bool = False) -> List[int]:
+        # Rows whose leading columns equal `prefix` and whose next column lies
+        # between low and high (None = unbounded; NULLs never match a bound)
+        base = tuple(encode_component(value) for value in prefix)
+        if len(base) > len(self.columns) or _NULL in base:
+            return []
+        if len(base) == len(self.columns) or low is None and high is None:
+            # No bound on the next column, so its NULLs belong in the result too
+            rids = self._equal(base)
+            return rids[::-1] if descending else rids
+        if low is None:
+            start = bisect_left(self.keys, base + (_FIRST_VALUE,))
+        elif low_inclusive:
+            start = bisect_left(self.keys, base + ((1, low),))
+        else:
+            start = bisect_left(self.keys, base + ((1, low), _HIGH))
+        if high is None:
+            end = bisect_left(self.keys, base + (_HIGH,), start)
+        elif high_inclusive:
+            end = bisect_left(self.keys, base + ((1, high), _HIGH), start)
+        else:
+            end = bisect_left(self.keys, base + ((1, high),), start)
+        rids = self.rids[start:max(start, end)]
+        return rids[::-1] if descending else rids
+
+    def scan(self, descending: bool = False) -> List[int]:
+        # Every row id in key order (NULLs first), for ORDER BY without sorting
+        return self.rids[::-1] if descending else list(self.rids)
@@ -0,0 +1,266 @@
+"""Multi-version concurrency control for pcsj_sql transactions.
+
+Tables are changed in place, so storage always holds the newest version of
+every row, including changes that are not committed yet. Changes made in a
+BEGIN ... COMMIT transaction, or while one is open, also keep the row as it
+was before (a version) together with the transaction that made it.
+
+A statement reads through a `Snapshot`: rows whose newest change it must
+not see, made by a transaction that is still open or that committed after
+the reader's snapshot was taken, are read from their versions instead.
+Readers never wait for writers, and tables without versions are read
+straight from storage.
+
+Writers do not wait either. Changing a row whose newest version belongs to
+a transaction that is still open, or that committed after the writer's
+snapshot, raises SerializationError: the first transaction to commit a row
+wins, and the other is expected to roll back and retry.
+
+Versions are dropped once every open transaction's snapshot includes the
+change they were kept for.
+"""
+
+import heapq
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .index import encode_component
+
+class Transaction:
+    __slots__ = ('snapshot', 'commit_number', 'open', 'explicit', 'versioned', 'undo_log')
+
+    def __init__(self, snapshot: int, explicit: bool = False, versioned: bool = False):
+        # Number of the last commit this transaction sees
+        self.snapshot = snapshot
+        # Set by COMMIT; stays None for rolled back and read-only transactions
+        self.commit_number: Optional[int] = None
+        self.open = True
+        # BEGIN TRANSACTION, as opposed to a single autocommit statement
+        self.explicit = explicit
+        # Whether changes keep versions; only needed while other transactions are open
+        self.versioned = versioned
+        self.undo_log: list = []
+
+    def sees(self, writer: 'Transaction') -> bool:
+        return writer is self or writer.commit_number is not None and writer.commit_number <= self.snapshot
+
+# visible_version() result for rows whose stored values are the visible ones
+CURRENT = object()
+
+def visible_version(versions: List[tuple], reader: Transaction) -> Any:
+    # The row as `reader` sees it: CURRENT, None if it does not exist for
+    # the reader, or the values of an older version. `versions` holds
+    # (writer, values before the change) pairs, oldest first.
+    state = CURRENT
+    snapshot = reader.snapshot
+    for writer, before in reversed(versions):
+        if writer is reader or writer.commit_number is not None and writer.commit_number <= snapshot:
+            break
+        state = before
+    return state
+
+class Snapshot:
+    # What one statement reads: tables as `reader` sees them. Views are made
+    # on first use and kept for the rest of the statement.
+    def __init__(self, reader: Transaction):
+        self.reader = reader
+        self.views: Dict[str, Any] = {}
+
+    def table(self, table: Any) -> Any:
+        if not table.versions:
+            return table
+        view = self.views.get(table.name)
+        if view is None:
+            view = self.views[table.name] = TableView(table, self.reader)
+        return view
+
+class ColumnView:
+    __slots__ = ('view', 'column', 'position')
+
+    def __init__(self, view: 'TableView', column: Any, position: int):
+        self.view = view
+        self.column = column
+        self.position = position
+
+    def get(self, rid: int) -> Any:
+        view = self.view
+        if rid in view.table.versions:
+            row = view.state(rid)
+            if row is not CURRENT:
+                return row[self.position]
+        return self.column.get(rid)
+
+class TableView:
+    # The read side of a Table as `reader` sees it. Rows with versions are
+    # resolved when first read (all of them at once for scans); every other
+    # row is read from storage.
+    def __init__(self, table: Any, reader: Transaction):
+        self.table = table
+        self.reader = reader
+        self.name = table.name
+        self.column_names = table.column_names
+        self.states: Dict[int, Any] = {}
+        self._overrides: Optional[Dict[int, Optional[tuple]]] = None
+        self.columns = {name: ColumnView(self, table.columns[name], position)
+                        for position, name in enumerate(table.column_names)}
+        self.indexes = {name: IndexView(index, self) for name, index in table.indexes.items()}
+
+    def state(self, rid: int) -> Any:
+        # visible_version() of one row, remembered for the rest of the statement
+        state = self.states.get(rid, self)
+        if state is self:
+            versions = self.table.versions.get(rid)
+            state = self.states[rid] = CURRENT if versions is None else visible_version(versions, self.reader)
+        return state
+
+    @property
+    def overrides(self) -> Dict[int, Optional[tuple]]:
+        # Every row the reader sees differently from storage: its older
+        # values, or None for rows it does not see at all
+        if self._overrides is None:
+            reader = self.reader
+            snapshot = reader.snapshot
+            overrides = {}
+            for rid, versions in self.table.versions.items():
+                # Most rows' newest change is already visible; check that inline
+                writer = versions[-1][0]
+                if writer is reader or writer.commit_number is not None and writer.commit_number <= snapshot:
+                    continue
+                state = self.state(rid)
+                if state is not CURRENT:
+                    overrides[rid] = state
+            self._overrides = overrides
+        return self._overrides
+
+    def __len__(self) -> int:
+        table, overrides = self.table, self.overrides
+        stored = sum(1 for rid in overrides if table.is_live(rid))
+        return len(table) - stored + sum(1 for row in overrides.values() if row is not None)
+
+    def __repr__(self) -> str:
+        return f"TableView({self.name}, {len(self)} rows)"
+
+    def column(self, name: str) -> ColumnView:
+        self.table.column(name)
+        return self.columns[name]
+
+    def rids(self) -> Iterator[int]:
+        overrides = self.overrides
+        if not overrides:
+            return self.table.rids()
+        older = sorted(rid for rid, row in overrides.items() if row is not None)
+        return heapq.merge((rid for rid in self.table.rids() if rid not in overrides), older)
+
+    def is_live(self, rid: int) -> bool:
+        row = self.state(rid)
+        return self.table.is_live(rid) if row is CURRENT else row is not None
+
+    def get(self, rid: int, column_names: Optional[Sequence[str]] = None) -> tuple:
+        return tuple(self.columns[name].get(rid) for name in column_names or self.column_names)
+
+    def row_dict(self, rid: int) -> Dict[str, Any]:
+        return dict(zip(self.column_names, self.get(rid)))
+
+    def column_values(self, name: str) -> Iterable[Any]:
+        if not self.overrides:
+            return self.table.column_values(name)
+        get = self.column(name).get
+        return [get(rid) for rid in self.rids()]
+
+    def column_chunks(self, name: str, size: int) -> Iterator[Sequence[Any]]:
+        if not self.overrides:
+            return self.table.column_chunks(name, size)
+        return self._chunks(self.column_values(name), size)
+
+    @staticmethod
+    def _chunks(values: Iterable[Any], size: int) -> Iterator[List[Any]]:
+        values = iter(values)
+        while True:
+            chunk = list(islice(values, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def scan(self, column_names: Optional[Sequence[str]] = None) -> Iterator[tuple]:
+        if not self.overrides:
+            return self.table.scan(column_names)
+        getters = [self.column(name).get for name in column_names or self.column_names]
+        return (tuple([get(rid) for get in getters]) for rid in list(self.rids()))
+
+class IndexView:
+    # An index as a snapshot sees it. Rows the reader sees older versions of
+    # keep their entries, since their key is the same (the table's `moved`
+    # rows aside); rows it does not see at all are skipped. Older versions of
+    # moved rows come from a small index of the same kind, merged in key order.
+    def __init__(self, index: Any, view: TableView):
+        self.index = index
+        self.view = view
+        self.name = index.name
+        self.table_name = index.table_name
+        self.columns = index.columns
+        self.unique = index.unique
+        self.kind = index.kind
+        self._older: Any = None
+
+    @property
+    def older(self) -> Any:
+        # Older versions of moved rows, indexed on first use
+        if self._older is not None:
+            return self._older
+        index, view = self.index, self.view
+        positions = [view.column_names.index(name) for name in self.columns]
+        rows = []
+        for rid in view.table.moved:
+            row = view.state(rid)
+            if row is not CURRENT and row is not None:
+                rows.append((rid, row))
+        older = self._older = type(index)(index.name, index.table_name, index.columns)
+        if self.kind == 'hash':
+            # Filled directly: these few keys need none of add()'s checks
+            entries = older.entries
+            for rid, row in rows:
+                key = row[positions[0]] if len(positions) == 1 else tuple([row[i] for i in positions])
+                if key is not None and not (isinstance(key, tuple) and None in key):
+                    entries.setdefault(key, []).append(rid)
+        else:
+            older.build((tuple([encode_component(row[i]) for i in positions]), rid) for rid, row in rows)
+        return older
+
+    def key(self, row: Dict[str, Any]) -> Any:
+        return self.index.key(row)
+
+    def _sort_key(self, rid: int) -> tuple:
+        return tuple(encode_component(self.view.columns[name].get(rid)) for name in self.columns)
+
+    def _merge(self, stored: List[int], older: List[int], descending: bool = False) -> List[int]:
+        view = self.view
+        versions, moved = view.table.versions, view.table.moved
+        kept = []
+        for rid in stored:
+            if rid in versions:
+                row = view.state(rid)
+                if row is None or row is not CURRENT and rid in moved:
+                    continue
+            kept.append(rid)
+        if not older:
+            return kept
+        if self.kind == 'hash':
+            return kept + older
+        return list(heapq.merge(kept, older, key=self._sort_key, reverse=descending))
+
+    def lookup(self, key: Any) -> List[int]:
+        return self._merge(self.index.lookup(key), self.older.lookup(key))
+
+    def __contains__(self, key: Any) -> bool:
+        return bool(self.lookup(key))
+
+    def prefix(self, values: Sequence[Any]) -> List[int]:
+        return self._merge(self.index.prefix(values), self.older.prefix(values))
+
+    def range(self, prefix: Sequence[Any] = (), low: Any = None, high: Any = None,
+              low_inclusive: bool = True, high_inclusive: bool = True, descending: bool = False) -> List[int]:
+        bounds = (prefix, low, high, low_inclusive, high_inclusive, descending)
+        return self._merge(self.index.range(*bounds), self.older.range(*bounds), descending)
+
+    def scan(self, descending: bool = False) -> List[int]:
+        return self._merge(self.index.scan(descending), self.older.scan(descending), descending)
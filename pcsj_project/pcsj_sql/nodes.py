@@ -0,0 +1,265 @@
+"""Syntax tree for the PCSJ SQL dialect."""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# --- Expressions ----------------------------------------------------------------
+
+@dataclass
+class Literal:
+    value: Any
+
+@dataclass
+class Name:
+    # A bare or qualified identifier. Whether it is a column or a PCSJ host
+    # variable (e.g. `fromId`) is only known once the FROM clause is resolved.
+    parts: Tuple[str, ...]
+
+    @property
+    def column(self) -> str:
+        return self.parts[-1]
+
+    @property
+    def qualifier(self) -> Optional[str]:
+        return self.parts[0] if len(self.parts) > 1 else None
+
+    def __str__(self) -> str:
+        return '.'.join(self.parts)
+
+@dataclass
+class Param:
+    # `?` (positional) or `:name` placeholder
+    name: Any
+
+@dataclass
+class UnaryOp:
+    op: str
+    operand: Any
+
+@dataclass
+class BinaryOp:
+    op: str
+    left: Any
+    right: Any
+
+@dataclass
+class FuncCall:
+    name: str
+    args: List[Any]
+    distinct: bool = False
+    star: bool = False # COUNT(*)
+
+@dataclass
+class WindowSpec:
+    partition_by: List[Any] = field(default_factory=list)
+    order_by: List['OrderItem'] = field(default_factory=list)
+    # ROWS frame as (start, end) row offsets from the current row, negative
+    # for PRECEDING and None for UNBOUNDED; None for the default frame
+    frame: Optional[Tuple[Optional[int], Optional[int]]] = None
+
+@dataclass
+class WindowFunction:
+    # `name(args) OVER (window)`: ROW_NUMBER, RANK, DENSE_RANK, LAG, LEAD or an aggregate
+    name: str
+    args: List[Any]
+    window: WindowSpec
+    star: bool = False # COUNT(*) OVER (...)
+
+@dataclass
+class InList:
+    operand: Any
+    items: List[Any]
+    negated: bool = False
+
+@dataclass
+class Between:
+    operand: Any
+    low: Any
+    high: Any
+    negated: bool = False
+
+@dataclass
+class IsNull:
+    operand: Any
+    negated: bool = False
+
+@dataclass
+class Like:
+    operand: Any
+    pattern: Any
+    negated: bool = False
+
+@dataclass
+class Star:
+    qualifier: Optional[str] = None
+
+@dataclass
+class Subquery:
+    # Scalar `(SELECT ...)` inside an expression
+    select: Any
+
+@dataclass
+class InSubquery:
+    operand: Any
+    select: Any
+    negated: bool = False
+
+@dataclass
+class Exists:
+    select: Any
+    negated: bool = False
+
+# --- Bound expressions (produced by the planner) ----------------------------------
+
+@dataclass
+class ColumnRef:
+    # Slot `index` of the row produced by the operator below
+    index: int
+    name: str = field(default='', compare=False)
+
+@dataclass
+class OuterRef:
+    # Slot of the row of an enclosing query, `depth` levels up (correlated subqueries)
+    depth: int
+    index: int
+    name: str = field(default='', compare=False)
+
+@dataclass
+class SubPlan:
+    # A planned subquery: kind is 'scalar', 'in' or 'exists'
+    kind: str
+    plan: Any = field(compare=False)
+    operand: Any = None
+    negated: bool = False
+    correlated: bool = False
+
+# --- Statements -----------------------------------------------------------------
+
+@dataclass
+class ColumnDef:
+    name: str
+    type: str
+    primary_key: bool = False
+    not_null: bool = False
+    unique: bool = False
+    references: Optional[Tuple[str, str]] = None # (table, column)
+
+@dataclass
+class CreateTable:
+    name: str
+    columns: List[ColumnDef]
+
+@dataclass
+class SelectItem:
+    expr: Any
+    alias: Optional[str] = None
+
+@dataclass
+class OrderItem:
+    expr: Any
+    descending: bool = False
+
+@dataclass
+class TableRef:
+    name: str
+    alias: Optional[str] = None
+
+@dataclass
+class SubqueryRef:
+    # `(SELECT ...) alias` in a FROM clause
+    select: Any
+    alias: str
+
+@dataclass
+class Join:
+    kind: str # 'INNER', 'LEFT', 'SEMI', 'ANTI' or 'CROSS'
+    left: Any
+    right: Any
+    condition: Any = None
+
+@dataclass
+class Select:
+    items: List[SelectItem]
+    source: Any = None # TableRef, SubqueryRef or Join tree
+    where: Any = None
+    group_by: List[Any] = field(default_factory=list)
+    having: Any = None
+    order_by: List[OrderItem] = field(default_factory=list)
+    limit: Any = None
+    offset: Any = None
+    distinct: bool = False
+    ctes: List[Tuple[str, Any]] = field(default_factory=list) # WITH name AS (SELECT ...)
+
+@dataclass
+class Explain:
+    statement: Any
+    analyze: bool = False # EXPLAIN ANALYZE runs the statement
+
+@dataclass
+class Analyze:
+    table: Optional[str] = None # None: every table
+
+@dataclass
+class CreateIndex:
+    name: str
+    table: str
+    columns: List[str]
+    unique: bool = False
+    using: str = 'ordered' # or 'hash'
+
+@dataclass
+class DropIndex:
+    name: str
+
+@dataclass
+class CreateView:
+    # CREATE MATERIALIZED VIEW name AS SELECT ...
+    name: str
+    select: Select
+
+@dataclass
+class RefreshView:
+    name: str
+
+@dataclass
+class DropView:
+    name: str
+
+@dataclass
+class Insert:
+    table: str
+    columns: Optional[List[str]]
+    rows: List[List[Any]] = field(default_factory=list)
+
+@dataclass
+class Copy:
+    # COPY table [(columns)] FROM 'file' [WITH (FORMAT csv, HEADER true, ...)]
+    table: str
+    columns: Optional[List[str]]
+    path: Any # expression: a string literal, parameter or host variable
+    options: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class Update:
+    table: str
+    assignments: List[Tuple[str, Any]]
+    where: Any = None
+    alias: Optional[str] = None
+
+@dataclass
+class Delete:
+    table: str
+    where: Any = None
+    alias: Optional[str] = None
+
+@dataclass
+class Begin:
+    pass
+
+@dataclass
+class Commit:
+    pass
+
+@dataclass
+class Rollback:
+    pass
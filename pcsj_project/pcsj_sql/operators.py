@@ -0,0 +1,1431 @@
+"""Physical query operators.
+
+Operators hand rows to the operator above either one tuple at a time
+(`execute`) or as column batches (`execute_batches`). Scans, filters,
+projections, aggregation, hash joins and limits work on batches, so their
+expressions are evaluated a column at a time; the rest stay row-at-a-time
+and convert at the boundary. Row-at-a-time filters, join conditions and sort
+keys use functions generated by the expression compiler.
+"""
+
+import heapq
+import sys
+import time
+from dataclasses import replace
+from itertools import chain, islice, repeat
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .errors import SQLError
+from .expressions import evaluate, host_value, truthy
+from .nodes import (
+    Between, BinaryOp, ColumnRef, FuncCall, InList, IsNull, Like, Literal, Name, OuterRef, Param, SubPlan, UnaryOp,
+    WindowFunction,
+)
+from .compiler import CompiledExpressions
+from .spill import DEFAULT_WORK_MEM, HashPartitions, SpillFile
+from .vector import DEFAULT_BATCH_SIZE, Batch, BatchEvaluator, from_storage, to_list
+
+class ExecutionContext:
+    def __init__(self, params: Any = None, analyze: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                 work_mem: Optional[int] = DEFAULT_WORK_MEM):
+        self.params = params
+        # EXPLAIN ANALYZE: count rows and time every operator
+        self.analyze = analyze
+        # Rows per column batch passed between batch operators
+        self.batch_size = max(int(batch_size), 1)
+        # Bytes of state an operator may hold before spilling to disk; None for no limit
+        self.work_mem = work_mem
+        # Rows of the enclosing queries while a correlated subquery runs, innermost last
+        self.outer: List[tuple] = []
+        # Results of uncorrelated subqueries, computed once per statement
+        self.subquery_results: Dict[int, Any] = {}
+        # Batches of materialized CTEs, computed once per statement
+        self.cte_results: Dict[int, List[Batch]] = {}
+        # Generated code for the statement's expressions (see compiler.py)
+        self.compiled: Dict[tuple, Any] = {}
+        # The transaction snapshot tables are read through (see mvcc.py); None reads storage
+        self.snapshot: Any = None
+
+    def table(self, table: Any) -> Any:
+        # `table` as this statement's snapshot sees it
+        return table if self.snapshot is None else self.snapshot.table(table)
+
+class RowEnv:
+    # The `resolve` callback for bound expressions over the current row
+    __slots__ = ('row', 'ctx')
+
+    def __init__(self, ctx: ExecutionContext, row: Optional[tuple] = None):
+        self.ctx = ctx
+        self.row = row
+
+    def __call__(self, node: Any) -> Any:
+        kind = type(node)
+        if kind is ColumnRef:
+            return self.row[node.index]
+        if kind is OuterRef:
+            return self.ctx.outer[-node.depth][node.index]
+        if kind is SubPlan:
+            return self.subquery(node)
+        return host_value(node, self.ctx.params)
+
+    def subquery(self, node: SubPlan) -> Any:
+        ctx = self.ctx
+        key = id(node)
+        if node.correlated or key not in ctx.subquery_results:
+            ctx.outer.append(self.row)
+            try:
+                rows = node.plan.execute(ctx)
+                if node.kind == 'exists':
+                    result = next(iter(rows), None) is not None
+                elif node.kind == 'scalar':
+                    first = list(islice(rows, 2))
+                    if len(first) > 1:
+                        raise SQLError("Scalar subquery returned more than one row")
+                    result = first[0][0] if first else None
+                else:
+                    values = {row[0] for row in rows}
+                    result = (values, None in values)
+            finally:
+                ctx.outer.pop()
+            if not node.correlated:
+                ctx.subquery_results[key] = result
+        else:
+            result = ctx.subquery_results[key]
+        if node.kind == 'exists':
+            return result != node.negated
+        if node.kind == 'scalar':
+            return result
+        value = evaluate(node.operand, self, ctx.params)
+        values, has_null = result
+        if value is None:
+            return None
+        if value in values:
+            return not node.negated
+        # `x IN (1, NULL)` is unknown, not false, when x is not 1
+        return None if has_null else node.negated
+
+def _format_frame_bound(offset: Optional[int], unbounded: str) -> str:
+    if offset is None:
+        return f"UNBOUNDED {unbounded}"
+    if offset == 0:
+        return 'CURRENT ROW'
+    return f"{abs(offset)} {'PRECEDING' if offset < 0 else 'FOLLOWING'}"
+
+def _format_window(window: Any) -> str:
+    parts = []
+    if window.partition_by:
+        parts.append(f"PARTITION BY {', '.join(map(format_expr, window.partition_by))}")
+    if window.order_by:
+        parts.append('ORDER BY ' + ', '.join(f"{format_expr(item.expr)}{' DESC' if item.descending else ''}"
+                                             for item in window.order_by))
+    if window.frame is not None:
+        start, end = window.frame
+        parts.append(f"ROWS BETWEEN {_format_frame_bound(start, 'PRECEDING')} AND {_format_frame_bound(end, 'FOLLOWING')}")
+    return ' '.join(parts)
+
+def format_expr(expr: Any) -> str:
+    # Compact SQL-ish text for EXPLAIN
+    kind = type(expr)
+    if kind is ColumnRef or kind is OuterRef:
+        return expr.name or f"${expr.index}"
+    if kind is Name:
+        return str(expr)
+    if kind is Literal:
+        return 'NULL' if expr.value is None else repr(expr.value)
+    if kind is Param:
+        return '?' if isinstance(expr.name, int) else f":{expr.name}"
+    if kind is BinaryOp:
+        return f"({format_expr(expr.left)} {expr.op} {format_expr(expr.right)})"
+    if kind is UnaryOp:
+        return f"{expr.op} {format_expr(expr.operand)}" if expr.op == 'NOT' else f"-{format_expr(expr.operand)}"
+    if kind is FuncCall:
+        args = '*' if expr.star else ', '.join(format_expr(arg) for arg in expr.args)
+        return f"{expr.name}({'DISTINCT ' if expr.distinct else ''}{args})"
+    if kind is WindowFunction:
+        args = '*' if expr.star else ', '.join(format_expr(arg) for arg in expr.args)
+        return f"{expr.name}({args}) OVER ({_format_window(expr.window)})"
+    if kind is InList:
+        return f"{format_expr(expr.operand)} {'NOT ' if expr.negated else ''}IN ({', '.join(map(format_expr, expr.items))})"
+    if kind is Between:
+        return f"{format_expr(expr.operand)} {'NOT ' if expr.negated else ''}BETWEEN {format_expr(expr.low)} AND {format_expr(expr.high)}"
+    if kind is IsNull:
+        return f"{format_expr(expr.operand)} IS {'NOT ' if expr.negated else ''}NULL"
+    if kind is Like:
+        return f"{format_expr(expr.operand)} {'NOT ' if expr.negated else ''}LIKE {format_expr(expr.pattern)}"
+    if kind is SubPlan:
+        label = {'scalar': 'SubPlan', 'in': 'IN SubPlan', 'exists': 'EXISTS SubPlan'}[expr.kind]
+        prefix = f"{format_expr(expr.operand)} " if expr.operand is not None else ''
+        return f"{prefix}{'NOT ' if expr.negated else ''}{label}"
+    return type(expr).__name__
+
+class Operator:
+    label = 'Operator'
+
+    def __init__(self, layout: List[Tuple[Optional[str], str]], children: Sequence['Operator'] = (),
+                 rows: float = 0.0, cost: float = 0.0):
+        # (qualifier, column name) for every slot of the rows this operator yields
+        self.layout = layout
+        self.children = list(children)
+        self.estimated_rows = rows
+        self.cost = cost
+        # Layout slots the output is sorted on (ascending), when known
+        self.sorted_by: List[int] = []
+        self.actual_rows = 0
+        self.loops = 0
+        self.elapsed = 0.0
+
+    def execute(self, ctx: ExecutionContext) -> Iterator[tuple]:
+        if ctx.analyze:
+            return self._instrumented(self.rows(ctx), lambda row: 1)
+        return self.rows(ctx)
+
+    def execute_batches(self, ctx: ExecutionContext) -> Iterator[Batch]:
+        if ctx.analyze:
+            return self._instrumented(self.batches(ctx), len)
+        return self.batches(ctx)
+
+    def rows(self, ctx: ExecutionContext) -> Iterator[tuple]:
+        raise NotImplementedError
+
+    def batches(self, ctx: ExecutionContext) -> Iterator[Batch]:
+        # Row-at-a-time operators hand their rows up in column batches
+        width = len(self.layout)
+        size = ctx.batch_size
+        source = self.rows(ctx)
+        while True:
+            chunk = list(islice(source, size))
+            if not chunk:
+                return
+            yield Batch.from_rows(chunk, width)
+
+    def _instrumented(self, source: Iterator[Any], count) -> Iterator[Any]:
+        # Time spent producing each row or batch, including the operators below
+        self.loops += 1
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(source)
+            except StopIteration:
+                self.elapsed += clock() - start
+                return
+            self.elapsed += clock() - start
+            self.actual_rows += count(item)
+            yield item
+
+    def detail(self) -> str:
+        return ''
+
+    def explain(self, analyze: bool = False, depth: int = 0) -> List[str]:
+        line = f"{'  ' * depth}{'-> ' if depth else ''}{self.label}{self.detail()}"
+        line += f"  (cost={self.cost:.1f} rows={self.estimated_rows:.0f})"
+        if analyze:
+            if self.loops:
+                line += f" (actual rows={self.actual_rows / self.loops:.0f} loops={self.loops} time={self.elapsed * 1000:.3f} ms)"
+            else:
+                line += " (never executed)"
+        lines = [line]
+        for number, subplan in enumerate(self.subplans(), 1):
+            lines.append(f"{'  ' * (depth + 1)}SubPlan {number}{' (correlated)' if subplan.correlated else ''}")
+            lines.extend(subplan.plan.explain(analyze, depth + 2))
+        for child in self.children:
+            lines.extend(child.explain(analyze, depth + 1))
+        return lines
+
+    def subplans(self) -> List[SubPlan]:
+        # Subqueries evaluated by this operator's own expressions
+        found: List[SubPlan] = []
+        def visit(value):
+            if type(value) is SubPlan:
+                found.append(value)
+                visit(value.operand)
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    visit(item)
+            elif hasattr(value, '__dataclass_fields__'):
+                for name in value.__dataclass_fields__:
+                    visit(getattr(value, name))
+        for name, value in vars(self).items():
+            if name not in ('children', 'layout'):
+                visit(value)
+        return found
+
+class BatchOperator(Operator):
+    # Operators that work on column batches; their rows come from those batches
+    def rows(self, ctx):
+        for batch in self.batches(ctx):
+            yield from batch.rows()
+
+    def batches(self, ctx):
+        raise NotImplementedError
+
+def input_rows(child: Operator, ctx: ExecutionContext) -> Iterator[tuple]:
+    # Rows of a child read through its batch interface
+    for batch in child.execute_batches(ctx):
+        yield from batch.rows()
+
+def _evaluator(ctx: ExecutionContext) -> BatchEvaluator:
+    return BatchEvaluator(RowEnv(ctx), ctx.params, ctx.compiled)
+
+def _compiled(ctx: ExecutionContext) -> CompiledExpressions:
+    return CompiledExpressions(RowEnv(ctx), ctx.params, ctx.compiled)
+
+def _filtered_batches(source: Iterator[Batch], predicate: Any, ctx: ExecutionContext) -> Iterator[Batch]:
+    evaluator = _evaluator(ctx)
+    for batch in source:
+        positions = evaluator.selection(predicate, batch)
+        if positions:
+            yield batch.take(positions)
+
+def _filtered(source: Iterator[tuple], predicate: Any, ctx: ExecutionContext) -> Iterator[tuple]:
+    run = _compiled(ctx).row_filter(predicate)
+    if run is not None:
+        return run(source)
+    return _interpreted_filter(source, predicate, ctx)
+
+def _interpreted_filter(source: Iterator[tuple], predicate: Any, ctx: ExecutionContext) -> Iterator[tuple]:
+    env = RowEnv(ctx)
+    params = ctx.params
+    for row in source:
+        env.row = row
+        if truthy(evaluate(predicate, env, params)):
+            yield row
+
+class Result(Operator):
+    # SELECT without FROM: one empty row
+    label = 'Result'
+
+    def __init__(self):
+        super().__init__([], rows=1, cost=0.0)
+
+    def rows(self, ctx):
+        yield ()
+
+class SeqScan(Operator):
+    label = 'Seq Scan'
+
+    def __init__(self, table: Any, alias: str, columns: List[str], predicate: Any = None, **estimates):
+        super().__init__([(alias, name) for name in columns], **estimates)
+        self.table = table
+        self.alias = alias
+        self.columns = columns
+        self.predicate = predicate
+
+    def detail(self) -> str:
+        text = f" on {self.table.name}" + (f" {self.alias}" if self.alias != self.table.name else '')
+        if self.predicate is not None:
+            text += f" filter: {format_expr(self.predicate)}"
+        return text
+
+    def rows(self, ctx):
+        # Only the referenced columns are read
+        table = ctx.table(self.table)
+        if self.columns:
+            source = table.scan(self.columns)
+        else:
+            source = repeat((), len(table))
+        if self.predicate is None:
+            return source
+        return _filtered(source, self.predicate, ctx)
+
+    def batches(self, ctx):
+        # Column slices straight from storage, filtered a batch at a time
+        size = ctx.batch_size
+        table = ctx.table(self.table)
+        if self.columns:
+            chunks = zip(*[table.column_chunks(name, size) for name in self.columns])
+            source = (Batch([from_storage(chunk) for chunk in columns], len(columns[0])) for columns in chunks)
+        else:
+            count = len(table)
+            source = (Batch([], min(size, count - start)) for start in range(0, count, size))
+        if self.predicate is None:
+            return source
+        return _filtered_batches(source, self.predicate, ctx)
+
+class IndexScan(Operator):
+    label = 'Index Scan'
+
+    def __init__(self, table: Any, alias: str, columns: List[str], probe: Any = None, index: Any = None,
+                 predicate: Any = None, descending: bool = False, **estimates):
+        # `probe` narrows the rows with a bound IndexProbe; without one the
+        # whole `index` is walked in key order (for ORDER BY)
+        super().__init__([(alias, name) for name in columns], **estimates)
+        self.table = table
+        self.alias = alias
+        self.columns = columns
+        self.probe = probe
+        self.index = probe.index if probe is not None else index
+        self.predicate = predicate
+        self.descending = descending
+        if self.index.kind == 'ordered' and not descending and (probe is None or probe.any_of is None):
+            skip = len(probe.equal) if probe is not None else 0
+            for name in self.index.columns[skip:]:
+                if name not in columns:
+                    break
+                self.sorted_by.append(columns.index(name))
+
+    def detail(self) -> str:
+        text = f" using {self.probe.describe() if self.probe is not None else self.index.name}"
+        text += f" on {self.table.name}" + (f" {self.alias}" if self.alias != self.table.name else '')
+        if self.descending:
+            text += ' backward'
+        if self.predicate is not None:
+            text += f" filter: {format_expr(self.predicate)}"
+        return text
+
+    def rows(self, ctx):
+        table = ctx.table(self.table)
+        index = table.indexes[self.index.name]
+        if self.probe is not None:
+            env = RowEnv(ctx)
+            probe = self.probe if index is self.index else replace(self.probe, index=index)
+            rids = probe.rids(ctx.params, lambda expr: evaluate(expr, env, ctx.params), self.descending)
+        else:
+            rids = index.scan(self.descending)
+        getters = [table.columns[name].get for name in self.columns]
+        source = (tuple([get(rid) for get in getters]) for rid in rids)
+        if self.predicate is None:
+            return source
+        return _filtered(source, self.predicate, ctx)
+
+class SubqueryScan(BatchOperator):
+    # Rows of a derived table (FROM subquery or CTE) under its alias
+    label = 'Subquery Scan'
+
+    def __init__(self, child: Operator, alias: str, predicate: Any = None, **estimates):
+        super().__init__([(alias, name) for _, name in child.layout], [child], **estimates)
+        self.alias = alias
+        self.predicate = predicate
+
+    def detail(self) -> str:
+        text = f" on {self.alias}"
+        if self.predicate is not None:
+            text += f" filter: {format_expr(self.predicate)}"
+        return text
+
+    def batches(self, ctx):
+        source = self.children[0].execute_batches(ctx)
+        if self.predicate is None:
+            return source
+        return _filtered_batches(source, self.predicate, ctx)
+
+class CTEScan(BatchOperator):
+    # Rows of a materialized CTE: its plan runs once per statement and every
+    # reference reads the stored batches. Only the first reference lists the
+    # plan as its child, so EXPLAIN shows it once.
+    label = 'CTE Scan'
+
+    def __init__(self, cte: Operator, name: str, first: bool, **estimates):
+        super().__init__(cte.layout, [cte] if first else [], **estimates)
+        self.cte = cte
+        self.name = name
+
+    def detail(self) -> str:
+        return f" on {self.name}" + ('' if self.children else ' (shared)')
+
+    def batches(self, ctx):
+        key = id(self.cte)
+        stored = ctx.cte_results.get(key)
+        if stored is None:
+            stored = ctx.cte_results[key] = list(self.cte.execute_batches(ctx))
+        return iter(stored)
+
+class Filter(BatchOperator):
+    label = 'Filter'
+
+    def __init__(self, child: Operator, predicate: Any, **estimates):
+        super().__init__(child.layout, [child], **estimates)
+        self.predicate = predicate
+
+    def detail(self) -> str:
+        return f": {format_expr(self.predicate)}"
+
+    def batches(self, ctx):
+        return _filtered_batches(self.children[0].execute_batches(ctx), self.predicate, ctx)
+
+def _join_layout(left: Operator, right_layout: list, kind: str) -> list:
+    # Semi and anti joins only tell whether a match exists, so they keep the left columns
+    return left.layout if kind in ('SEMI', 'ANTI') else left.layout + right_layout
+
+def _join_detail(kind: str, keys: str, residual: Any, named: bool = False) -> str:
+    # `named`: the operator label already says which kind of join this is
+    text = '' if named else {'INNER': '', 'LEFT': ' Left Join', 'SEMI': ' Semi Join', 'ANTI': ' Anti Join'}[kind]
+    if keys:
+        text += f" on {keys}"
+    if residual is not None:
+        text += f"{' and' if keys else ' on'} {format_expr(residual)}"
+    return text
+
+def _format_keys(left_keys: List[Any], right_keys: List[Any]) -> str:
+    return ' and '.join(f"({format_expr(left)} = {right if isinstance(right, str) else format_expr(right)})"
+                        for left, right in zip(left_keys, right_keys))
+
+def _keyed_rows(child: Operator, exprs: List[Any], ctx: ExecutionContext) -> Iterator[Tuple[Any, tuple]]:
+    # (join key, row) pairs of a child, with the keys computed a batch at a
+    # time: a scalar for one key expression, a tuple for several
+    evaluator = _evaluator(ctx)
+    for batch in child.execute_batches(ctx):
+        columns = [to_list(evaluator.column(expr, batch)) for expr in exprs]
+        keys = columns[0] if len(columns) == 1 else zip(*columns)
+        yield from zip(keys, batch.rows())
+
+def _residual_check(residual: Any, ctx: ExecutionContext):
+    if residual is None:
+        return None
+    compiled = _compiled(ctx).row_check(residual)
+    if compiled is not None:
+        return compiled
+    env = RowEnv(ctx)
+    params = ctx.params
+    def check(row):
+        env.row = row
+        return truthy(evaluate(residual, env, params))
+    return check
+
+def _has_null(key: Any, width: int) -> bool:
+    # NULL never equals anything, so such rows never match
+    return key is None if width == 1 else None in key
+
+class NestedLoopJoin(Operator):
+    label = 'Nested Loop'
+
+    def __init__(self, left: Operator, right: Operator, kind: str = 'INNER', predicate: Any = None, **estimates):
+        super().__init__(_join_layout(left, right.layout, kind), [left, right], **estimates)
+        self.kind = kind
+        self.predicate = predicate
+
+    def detail(self) -> str:
+        return _join_detail(self.kind, '', self.predicate)
+
+    def rows(self, ctx):
+        # The inner side is materialized once and rescanned for every outer row
+        inner = list(self.children[1].execute(ctx))
+        padding = (None,) * len(self.children[1].layout)
+        check = _residual_check(self.predicate, ctx)
+        kind = self.kind
+        for left in self.children[0].execute(ctx):
+            matched = False
+            for right in inner:
+                row = left + right
+                if check is not None and not check(row):
+                    continue
+                matched = True
+                if kind in ('SEMI', 'ANTI'):
+                    break
+                yield row
+            if matched and kind == 'SEMI':
+                yield left
+            elif not matched and kind in ('LEFT', 'ANTI'):
+                yield left + padding if kind == 'LEFT' else left
+
+class HashJoin(Operator):
+    # Equi-join: hash the build side once, then stream the probe side past it.
+    # Inner joins build on whichever input is estimated smaller; LEFT, SEMI and
+    # ANTI joins always build on the right so every left row is probed exactly once.
+    label = 'Hash Join'
+
+    def __init__(self, left: Operator, right: Operator, left_keys: List[Any], right_keys: List[Any],
+                 kind: str = 'INNER', residual: Any = None, build: str = 'right', **estimates):
+        super().__init__(_join_layout(left, right.layout, kind), [left, right], **estimates)
+        self.left_keys = left_keys
+        self.right_keys = right_keys
+        self.kind = kind
+        self.label = {'INNER': 'Hash Join', 'LEFT': 'Hash Left Join', 'SEMI': 'Hash Semi Join',
+                      'ANTI': 'Hash Anti Join'}[kind]
+        self.residual = residual
+        self.build = build
+
+    def detail(self) -> str:
+        keys = _format_keys(self.left_keys, self.right_keys)
+        return _join_detail(self.kind, keys, self.residual, named=True) + f" (build {self.build})"
+
+    def _hash(self, pairs: Iterator[Tuple[Any, tuple]], width: int) -> Dict[Any, list]:
+        table: Dict[Any, list] = {}
+        get = table.get
+        for k, row in pairs:
+            if _has_null(k, width):
+                continue
+            bucket = get(k)
+            if bucket is None:
+                table[k] = [row]
+            else:
+                bucket.append(row)
+        return table
+
+    def rows(self, ctx):
+        width = len(self.left_keys)
+        check = _residual_check(self.residual, ctx)
+        left_input, right_input = self.children
+        if self.build == 'left':
+            table = self._hash(_keyed_rows(left_input, self.left_keys, ctx), width)
+            get = table.get
+            for key, right in _keyed_rows(right_input, self.right_keys, ctx):
+                matches = get(key)
+                if matches:
+                    for left in matches:
+                        row = left + right
+                        if check is None or check(row):
+                            yield row
+            return
+        table = self._hash(_keyed_rows(right_input, self.right_keys, ctx), width)
+        get = table.get
+        kind = self.kind
+        padding = (None,) * len(right_input.layout)
+        for key, left in _keyed_rows(left_input, self.left_keys, ctx):
+            matches = get(key)
+            if kind == 'INNER':
+                if matches:
+                    for right in matches:
+                        row = left + right
+                        if check is None or check(row):
+                            yield row
+            elif kind in ('SEMI', 'ANTI'):
+                matched = bool(matches) and (check is None or any(check(left + right) for right in matches))
+                if matched == (kind == 'SEMI'):
+                    yield left
+            else:
+                matched = False
+                if matches:
+                    for right in matches:
+                        row = left + right
+                        if check is None or check(row):
+                            matched = True
+                            yield row
+                if not matched:
+                    yield left + padding
+
+class MergeJoin(Operator):
+    # Equi-join over inputs ordered by their keys: inputs that are not already
+    # sorted (e.g. by an ordered index scan) are sorted first, then both are
+    # walked once, pairing groups of equal keys.
+    label = 'Merge Join'
+
+    def __init__(self, left: Operator, right: Operator, left_keys: List[Any], right_keys: List[Any],
+                 kind: str = 'INNER', residual: Any = None, left_sorted: bool = False,
+                 right_sorted: bool = False, **estimates):
+        super().__init__(_join_layout(left, right.layout, kind), [left, right], **estimates)
+        self.left_keys = left_keys
+        self.right_keys = right_keys
+        self.kind = kind
+        self.label = {'INNER': 'Merge Join', 'LEFT': 'Merge Left Join', 'SEMI': 'Merge Semi Join',
+                      'ANTI': 'Merge Anti Join'}[kind]
+        self.residual = residual
+        self.left_sorted = left_sorted
+        self.right_sorted = right_sorted
+        if all(type(key) is ColumnRef for key in left_keys):
+            self.sorted_by = [key.index for key in left_keys]
+
+    def detail(self) -> str:
+        keys = _format_keys(self.left_keys, self.right_keys)
+        sorts = [side for side, done in (('left', self.left_sorted), ('right', self.right_sorted)) if not done]
+        return _join_detail(self.kind, keys, self.residual, named=True) + (f" (sort {' and '.join(sorts)})" if sorts else '')
+
+    @staticmethod
+    def _keyed(pairs: Iterator[Tuple[Any, tuple]], width: int, presorted: bool, unmatched: Optional[list]):
+        keyed = []
+        for k, row in pairs:
+            if _has_null(k, width):
+                if unmatched is not None:
+                    unmatched.append(row)
+                continue
+            keyed.append((k, row))
+        if not presorted:
+            keyed.sort(key=itemgetter(0))
+        return keyed
+
+    def rows(self, ctx):
+        width = len(self.left_keys)
+        kind = self.kind
+        check = _residual_check(self.residual, ctx)
+        padding = (None,) * len(self.children[1].layout)
+        # Left rows with a NULL key match nothing, which LEFT and ANTI joins still output
+        null_left: Optional[list] = [] if kind in ('LEFT', 'ANTI') else None
+        left = self._keyed(_keyed_rows(self.children[0], self.left_keys, ctx), width, self.left_sorted, null_left)
+        right = self._keyed(_keyed_rows(self.children[1], self.right_keys, ctx), width, self.right_sorted, None)
+        for row in null_left or ():
+            yield row + padding if kind == 'LEFT' else row
+        i = j = 0
+        while i < len(left):
+            key = left[i][0]
+            while j < len(right) and right[j][0] < key:
+                j += 1
+            group_end = j
+            while group_end < len(right) and right[group_end][0] == key:
+                group_end += 1
+            while i < len(left) and left[i][0] == key:
+                row_left = left[i][1]
+                matched = False
+                for position in range(j, group_end):
+                    row = row_left + right[position][1]
+                    if check is not None and not check(row):
+                        continue
+                    matched = True
+                    if kind in ('SEMI', 'ANTI'):
+                        break
+                    yield row
+                if matched and kind == 'SEMI':
+                    yield row_left
+                elif not matched and kind in ('LEFT', 'ANTI'):
+                    yield row_left + padding if kind == 'LEFT' else row_left
+                i += 1
+            j = group_end
+
+class IndexNestedLoopJoin(Operator):
+    # For every left row, probe an index of the right-hand table with the
+    # row's key instead of scanning that table
+    label = 'Index Nested Loop'
+
+    def __init__(self, left: Operator, table: Any, alias: str, columns: List[str], index: Any,
+                 left_keys: List[Any], kind: str = 'INNER', predicate: Any = None, residual: Any = None,
+                 **estimates):
+        super().__init__(_join_layout(left, [(alias, name) for name in columns], kind), [left], **estimates)
+        self.table = table
+        self.alias = alias
+        self.columns = columns
+        self.index = index
+        self.left_keys = left_keys
+        self.kind = kind
+        # `predicate` filters the right table's rows; `residual` checks joined rows
+        self.predicate = predicate
+        self.residual = residual
+
+    def detail(self) -> str:
+        keys = _format_keys(self.left_keys, [f"{self.alias}.{column}" for column in self.index.columns])
+        text = _join_detail(self.kind, keys, self.residual)
+        text += f" using {self.index.name} on {self.table.name}" + (f" {self.alias}" if self.alias != self.table.name else '')
+        if self.predicate is not None:
+            text += f" filter: {format_expr(self.predicate)}"
+        return text
+
+    def rows(self, ctx):
+        width = len(self.left_keys)
+        table = ctx.table(self.table)
+        index = table.indexes[self.index.name]
+        if width < len(index.columns):
+            lookup = lambda k: index.prefix((k,) if width == 1 else k)
+        else:
+            lookup = index.lookup
+        getters = [table.columns[name].get for name in self.columns]
+        right_check = _residual_check(self.predicate, ctx)
+        check = _residual_check(self.residual, ctx)
+        padding = (None,) * len(getters)
+        kind = self.kind
+        for k, left in _keyed_rows(self.children[0], self.left_keys, ctx):
+            matched = False
+            if not _has_null(k, width):
+                for rid in lookup(k):
+                    right = tuple([get(rid) for get in getters])
+                    if right_check is not None and not right_check(right):
+                        continue
+                    row = left + right
+                    if check is not None and not check(row):
+                        continue
+                    matched = True
+                    if kind in ('SEMI', 'ANTI'):
+                        break
+                    yield row
+            if matched and kind == 'SEMI':
+                yield left
+            elif not matched and kind in ('LEFT', 'ANTI'):
+                yield left + padding if kind == 'LEFT' else left
+
+# --- Aggregation ------------------------------------------------------------------
+
+def _present(values: list) -> list:
+    return [value for value in values if value is not None] if None in values else values
+
+class _Count:
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.count += 1
+
+    def add_batch(self, values: list):
+        # Bulk form of add() for one group's values from a column batch
+        self.count += len(values) - values.count(None)
+
+    def merge(self, other: '_Count'):
+        # Fold in the state of the same aggregate over other rows (parallel.py)
+        self.count += other.count
+
+    def result(self):
+        return self.count
+
+class _CountStar(_Count):
+    __slots__ = ()
+
+    def add(self, value):
+        self.count += 1
+
+    def add_batch(self, values: list):
+        self.count += len(values)
+
+class _Sum:
+    __slots__ = ('total',)
+
+    def __init__(self):
+        self.total = None
+
+    def add(self, value):
+        if value is not None:
+            self.total = value if self.total is None else self.total + value
+
+    def add_batch(self, values: list):
+        present = _present(values)
+        if present:
+            # sum() with a start value adds in row order, like add() would
+            if self.total is None:
+                self.total = sum(present[1:], present[0])
+            else:
+                self.total = sum(present, self.total)
+
+    def merge(self, other: '_Sum'):
+        self.add(other.total)
+
+    def result(self):
+        return self.total
+
+class _Avg:
+    __slots__ = ('total', 'count')
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.total += value
+            self.count += 1
+
+    def add_batch(self, values: list):
+        present = _present(values)
+        self.total = sum(present, self.total)
+        self.count += len(present)
+
+    def merge(self, other: '_Avg'):
+        self.total += other.total
+        self.count += other.count
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+class _Min:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def add_batch(self, values: list):
+        present = _present(values)
+        if present:
+            self.add(min(present))
+
+    def merge(self, other: '_Min'):
+        self.add(other.value)
+
+    def result(self):
+        return self.value
+
+class _Max(_Min):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+    def add_batch(self, values: list):
+        present = _present(values)
+        if present:
+            self.add(max(present))
+
+class _Distinct:
+    # COUNT(DISTINCT x) and friends: feed each value to the inner accumulator once
+    __slots__ = ('inner', 'seen')
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.seen = set()
+
+    def add(self, value) -> bool:
+        # Returns whether the value was new, for memory accounting
+        if value not in self.seen:
+            self.seen.add(value)
+            self.inner.add(value)
+            return True
+        return False
+
+    def add_batch(self, values: list) -> int:
+        # Returns how many new values were stored, for memory accounting
+        seen = len(self.seen)
+        for value in values:
+            self.add(value)
+        return len(self.seen) - seen
+
+    def merge(self, other: '_Distinct'):
+        for value in other.seen:
+            self.add(value)
+
+    def result(self):
+        return self.inner.result()
+
+ACCUMULATORS = {'COUNT': _Count, 'SUM': _Sum, 'AVG': _Avg, 'MIN': _Min, 'MAX': _Max}
+
+def accumulator_factory(call: FuncCall):
+    if call.star:
+        return _CountStar
+    accumulator = ACCUMULATORS[call.name]
+    if call.distinct:
+        return lambda: _Distinct(accumulator())
+    return accumulator
+
+# Rough bytes per value held in a COUNT(DISTINCT ...) set
+_DISTINCT_VALUE_BYTES = 64
+# Spill files a Hash Aggregate splits its overflow into
+SPILL_PARTITIONS = 32
+
+def _group_bytes(key: tuple, accumulators: list) -> int:
+    # Approximate size of one group table entry: key, states and dict slot
+    return (sys.getsizeof(key) + sum(map(sys.getsizeof, key)) + sys.getsizeof(accumulators)
+            + sum(map(sys.getsizeof, accumulators)) + 100)
+
+class _SpilledGroups:
+    # Input of the groups that did not fit in memory, in the same
+    # (keys, argument columns, row count) chunks as the operator's input
+    def __init__(self, level: int):
+        self.partitions = HashPartitions(SPILL_PARTITIONS, level)
+        self.buffers: Dict[int, tuple] = {}
+
+    def add(self, key: tuple, positions: List[int], columns: List[Optional[list]]):
+        number = self.partitions.partition(key)
+        buffer = self.buffers.get(number)
+        if buffer is None:
+            buffer = self.buffers[number] = ([], [None if column is None else [] for column in columns])
+        keys, spilled = buffer
+        keys.extend([key] * len(positions))
+        for column, values in zip(columns, spilled):
+            if column is not None:
+                values.extend([column[i] for i in positions])
+
+    def flush(self):
+        # Written once per input batch, so each partition keeps row order
+        for number, (keys, columns) in self.buffers.items():
+            self.partitions.write(number, (keys, columns, len(keys)))
+        self.buffers.clear()
+
+class HashAggregate(Operator):
+    # Groups live in a hash table of incremental accumulator states. Past
+    # `work_mem` the table stops taking new groups: rows of groups already in
+    # memory are still aggregated there, the others are spilled to hash
+    # partitions and aggregated partition by partition afterwards (splitting
+    # again if one is still too big). Every group sees all its rows in input
+    # order either way, so results do not depend on spilling.
+    label = 'Hash Aggregate'
+
+    def __init__(self, child: Operator, group_exprs: List[Any], aggregates: List[FuncCall],
+                 layout: List[Tuple[Optional[str], str]], **estimates):
+        # Output rows are the group key values followed by one value per aggregate
+        super().__init__(layout, [child], **estimates)
+        self.group_exprs = group_exprs
+        self.aggregates = aggregates
+        self.factories = [accumulator_factory(call) for call in aggregates]
+        # Spill files written and their total size, for EXPLAIN ANALYZE
+        self.spill_files = 0
+        self.spill_bytes = 0
+
+    def detail(self) -> str:
+        text = ''
+        if self.group_exprs:
+            text += f" group by: {', '.join(map(format_expr, self.group_exprs))}"
+        if self.aggregates:
+            text += f" aggregates: {', '.join(map(format_expr, self.aggregates))}"
+        if self.spill_files:
+            text += f" spilled: {self.spill_files} files, {self.spill_bytes // 1024} kB"
+        return text
+
+    def rows(self, ctx):
+        return self._aggregate(self._chunks(ctx), ctx.work_mem, 0)
+
+    def partial_groups(self, ctx: ExecutionContext) -> Dict[tuple, list]:
+        # The accumulators of every group, unfinished, for a parallel worker
+        # whose share of the input is small enough to keep in memory
+        return self._accumulate(self._chunks(ctx), None, 0)[0]
+
+    def _chunks(self, ctx: ExecutionContext) -> Iterator[tuple]:
+        # (group keys, argument columns, row count) per input batch; keys
+        # are None without GROUP BY
+        evaluator = _evaluator(ctx)
+        group_exprs = self.group_exprs
+        arguments = [call.args[0] if call.args else None for call in self.aggregates]
+        for batch in self.children[0].execute_batches(ctx):
+            columns = [None if argument is None else list(to_list(evaluator.column(argument, batch)))
+                       for argument in arguments]
+            keys = None
+            if group_exprs:
+                keys = list(zip(*[to_list(evaluator.column(expr, batch)) for expr in group_exprs]))
+            yield keys, columns, batch.length
+
+    def _aggregate(self, chunks: Iterator[tuple], work_mem: Optional[int], level: int) -> Iterator[tuple]:
+        groups, spilled = self._accumulate(chunks, work_mem, level)
+        yield from self.results(groups)
+        if spilled is None:
+            return
+        groups.clear()
+        partitions = spilled.partitions
+        self.spill_files += partitions.used
+        self.spill_bytes += partitions.size
+        try:
+            for partition in partitions.drain():
+                yield from self._aggregate(partition, work_mem, level + 1)
+        finally:
+            partitions.close()
+
+    def results(self, groups: Dict[tuple, list]) -> Iterator[tuple]:
+        # Output rows of finished groups
+        if not groups and not self.group_exprs:
+            # Aggregates without GROUP BY return one row even for no input
+            groups[()] = [make() for make in self.factories]
+        for key, accumulators in groups.items():
+            yield key + tuple([accumulator.result() for accumulator in accumulators])
+
+    def _accumulate(self, chunks: Iterator[tuple], work_mem: Optional[int],
+                    level: int) -> Tuple[Dict[tuple, list], Optional[_SpilledGroups]]:
+        # Each chunk is split by group key into selection vectors, and every
+        # group's slice of an argument column goes to its accumulators at once
+        factories = self.factories
+        groups: Dict[tuple, list] = {}
+        spilled: Optional[_SpilledGroups] = None
+        group_bytes = 0
+        distinct_values = 0
+        for keys, columns, length in chunks:
+            if keys is None:
+                split = {(): None}
+            else:
+                split = {}
+                for position, key in enumerate(keys):
+                    found = split.get(key)
+                    if found is None:
+                        split[key] = [position]
+                    else:
+                        found.append(position)
+            for key, positions in split.items():
+                accumulators = groups.get(key)
+                if accumulators is None:
+                    if spilled is not None:
+                        spilled.add(key, positions, columns)
+                        continue
+                    accumulators = groups[key] = [make() for make in factories]
+                    if not group_bytes:
+                        group_bytes = _group_bytes(key, accumulators)
+                if positions is not None and len(positions) == 1:
+                    # One row of this group in the chunk (typical for many
+                    # groups): add() it rather than slicing out a list
+                    position = positions[0]
+                    for accumulator, column in zip(accumulators, columns):
+                        if accumulator.add(None if column is None else column[position]):
+                            distinct_values += 1
+                    continue
+                for accumulator, column in zip(accumulators, columns):
+                    if column is None:
+                        # COUNT(*) only needs the number of rows
+                        column = positions if positions is not None else range(length)
+                    elif positions is not None:
+                        column = [column[i] for i in positions]
+                    stored = accumulator.add_batch(column)
+                    if stored:
+                        distinct_values += stored
+            if spilled is not None:
+                spilled.flush()
+            elif work_mem and keys is not None \
+                    and len(groups) * group_bytes + distinct_values * _DISTINCT_VALUE_BYTES > work_mem:
+                # A single group (no GROUP BY) cannot be split, so it never spills
+                spilled = _SpilledGroups(level)
+        return groups, spilled
+
+def _row_functions(exprs: List[Any], ctx: ExecutionContext) -> List[Any]:
+    # row -> value per expression: generated code, or the interpreter for
+    # what the compiler does not handle
+    env = RowEnv(ctx)
+    params = ctx.params
+    compiled = _compiled(ctx)
+    functions = []
+    for expr in exprs:
+        function = compiled.row_function(expr)
+        if function is None:
+            def function(row, expr=expr):
+                env.row = row
+                return evaluate(expr, env, params)
+        functions.append(function)
+    return functions
+
+class _Descending:
+    # A value compared in reverse, for descending keys that cannot be negated
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.value < self.value
+
+    def __gt__(self, other: '_Descending') -> bool:
+        return other.value > self.value
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is _Descending and self.value == other.value
+
+    def __reduce__(self):
+        return _Descending, (self.value,)
+
+_NEGATABLE = {int, float, bool}
+
+def _key_encoder(directions: List[bool]):
+    # Sort keys encoded as one flat tuple per row, so a sort or merge
+    # compares rows in C: each key value becomes a (present, value) pair.
+    # The first key's direction is the sort's `reverse`; keys running the
+    # other way are negated (or wrapped in `_Descending`). NULLs come before
+    # every value ascending and after every value descending.
+    reverse = directions[0]
+    inverted = [descending != reverse for descending in directions]
+    if len(directions) == 1:
+        return (lambda values: (0, 0) if values[0] is None else (1, values[0])), reverse
+
+    def encode(values: Sequence[Any]) -> tuple:
+        key: List[Any] = []
+        for value, invert in zip(values, inverted):
+            if value is None:
+                key += (1, 0) if invert else (0, 0)
+            elif invert:
+                key += (0, -value if type(value) in _NEGATABLE else _Descending(value))
+            else:
+                key += (1, value)
+        return tuple(key)
+    return encode, reverse
+
+def _sort_decorated(decorated: List[Tuple[list, tuple]], directions: List[bool]):
+    # Sorts (key values, row) pairs in place, stably
+    encode, reverse = _key_encoder(directions)
+    decorated.sort(key=lambda item: encode(item[0]), reverse=reverse)
+
+# --- Window functions -------------------------------------------------------------
+
+RANKING_FUNCTIONS = {'ROW_NUMBER', 'RANK', 'DENSE_RANK'}
+OFFSET_FUNCTIONS = {'LAG', 'LEAD'}
+
+def _peer_sizes(keys: List[list]) -> List[int]:
+    # Lengths of the runs of rows with equal ORDER BY values
+    sizes: List[int] = []
+    previous = None
+    for key in keys:
+        if sizes and key == previous:
+            sizes[-1] += 1
+        else:
+            sizes.append(1)
+            previous = key
+    return sizes
+
+class WindowAgg(Operator):
+    # Every window function sharing one PARTITION BY / ORDER BY, computed in
+    # a single pass: rows are hashed into partitions, each partition is
+    # sorted once on the ORDER BY keys (not at all when `presorted`, i.e. the
+    # input already has every partition in that order), and each output row
+    # is the input row followed by one value per function. Partitions come
+    # out in order of first appearance.
+    label = 'WindowAgg'
+
+    def __init__(self, child: Operator, partition_by: List[Any], order_by: List[Tuple[Any, bool]],
+                 functions: List[WindowFunction], presorted: bool = False, **estimates):
+        super().__init__(child.layout + [(None, format_expr(function)) for function in functions], [child], **estimates)
+        self.partition_by = partition_by
+        self.order_by = order_by
+        self.functions = functions
+        self.presorted = presorted
+
+    def detail(self) -> str:
+        text = ''
+        if self.partition_by:
+            text += f" partition by: {', '.join(map(format_expr, self.partition_by))}"
+        if self.order_by:
+            text += ' order by: ' + ', '.join(f"{format_expr(expr)}{' DESC' if descending else ''}"
+                                              for expr, descending in self.order_by)
+            if self.presorted:
+                text += ' (presorted)'
+        return text + f" functions: {', '.join(map(format_expr, self.functions))}"
+
+    def rows(self, ctx):
+        partition_keys = _row_functions(self.partition_by, ctx)
+        order_keys = _row_functions([expr for expr, _ in self.order_by], ctx)
+        arguments = [_row_functions(function.args, ctx) for function in self.functions]
+        partitions: Dict[tuple, list] = {}
+        for row in input_rows(self.children[0], ctx):
+            key = tuple([function(row) for function in partition_keys])
+            item = ([function(row) for function in order_keys], row)
+            partition = partitions.get(key)
+            if partition is None:
+                partitions[key] = [item]
+            else:
+                partition.append(item)
+        directions = [descending for _, descending in self.order_by]
+        for partition in partitions.values():
+            if directions and not self.presorted:
+                _sort_decorated(partition, directions)
+            rows = [row for _, row in partition]
+            peers = _peer_sizes([key for key, _ in partition]) if directions else [len(rows)]
+            columns = [self._compute(function, functions, rows, peers)
+                       for function, functions in zip(self.functions, arguments)]
+            for row, values in zip(rows, zip(*columns)):
+                yield row + values
+
+    def _compute(self, function: WindowFunction, arguments: List[Any], rows: List[tuple], peers: List[int]) -> list:
+        # The function's value for every row of one sorted partition
+        name = function.name
+        count = len(rows)
+        if name == 'ROW_NUMBER':
+            return list(range(1, count + 1))
+        if name in ('RANK', 'DENSE_RANK'):
+            values: list = []
+            rank = 1
+            for size in peers:
+                values.extend([rank] * size)
+                rank += size if name == 'RANK' else 1
+            return values
+        args = [[argument(row) for row in rows] for argument in arguments]
+        if name in OFFSET_FUNCTIONS:
+            # LAG/LEAD(value [, offset [, default]])
+            offsets = args[1] if len(args) > 1 else [1] * count
+            defaults = args[2] if len(args) > 2 else [None] * count
+            step = -1 if name == 'LAG' else 1
+            values = []
+            for i, (offset, default) in enumerate(zip(offsets, defaults)):
+                if offset is None:
+                    values.append(None)
+                    continue
+                if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+                    raise SQLError(f"{name}() offset must be a non-negative integer, got {offset!r}")
+                source = i + step * offset
+                values.append(args[0][source] if 0 <= source < count else default)
+            return values
+        # Aggregates over the frame
+        make = accumulator_factory(FuncCall(name, function.args, star=function.star))
+        column = args[0] if args else [None] * count
+        frame = function.window.frame
+        if frame == (None, None) or frame is None and not function.window.order_by:
+            # The whole partition
+            accumulator = make()
+            accumulator.add_batch(column)
+            return [accumulator.result()] * count
+        if frame is None:
+            # Default frame with ORDER BY: from the start through the current row's last peer
+            accumulator = make()
+            values = []
+            start = 0
+            for size in peers:
+                accumulator.add_batch(column[start:start + size])
+                values.extend([accumulator.result()] * size)
+                start += size
+            return values
+        first, last = frame
+        values = []
+        if first is None:
+            # Running frame: extend one accumulator as the frame end moves
+            accumulator = make()
+            added = 0
+            for i in range(count):
+                end = min(count, i + last + 1)
+                if end > added:
+                    accumulator.add_batch(column[added:end])
+                    added = end
+                values.append(accumulator.result())
+            return values
+        # Sliding frame: aggregate each row's slice (frames are usually narrow)
+        for i in range(count):
+            start = max(0, i + first)
+            end = count if last is None else min(count, i + last + 1)
+            accumulator = make()
+            if start < end:
+                accumulator.add_batch(column[start:end])
+            values.append(accumulator.result())
+        return values
+
+# --- Output shaping ---------------------------------------------------------------
+
+def _row_count(expr: Any, ctx: ExecutionContext) -> Optional[int]:
+    # The value of a LIMIT or OFFSET expression
+    value = evaluate(expr, RowEnv(ctx), ctx.params) if expr is not None else None
+    if value is not None and (not isinstance(value, int) or value < 0):
+        raise SQLError(f"LIMIT/OFFSET must be a non-negative integer, got {value!r}")
+    return value
+
+def _pair_bytes(item: Tuple[tuple, tuple]) -> int:
+    # Approximate size of one (encoded key, row) pair held by a sort
+    key, row = item
+    return (sys.getsizeof(item) + sys.getsizeof(key) + sum(map(sys.getsizeof, key))
+            + sys.getsizeof(row) + sum(map(sys.getsizeof, row)))
+
+# Sorted runs a Sort merges at once; more are first merged into longer runs
+SORT_MERGE_FANIN = 16
+# (key, row) pairs per pickled chunk of a sorted run
+_RUN_CHUNK = 1024
+
+class Sort(Operator):
+    # Rows are sorted on encoded keys (see `_key_encoder`). Below a LIMIT,
+    # only the first `limit + offset` rows are kept, in a bounded heap.
+    # Otherwise rows are sorted in memory up to `work_mem`; past it each
+    # sorted run is spilled, and the runs are merged as the output is read.
+    # Equal keys keep their input order either way.
+    label = 'Sort'
+
+    def __init__(self, child: Operator, keys: List[Tuple[Any, bool]], limit: Any = None, offset: Any = None,
+                 **estimates):
+        super().__init__(child.layout, [child], **estimates)
+        self.keys = keys
+        self.limit = limit
+        self.offset = offset
+        # Sorted runs written and their total size, for EXPLAIN ANALYZE
+        self.spill_files = 0
+        self.spill_bytes = 0
+
+    def detail(self) -> str:
+        text = ' by ' + ', '.join(f"{format_expr(expr)}{' DESC' if descending else ''}" for expr, descending in self.keys)
+        if self.limit is not None:
+            text += f" top {format_expr(self.limit)}"
+            if self.offset is not None:
+                text += f" + {format_expr(self.offset)}"
+        if self.spill_files:
+            text += f" spilled: {self.spill_files} files, {self.spill_bytes // 1024} kB"
+        return text
+
+    def rows(self, ctx):
+        functions = _row_functions([expr for expr, _ in self.keys], ctx)
+        encode, reverse = _key_encoder([descending for _, descending in self.keys])
+        limit = _row_count(self.limit, ctx)
+        if limit is not None:
+            limit += _row_count(self.offset, ctx) or 0
+        keyed = ((encode([function(row) for function in functions]), row)
+                 for row in input_rows(self.children[0], ctx))
+        if limit is not None:
+            top = heapq.nlargest if reverse else heapq.nsmallest
+            return iter([row for _, row in top(limit, keyed, key=itemgetter(0))])
+        work_mem = ctx.work_mem
+        run = list(keyed) if not work_mem else []
+        runs: List[Tuple[int, SpillFile]] = []
+        if work_mem:
+            capacity = 0
+            for item in keyed:
+                run.append(item)
+                if not capacity:
+                    capacity = max(work_mem // _pair_bytes(item), 1)
+                if len(run) >= capacity:
+                    run.sort(key=itemgetter(0), reverse=reverse)
+                    self._add_run(runs, iter(run), reverse)
+                    run = []
+        run.sort(key=itemgetter(0), reverse=reverse)
+        if not runs:
+            return iter([row for _, row in run])
+        return self._merged(runs, run, reverse)
+
+    def _add_run(self, runs: List[Tuple[int, SpillFile]], pairs: Iterator[tuple], reverse: bool, level: int = 0):
+        # Spill one sorted run. Once the last SORT_MERGE_FANIN runs are of
+        # one level they are merged into a run of the next, which keeps the
+        # open files and the merge width bounded however many runs there are
+        file = SpillFile()
+        while True:
+            chunk = list(islice(pairs, _RUN_CHUNK))
+            if not chunk:
+                break
+            file.write(chunk)
+        self.spill_files += 1
+        self.spill_bytes += file.size
+        runs.append((level, file))
+        if len(runs) >= SORT_MERGE_FANIN and all(run_level == level for run_level, _ in runs[-SORT_MERGE_FANIN:]):
+            merged = [file for _, file in runs[-SORT_MERGE_FANIN:]]
+            del runs[-SORT_MERGE_FANIN:]
+            self._add_run(runs, _merge(merged, [], reverse), reverse, level + 1)
+
+    def _merged(self, runs: List[Tuple[int, SpillFile]], last: List[tuple], reverse: bool) -> Iterator[tuple]:
+        files = [file for _, file in runs]
+        try:
+            for _, row in _merge(files, last, reverse):
+                yield row
+        finally:
+            for file in files:
+                file.close()
+
+def _merge(files: List[SpillFile], last: List[tuple], reverse: bool) -> Iterator[tuple]:
+    # The (key, row) pairs of sorted runs, in order; ties come from the
+    # earlier run, and `last` (still in memory) follows every file
+    sources = [chain.from_iterable(file.read()) for file in files]
+    return heapq.merge(*sources, iter(last), key=itemgetter(0), reverse=reverse)
+
+class Project(BatchOperator):
+    label = 'Project'
+
+    def __init__(self, child: Operator, exprs: List[Any], names: List[str], **estimates):
+        super().__init__([(None, name) for name in names], [child], **estimates)
+        self.exprs = exprs
+
+    def detail(self) -> str:
+        return ': ' + ', '.join(map(format_expr, self.exprs))
+
+    def batches(self, ctx):
+        evaluator = _evaluator(ctx)
+        exprs = self.exprs
+        for batch in self.children[0].execute_batches(ctx):
+            yield Batch([evaluator.column(expr, batch) for expr in exprs], batch.length)
+
+class Distinct(Operator):
+    label = 'Distinct'
+
+    def __init__(self, child: Operator, **estimates):
+        super().__init__(child.layout, [child], **estimates)
+
+    def rows(self, ctx):
+        seen = set()
+        for row in input_rows(self.children[0], ctx):
+            if row not in seen:
+                seen.add(row)
+                yield row
+
+class Limit(BatchOperator):
+    label = 'Limit'
+
+    def __init__(self, child: Operator, limit: Any = None, offset: Any = None, **estimates):
+        super().__init__(child.layout, [child], **estimates)
+        self.limit = limit
+        self.offset = offset
+
+    def detail(self) -> str:
+        text = f" {format_expr(self.limit)}" if self.limit is not None else ''
+        if self.offset is not None:
+            text += f" offset {format_expr(self.offset)}"
+        return text
+
+    def batches(self, ctx):
+        limit, offset = _row_count(self.limit, ctx), _row_count(self.offset, ctx) or 0
+        return self._sliced(ctx, offset, limit)
+
+    def _sliced(self, ctx, skip: int, remaining: Optional[int]):
+        # Trim whole batches; stops pulling from the child once the limit is met
+        if remaining == 0:
+            return
+        for batch in self.children[0].execute_batches(ctx):
+            if skip >= batch.length:
+                skip -= batch.length
+                continue
+            end = batch.length if remaining is None else min(batch.length, skip + remaining)
+            if skip or end < batch.length:
+                batch = batch.take(range(skip, end))
+            skip = 0
+            yield batch
+            if remaining is not None:
+                remaining -= len(batch)
+                if remaining == 0:
+                    return
@@ -0,0 +1,262 @@
+"""Parallel execution of scans and aggregations over one large table.
+
+The planner puts a `Gather` above a plan fragment that reads a single
+stored table: a filtered Seq Scan, possibly under a Project or a Hash
+Aggregate. When it runs, the table's row slots are cut into morsels and
+each morsel runs the fragment in a worker process of the pool shared with
+`spawn` (see pcsj_parallel.py). Typed columns, and their NULL and
+deleted-row flags, reach the workers through shared memory and are read
+there in place; other columns are pickled a morsel at a time. The shared
+copy of a table is made once and kept until the table changes.
+
+Workers send back the fragment's rows, or for a Hash Aggregate the
+unfinished accumulators of every group they saw, which are merged. Morsels
+are consumed in table order, so rows and groups come out in the order of a
+serial run; only floating-point sums may round differently.
+"""
+
+import pickle
+import weakref
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import compress
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pcsj_parallel import SharedArray, get_pool
+
+from .operators import ExecutionContext, HashAggregate, Operator, Project, SeqScan, input_rows
+
+# Tables with fewer live rows are always scanned serially
+PARALLEL_MIN_ROWS = 100_000
+# Upper bound on the row slots of one morsel; smaller tables get smaller
+# morsels, so every worker has several to take
+MORSEL_ROWS = 65_536
+# Finished morsels kept per worker while an earlier one still runs
+_MORSELS_AHEAD = 2
+
+def fragment_expressions(plan: Operator) -> List[Any]:
+    # The expressions a Gather's workers would evaluate for `plan`
+    if type(plan) is Project:
+        return plan.exprs + fragment_expressions(plan.children[0])
+    if type(plan) is HashAggregate:
+        return plan.group_exprs + plan.aggregates + fragment_expressions(plan.children[0])
+    return [plan.predicate] if plan.predicate is not None else []
+
+def _describe(plan: Operator) -> tuple:
+    # What a worker needs to build the fragment again over its morsel
+    kind = type(plan)
+    if kind is SeqScan:
+        return 'scan', plan.alias, plan.columns, plan.predicate
+    if kind is Project:
+        return 'project', _describe(plan.children[0]), plan.exprs, [name for _, name in plan.layout]
+    return 'aggregate', _describe(plan.children[0]), plan.group_exprs, plan.aggregates, plan.layout
+
+def _build(description: tuple, table: Any) -> Operator:
+    kind = description[0]
+    if kind == 'scan':
+        return SeqScan(table, *description[1:])
+    child = _build(description[1], table)
+    if kind == 'project':
+        return Project(child, *description[2:])
+    return HashAggregate(child, *description[2:])
+
+class Gather(Operator):
+    # Runs its child fragment over morsels of the table in up to `workers`
+    # processes at once. A transaction that must not see the latest rows
+    # (see mvcc.py), or host variables that cannot be pickled, run the
+    # fragment here instead.
+    label = 'Gather'
+
+    def __init__(self, child: Operator, workers: int, params: Sequence[Any] = (), **estimates):
+        super().__init__(child.layout, [child], **estimates)
+        self.workers = workers
+        # Parameter names and host variables the fragment reads
+        self.params = list(params)
+        self.scan = child if type(child) is SeqScan else child.children[0]
+        # Morsels run by the last execution, for EXPLAIN ANALYZE
+        self.morsels = 0
+
+    def detail(self) -> str:
+        text = f" workers: {self.workers}"
+        if self.morsels:
+            text += f" morsels: {self.morsels}"
+        return text
+
+    def rows(self, ctx):
+        fragment = self.children[0]
+        table = ctx.table(self.scan.table)
+        payload = None
+        if table is self.scan.table:
+            params = ctx.params
+            if isinstance(params, dict):
+                params = {name: params[name] for name in self.params if name in params}
+            try:
+                payload = pickle.dumps((_describe(fragment), params, ctx.batch_size), pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                pass
+        if payload is None:
+            return input_rows(fragment, ctx)
+        results = self._run(table, payload)
+        if type(fragment) is not HashAggregate:
+            return (row for rows in results for row in rows)
+        groups: Dict[tuple, list] = {}
+        for partial in results:
+            for key, accumulators in partial:
+                found = groups.get(key)
+                if found is None:
+                    groups[key] = accumulators
+                else:
+                    for accumulator, other in zip(found, accumulators):
+                        accumulator.merge(other)
+        return fragment.results(groups)
+
+    def _run(self, table: Any, payload: bytes) -> Iterator[Any]:
+        # Worker results per morsel, in table order. The pool may have more
+        # processes than `workers`, so at most `workers` morsels run at once.
+        names = self.scan.columns
+        columns = _shared_columns(table, names)
+        slots = len(table.live)
+        size = max(1, min(MORSEL_ROWS, -(-slots // (self.workers * 4))))
+        starts = iter(range(0, slots, size))
+        pool = get_pool()
+        pending: deque = deque()
+        self.morsels = 0
+        try:
+            while True:
+                running = [future for future in pending if not future.done()]
+                while len(running) < self.workers and len(pending) < self.workers * _MORSELS_AHEAD:
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    end = min(start + size, slots)
+                    future = pool.submit(_run_morsel, payload, columns.morsel(table, names, start, end), start, end)
+                    pending.append(future)
+                    running.append(future)
+                    self.morsels += 1
+                if not pending:
+                    return
+                if pending[0].done():
+                    yield pending.popleft().result()
+                else:
+                    wait(running, return_when=FIRST_COMPLETED)
+        finally:
+            for future in pending:
+                future.cancel()
+
+# Shared copies of the tables parallel scans read, each of one version of its table
+_shared: 'weakref.WeakKeyDictionary[Any, _SharedColumns]' = weakref.WeakKeyDictionary()
+
+def _shared_columns(table: Any, names: List[str]) -> '_SharedColumns':
+    # The shared copy of `table` with at least the typed columns in `names`.
+    # A copy of an older version is released: results still being read
+    # from the table took their rows before it changed (see cursor.py).
+    shared = _shared.get(table)
+    if shared is None or shared.version != table.version:
+        if shared is not None:
+            shared.finalizer()
+        shared = _shared[table] = _SharedColumns(table)
+    for name in names:
+        shared.add(table.column(name))
+    return shared
+
+class _SharedColumns:
+    # Typed columns, their NULL flags and the live-row flags of one version
+    # of a table in shared memory, added as scans need them; other columns
+    # are sliced from the table per morsel
+    def __init__(self, table: Any):
+        self.version = table.version
+        self.shared: List[SharedArray] = []
+        self.typed: Dict[str, Tuple[SharedArray, Optional[SharedArray]]] = {}
+        self.live = self._share(array('B', table.live)) if table.live_count != len(table.live) else None
+        # Releases the memory once the table is gone, or at exit
+        self.finalizer = weakref.finalize(table, self.release)
+
+    def add(self, column: Any):
+        if column.typecode is not None and column.name not in self.typed:
+            nulls = column.nulls
+            self.typed[column.name] = (self._share(column.data),
+                                       self._share(array('B', nulls)) if nulls is not None and 1 in nulls else None)
+
+    def _share(self, values: array) -> SharedArray:
+        shared = SharedArray(values)
+        self.shared.append(shared)
+        return shared
+
+    def morsel(self, table: Any, names: List[str], start: int, end: int) -> tuple:
+        typed = {name: self.typed[name] for name in names if name in self.typed}
+        lists = {name: table.column(name).data[start:end] for name in names if name not in self.typed}
+        return typed, lists, self.live
+
+    def release(self):
+        for shared in self.shared:
+            shared.release()
+        self.shared = []
+
+class _Morsel:
+    # Row slots [start, end) of a table, read the way SeqScan reads a table
+    def __init__(self, columns: Dict[str, Any], nulls: Dict[str, bytes], live: Optional[bytes], length: int):
+        self.columns = columns
+        self.nulls = nulls
+        self.live = live
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def column_chunks(self, name: str, size: int) -> Iterator[Sequence[Any]]:
+        # As Table.column_chunks: typed slots without NULLs or deleted rows
+        # are sliced straight from shared memory
+        values = self.columns[name]
+        nulls = self.nulls.get(name)
+        if isinstance(values, memoryview) and values.format in ('q', 'd') and nulls is None and self.live is None:
+            for start in range(0, len(values), size):
+                yield values[start:start + size]
+            return
+        if isinstance(values, memoryview):
+            values = list(map(bool, values)) if values.format == 'b' else values.tolist()
+        if nulls is not None:
+            values = [None if null else value for value, null in zip(values, nulls)]
+        if self.live is not None:
+            values = list(compress(values, self.live))
+        for start in range(0, len(values), size):
+            yield values[start:start + size]
+
+def _run_morsel(payload: bytes, columns: tuple, start: int, end: int) -> Any:
+    # Worker side: the fragment over one morsel; its rows, or the partial
+    # groups of a Hash Aggregate
+    description, params, batch_size = pickle.loads(payload)
+    typed, lists, live = columns
+    handles = []
+
+    def view(shared: SharedArray) -> memoryview:
+        values, shm = shared.open()
+        handles.append(shm)
+        return values[start:end]
+    try:
+        data: Dict[str, Any] = dict(lists)
+        nulls: Dict[str, bytes] = {}
+        for name, (values, flags) in typed.items():
+            data[name] = view(values)
+            if flags is not None:
+                flags = view(flags).tobytes()
+                if 1 in flags:
+                    nulls[name] = flags
+        alive = None
+        if live is not None:
+            alive = view(live).tobytes()
+            if 0 not in alive:
+                alive = None
+        length = end - start if alive is None else alive.count(1)
+        fragment = _build(description, _Morsel(data, nulls, alive, length))
+        ctx = ExecutionContext(params, False, batch_size, None)
+        if type(fragment) is HashAggregate:
+            return list(fragment.partial_groups(ctx).items())
+        return list(input_rows(fragment, ctx))
+    finally:
+        data = fragment = ctx = None
+        for shm in handles:
+            try:
+                shm.close()
+            except BufferError:
+                pass # A view is still referenced; the mapping goes away with it
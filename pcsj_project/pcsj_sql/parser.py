@@ -0,0 +1,674 @@
+"""Tokenizer and recursive-descent parser for PCSJ SQL statements."""
+
+import re
+from typing import Any, Iterator, List, Tuple
+
+from .errors import SQLError, SQLSyntaxError
+from .nodes import (
+    Analyze, Begin, Between, BinaryOp, ColumnDef, Commit, Copy, CreateIndex, CreateTable, CreateView, Delete,
+    DropIndex, DropView, Exists, Explain, FuncCall, InList, InSubquery, Insert, IsNull, Join, Like, Literal, Name,
+    OrderItem, Param, RefreshView, Rollback, Select, SelectItem, Star, Subquery, SubqueryRef, TableRef, UnaryOp,
+    Update, WindowFunction, WindowSpec,
+)
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<ws>\s+|--[^\n]*|//[^\n]*)
+  | (?P<number>\d+\.\d*|\.\d+|\d+)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|''|\\.)*')
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<param>\?|:[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><=|>=|<>|!=|==|\|\||[-+*/%=<>(),.;{}:])
+''', re.VERBOSE)
+
+# Words that end an expression, so they cannot be read as an implicit alias
+RESERVED = {
+    'SELECT', 'FROM', 'WHERE', 'GROUP', 'BY', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'JOIN',
+    'INNER', 'LEFT', 'RIGHT', 'FULL', 'OUTER', 'CROSS', 'ON', 'USING', 'AS', 'AND', 'OR',
+    'NOT', 'WITH', 'UNION', 'ASC', 'DESC', 'DISTINCT', 'IN', 'IS', 'LIKE', 'BETWEEN', 'EXISTS',
+    'SET', 'VALUES', 'INTO', 'QUERY', 'SEMI', 'ANTI', 'OVER',
+}
+
+# Methods of result rows (see Row in database.py), which a column of the
+# same name would hide
+_ROW_ATTRIBUTES = {'as_dict', 'as_tuple'}
+
+def _result_name(name: str) -> str:
+    # A column or select-list alias becomes an attribute of result rows;
+    # `__name` would also be mangled as a slot
+    if name in _ROW_ATTRIBUTES or name.startswith('__'):
+        raise SQLError(f"'{name}' cannot name a column: result rows use it")
+    return name
+
+# Keywords that are literal values
+_LITERAL_WORDS = {'TRUE': True, 'FALSE': False, 'NULL': None}
+
+class Token:
+    __slots__ = ('kind', 'value', 'pos')
+
+    def __init__(self, kind: str, value: Any, pos: int):
+        self.kind = kind
+        self.value = value
+        self.pos = pos
+
+    def __repr__(self) -> str:
+        return f"Token({self.kind}, {self.value!r})"
+
+def _lexemes(sql: str) -> Iterator[Tuple[str, str, int]]:
+    # (kind, text, position) of every token, whitespace and comments included
+    pos = 0
+    while pos < len(sql):
+        match = TOKEN_PATTERN.match(sql, pos)
+        if not match:
+            raise SQLSyntaxError(f"Unexpected character {sql[pos]!r} at position {pos}")
+        yield match.lastgroup, match.group(), pos
+        pos = match.end()
+
+def tokenize(sql: str) -> List[Token]:
+    tokens = []
+    for kind, text, pos in _lexemes(sql):
+        if kind == 'number':
+            tokens.append(Token(kind, float(text) if '.' in text else int(text), pos))
+        elif kind == 'string':
+            body = text[1:-1]
+            if text[0] == "'":
+                body = body.replace("''", "'")
+            tokens.append(Token(kind, re.sub(r'\\(.)', r'\1', body), pos))
+        elif kind != 'ws':
+            tokens.append(Token(kind, text, pos))
+    tokens.append(Token('eof', None, len(sql)))
+    return tokens
+
+def normalize(sql: str) -> str:
+    # The statement's tokens separated by single spaces, so texts that only
+    # differ in layout and comments share one statement cache entry
+    return ' '.join(text for kind, text, _ in _lexemes(sql) if kind != 'ws')
+
+class Parser:
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.tokens = tokenize(sql)
+        self.current = 0
+        self.positional_params = 0
+
+    # --- Token helpers ----------------------------------------------------------
+
+    def peek(self, offset: int = 0) -> Token:
+        return self.tokens[min(self.current + offset, len(self.tokens) - 1)]
+
+    def advance(self) -> Token:
+        token = self.tokens[self.current]
+        if token.kind != 'eof':
+            self.current += 1
+        return token
+
+    def check_word(self, *words: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == 'name' and token.value.upper() in words
+
+    def match_word(self, *words: str) -> bool:
+        if self.check_word(*words):
+            self.advance()
+            return True
+        return False
+
+    def expect_word(self, word: str):
+        if not self.match_word(word):
+            self.error(f"Expected {word}")
+
+    def check_op(self, *ops: str) -> bool:
+        token = self.peek()
+        return token.kind == 'op' and token.value in ops
+
+    def match_op(self, *ops: str) -> bool:
+        if self.check_op(*ops):
+            self.advance()
+            return True
+        return False
+
+    def expect_op(self, op: str):
+        if not self.match_op(op):
+            self.error(f"Expected '{op}'")
+
+    def identifier(self) -> str:
+        token = self.peek()
+        if token.kind != 'name':
+            self.error("Expected identifier")
+        self.advance()
+        return token.value
+
+    def error(self, message: str):
+        token = self.peek()
+        found = 'end of input' if token.kind == 'eof' else repr(token.value)
+        raise SQLSyntaxError(f"{message} at position {token.pos}, found {found}")
+
+    def at_end(self) -> bool:
+        while self.match_op(';'):
+            pass
+        return self.peek().kind == 'eof'
+
+    # --- Statements -------------------------------------------------------------
+
+    def parse_statement(self):
+        if self.match_word('EXPLAIN'):
+            analyze = self.match_word('ANALYZE')
+            return Explain(self.parse_statement(), analyze)
+        if self.check_word('SELECT', 'WITH'):
+            statement = self.parse_query()
+        elif self.match_word('ANALYZE'):
+            statement = Analyze(None if self.at_end() else self.identifier())
+        elif self.check_word('TABLE') or self.check_word('CREATE') and self.check_word('TABLE', offset=1):
+            statement = self.parse_create_table()
+        elif self.check_word('CREATE') and self.check_word('INDEX', 'UNIQUE', offset=1):
+            statement = self.parse_create_index()
+        elif self.check_word('CREATE') and self.check_word('MATERIALIZED', offset=1):
+            self.advance()
+            statement = CreateView(self.parse_view_name(), None)
+            self.expect_word('AS')
+            statement.select = self.parse_query()
+        elif self.match_word('REFRESH'):
+            statement = RefreshView(self.parse_view_name())
+        elif self.match_word('DROP'):
+            if self.check_word('MATERIALIZED'):
+                statement = DropView(self.parse_view_name())
+            else:
+                self.expect_word('INDEX')
+                statement = DropIndex(self.identifier())
+        elif self.check_word('INSERT'):
+            statement = self.parse_insert()
+        elif self.check_word('COPY'):
+            statement = self.parse_copy()
+        elif self.check_word('UPDATE'):
+            statement = self.parse_update()
+        elif self.check_word('DELETE'):
+            statement = self.parse_delete()
+        elif self.match_word('BEGIN', 'START'):
+            self.match_word('TRANSACTION', 'WORK')
+            statement = Begin()
+        elif self.match_word('COMMIT'):
+            self.match_word('TRANSACTION', 'WORK')
+            statement = Commit()
+        elif self.match_word('ROLLBACK'):
+            self.match_word('TRANSACTION', 'WORK')
+            statement = Rollback()
+        else:
+            self.error("Unsupported statement")
+        if not self.at_end():
+            self.error("Unexpected input after statement")
+        return statement
+
+    def parse_create_table(self) -> CreateTable:
+        # PCSJ form:  table name { id: int PRIMARY KEY, ... }
+        # SQL form:   CREATE TABLE name (id int PRIMARY KEY, ...)
+        self.match_word('CREATE')
+        self.expect_word('TABLE')
+        name = self.identifier()
+        closer = '}' if self.match_op('{') else None
+        if closer is None:
+            self.expect_op('(')
+            closer = ')'
+        columns = []
+        while not self.check_op(closer):
+            columns.append(self.parse_column_def())
+            if not self.match_op(','):
+                break
+        self.expect_op(closer)
+        return CreateTable(name, columns)
+
+    def parse_create_index(self) -> CreateIndex:
+        # CREATE [UNIQUE] INDEX name ON table [USING HASH|BTREE] (column, ...)
+        self.expect_word('CREATE')
+        unique = self.match_word('UNIQUE')
+        self.expect_word('INDEX')
+        name = self.identifier()
+        self.expect_word('ON')
+        statement = CreateIndex(name, self.identifier(), [], unique)
+        if self.match_word('USING'):
+            if not self.check_word('HASH', 'BTREE'):
+                self.error("Expected HASH or BTREE")
+            statement.using = 'hash' if self.advance().value.upper() == 'HASH' else 'ordered'
+        self.expect_op('(')
+        statement.columns = self.parse_name_list()
+        self.expect_op(')')
+        return statement
+
+    def parse_view_name(self) -> str:
+        # MATERIALIZED VIEW name, after CREATE, REFRESH or DROP
+        self.expect_word('MATERIALIZED')
+        self.expect_word('VIEW')
+        return self.identifier()
+
+    def parse_column_def(self) -> ColumnDef:
+        name = _result_name(self.identifier())
+        if self.peek().kind == 'param':
+            # `id:int` without a space tokenizes like a `:name` placeholder
+            column = ColumnDef(name, self.advance().value[1:].lower())
+        else:
+            self.match_op(':')
+            column = ColumnDef(name, self.identifier().lower())
+        while True:
+            if self.match_word('PRIMARY'):
+                self.expect_word('KEY')
+                column.primary_key = True
+            elif self.match_word('NOT'):
+                self.expect_word('NULL')
+                column.not_null = True
+            elif self.match_word('UNIQUE'):
+                column.unique = True
+            elif self.check_word('FOREIGN', 'REFERENCES'):
+                if self.match_word('FOREIGN'):
+                    self.expect_word('KEY')
+                self.expect_word('REFERENCES')
+                table = self.identifier()
+                self.expect_op('(')
+                column.references = (table, self.identifier())
+                self.expect_op(')')
+            else:
+                return column
+
+    def parse_insert(self) -> Insert:
+        self.expect_word('INSERT')
+        self.expect_word('INTO')
+        statement = Insert(self.identifier(), None)
+        if self.match_op('('):
+            statement.columns = self.parse_name_list()
+            self.expect_op(')')
+        self.expect_word('VALUES')
+        while True:
+            self.expect_op('(')
+            statement.rows.append(self.parse_value_list())
+            self.expect_op(')')
+            if not self.match_op(','):
+                return statement
+
+    def parse_value_list(self) -> List[Any]:
+        # parse_expression_list() for a VALUES row. Bulk inserts are mostly
+        # literals, so a literal followed by ',' or ')' is taken directly.
+        values = []
+        while True:
+            token, after = self.peek(), self.peek(1)
+            if after.kind == 'op' and after.value in (',', ')') and (
+                    token.kind in ('number', 'string') or token.kind == 'name' and token.value.upper() in _LITERAL_WORDS):
+                self.advance()
+                values.append(Literal(_LITERAL_WORDS[token.value.upper()] if token.kind == 'name' else token.value))
+            else:
+                values.append(self.parse_expression())
+            if not self.match_op(','):
+                return values
+
+    def parse_copy(self) -> Copy:
+        # COPY table [(column, ...)] FROM 'file' [[WITH] (option [value], ...)]
+        # Options: FORMAT CSV|JSONL, HEADER [true|false], DELIMITER 'c', NULL 'text'
+        self.expect_word('COPY')
+        statement = Copy(self.identifier(), None, None)
+        if self.match_op('('):
+            statement.columns = self.parse_name_list()
+            self.expect_op(')')
+        self.expect_word('FROM')
+        statement.path = self.parse_primary()
+        self.match_word('WITH')
+        if self.match_op('('):
+            while not self.check_op(')'):
+                option = self.identifier().lower()
+                if option not in ('format', 'header', 'delimiter', 'null'):
+                    self.error(f"Unknown COPY option '{option}'")
+                if option == 'format':
+                    value = self.identifier().lower()
+                    if value not in ('csv', 'jsonl'):
+                        self.error("Expected FORMAT CSV or JSONL")
+                elif option == 'header':
+                    value = True
+                    if self.check_word('TRUE', 'FALSE'):
+                        value = self.advance().value.upper() == 'TRUE'
+                else:
+                    token = self.advance()
+                    if token.kind != 'string':
+                        self.error(f"COPY option {option.upper()} expects a string")
+                    value = token.value
+                statement.options[option] = value
+                if not self.match_op(','):
+                    break
+            self.expect_op(')')
+        return statement
+
+    def parse_update(self) -> Update:
+        self.expect_word('UPDATE')
+        statement = Update(self.identifier(), [])
+        if not self.check_word('SET'):
+            self.match_word('AS')
+            statement.alias = self.identifier()
+        self.expect_word('SET')
+        while True:
+            column = self.identifier()
+            if self.match_op('.'): # SET alias.column = ...
+                column = self.identifier()
+            self.expect_op('=')
+            statement.assignments.append((column, self.parse_expression()))
+            if not self.match_op(','):
+                break
+        if self.match_word('WHERE'):
+            statement.where = self.parse_expression()
+        return statement
+
+    def parse_delete(self) -> Delete:
+        self.expect_word('DELETE')
+        self.expect_word('FROM')
+        statement = Delete(self.identifier())
+        if self.peek().kind == 'name' and not self.check_word('WHERE'):
+            self.match_word('AS')
+            statement.alias = self.identifier()
+        if self.match_word('WHERE'):
+            statement.where = self.parse_expression()
+        return statement
+
+    def parse_query(self) -> Select:
+        # [WITH name AS (SELECT ...), ...] SELECT ...
+        ctes = []
+        if self.match_word('WITH'):
+            while True:
+                name = self.identifier()
+                self.expect_word('AS')
+                self.expect_op('(')
+                ctes.append((name, self.parse_query()))
+                self.expect_op(')')
+                if not self.match_op(','):
+                    break
+            # PCSJ scripts put `query name =` between the CTEs and the SELECT
+            if self.match_word('QUERY'):
+                self.identifier()
+                self.expect_op('=')
+        select = self.parse_select()
+        select.ctes = ctes + select.ctes
+        return select
+
+    def parse_select(self) -> Select:
+        self.expect_word('SELECT')
+        select = Select([])
+        select.distinct = self.match_word('DISTINCT')
+        self.match_word('ALL')
+        while True:
+            expr = self.parse_expression()
+            alias = self.parse_alias()
+            select.items.append(SelectItem(expr, _result_name(alias) if alias is not None else None))
+            if not self.match_op(','):
+                break
+        if self.match_word('FROM'):
+            select.source = self.parse_from()
+        if self.match_word('WHERE'):
+            select.where = self.parse_expression()
+        if self.match_word('GROUP'):
+            self.expect_word('BY')
+            select.group_by = self.parse_expression_list()
+        if self.match_word('HAVING'):
+            select.having = self.parse_expression()
+        if self.match_word('ORDER'):
+            self.expect_word('BY')
+            select.order_by = self.parse_order_list()
+        if self.match_word('LIMIT'):
+            select.limit = self.parse_expression()
+            if self.match_op(','): # LIMIT offset, count
+                select.offset, select.limit = select.limit, self.parse_expression()
+        if self.match_word('OFFSET'):
+            select.offset = self.parse_expression()
+        return select
+
+    def parse_order_list(self) -> List[OrderItem]:
+        items = []
+        while True:
+            item = OrderItem(self.parse_expression())
+            if self.match_word('DESC'):
+                item.descending = True
+            else:
+                self.match_word('ASC')
+            items.append(item)
+            if not self.match_op(','):
+                return items
+
+    def parse_alias(self):
+        if self.match_word('AS'):
+            return self.identifier()
+        token = self.peek()
+        if token.kind == 'name' and token.value.upper() not in RESERVED:
+            return self.advance().value
+        return None
+
+    def parse_from(self):
+        source = self.parse_table_ref()
+        while True:
+            if self.match_op(','):
+                source = Join('CROSS', source, self.parse_table_ref())
+                continue
+            if self.match_word('CROSS'):
+                self.expect_word('JOIN')
+                source = Join('CROSS', source, self.parse_table_ref())
+                continue
+            if self.match_word('SEMI'):
+                kind = 'SEMI'
+            elif self.match_word('ANTI'):
+                kind = 'ANTI'
+            elif self.match_word('LEFT'):
+                # LEFT SEMI/ANTI JOIN is the spelling some dialects use for SEMI/ANTI JOIN
+                if self.match_word('SEMI'):
+                    kind = 'SEMI'
+                elif self.match_word('ANTI'):
+                    kind = 'ANTI'
+                else:
+                    kind = 'LEFT'
+                    self.match_word('OUTER')
+            elif self.match_word('INNER') or self.check_word('JOIN'):
+                kind = 'INNER'
+            else:
+                return source
+            self.expect_word('JOIN')
+            right = self.parse_table_ref()
+            self.expect_word('ON')
+            source = Join(kind, source, right, self.parse_expression())
+
+    def parse_table_ref(self):
+        if self.match_op('('):
+            select = self.parse_query()
+            self.expect_op(')')
+            alias = self.parse_alias()
+            if alias is None:
+                self.error("A subquery in FROM needs an alias")
+            return SubqueryRef(select, alias)
+        return TableRef(self.identifier(), self.parse_alias())
+
+    def parse_name_list(self) -> List[str]:
+        names = [self.identifier()]
+        while self.match_op(','):
+            names.append(self.identifier())
+        return names
+
+    # --- Expressions ------------------------------------------------------------
+
+    def parse_expression_list(self) -> List[Any]:
+        items = [self.parse_expression()]
+        while self.match_op(','):
+            items.append(self.parse_expression())
+        return items
+
+    def parse_expression(self):
+        return self.parse_or()
+
+    def parse_or(self):
+        expr = self.parse_and()
+        while self.match_word('OR'):
+            expr = BinaryOp('OR', expr, self.parse_and())
+        return expr
+
+    def parse_and(self):
+        expr = self.parse_not()
+        while self.match_word('AND'):
+            expr = BinaryOp('AND', expr, self.parse_not())
+        return expr
+
+    def parse_not(self):
+        if self.match_word('NOT'):
+            return UnaryOp('NOT', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        expr = self.parse_additive()
+        while True:
+            if self.check_op('=', '==', '!=', '<>', '<', '<=', '>', '>='):
+                op = self.advance().value
+                op = {'==': '=', '<>': '!='}.get(op, op)
+                expr = BinaryOp(op, expr, self.parse_additive())
+                continue
+            negated = self.check_word('NOT') and self.check_word('IN', 'BETWEEN', 'LIKE', offset=1)
+            if negated:
+                self.advance()
+            if self.match_word('IN'):
+                expr = self.parse_in(expr, negated)
+            elif self.match_word('BETWEEN'):
+                low = self.parse_additive()
+                self.expect_word('AND')
+                expr = Between(expr, low, self.parse_additive(), negated)
+            elif self.match_word('LIKE'):
+                expr = Like(expr, self.parse_additive(), negated)
+            elif self.match_word('IS'):
+                expr = IsNull(expr, self.match_word('NOT'))
+                self.expect_word('NULL')
+            else:
+                return expr
+
+    def parse_in(self, operand, negated: bool):
+        self.expect_op('(')
+        if self.check_word('SELECT', 'WITH'):
+            select = self.parse_query()
+            self.expect_op(')')
+            return InSubquery(operand, select, negated)
+        items = self.parse_expression_list()
+        self.expect_op(')')
+        return InList(operand, items, negated)
+
+    def parse_additive(self):
+        expr = self.parse_multiplicative()
+        while self.check_op('+', '-', '||'):
+            expr = BinaryOp(self.advance().value, expr, self.parse_multiplicative())
+        return expr
+
+    def parse_multiplicative(self):
+        expr = self.parse_unary()
+        while self.check_op('*', '/', '%'):
+            expr = BinaryOp(self.advance().value, expr, self.parse_unary())
+        return expr
+
+    def parse_unary(self):
+        if self.match_op('-'):
+            operand = self.parse_unary()
+            if isinstance(operand, Literal) and isinstance(operand.value, (int, float)):
+                return Literal(-operand.value)
+            return UnaryOp('-', operand)
+        if self.match_op('+'):
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token = self.peek()
+        if token.kind in ('number', 'string'):
+            self.advance()
+            return Literal(token.value)
+        if token.kind == 'param':
+            self.advance()
+            if token.value == '?':
+                self.positional_params += 1
+                return Param(self.positional_params - 1)
+            return Param(token.value[1:])
+        if self.match_op('('):
+            if self.check_word('SELECT', 'WITH'):
+                expr = Subquery(self.parse_query())
+            else:
+                expr = self.parse_expression()
+            self.expect_op(')')
+            return expr
+        if self.match_op('*'):
+            return Star()
+        if token.kind != 'name':
+            self.error("Expected expression")
+        word = token.value.upper()
+        if word in ('TRUE', 'FALSE'):
+            self.advance()
+            return Literal(word == 'TRUE')
+        if word == 'NULL':
+            self.advance()
+            return Literal(None)
+        if word == 'EXISTS' and self.peek(1).kind == 'op' and self.peek(1).value == '(':
+            self.advance()
+            self.expect_op('(')
+            select = self.parse_query()
+            self.expect_op(')')
+            return Exists(select)
+        parts = [self.identifier()]
+        while self.check_op('.'):
+            self.advance()
+            if self.match_op('*'):
+                return Star(parts[0])
+            parts.append(self.identifier())
+        if len(parts) == 1 and self.check_op('('):
+            return self.parse_call(parts[0])
+        return Name(tuple(parts))
+
+    def parse_call(self, name: str):
+        self.expect_op('(')
+        call = FuncCall(name.upper(), [])
+        if self.match_op('*'):
+            call.star = True
+        elif not self.check_op(')'):
+            call.distinct = self.match_word('DISTINCT')
+            call.args = self.parse_expression_list()
+        self.expect_op(')')
+        if self.check_word('OVER'):
+            if call.distinct:
+                self.error(f"DISTINCT is not supported in window function {call.name}()")
+            self.advance()
+            return WindowFunction(call.name, call.args, self.parse_window(), call.star)
+        return call
+
+    def parse_window(self) -> WindowSpec:
+        # OVER ([PARTITION BY ...] [ORDER BY ...] [ROWS frame])
+        self.expect_op('(')
+        window = WindowSpec()
+        if self.match_word('PARTITION'):
+            self.expect_word('BY')
+            window.partition_by = self.parse_expression_list()
+        if self.match_word('ORDER'):
+            self.expect_word('BY')
+            window.order_by = self.parse_order_list()
+        if self.match_word('ROWS'):
+            if self.match_word('BETWEEN'):
+                start = self.parse_frame_bound()
+                self.expect_word('AND')
+                end = self.parse_frame_bound()
+            else:
+                start, end = self.parse_frame_bound(), 0
+            if start == 'end' or end == 'start':
+                self.error("Invalid ROWS frame")
+            window.frame = (None if start == 'start' else start, None if end == 'end' else end)
+            if None not in window.frame and window.frame[0] > window.frame[1]:
+                self.error("ROWS frame starts after it ends")
+        elif self.check_word('RANGE', 'GROUPS'):
+            self.error("Only ROWS window frames are supported")
+        self.expect_op(')')
+        return window
+
+    def parse_frame_bound(self):
+        # A row offset, or 'start'/'end' for UNBOUNDED PRECEDING/FOLLOWING
+        if self.match_word('UNBOUNDED'):
+            if self.match_word('PRECEDING'):
+                return 'start'
+            self.expect_word('FOLLOWING')
+            return 'end'
+        if self.match_word('CURRENT'):
+            self.expect_word('ROW')
+            return 0
+        token = self.advance()
+        if token.kind != 'number' or not isinstance(token.value, int) or token.value < 0:
+            self.error("Window frame offsets must be non-negative integers")
+        if self.match_word('PRECEDING'):
+            return -token.value
+        self.expect_word('FOLLOWING')
+        return token.value
+
+def parse(sql: str):
+    return Parser(sql).parse_statement()
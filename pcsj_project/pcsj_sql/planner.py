@@ -0,0 +1,1219 @@
+"""Cost-based planning of SELECT statements into operator trees.
+
+Single-table predicates are pushed down into scans, scans read only the
+columns the query mentions, each scan picks a sequential or index access
+path, inner joins are reordered by estimated cost, and every join picks a
+nested-loop, hash, merge or index nested-loop method. EXISTS and IN
+subqueries in WHERE become semi and anti joins, correlated scalar aggregates
+become joins against the grouped aggregate, and a CTE referenced several
+times may be materialized once. Window functions run after grouping, one
+WindowAgg per distinct PARTITION BY / ORDER BY. Estimates
+come from ANALYZE statistics when present and from row counts and defaults
+otherwise.
+"""
+
+import math
+from dataclasses import fields, replace
+from itertools import combinations
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .access import IndexProbe, conjuncts, probe_for, restrictions
+from .errors import SQLError
+from .expressions import AGGREGATE_FUNCTIONS
+from .nodes import (
+    Between, BinaryOp, ColumnRef, Exists, FuncCall, InList, InSubquery, IsNull, Join, Like, Literal,
+    Name, OrderItem, OuterRef, Param, Select, SelectItem, Star, Subquery, SubqueryRef, SubPlan, TableRef, UnaryOp,
+    WindowFunction, WindowSpec,
+)
+from .operators import (
+    OFFSET_FUNCTIONS, RANKING_FUNCTIONS, Distinct, Filter, HashAggregate, HashJoin, IndexNestedLoopJoin, IndexScan,
+    CTEScan, Limit, MergeJoin, NestedLoopJoin, Operator, Project, Result, SeqScan, Sort, SubqueryScan, WindowAgg,
+    format_expr,
+)
+from .parallel import Gather, fragment_expressions
+from .stats import DEFAULT_EQ_SELECTIVITY, DEFAULT_LIKE_SELECTIVITY, DEFAULT_NULL_FRACTION, DEFAULT_RANGE_SELECTIVITY
+from .storage import Table
+
+# Cost units: reading one row in a sequential scan costs 1
+SEQ_ROW_COST = 1.0
+RANDOM_ROW_COST = 4.0 # fetching one row by id found in an index
+CPU_OPERATOR_COST = 0.25 # evaluating one predicate or expression on one row
+SORT_ROW_COST = 0.1 # per row and comparison level (n log n)
+HASH_ROW_COST = 0.5 # adding one row to a hash join's table
+DISABLED_COST = 1e10 # added to join methods switched off in Database.settings
+DEFAULT_DISTINCT = 200 # distinct values assumed for a column without statistics
+DP_RELATION_LIMIT = 8 # join orders are searched exhaustively up to this many tables
+MATERIALIZED_ROW_COST = 0.5 # reading one stored row of a materialized CTE
+
+_COMPARISONS = {'=', '!=', '<', '<=', '>', '>='}
+_FLIPPED = {'=': '=', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+_SUBQUERIES = (Subquery, InSubquery, Exists)
+
+def _is_node(value: Any) -> bool:
+    return hasattr(value, '__dataclass_fields__')
+
+def map_children(expr: Any, fn: Callable[[Any], Any]) -> Any:
+    changes = {}
+    for f in fields(expr):
+        value = getattr(expr, f.name)
+        if isinstance(value, list):
+            changes[f.name] = [fn(item) if _is_node(item) else item for item in value]
+        elif _is_node(value):
+            changes[f.name] = fn(value)
+    return replace(expr, **changes) if changes else expr
+
+def walk(expr: Any, into_subqueries: bool = True):
+    # Every node of an expression; optionally also those of nested SELECTs
+    if isinstance(expr, (list, tuple)):
+        for item in expr:
+            yield from walk(item, into_subqueries)
+        return
+    if not _is_node(expr):
+        return
+    yield expr
+    if not into_subqueries and isinstance(expr, (Select, SubPlan)):
+        return
+    for f in fields(expr):
+        if not (isinstance(expr, SubPlan) and f.name == 'plan'):
+            yield from walk(getattr(expr, f.name), into_subqueries)
+
+def _local_nodes(expr: Any):
+    # Nodes of this query level only; subqueries are opaque
+    return walk(expr, into_subqueries=False)
+
+def _is_aggregate(node: Any) -> bool:
+    return type(node) is FuncCall and node.name in AGGREGATE_FUNCTIONS
+
+def _has_window(expr: Any) -> bool:
+    return any(type(node) is WindowFunction for node in walk(expr, into_subqueries=False))
+
+def _has_subquery(expr: Any) -> bool:
+    return any(isinstance(node, _SUBQUERIES) for node in walk(expr, into_subqueries=False))
+
+def _and(terms: List[Any]) -> Any:
+    expr = None
+    for term in terms:
+        expr = term if expr is None else BinaryOp('AND', expr, term)
+    return expr
+
+class Relation:
+    # One FROM item: a base table, or a derived table (FROM subquery or CTE)
+    def __init__(self, alias: str, table: Any = None, plan: Optional[Operator] = None):
+        self.alias = alias
+        self.table = table
+        self.plan = plan
+        self.columns: List[str] = table.column_names if table is not None else [name for _, name in plan.layout]
+        self.needed: Set[str] = set()
+        # Single-relation conjuncts, evaluated inside the scan
+        self.filters: List[Any] = []
+        # Right side of a LEFT JOIN: WHERE terms on it must wait for the join
+        self.nullable = False
+        # Right side of a SEMI or ANTI JOIN: only its ON condition may read it
+        self.semi = False
+
+    def __repr__(self) -> str:
+        return f"Relation({self.alias})"
+
+class CTE:
+    # A WITH query. A CTE referenced once is planned in place (inlined); one
+    # referenced several times runs once into stored batches that every
+    # reference scans, when that is estimated to be cheaper than re-running it.
+    def __init__(self, name: str, select: Select, visible: dict, references: int):
+        self.name = name
+        self.select = select
+        # The CTEs its body can see
+        self.visible = visible
+        self.references = references
+        self.inline = references <= 1
+        self.materialized: Optional[Operator] = None
+
+class Planner:
+    def __init__(self, database: Any, params: Any = None, outer: Optional[List[list]] = None,
+                 ctes: Optional[Dict[str, CTE]] = None, parent: Optional['Planner'] = None, workers: int = 0,
+                 tables: Optional[Dict[str, Any]] = None):
+        self.database = database
+        self.params = params
+        # Tables that FROM names resolve to instead of the database's (see views.py)
+        self.tables = tables if tables is not None else parent.tables if parent is not None else {}
+        # Worker processes a scan of one large table may use (see parallel.py);
+        # subqueries always run in the process of their query
+        self.workers = workers
+        # Layouts of the enclosing queries, innermost last, for correlated names
+        self.outer = outer or []
+        self.ctes = ctes or {}
+        self.parent = parent
+        self.correlated = False
+        # Aliases of the relations added by subquery decorrelation
+        self.hidden: Set[str] = set()
+
+    # --- Name binding -----------------------------------------------------------
+
+    @staticmethod
+    def lookup(layout: List[Tuple[Optional[str], str]], name: Name, hidden: Set[str] = frozenset()) -> Optional[int]:
+        # `hidden`: qualifiers that only qualified names may refer to
+        parts = name.parts
+        if len(parts) == 1:
+            matches = [i for i, (qualifier, column) in enumerate(layout) if column == parts[0] and qualifier not in hidden]
+        elif len(parts) == 2:
+            matches = [i for i, (qualifier, column) in enumerate(layout) if qualifier == parts[0] and column == parts[1]]
+        else:
+            return None
+        if len(matches) > 1:
+            raise SQLError(f"Column reference '{name}' is ambiguous")
+        return matches[0] if matches else None
+
+    def _mark_correlated(self, depth: int):
+        # Every query level between this one and the referenced scope depends on the outer row
+        target = len(self.outer) - depth
+        planner = self
+        while planner is not None and len(planner.outer) > target:
+            planner.correlated = True
+            planner = planner.parent
+
+    def bind(self, expr: Any, layout: List[Tuple[Optional[str], str]]) -> Any:
+        # Replace names with slots of `layout` (or of an enclosing query) and
+        # plan subqueries; names that match no column are PCSJ host variables
+        kind = type(expr)
+        if kind is Name:
+            index = self.lookup(layout, expr, self.hidden)
+            if index is not None:
+                return ColumnRef(index, str(expr))
+            for depth, outer_layout in enumerate(reversed(self.outer), 1):
+                index = self.lookup(outer_layout, expr)
+                if index is not None:
+                    self._mark_correlated(depth)
+                    return OuterRef(depth, index, str(expr))
+            return expr
+        if kind is Subquery:
+            return self._subplan('scalar', expr.select, layout)
+        if kind is InSubquery:
+            return self._subplan('in', expr.select, layout, self.bind(expr.operand, layout), expr.negated)
+        if kind is Exists:
+            return self._subplan('exists', expr.select, layout, negated=expr.negated)
+        if kind is Star:
+            raise SQLError("* is only allowed in the select list and in COUNT(*)")
+        if kind is FuncCall and expr.name in AGGREGATE_FUNCTIONS:
+            raise SQLError(f"Aggregate {expr.name}() is not allowed here")
+        if kind is WindowFunction:
+            raise SQLError(f"Window function {expr.name}() is only allowed in the select list and ORDER BY")
+        if kind in (ColumnRef, OuterRef, Literal, Param, SubPlan):
+            return expr
+        return map_children(expr, lambda child: self.bind(child, layout))
+
+    def _subplan(self, kind: str, select: Select, layout: list, operand: Any = None, negated: bool = False) -> SubPlan:
+        planner = Planner(self.database, self.params, self.outer + [layout], self.ctes, parent=self)
+        plan = planner.plan_select(select)
+        if kind in ('in', 'scalar') and len(plan.layout) != 1:
+            raise SQLError(f"{'IN' if kind == 'in' else 'Scalar'} subquery must return exactly one column")
+        return SubPlan(kind, plan, operand, negated, planner.correlated)
+
+    # --- FROM -------------------------------------------------------------------
+
+    def _relation(self, ref: Any) -> Relation:
+        if isinstance(ref, SubqueryRef):
+            return Relation(ref.alias, plan=self._derived(ref.select, self.ctes))
+        if ref.name in self.ctes:
+            return Relation(ref.alias or ref.name, plan=self._cte_plan(self.ctes[ref.name]))
+        table = self.tables.get(ref.name)
+        return Relation(ref.alias or ref.name, table=table if table is not None else self.database.table(ref.name))
+
+    def _cte_plan(self, cte: CTE) -> Operator:
+        if cte.materialized is not None:
+            rows = cte.materialized.estimated_rows
+            return CTEScan(cte.materialized, cte.name, first=False, rows=rows, cost=rows * MATERIALIZED_ROW_COST)
+        planner = Planner(self.database, self.params, self.outer, cte.visible, parent=self)
+        plan = planner.plan_select(cte.select)
+        rows = plan.estimated_rows
+        # A CTE that reads an enclosing query's row cannot be shared
+        if cte.inline or planner.correlated or \
+                plan.cost + cte.references * rows * MATERIALIZED_ROW_COST >= cte.references * plan.cost:
+            cte.inline = True
+            return plan
+        cte.materialized = plan
+        return CTEScan(plan, cte.name, first=True, rows=rows, cost=plan.cost + rows * MATERIALIZED_ROW_COST)
+
+    def _derived(self, select: Select, ctes: dict) -> Operator:
+        # Derived tables see the enclosing queries but not their sibling FROM items
+        return Planner(self.database, self.params, self.outer, ctes, parent=self).plan_select(select)
+
+    def _flatten(self, source: Any, steps: list):
+        # FROM items in written order as (relation, join kind, ON condition)
+        if isinstance(source, Join):
+            self._flatten(source.left, steps)
+            steps.append((self._relation(source.right), source.kind, source.condition))
+        else:
+            steps.append((self._relation(source), None, None))
+
+    # --- Subquery decorrelation ---------------------------------------------------
+
+    def _decorrelate(self, select: Select, steps: list) -> Select:
+        # Rewrite WHERE conjuncts `[NOT] EXISTS (...)` and `x IN (...)` into
+        # SEMI and ANTI join steps, and correlated scalar aggregates (in WHERE,
+        # or anywhere in an ungrouped query) into LEFT joins against that
+        # aggregate grouped by the correlation keys, so each subquery runs
+        # once instead of once per outer row. Other subqueries stay SubPlans;
+        # NOT IN does too, since its NULL handling is not an anti join's.
+        relations = [relation for relation, _, _ in steps]
+        where = []
+        for term in conjuncts(select.where) if select.where is not None else []:
+            step = self._semi_step(term, relations)
+            if step is None:
+                where.append(term)
+            else:
+                steps.append(step)
+                relations.append(step[0])
+        replaced: List[Tuple[Subquery, Any]] = []
+
+        def rewrite(expr: Any) -> Any:
+            if type(expr) is Subquery:
+                for subquery, replacement in replaced:
+                    if subquery == expr:
+                        return replacement
+                join = self._scalar_step(expr, relations)
+                if join is None:
+                    return expr
+                relation, condition, replacement = join
+                steps.append((relation, 'LEFT', condition))
+                relations.append(relation)
+                replaced.append((expr, replacement))
+                return replacement
+            if not _is_node(expr) or isinstance(expr, _SUBQUERIES):
+                return expr
+            return map_children(expr, rewrite)
+        where = [rewrite(term) for term in where]
+        items, order_by = select.items, select.order_by
+        # After grouping only group keys and aggregates can be read
+        if not select.group_by and not self._collect_aggregates(select):
+            items = [replace(item, expr=rewrite(item.expr)) for item in items]
+            order_by = [replace(item, expr=rewrite(item.expr)) for item in order_by]
+        return replace(select, where=_and(where), items=items, order_by=order_by)
+
+    def _fresh_alias(self, alias: str, relations: List[Relation]) -> str:
+        # An alias no table of this query or of an enclosing one uses
+        taken = {relation.alias for relation in relations} | {q for layout in self.outer for q, _ in layout}
+        fresh, n = alias, 1
+        while fresh in taken:
+            fresh, n = f"{alias}_{n}", n + 1
+        return fresh
+
+    @staticmethod
+    def _inner_test(source: Any, columns: List[str]) -> Callable[[Name], bool]:
+        # Whether a name inside a single-table subquery means that table's column
+        alias = source.alias or source.name if type(source) is TableRef else source.alias
+        names = set(columns)
+        def inner(name: Name) -> bool:
+            if len(name.parts) == 2:
+                return name.parts[0] == alias
+            return len(name.parts) == 1 and name.parts[0] in names
+        return inner
+
+    def _requalify(self, expr: Any, inner: Callable[[Name], bool], alias: str) -> Any:
+        if type(expr) is Name:
+            return Name((alias, expr.column)) if inner(expr) else expr
+        if not _is_node(expr):
+            return expr
+        return map_children(expr, lambda child: self._requalify(child, inner, alias))
+
+    def _mentions(self, expr: Any, relations: List[Relation]) -> bool:
+        # Whether any name in `expr`, subqueries included, could be a column of `relations`
+        return any(type(node) is Name and self._relation_of(node, relations, strict=False) for node in walk(expr))
+
+    def _semi_step(self, term: Any, relations: List[Relation]) -> Optional[tuple]:
+        # A (relation, 'SEMI' or 'ANTI', ON condition) join step for an EXISTS
+        # or IN conjunct, or None to keep it as a SubPlan
+        negated = False
+        if type(term) is UnaryOp and term.op == 'NOT' and type(term.operand) is Exists:
+            term, negated = term.operand, True # NOT EXISTS
+        kind = type(term)
+        if kind is Exists:
+            join = 'ANTI' if term.negated != negated else 'SEMI'
+            # An uncorrelated EXISTS is a constant, already computed only once
+            if not self._references(term, relations):
+                return None
+        elif kind is InSubquery and not term.negated and not _has_subquery(term.operand):
+            join = 'SEMI'
+        else:
+            return None
+        select = term.select
+        items = [item.expr for item in select.items]
+        if kind is InSubquery and (len(items) != 1 or type(items[0]) is Star):
+            return None
+        source = select.source
+        # A derived table or CTE body reading the outer query's columns only works inside the subquery
+        body = source.select if type(source) is SubqueryRef else \
+            self.ctes[source.name].select if type(source) is TableRef and source.name in self.ctes else None
+        single = type(source) in (TableRef, SubqueryRef) and not select.ctes and not select.group_by \
+            and (body is None or not self._mentions(body, relations)) \
+            and select.having is None and select.limit is None and select.offset is None \
+            and not any(_is_aggregate(node) or isinstance(node, _SUBQUERIES) or type(node) is WindowFunction
+                        for node in walk([items, select.where], into_subqueries=False))
+        if single:
+            # Join the subquery's table itself, its WHERE becoming the ON condition
+            original = source.alias or source.name if type(source) is TableRef else source.alias
+            relation = self._relation(replace(source, alias=self._fresh_alias(original, relations)))
+            inner = self._inner_test(source, relation.columns)
+            terms = [self._requalify(t, inner, relation.alias)
+                     for t in (conjuncts(select.where) if select.where is not None else [])]
+            if kind is InSubquery:
+                terms.append(BinaryOp('=', term.operand, self._requalify(items[0], inner, relation.alias)))
+            condition = _and(terms)
+        elif kind is InSubquery and not self._mentions(select, relations):
+            # An uncorrelated IN over any query joins its result as a derived table
+            relation = self._relation(SubqueryRef(select, self._fresh_alias('subquery', relations)))
+            if len(relation.columns) != 1:
+                raise SQLError("IN subquery must return exactly one column")
+            condition = BinaryOp('=', term.operand, Name((relation.alias, relation.columns[0])))
+        else:
+            return None
+        self.hidden.add(relation.alias)
+        return relation, join, condition
+
+    def _scalar_step(self, subquery: Subquery, relations: List[Relation]) -> Optional[tuple]:
+        # For `(SELECT agg(...) FROM table WHERE inner = outer AND ...)`, the
+        # relation `SELECT inner..., agg(...) FROM table WHERE ... GROUP BY
+        # inner...`, the ON condition `outer = key` and the expression that
+        # replaces the subquery; None for any other scalar subquery
+        select = subquery.select
+        source = select.source
+        if type(source) is not TableRef or source.name in self.ctes or select.ctes or select.group_by \
+                or select.having is not None or select.limit is not None or select.offset is not None \
+                or select.distinct or len(select.items) != 1 or not _is_aggregate(select.items[0].expr) \
+                or any(isinstance(node, _SUBQUERIES) or type(node) is WindowFunction
+                       for node in walk([select.items, select.where], into_subqueries=False)):
+            return None
+        table = self.database.table(source.name)
+        inner = self._inner_test(source, table.column_names)
+
+        def correlated(expr: Any) -> bool:
+            return any(type(node) is Name and not inner(node) and self._relation_of(node, relations, strict=False)
+                       for node in walk(expr))
+
+        def inner_only(expr: Any) -> bool:
+            return not correlated(expr) and any(type(node) is Name and inner(node) for node in walk(expr))
+
+        aggregate = select.items[0].expr
+        if correlated(aggregate):
+            return None
+        keys, outer_keys, local = [], [], []
+        for term in conjuncts(select.where) if select.where is not None else []:
+            if not correlated(term):
+                local.append(term)
+            elif type(term) is BinaryOp and term.op == '=' and inner_only(term.left) and not inner_only(term.right) \
+                    and not any(type(node) is Name and inner(node) for node in walk(term.right)):
+                keys.append(term.left)
+                outer_keys.append(term.right)
+            elif type(term) is BinaryOp and term.op == '=' and inner_only(term.right) \
+                    and not any(type(node) is Name and inner(node) for node in walk(term.left)):
+                keys.append(term.right)
+                outer_keys.append(term.left)
+            else:
+                return None
+        if not keys:
+            return None
+        alias = self._fresh_alias('subquery', relations)
+        grouped = Select(items=[SelectItem(key, f"#key{i}") for i, key in enumerate(keys, 1)]
+                         + [SelectItem(aggregate, '#value')],
+                         source=source, where=_and(local), group_by=keys)
+        relation = Relation(alias, plan=self._derived(grouped, self.ctes))
+        self.hidden.add(alias)
+        condition = _and([BinaryOp('=', outer, Name((alias, f"#key{i}"))) for i, outer in enumerate(outer_keys, 1)])
+        value = Name((alias, '#value'))
+        # Over no rows COUNT is 0, but the LEFT join has no group to read it from
+        return relation, condition, FuncCall('COALESCE', [value, Literal(0)]) if aggregate.name == 'COUNT' else value
+
+    def _relation_of(self, name: Name, relations: List[Relation], strict: bool = True) -> Set[int]:
+        parts = name.parts
+        if len(parts) == 2:
+            return {i for i, r in enumerate(relations) if r.alias == parts[0] and parts[1] in r.columns}
+        if len(parts) != 1:
+            return set()
+        found = {i for i, r in enumerate(relations) if parts[0] in r.columns and r.alias not in self.hidden}
+        if strict and len(found) > 1:
+            raise SQLError(f"Column reference '{name}' is ambiguous")
+        return found
+
+    def _references(self, expr: Any, relations: List[Relation]) -> Set[int]:
+        # Relations a conjunct reads. Names inside subqueries count whenever they
+        # could be correlated references, which only ever delays a predicate.
+        refs: Set[int] = set()
+        for node in walk(expr, into_subqueries=False):
+            if type(node) is Name:
+                refs |= self._relation_of(node, relations)
+            elif isinstance(node, _SUBQUERIES):
+                for inner in walk(node.select):
+                    if type(inner) is Name:
+                        refs |= self._relation_of(inner, relations, strict=False)
+        return refs
+
+    # --- Estimates --------------------------------------------------------------
+
+    def _stats(self, relation: Relation):
+        if relation.table is None:
+            return None
+        return self.database.stats.get(relation.table.name)
+
+    def _rows(self, relation: Relation) -> float:
+        if relation.table is not None:
+            return float(len(relation.table))
+        return relation.plan.estimated_rows
+
+    def _distinct(self, relation: Relation, column: str) -> float:
+        rows = max(self._rows(relation), 1.0)
+        stats = self._stats(relation)
+        if stats is not None and stats.column(column) is not None:
+            return float(min(max(stats.column(column).distinct, 1), rows))
+        if relation.table is not None and relation.table.index_on([column], unique=True) is not None:
+            return rows
+        return min(rows, DEFAULT_DISTINCT)
+
+    def _column(self, expr: Any, relations: List[Relation]) -> Optional[Tuple[Relation, str]]:
+        if type(expr) is not Name:
+            return None
+        found = self._relation_of(expr, relations, strict=False)
+        if len(found) != 1:
+            return None
+        return relations[found.pop()], expr.column
+
+    def _eq_selectivity(self, relation: Relation, column: str) -> float:
+        stats = self._stats(relation)
+        if stats is not None and stats.column(column) is not None:
+            return stats.column(column).eq_selectivity()
+        return 1.0 / self._distinct(relation, column)
+
+    def _range_selectivity(self, relation: Relation, column: str, low: Any, high: Any,
+                           low_inclusive: bool = True, high_inclusive: bool = True) -> float:
+        stats = self._stats(relation)
+        column_stats = stats.column(column) if stats is not None else None
+        literal_low = low is None or type(low) is Literal
+        literal_high = high is None or type(high) is Literal
+        if column_stats is not None and literal_low and literal_high:
+            return column_stats.range_selectivity(low.value if low is not None else None,
+                                                  high.value if high is not None else None,
+                                                  low_inclusive, high_inclusive)
+        if low is not None and high is not None:
+            return DEFAULT_RANGE_SELECTIVITY * DEFAULT_RANGE_SELECTIVITY * 2
+        return DEFAULT_RANGE_SELECTIVITY
+
+    def selectivity(self, expr: Any, relations: List[Relation]) -> float:
+        kind = type(expr)
+        if kind is BinaryOp:
+            if expr.op == 'AND':
+                return self.selectivity(expr.left, relations) * self.selectivity(expr.right, relations)
+            if expr.op == 'OR':
+                left, right = self.selectivity(expr.left, relations), self.selectivity(expr.right, relations)
+                return left + right - left * right
+            if expr.op not in _COMPARISONS:
+                return DEFAULT_RANGE_SELECTIVITY
+            left, right = self._column(expr.left, relations), self._column(expr.right, relations)
+            if left and right:
+                if expr.op == '=':
+                    # Equi-join: each value matches 1/max(distinct) of the other side
+                    return 1.0 / max(self._distinct(*left), self._distinct(*right))
+                return DEFAULT_RANGE_SELECTIVITY
+            op, value = expr.op, expr.right
+            if left is None:
+                left, op, value = right, _FLIPPED[expr.op], expr.left
+            if left is None:
+                return DEFAULT_EQ_SELECTIVITY if op == '=' else DEFAULT_RANGE_SELECTIVITY
+            if op == '=':
+                return self._eq_selectivity(*left)
+            if op == '!=':
+                return 1.0 - self._eq_selectivity(*left)
+            if op in ('>', '>='):
+                return self._range_selectivity(*left, value, None, low_inclusive=op == '>=')
+            return self._range_selectivity(*left, None, value, high_inclusive=op == '<=')
+        if kind is Between:
+            column = self._column(expr.operand, relations)
+            inside = self._range_selectivity(*column, expr.low, expr.high) if column else DEFAULT_RANGE_SELECTIVITY
+            return 1.0 - inside if expr.negated else inside
+        if kind is InList:
+            column = self._column(expr.operand, relations)
+            each = self._eq_selectivity(*column) if column else DEFAULT_EQ_SELECTIVITY
+            inside = min(1.0, each * len(expr.items))
+            return 1.0 - inside if expr.negated else inside
+        if kind is IsNull:
+            column = self._column(expr.operand, relations)
+            stats = self._stats(column[0]) if column else None
+            nulls = DEFAULT_NULL_FRACTION
+            if stats is not None and stats.column(column[1]) is not None:
+                nulls = stats.column(column[1]).null_fraction
+            return 1.0 - nulls if expr.negated else nulls
+        if kind is Like:
+            return 1.0 - DEFAULT_LIKE_SELECTIVITY if expr.negated else DEFAULT_LIKE_SELECTIVITY
+        if kind is UnaryOp and expr.op == 'NOT':
+            return 1.0 - self.selectivity(expr.operand, relations)
+        if kind is Literal:
+            return 1.0 if expr.value else 0.0
+        if kind in _SUBQUERIES:
+            return 0.5
+        return DEFAULT_RANGE_SELECTIVITY
+
+    def _probe_selectivity(self, probe: IndexProbe, relation: Relation) -> float:
+        index = probe.index
+        rows = max(self._rows(relation), 1.0)
+        if probe.any_of is None and len(probe.equal) == len(index.columns) and index.unique:
+            return 1.0 / rows
+        selectivity = 1.0
+        for column in index.columns[:len(probe.equal)]:
+            selectivity *= self._eq_selectivity(relation, column)
+        if len(probe.equal) < len(index.columns):
+            column = index.columns[len(probe.equal)]
+            if probe.any_of is not None:
+                selectivity *= min(1.0, self._eq_selectivity(relation, column) * len(probe.any_of))
+            elif probe.low is not None or probe.high is not None:
+                low, high = probe.low, probe.high
+                selectivity *= self._range_selectivity(relation, column, low and low[1], high and high[1],
+                                                       not low or low[0] == '>=', not high or high[0] == '<=')
+        return max(selectivity, 1.0 / rows)
+
+    # --- Access paths -----------------------------------------------------------
+
+    def _scan(self, relation: Relation, relations: List[Relation],
+              order: Optional[Tuple[List[str], bool]] = None, fraction: float = 1.0) -> Tuple[Operator, bool]:
+        # The cheapest way to read one relation with its pushed-down filters.
+        # With `order` (columns, descending) a path that already yields rows in
+        # that order may win over scanning and sorting; returns (plan, sorted).
+        filters = relation.filters
+        rows_in = self._rows(relation)
+        selectivity = 1.0
+        for term in filters:
+            selectivity *= self.selectivity(term, [relation])
+        rows_out = max(rows_in * selectivity, 1.0 if rows_in else 0.0)
+        filter_cost = CPU_OPERATOR_COST * len(filters)
+
+        if relation.table is None:
+            child = relation.plan
+            layout = [(relation.alias, name) for _, name in child.layout]
+            predicate = self.bind(_and(filters), layout) if filters else None
+            return SubqueryScan(child, relation.alias, predicate, rows=rows_out,
+                                cost=child.cost + rows_in * filter_cost), False
+
+        table = relation.table
+        columns = [name for name in relation.columns if name in relation.needed]
+        layout = [(relation.alias, name) for name in columns]
+        predicate = self.bind(_and(filters), layout) if filters else None
+        sort_cost = rows_out * math.log2(rows_out + 1) * SORT_ROW_COST if order else 0.0
+        best_cost = rows_in * (SEQ_ROW_COST + filter_cost) + sort_cost
+        best: Tuple[Operator, bool] = (SeqScan(table, relation.alias, columns, predicate, rows=rows_out,
+                                               cost=rows_in * (SEQ_ROW_COST + filter_cost)), False)
+
+        def sorted_by(index, skip: int) -> bool:
+            wanted = tuple(order[0]) if order else ()
+            return bool(wanted) and index.kind == 'ordered' and index.columns[skip:skip + len(wanted)] == wanted
+
+        found = restrictions(table, relation.alias, _and(filters)) if filters else {}
+        for index in table.indexes.values():
+            probe = probe_for(index, found)
+            if probe is not None:
+                matched = rows_in * self._probe_selectivity(probe, relation)
+                in_order = probe.any_of is None and sorted_by(index, len(probe.equal))
+                cost = math.log2(rows_in + 1) + matched * (RANDOM_ROW_COST + filter_cost)
+                total = cost * fraction if in_order else cost + (sort_cost if order else 0.0)
+                if total < best_cost:
+                    best_cost = total
+                    bound = IndexProbe(index, [self.bind(e, layout) for e in probe.equal],
+                                       probe.low and (probe.low[0], self.bind(probe.low[1], layout)),
+                                       probe.high and (probe.high[0], self.bind(probe.high[1], layout)),
+                                       probe.any_of and [self.bind(e, layout) for e in probe.any_of])
+                    best = (IndexScan(table, relation.alias, columns, bound, predicate=predicate,
+                                      descending=in_order and order[1], rows=rows_out, cost=cost), in_order)
+            elif sorted_by(index, 0):
+                # Walk the whole index in key order and stop early under LIMIT
+                cost = rows_in * (RANDOM_ROW_COST + filter_cost)
+                if cost * fraction < best_cost:
+                    best_cost = cost * fraction
+                    best = (IndexScan(table, relation.alias, columns, index=index, predicate=predicate,
+                                      descending=order[1], rows=rows_out, cost=cost), True)
+        return best
+
+    # --- Joins ------------------------------------------------------------------
+
+    def _join_keys(self, terms: List[Any], members: Set[int], position: int,
+                   relations: List[Relation]) -> Tuple[List[Tuple[Any, Any]], List[Any]]:
+        # Split join conjuncts into equality keys (joined side, new relation)
+        # that hash, merge and index joins can use, and the residual rest
+        keys, residual = [], []
+        for term in terms:
+            if type(term) is BinaryOp and term.op == '=' and not _has_subquery(term):
+                left_refs = self._references(term.left, relations)
+                right_refs = self._references(term.right, relations)
+                if left_refs and left_refs <= members and right_refs == {position}:
+                    keys.append((term.left, term.right))
+                    continue
+                if right_refs and right_refs <= members and left_refs == {position}:
+                    keys.append((term.right, term.left))
+                    continue
+            residual.append(term)
+        return keys, residual
+
+    def _join_index(self, relation: Relation, keys: List[Tuple[Any, Any]]) -> Optional[Tuple[Any, List[Any], float]]:
+        # The index of a base table that the join keys can probe: a hash index
+        # needs every column, an ordered index a leading prefix. Returns the
+        # index, the outer key expressions in index column order and the
+        # estimated rows per probe.
+        if relation.table is None:
+            return None
+        by_column = {}
+        for outer, inner in keys:
+            if type(inner) is Name and inner.column not in by_column:
+                by_column[inner.column] = outer
+        best = None
+        for index in relation.table.indexes.values():
+            covered = 0
+            while covered < len(index.columns) and index.columns[covered] in by_column:
+                covered += 1
+            if covered == 0 or index.kind == 'hash' and covered < len(index.columns):
+                continue
+            if index.unique and covered == len(index.columns):
+                per_probe = 1.0
+            else:
+                per_probe = self._rows(relation)
+                for column in index.columns[:covered]:
+                    per_probe *= self._eq_selectivity(relation, column)
+            if best is None or per_probe < best[2]:
+                best = (index, [by_column[column] for column in index.columns[:covered]], per_probe)
+        return best
+
+    def _join_rows(self, left_rows: float, right_rows: float, terms: List[Any], relations: List[Relation],
+                   kind: str) -> float:
+        rows = left_rows * right_rows
+        for term in terms:
+            rows *= self.selectivity(term, relations)
+        rows = max(rows, min(left_rows * right_rows, 1.0))
+        if kind == 'LEFT':
+            rows = max(rows, left_rows)
+        elif kind == 'SEMI':
+            rows = min(rows, left_rows)
+        elif kind == 'ANTI':
+            rows = max(left_rows - min(rows, left_rows), min(left_rows, 1.0))
+        return rows
+
+    def _join_methods(self, left_rows: float, left_cost: float, right: Operator, relation: Relation,
+                      keys: List[Tuple[Any, Any]], terms: List[Any], kind: str, rows: float,
+                      left_sorted: bool = False, right_sorted: bool = False) -> Dict[str, float]:
+        # Estimated cost of every join method that can run this join step
+        enabled = self.database.settings
+        right_rows = right.estimated_rows
+        residual = CPU_OPERATOR_COST * (len(terms) - len(keys))
+        costs = {'nestloop': left_cost + right.cost + left_rows * right_rows * CPU_OPERATOR_COST * max(len(terms), 1)}
+        if keys:
+            build, probe = right_rows, left_rows
+            if kind == 'INNER' and left_rows < right_rows:
+                build, probe = left_rows, right_rows
+            costs['hash'] = (left_cost + right.cost + build * HASH_ROW_COST + probe * CPU_OPERATOR_COST
+                             + rows * residual)
+            merge = left_cost + right.cost + (left_rows + right_rows) * CPU_OPERATOR_COST + rows * residual
+            for sorted_input, count in ((left_sorted, left_rows), (right_sorted, right_rows)):
+                if not sorted_input:
+                    merge += count * math.log2(count + 1) * SORT_ROW_COST
+            costs['merge'] = merge
+            found = self._join_index(relation, keys)
+            if found is not None:
+                index, _, per_probe = found
+                search = CPU_OPERATOR_COST * (1 if index.kind == 'hash' else math.log2(self._rows(relation) + 1))
+                fetch = per_probe * (RANDOM_ROW_COST + CPU_OPERATOR_COST * len(relation.filters))
+                costs['index'] = left_cost + left_rows * (search + fetch) + rows * residual
+        for method, setting in (('nestloop', 'enable_nestloop'), ('hash', 'enable_hashjoin'),
+                                ('merge', 'enable_mergejoin'), ('index', 'enable_indexnestloop')):
+            if method in costs and not enabled.get(setting, True):
+                costs[method] += DISABLED_COST
+        return costs
+
+    def _join_step(self, left: Operator, right: Operator, terms: List[Any], relations: List[Relation],
+                   members: Set[int], position: int, kind: str = 'INNER') -> Operator:
+        # Join the plan for `members` with relation `position` by the cheapest method
+        relation = relations[position]
+        keys, residual = self._join_keys(terms, members, position, relations)
+        rows = self._join_rows(left.estimated_rows, right.estimated_rows, terms, relations, kind)
+        left_keys = [self.bind(outer, left.layout) for outer, _ in keys]
+        right_keys = [self.bind(inner, right.layout) for _, inner in keys]
+
+        def presorted(plan: Operator, bound: List[Any]) -> bool:
+            slots = [key.index for key in bound if type(key) is ColumnRef]
+            return len(slots) == len(bound) and plan.sorted_by[:len(slots)] == slots
+
+        left_sorted, right_sorted = presorted(left, left_keys), presorted(right, right_keys)
+        costs = self._join_methods(left.estimated_rows, left.cost, right, relation, keys, terms, kind, rows,
+                                   left_sorted, right_sorted)
+        method = min(costs, key=costs.get)
+        cost = costs[method]
+        layout = left.layout + right.layout
+        if method == 'nestloop':
+            predicate = self.bind(_and(terms), layout) if terms else None
+            return NestedLoopJoin(left, right, kind, predicate, rows=rows, cost=cost)
+        bound_residual = self.bind(_and(residual), layout) if residual else None
+        if method == 'hash':
+            build = 'left' if kind == 'INNER' and left.estimated_rows < right.estimated_rows else 'right'
+            return HashJoin(left, right, left_keys, right_keys, kind, bound_residual, build, rows=rows, cost=cost)
+        if method == 'merge':
+            return MergeJoin(left, right, left_keys, right_keys, kind, bound_residual, left_sorted, right_sorted,
+                             rows=rows, cost=cost)
+        index, outer_keys, _ = self._join_index(relation, keys)
+        columns = [name for _, name in right.layout]
+        predicate = self.bind(_and(relation.filters), right.layout) if relation.filters else None
+        # Key terms the index does not cover are checked on the joined row
+        covered = set(index.columns[:len(outer_keys)])
+        leftover = [BinaryOp('=', outer, inner) for outer, inner in keys
+                    if type(inner) is not Name or inner.column not in covered
+                    or outer is not outer_keys[index.columns.index(inner.column)]]
+        extra = residual + leftover
+        return IndexNestedLoopJoin(left, relation.table, relation.alias, columns, index,
+                                   [self.bind(outer, left.layout) for outer in outer_keys], kind, predicate,
+                                   self.bind(_and(extra), layout) if extra else None, rows=rows, cost=cost)
+
+    def _join_order(self, scans: List[Operator], joins: List[Tuple[Any, Set[int]]],
+                    relations: List[Relation], positions: List[int]) -> List[int]:
+        # Left-deep order of the relations at `positions` with the lowest
+        # estimated cost: exhaustive dynamic programming over subsets for small
+        # joins, greedy beyond that
+        n = len(positions)
+        def extend(state, r):
+            cost, rows, order, members = state
+            terms = [term for term, refs in joins if r in refs and refs <= members | {r} and refs & members]
+            joined = self._join_rows(rows, scans[r].estimated_rows, terms, relations, 'INNER')
+            keys, _ = self._join_keys(terms, members, r, relations)
+            step = min(self._join_methods(rows, cost, scans[r], relations[r], keys, terms, 'INNER', joined).values())
+            # Cross products only when nothing connects
+            if not terms and any(r in refs and refs & members for _, refs in joins):
+                step *= 2
+            return (step, joined, order + [r], members | {r})
+        starts = [(scans[r].cost, scans[r].estimated_rows, [r], frozenset({r})) for r in positions]
+        if n <= DP_RELATION_LIMIT:
+            best = {state[3]: state for state in starts}
+            for size in range(2, n + 1):
+                for subset in combinations(positions, size):
+                    members = frozenset(subset)
+                    for r in subset:
+                        previous = best.get(members - {r})
+                        if previous is None:
+                            continue
+                        candidate = extend((previous[0], previous[1], previous[2], previous[3]), r)
+                        if members not in best or candidate[0] < best[members][0]:
+                            best[members] = candidate
+            return best[frozenset(positions)][2]
+        state = min(starts, key=lambda s: s[1])
+        while len(state[2]) < n:
+            state = min((extend(state, r) for r in positions if r not in state[3]), key=lambda s: s[0])
+        return state[2]
+
+    # --- SELECT -----------------------------------------------------------------
+
+    def plan_select(self, select: Select) -> Operator:
+        if select.ctes:
+            ctes = dict(self.ctes)
+            for name, body in select.ctes:
+                references = sum(1 for node in walk(select) if type(node) is TableRef and node.name == name)
+                ctes[name] = CTE(name, body, dict(ctes), references) # a CTE sees the ones before it
+            self.ctes = ctes
+        relations: List[Relation] = []
+        steps: list = []
+        written = select.items
+        if select.source is not None:
+            self._flatten(select.source, steps)
+            select = self._decorrelate(select, steps)
+            relations = [relation for relation, _, _ in steps]
+            aliases = [relation.alias for relation in relations]
+            duplicate = next((a for a in aliases if aliases.count(a) > 1), None)
+            if duplicate:
+                raise SQLError(f"Table name '{duplicate}' is used more than once in FROM; add an alias")
+        for relation, kind, _ in steps:
+            relation.nullable = kind == 'LEFT'
+            relation.semi = kind in ('SEMI', 'ANTI')
+        self._mark_needed(select, relations, steps)
+        self._check_semi(select, relations)
+
+        # Distribute the WHERE and inner ON conjuncts; LEFT, SEMI and ANTI joins
+        # keep their ON conditions in `left_terms` for the join itself
+        pool = []
+        left_terms: Dict[int, List[Any]] = {}
+        for position, (_, kind, condition) in enumerate(steps):
+            if kind in ('LEFT', 'SEMI', 'ANTI'):
+                left_terms[position] = []
+                for term in conjuncts(condition):
+                    refs = self._references(term, relations)
+                    if refs <= {position} and not _has_subquery(term):
+                        relations[position].filters.append(term)
+                    else:
+                        left_terms[position].append(term)
+            elif condition is not None:
+                pool.extend(conjuncts(condition))
+        if select.where is not None:
+            pool.extend(conjuncts(select.where))
+        joins: List[Tuple[Any, Set[int]]] = []
+        for term in pool:
+            refs = self._references(term, relations)
+            if not relations:
+                joins.append((term, refs))
+            elif not refs:
+                # Only constants and host variables: check it on the first table
+                relations[0].filters.append(term)
+            elif len(refs) == 1 and not relations[next(iter(refs))].nullable:
+                relations[next(iter(refs))].filters.append(term)
+            else:
+                joins.append((term, refs))
+
+        aggregates = self._collect_aggregates(select)
+        grouped = bool(select.group_by or aggregates)
+        items = self._expand_items(select, relations, written)
+        order = self._resolve_order(select, items)
+        windowed = _has_window([expr for expr, _ in items] + [expr for expr, _ in order])
+
+        # A single table can satisfy ORDER BY straight from an ordered index
+        order_columns = None
+        fraction = 1.0
+        if len(relations) == 1 and relations[0].table is not None and order and not grouped and not windowed \
+                and not select.distinct \
+                and len({descending for _, descending in order}) == 1:
+            names = [self._column(expr, relations) for expr, _ in order]
+            if all(names):
+                order_columns = ([column for _, column in names], order[0][1])
+                limit = select.limit
+                if type(limit) is Literal and isinstance(limit.value, int):
+                    offset = select.offset.value if type(select.offset) is Literal else 0
+                    fraction = min(1.0, (limit.value + offset) / max(self._rows(relations[0]), 1.0))
+
+        if not relations:
+            plan: Operator = Result()
+            presorted = False
+            if pool:
+                plan = Filter(plan, self.bind(_and(pool), []), rows=1, cost=0.0)
+        elif len(relations) == 1:
+            plan, presorted = self._scan(relations[0], relations, order_columns, fraction)
+            remaining = [term for term, _ in joins]
+            if remaining:
+                plan = Filter(plan, self.bind(_and(remaining), plan.layout),
+                              rows=plan.estimated_rows * self.selectivity(_and(remaining), relations),
+                              cost=plan.cost + plan.estimated_rows * CPU_OPERATOR_COST)
+        else:
+            presorted = False
+            scans = [self._scan(relation, relations)[0] for relation in relations]
+            written = [i for i, relation in enumerate(relations) if relation.alias not in self.hidden]
+            if any(i in left_terms for i in written):
+                sequence = written # LEFT, SEMI and ANTI JOINs keep the written order
+            else:
+                sequence = self._join_order(scans, joins, relations, written)
+            # Decorrelated subqueries join as soon as every table they read has been joined
+            for position in range(len(written), len(relations)):
+                refs = set().union(*(self._references(term, relations) for term in left_terms[position])) - {position}
+                at = 1
+                while at < len(sequence) and not refs <= set(sequence[:at]):
+                    at += 1
+                sequence.insert(at, position)
+            plan = scans[sequence[0]]
+            members = {sequence[0]}
+            applied: Set[int] = set()
+            for position in sequence[1:]:
+                joined = set(members)
+                members.add(position)
+                ready = [i for i, (_, refs) in enumerate(joins) if i not in applied and refs <= members]
+                kind = steps[position][1] if position in left_terms else 'INNER'
+                if kind in ('LEFT', 'SEMI', 'ANTI'):
+                    plan = self._join_step(plan, scans[position], left_terms[position], relations,
+                                           joined, position, kind)
+                    # WHERE terms that read the NULL-extended side filter after the join
+                    if ready:
+                        terms = [joins[i][0] for i in ready]
+                        plan = Filter(plan, self.bind(_and(terms), plan.layout),
+                                      rows=plan.estimated_rows * self.selectivity(_and(terms), relations),
+                                      cost=plan.cost + plan.estimated_rows * CPU_OPERATOR_COST)
+                else:
+                    plan = self._join_step(plan, scans[position], [joins[i][0] for i in ready], relations,
+                                           joined, position)
+                applied.update(ready)
+
+        if grouped:
+            plan, rewrite = self._aggregate(plan, select, aggregates, relations)
+            plan = self._parallel(plan)
+            items = [(rewrite(expr), name) for expr, name in items]
+            order = [(rewrite(expr), descending) for expr, descending in order]
+            if select.having is not None:
+                having = self.bind(rewrite(select.having), plan.layout)
+                plan = Filter(plan, having, rows=max(plan.estimated_rows * DEFAULT_RANGE_SELECTIVITY, 1.0),
+                              cost=plan.cost + plan.estimated_rows * CPU_OPERATOR_COST)
+        elif select.having is not None:
+            raise SQLError("HAVING needs GROUP BY or an aggregate")
+
+        if windowed:
+            plan, rewrite, window_order = self._window(plan, [expr for expr, _ in items] + [expr for expr, _ in order])
+            items = [(rewrite(expr), name) for expr, name in items]
+            order = [(rewrite(expr), descending) for expr, descending in order]
+            # The last WindowAgg may already produce the ORDER BY order
+            presorted = bool(order) and not any(_has_subquery(expr) for expr, _ in order) \
+                and [(self.bind(expr, plan.layout), descending) for expr, descending in order] == window_order[:len(order)]
+
+        names = [name for _, name in items]
+        # A LIMIT lets the sort keep only the rows it needs
+        limit = self.bind(select.limit, []) if select.limit is not None else None
+        offset = self.bind(select.offset, []) if select.offset is not None else None
+        if select.distinct:
+            plan = self._project(plan, items)
+            plan = Distinct(plan, rows=plan.estimated_rows, cost=plan.cost + plan.estimated_rows * CPU_OPERATOR_COST)
+            if order:
+                keys = []
+                for expr, descending in order:
+                    position = next((i for i, (item, _) in enumerate(items) if item == expr), None)
+                    if position is None:
+                        raise SQLError("ORDER BY expressions must appear in the select list for SELECT DISTINCT")
+                    keys.append((ColumnRef(position, names[position]), descending))
+                plan = self._sort(plan, keys, limit, offset)
+        else:
+            if order and not presorted:
+                plan = self._parallel(plan)
+                plan = self._sort(plan, [(self.bind(expr, plan.layout), descending) for expr, descending in order],
+                                  limit, offset)
+            plan = self._project(plan, items)
+            if not order:
+                plan = self._parallel(plan)
+
+        if select.limit is not None or select.offset is not None:
+            rows = plan.estimated_rows
+            if type(select.limit) is Literal and isinstance(select.limit.value, int):
+                rows = min(rows, select.limit.value)
+            plan = Limit(plan, limit, offset, rows=rows, cost=plan.cost)
+        return plan
+
+    def _mark_needed(self, select: Select, relations: List[Relation], steps: list):
+        # Projection pruning: scans only read columns the query mentions anywhere
+        for node in walk([select.items, select.where, select.group_by, select.having,
+                          [item.expr for item in select.order_by], select.source,
+                          [condition for _, _, condition in steps]]):
+            if type(node) is Name:
+                for i in self._relation_of(node, relations, strict=False):
+                    relations[i].needed.add(node.column)
+            elif type(node) is Star:
+                for relation in relations:
+                    if node.qualifier in (None, relation.alias) and not relation.semi:
+                        relation.needed.update(relation.columns)
+
+    def _check_semi(self, select: Select, relations: List[Relation]):
+        # Semi and anti joins only filter their left side, so nothing past the
+        # ON condition can read the joined table's columns
+        semi = {i for i, relation in enumerate(relations) if relation.semi}
+        if not semi:
+            return
+        for node in walk([select.items, select.where, select.group_by, select.having,
+                          [item.expr for item in select.order_by]]):
+            if type(node) is Name:
+                found = self._relation_of(node, relations, strict=False)
+                if found and found <= semi:
+                    raise SQLError(f"Column '{node}' of a SEMI or ANTI JOIN table can only be used in its ON condition")
+
+    def _expand_items(self, select: Select, relations: List[Relation],
+                      written: List[SelectItem]) -> List[Tuple[Any, str]]:
+        # (expression, output name) per result column, with * expanded in FROM
+        # order; names come from the select list as `written`, before subquery
+        # decorrelation replaced any of its expressions
+        items = []
+        for item, original in zip(select.items, written):
+            if type(item.expr) is Star:
+                matched = [r for r in relations if item.expr.qualifier in (None, r.alias) and not r.semi and r.alias not in self.hidden]
+                if not matched:
+                    raise SQLError(f"No table '{item.expr.qualifier}' for {item.expr.qualifier}.*"
+                                   if item.expr.qualifier else "SELECT * needs a FROM clause")
+                for relation in matched:
+                    items.extend((Name((relation.alias, column)), column) for column in relation.columns)
+                continue
+            if item.alias:
+                name = item.alias
+            elif type(original.expr) is Name:
+                name = original.expr.column
+            elif type(original.expr) in (FuncCall, WindowFunction):
+                name = original.expr.name.lower()
+            else:
+                name = f"column{len(items) + 1}"
+            items.append((item.expr, name))
+        # Result rows become objects, so every column needs its own attribute name
+        seen: Dict[str, int] = {}
+        unique = []
+        for expr, name in items:
+            seen[name] = seen.get(name, 0) + 1
+            unique.append((expr, name if seen[name] == 1 else f"{name}_{seen[name]}"))
+        return unique
+
+    def _resolve_order(self, select: Select, items: List[Tuple[Any, str]]) -> List[Tuple[Any, bool]]:
+        # ORDER BY 2 and ORDER BY alias refer to select-list entries
+        order = []
+        aliases = {name: expr for expr, name in items}
+        for item in select.order_by:
+            expr = item.expr
+            if type(expr) is Literal and isinstance(expr.value, int) and not isinstance(expr.value, bool):
+                if not 1 <= expr.value <= len(items):
+                    raise SQLError(f"ORDER BY position {expr.value} is not in the select list")
+                expr = items[expr.value - 1][0]
+            elif type(expr) is Name and len(expr.parts) == 1 and expr.column in aliases:
+                expr = aliases[expr.column]
+            order.append((expr, item.descending))
+        return order
+
+    def _collect_aggregates(self, select: Select) -> List[FuncCall]:
+        found: List[FuncCall] = []
+        for expr in [item.expr for item in select.items] + [select.having] + [item.expr for item in select.order_by]:
+            for node in _local_nodes(expr):
+                if _is_aggregate(node):
+                    if any(_is_aggregate(inner) for arg in node.args for inner in _local_nodes(arg)):
+                        raise SQLError(f"Aggregate calls cannot be nested in {node.name}()")
+                    if node not in found:
+                        found.append(node)
+        return found
+
+    def _aggregate(self, plan: Operator, select: Select, aggregates: List[FuncCall], relations: List[Relation]):
+        layout = plan.layout
+        group_exprs = list(select.group_by)
+        items = {item.alias: item.expr for item in select.items if item.alias}
+        for position, expr in enumerate(group_exprs):
+            # GROUP BY may name a select-list alias or position, as ORDER BY can
+            if type(expr) is Literal and isinstance(expr.value, int) and 1 <= expr.value <= len(select.items):
+                group_exprs[position] = select.items[expr.value - 1].expr
+            elif type(expr) is Name and len(expr.parts) == 1 and expr.column in items and self.lookup(layout, expr) is None:
+                group_exprs[position] = items[expr.column]
+        bound_groups = [self.bind(expr, layout) for expr in group_exprs]
+        bound_aggregates = [FuncCall(call.name, [self.bind(arg, layout) for arg in call.args], call.distinct, call.star)
+                            for call in aggregates]
+        out_layout = []
+        for i, bound in enumerate(bound_groups):
+            out_layout.append(layout[bound.index] if type(bound) is ColumnRef else (None, f"group{i + 1}"))
+        out_layout.extend((None, format_expr(call)) for call in aggregates)
+
+        rows = plan.estimated_rows
+        if not group_exprs:
+            groups = 1.0
+        else:
+            groups = 1.0
+            for expr in group_exprs:
+                column = self._column(expr, relations)
+                groups *= self._distinct(*column) if column else max(rows * DEFAULT_EQ_SELECTIVITY, 1.0)
+            groups = max(min(groups, rows), 1.0)
+        cost = plan.cost + rows * CPU_OPERATOR_COST * (len(group_exprs) + len(aggregates))
+        plan = HashAggregate(plan, bound_groups, bound_aggregates, out_layout, rows=groups, cost=cost)
+        width = len(bound_groups)
+
+        def rewrite(expr: Any) -> Any:
+            # Re-express a post-aggregation expression over the aggregate output
+            if _is_aggregate(expr):
+                return ColumnRef(width + aggregates.index(expr), format_expr(expr))
+            if isinstance(expr, _SUBQUERIES):
+                if isinstance(expr, InSubquery):
+                    return replace(expr, operand=rewrite(expr.operand))
+                return expr
+            if not _has_subquery(expr) and type(expr) not in (Literal, Param) and not _has_window(expr) \
+                    and not any(_is_aggregate(node) for node in _local_nodes(expr)):
+                bound = self.bind(expr, layout)
+                if bound in bound_groups:
+                    return ColumnRef(bound_groups.index(bound), format_expr(bound))
+                if type(expr) is Name and type(bound) is ColumnRef:
+                    raise SQLError(f"Column '{expr}' must appear in GROUP BY or be used in an aggregate")
+            if _is_node(expr) and type(expr) not in (Name, ColumnRef, OuterRef):
+                return map_children(expr, rewrite)
+            return expr
+        return plan, rewrite
+
+    def _window(self, plan: Operator, exprs: List[Any]):
+        # WindowAggs computing every window function in `exprs`, a rewrite
+        # that replaces those calls with their output columns, and the order
+        # the final rows come out in ([] if it is not a total order)
+        layout = plan.layout
+        windows: List[WindowFunction] = []
+        for node in _local_nodes(exprs):
+            if type(node) is WindowFunction and node not in windows:
+                self._check_window(node)
+                windows.append(node)
+        specs: List[Tuple[list, list, list]] = [] # (partition by, order by, [(call, bound call)])
+        for call in windows:
+            partition = [self.bind(expr, layout) for expr in call.window.partition_by]
+            order = [(self.bind(item.expr, layout), item.descending) for item in call.window.order_by]
+            bound = WindowFunction(call.name, [self.bind(arg, layout) for arg in call.args],
+                                   WindowSpec(partition, [OrderItem(expr, descending) for expr, descending in order],
+                                              call.window.frame), call.star)
+            spec = next((spec for spec in specs if spec[0] == partition and spec[1] == order), None)
+            if spec is None:
+                specs.append((partition, order, [(call, bound)]))
+            else:
+                spec[2].append((call, bound))
+        # Specs with the same partitioning run back to back, longest ORDER BY
+        # first: one whose ORDER BY is a prefix of the previous one's is presorted
+        first_seen = [next(j for j, other in enumerate(specs) if other[0] == spec[0]) for spec in specs]
+        specs = [spec for _, _, spec in sorted(zip(first_seen, [-len(spec[1]) for spec in specs], specs),
+                                               key=lambda entry: entry[:2])]
+        columns: List[int] = [0] * len(windows)
+        previous = None
+        for partition, order, calls in specs:
+            presorted = previous is not None and previous[0] == partition and previous[1][:len(order)] == order
+            rows = plan.estimated_rows
+            cost = plan.cost + rows * CPU_OPERATOR_COST * (len(partition) + len(order) + len(calls))
+            if order and not presorted:
+                cost += rows * math.log2(rows + 1) * SORT_ROW_COST * len(order)
+            width = len(plan.layout)
+            plan = WindowAgg(plan, partition, order, [bound for _, bound in calls], presorted, rows=rows, cost=cost)
+            for position, (call, _) in enumerate(calls):
+                columns[windows.index(call)] = width + position
+            previous = (partition, order)
+
+        def rewrite(expr: Any) -> Any:
+            if type(expr) is WindowFunction:
+                return ColumnRef(columns[windows.index(expr)], format_expr(expr))
+            if _is_node(expr) and not isinstance(expr, _SUBQUERIES) and type(expr) not in (Name, ColumnRef, OuterRef):
+                return map_children(expr, rewrite)
+            return expr
+        # Without PARTITION BY the last WindowAgg's rows are sorted on its ORDER BY
+        return plan, rewrite, previous[1] if not previous[0] else []
+
+    def _check_window(self, call: WindowFunction):
+        if any(type(node) is WindowFunction for node in _local_nodes([call.args, call.window])):
+            raise SQLError("Window function calls cannot be nested")
+        count = len(call.args)
+        if call.name in RANKING_FUNCTIONS:
+            valid = count == 0 and not call.star
+        elif call.name in OFFSET_FUNCTIONS:
+            valid = 1 <= count <= 3
+        elif call.name in AGGREGATE_FUNCTIONS:
+            valid = count == 1 or call.star and call.name == 'COUNT'
+        else:
+            raise SQLError(f"Unknown window function {call.name}()")
+        if not valid:
+            raise SQLError(f"Wrong number of arguments for window function {call.name}()")
+
+    def _parallel(self, plan: Operator) -> Operator:
+        # A Gather over a fragment that reads one large table (a filtered scan,
+        # maybe under a Project or Hash Aggregate) whose expressions a worker
+        # process can evaluate on its own
+        if self.workers < 2 or self.parent is not None:
+            return plan
+        scan = plan.children[0] if type(plan) in (Project, HashAggregate) else plan
+        if type(scan) is not SeqScan or type(scan.table) is not Table \
+                or len(scan.table) < self.database.settings['parallel_min_rows']:
+            return plan
+        exprs = fragment_expressions(plan)
+        if not exprs or type(plan) is Project and scan.predicate is None \
+                and all(type(expr) is ColumnRef for expr in plan.exprs):
+            return plan # Nothing to evaluate: the rows would only be copied
+        nodes = list(walk(exprs))
+        if any(type(node) in (SubPlan, OuterRef) for node in nodes):
+            return plan
+        params = {node.name for node in nodes if type(node) is Param} \
+            | {node.parts[0] for node in nodes if type(node) is Name}
+        rows = plan.estimated_rows
+        return Gather(plan, self.workers, sorted(params, key=str), rows=rows,
+                      cost=plan.cost / self.workers + rows * CPU_OPERATOR_COST)
+
+    def _sort(self, plan: Operator, keys: List[Tuple[Any, bool]], limit: Any = None, offset: Any = None) -> Operator:
+        # With a LIMIT, a top-N sort keeps a heap of `limit + offset` rows
+        rows = plan.estimated_rows
+        kept = rows
+        if all(type(expr) is Literal and isinstance(expr.value, int) for expr in (limit, offset) if expr is not None) \
+                and limit is not None:
+            kept = min(rows, limit.value + (offset.value if offset is not None else 0))
+        return Sort(plan, keys, limit, offset, rows=kept,
+                    cost=plan.cost + rows * math.log2(kept + 1) * SORT_ROW_COST * len(keys))
+
+    def _project(self, plan: Operator, items: List[Tuple[Any, str]]) -> Operator:
+        exprs = [self.bind(expr, plan.layout) for expr, _ in items]
+        return Project(plan, exprs, [name for _, name in items], rows=plan.estimated_rows,
+                       cost=plan.cost + plan.estimated_rows * CPU_OPERATOR_COST * len(exprs))
+
+def plan_query(database: Any, select: Select, params: Any = None, workers: Optional[int] = None,
+               tables: Optional[Dict[str, Any]] = None) -> Operator:
+    # `workers` overrides the database's parallel_workers setting for this
+    # query; `tables` stands in for catalog tables of the same names
+    if workers is None:
+        workers = database.settings['parallel_workers']
+    return Planner(database, params, workers=workers, tables=tables).plan_select(select)
@@ -0,0 +1,75 @@
+"""Temporary files for operators whose working state outgrows `work_mem`.
+
+Spilled data is written as pickled chunks to anonymous temporary files,
+which the operating system removes once they are closed, and is read back
+in the order it was written.
+"""
+
+import pickle
+import tempfile
+from typing import Any, Iterator, List, Optional
+
+# Bytes of operator state (e.g. Hash Aggregate groups) kept in memory before spilling
+DEFAULT_WORK_MEM = 64 * 1024 * 1024
+
+class SpillFile:
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.chunks = 0
+
+    def write(self, chunk: Any):
+        pickle.dump(chunk, self.file, pickle.HIGHEST_PROTOCOL)
+        self.chunks += 1
+
+    @property
+    def size(self) -> int:
+        return self.file.tell()
+
+    def read(self) -> Iterator[Any]:
+        # Every chunk in write order; the file is closed afterwards
+        self.file.seek(0)
+        try:
+            for _ in range(self.chunks):
+                yield pickle.load(self.file)
+        finally:
+            self.close()
+
+    def close(self):
+        self.file.close()
+
+class HashPartitions:
+    # Rows routed to one of `fanout` spill files by the hash of their key.
+    # `level` salts the hash, so a partition that has to be split again
+    # spreads its keys differently the second time.
+    def __init__(self, fanout: int, level: int = 0):
+        self.level = level
+        self.files: List[Optional[SpillFile]] = [None] * fanout
+
+    def partition(self, key: Any) -> int:
+        return hash((self.level, key)) % len(self.files)
+
+    def write(self, number: int, chunk: Any):
+        file = self.files[number]
+        if file is None:
+            file = self.files[number] = SpillFile()
+        file.write(chunk)
+
+    @property
+    def size(self) -> int:
+        return sum(file.size for file in self.files if file is not None)
+
+    @property
+    def used(self) -> int:
+        return sum(file is not None for file in self.files)
+
+    def drain(self) -> Iterator[Iterator[Any]]:
+        # The chunks of each non-empty partition in turn
+        for number, file in enumerate(self.files):
+            if file is not None:
+                self.files[number] = None
+                yield file.read()
+
+    def close(self):
+        for file in self.files:
+            if file is not None:
+                file.close()
@@ -0,0 +1,597 @@
+"""An alternative backend that runs PCSJ SQL on the standard library's sqlite3.
+
+`SQLiteDatabase` has the `execute` interface of `Database`. Statements are
+parsed by the PCSJ parser as usual, then written back out as SQLite SQL in
+which every value that is not a literal is a `?` placeholder:
+
+- `?` and `:name` parameters keep their values;
+- bare names that are not columns of a table the statement reads, such as
+  `fromId` or `user.id`, are PCSJ host variables, read from the params
+  mapping on each run as the native engine does;
+- `table` declarations become SQLite tables with the same constraints plus
+  CHECKs for the column types, so values are checked as PCSJ checks them.
+  The columns have no type affinity, so a CHECK sees the value as given:
+  SQLite does not turn '5' into 5 for an int column, nor does it match a
+  string host variable '7' against 7. Numbers written by INSERT and UPDATE
+  are converted as natively first (2 into a float column is stored as 2.0).
+
+Translations are cached by statement text, so the SQL sqlite3 sees for a
+statement never changes and its own statement cache reuses the compiled
+SQLite statement across calls. Results come back as the same row objects
+the native engine returns.
+
+Transactions are those of the one SQLite connection: unlike the native
+engine, async functions running transactions at the same time share it.
+`USING HASH` indexes are ordinary SQLite indexes.
+"""
+
+import json
+import sqlite3
+import weakref
+from contextlib import contextmanager
+from dataclasses import asdict
+from itertools import zip_longest
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .bulk import read_copy
+from .cache import DEFAULT_CACHE_SIZE, MAX_CACHED_LENGTH, StatementCache
+from .cursor import Cursor
+from .database import build_row_class
+from .errors import IntegrityError, SQLError
+from .expressions import SCALAR_FUNCTIONS, constant, host_value
+from .nodes import (
+    Analyze, Begin, Between, BinaryOp, ColumnDef, Commit, Copy, CreateIndex, CreateTable, CreateView, Delete,
+    DropIndex, DropView, Exists, Explain, FuncCall, InList, Insert, InSubquery, IsNull, Like, Literal, Name, Param,
+    RefreshView, Rollback, Select, Star, Subquery, SubqueryRef, TableRef, UnaryOp, Update, WindowFunction,
+)
+from .parser import normalize, parse
+from .planner import walk
+from .storage import _INT_MAX, _INT_MIN, Table
+
+# Declared SQLite type, and the CHECK that keeps out values of other types.
+# Every declared type has BLOB affinity (none), so SQLite stores values as
+# given; BOOLEAN names the converter that reads bool columns back.
+_TYPES = {
+    'int': ('BLOB', "typeof({0}) IN ('integer', 'null')"),
+    'float': ('BLOB', "typeof({0}) IN ('real', 'null')"),
+    'bool': ('BOOLEAN BLOB', "typeof({0}) IN ('integer', 'null') AND {0} IN (0, 1)"),
+    'string': ('BLOB', "typeof({0}) IN ('text', 'null')"),
+}
+# Other types (datetime, ...) keep values as given
+_OTHER_TYPE = 'BLOB'
+
+def _to_int(value: Any) -> Any:
+    if type(value) is float and value.is_integer() and _INT_MIN <= value <= _INT_MAX:
+        return int(value)
+    return value
+
+def _to_float(value: Any) -> Any:
+    return float(value) if type(value) is int else value
+
+def _to_bool(value: Any) -> Any:
+    return int(value) if type(value) is float and value in (0, 1) else value
+
+# Functions that convert a number written to a column as the native engine
+# does; values of the wrong type pass through for the CHECK to reject
+_CONVERSIONS = {
+    'int': ('PCSJ_TO_INT', _to_int), 'float': ('PCSJ_TO_FLOAT', _to_float), 'bool': ('PCSJ_TO_BOOL', _to_bool),
+}
+
+# Where the PCSJ column definitions of a SQLite database file are kept
+CATALOG_TABLE = 'pcsj_catalog'
+
+# PCSJ functions SQLite lacks (or computes differently) run in Python
+_PYTHON_FUNCTIONS = ('FLOOR', 'CEIL', 'DATEDIFF')
+
+# Placeholder output name of an unnamed expression after `*` (see _result_names)
+_UNNAMED = '?column'
+
+# bool columns come back as bool rather than 0 and 1
+sqlite3.register_converter('BOOLEAN', lambda data: data != b'0')
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _column_sql(column: ColumnDef) -> str:
+    name = _quote(column.name)
+    declared, check = _TYPES.get(column.type, (_OTHER_TYPE, None))
+    parts = [name, declared]
+    if column.primary_key:
+        parts.append('NOT NULL PRIMARY KEY')
+    elif column.not_null:
+        parts.append('NOT NULL')
+    if column.unique and not column.primary_key:
+        parts.append('UNIQUE')
+    if column.references:
+        parts.append(f"REFERENCES {_quote(column.references[0])}({_quote(column.references[1])})")
+    if check:
+        constraint = _quote(f"column '{column.name}' expects {column.type}")
+        parts.append(f"CONSTRAINT {constraint} CHECK ({check.format(name)})")
+    return ' '.join(parts)
+
+@contextmanager
+def _errors() -> Iterator[None]:
+    # SQLite errors as the PCSJ exceptions the native engine raises:
+    # IntegrityError for key and reference violations, else SQLError
+    try:
+        yield
+    except sqlite3.Error as error:
+        message = str(error)
+        if isinstance(error, sqlite3.IntegrityError) and ('UNIQUE' in message or 'FOREIGN KEY' in message):
+            raise IntegrityError(message) from error
+        raise SQLError(message) from error
+
+def _result_names(description: Sequence[tuple]) -> List[str]:
+    # Attribute names of result rows: unnamed expressions after `*` are
+    # numbered by position, and repeated names get a suffix, as natively
+    names = [f"column{position}" if column[0] == _UNNAMED else column[0]
+             for position, column in enumerate(description, 1)]
+    seen: Dict[str, int] = {}
+    unique = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return unique
+
+def _explain(rows: Sequence[tuple]) -> str:
+    # EXPLAIN QUERY PLAN rows (id, parent, unused, detail) as an indented tree
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return '\n'.join(lines)
+
+class Translator:
+    # Writes one parsed statement as SQLite SQL, collecting where each `?`
+    # gets its value: ('param', name), ('host', Name) or ('value', value)
+    def __init__(self, tables: Dict[str, Table], statement: Any):
+        self.tables = tables
+        self.slots: List[tuple] = []
+        # Names that are columns rather than host variables: every column of
+        # a table the statement reads, every select-list alias, and every
+        # table, alias and CTE that can qualify a column
+        self.columns = set()
+        self.qualifiers = set()
+        for node in walk(statement):
+            kind = type(node)
+            if kind is TableRef:
+                self.qualifiers.update((node.name, node.alias))
+                if node.name in tables:
+                    self.columns.update(tables[node.name].column_names)
+            elif kind is SubqueryRef:
+                self.qualifiers.add(node.alias)
+                self.columns.update(self.output_names(node.select))
+            elif kind is Select:
+                self.qualifiers.update(name for name, _ in node.ctes)
+                for _, query in node.ctes:
+                    self.columns.update(self.output_names(query))
+                # ORDER BY and GROUP BY may name an alias
+                self.columns.update(item.alias for item in node.items if item.alias)
+        if isinstance(statement, (Update, Delete, Insert)) and statement.table in tables:
+            self.qualifiers.update((statement.table, getattr(statement, 'alias', None)))
+            self.columns.update(tables[statement.table].column_names)
+        self.qualifiers.discard(None)
+
+    @staticmethod
+    def output_names(select: Select) -> List[str]:
+        # Columns a subquery or CTE offers to the query around it
+        return [item.alias or item.expr.column for item in select.items
+                if item.alias or type(item.expr) is Name]
+
+    def placeholder(self, slot: tuple) -> str:
+        self.slots.append(slot)
+        return '?'
+
+    # --- Expressions --------------------------------------------------------------
+
+    def expr(self, node: Any) -> str:
+        kind = type(node)
+        if kind is Literal:
+            return self.literal(node.value)
+        if kind is Name:
+            if len(node.parts) == 1 and node.column in self.columns or node.parts[0] in self.qualifiers:
+                return '.'.join(map(_quote, node.parts))
+            return self.placeholder(('host', node))
+        if kind is Param:
+            return self.placeholder(('param', node.name))
+        if kind is BinaryOp:
+            left, right = self.expr(node.left), self.expr(node.right)
+            if node.op == '/':
+                # PCSJ divides as Python does: 7 / 2 is 3.5
+                return f"(CAST({left} AS REAL) / {right})"
+            return f"({left} {node.op} {right})"
+        if kind is UnaryOp:
+            return f"(NOT {self.expr(node.operand)})" if node.op == 'NOT' else f"(-{self.expr(node.operand)})"
+        if kind is FuncCall:
+            if node.star:
+                return f"{node.name}(*)"
+            distinct = 'DISTINCT ' if node.distinct else ''
+            return f"{node.name}({distinct}{', '.join(map(self.expr, node.args))})"
+        if kind is WindowFunction:
+            args = '*' if node.star else ', '.join(map(self.expr, node.args))
+            return f"{node.name}({args}) OVER ({self.window(node.window)})"
+        if kind is InList:
+            items = ', '.join(map(self.expr, node.items))
+            return f"({self.expr(node.operand)} {'NOT IN' if node.negated else 'IN'} ({items}))"
+        if kind is Between:
+            between = 'NOT BETWEEN' if node.negated else 'BETWEEN'
+            return f"({self.expr(node.operand)} {between} {self.expr(node.low)} AND {self.expr(node.high)})"
+        if kind is IsNull:
+            return f"({self.expr(node.operand)} {'IS NOT NULL' if node.negated else 'IS NULL'})"
+        if kind is Like:
+            return f"({self.expr(node.operand)} {'NOT LIKE' if node.negated else 'LIKE'} {self.expr(node.pattern)})"
+        if kind is Subquery:
+            return f"({self.select(node.select)})"
+        if kind is InSubquery:
+            return f"({self.expr(node.operand)} {'NOT IN' if node.negated else 'IN'} ({self.select(node.select)}))"
+        if kind is Exists:
+            return f"({'NOT ' if node.negated else ''}EXISTS ({self.select(node.select)}))"
+        if kind is Star:
+            return f"{_quote(node.qualifier)}.*" if node.qualifier else '*'
+        raise SQLError(f"The sqlite backend cannot run {kind.__name__} expressions")
+
+    def stored(self, table: str, column: Optional[str], value: Any) -> str:
+        # A value written to a column, with numbers converted for its CHECK
+        code = self.expr(value)
+        definition = self.tables[table].columns.get(column) if table in self.tables else None
+        conversion = _CONVERSIONS.get(definition.definition.type) if definition is not None else None
+        return f"{conversion[0]}({code})" if conversion else code
+
+    def literal(self, value: Any) -> str:
+        if value is None:
+            return 'NULL'
+        if isinstance(value, bool):
+            return 'TRUE' if value else 'FALSE'
+        if isinstance(value, int):
+            return str(value)
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return self.placeholder(('value', value))
+
+    def window(self, window: Any) -> str:
+        parts = []
+        if window.partition_by:
+            parts.append('PARTITION BY ' + ', '.join(map(self.expr, window.partition_by)))
+        if window.order_by:
+            parts.append('ORDER BY ' + self.order(window.order_by))
+        if window.frame is not None:
+            start, end = window.frame
+            parts.append(f"ROWS BETWEEN {self.bound(start, 'PRECEDING')} AND {self.bound(end, 'FOLLOWING')}")
+        return ' '.join(parts)
+
+    @staticmethod
+    def bound(offset: Optional[int], unbounded: str) -> str:
+        if offset is None:
+            return f"UNBOUNDED {unbounded}"
+        if offset == 0:
+            return 'CURRENT ROW'
+        return f"{abs(offset)} {'PRECEDING' if offset < 0 else 'FOLLOWING'}"
+
+    def order(self, items: Sequence[Any]) -> str:
+        return ', '.join(self.expr(item.expr) + (' DESC' if item.descending else '') for item in items)
+
+    # --- Statements ---------------------------------------------------------------
+
+    def select(self, select: Select) -> str:
+        sql = []
+        if select.ctes:
+            ctes = ', '.join(f"{_quote(name)} AS ({self.select(query)})" for name, query in select.ctes)
+            sql.append(f"WITH {ctes}")
+        items = []
+        star = False
+        for item in select.items:
+            text = self.expr(item.expr)
+            if type(item.expr) is Star:
+                star = True
+            else:
+                # Output names as the native engine gives them (see Planner._expand_items)
+                if item.alias:
+                    name = item.alias
+                elif type(item.expr) is Name:
+                    name = item.expr.column
+                elif type(item.expr) in (FuncCall, WindowFunction):
+                    name = item.expr.name.lower()
+                else:
+                    name = _UNNAMED if star else f"column{len(items) + 1}"
+                text += f" AS {_quote(name)}"
+            items.append(text)
+        sql.append(('SELECT DISTINCT ' if select.distinct else 'SELECT ') + ', '.join(items))
+        where = [select.where] if select.where is not None else []
+        if select.source is not None:
+            source, semi = self.source(select.source)
+            sql.append(f"FROM {source}")
+            where = semi + [self.expr(condition) for condition in where]
+        else:
+            where = [self.expr(condition) for condition in where]
+        if where:
+            sql.append('WHERE ' + ' AND '.join(where))
+        if select.group_by:
+            sql.append('GROUP BY ' + ', '.join(map(self.expr, select.group_by)))
+        if select.having is not None:
+            sql.append(f"HAVING {self.expr(select.having)}")
+        if select.order_by:
+            sql.append('ORDER BY ' + self.order(select.order_by))
+        if select.limit is not None:
+            sql.append(f"LIMIT {self.expr(select.limit)}")
+            if select.offset is not None:
+                sql.append(f"OFFSET {self.expr(select.offset)}")
+        elif select.offset is not None:
+            sql.append(f"LIMIT -1 OFFSET {self.expr(select.offset)}")
+        return ' '.join(sql)
+
+    def source(self, source: Any, spine: bool = True) -> Tuple[str, List[str]]:
+        # The FROM clause, and the EXISTS conditions standing in for SEMI and
+        # ANTI joins, which SQLite lacks; they can only join the left spine
+        kind = type(source)
+        if kind is TableRef:
+            alias = f" AS {_quote(source.alias)}" if source.alias else ''
+            return _quote(source.name) + alias, []
+        if kind is SubqueryRef:
+            return f"({self.select(source.select)}) AS {_quote(source.alias)}", []
+        if source.kind in ('SEMI', 'ANTI'):
+            if not spine:
+                raise SQLError("The sqlite backend only runs SEMI and ANTI joins at the top of a FROM clause")
+            left, semi = self.source(source.left)
+            right, _ = self.source(source.right, spine=False)
+            condition = f" WHERE {self.expr(source.condition)}" if source.condition is not None else ''
+            negated = 'NOT ' if source.kind == 'ANTI' else ''
+            return left, semi + [f"{negated}EXISTS (SELECT 1 FROM {right}{condition})"]
+        left, semi = self.source(source.left, spine)
+        right, _ = self.source(source.right, spine=False)
+        if source.kind == 'CROSS':
+            return f"{left} CROSS JOIN {right}", semi
+        join = 'LEFT JOIN' if source.kind == 'LEFT' else 'JOIN'
+        condition = self.expr(source.condition) if source.condition is not None else 'TRUE'
+        return f"{left} {join} {right} ON {condition}", semi
+
+    def statement(self, statement: Any) -> str:
+        kind = type(statement)
+        if kind is Select:
+            return self.select(statement)
+        if kind is Insert:
+            columns = f" ({', '.join(map(_quote, statement.columns))})" if statement.columns is not None else ''
+            names = statement.columns if statement.columns is not None else \
+                self.tables[statement.table].column_names if statement.table in self.tables else []
+            # Extra values keep no column, and SQLite reports the count
+            rows = ', '.join('(' + ', '.join(self.stored(statement.table, name, value)
+                                             for name, value in zip_longest(names[:len(row)], row)) + ')'
+                             for row in statement.rows)
+            return f"INSERT INTO {_quote(statement.table)}{columns} VALUES {rows}"
+        if kind is Update:
+            alias = f" AS {_quote(statement.alias)}" if statement.alias else ''
+            assignments = ', '.join(f"{_quote(column)} = {self.stored(statement.table, column, value)}"
+                                    for column, value in statement.assignments)
+            where = f" WHERE {self.expr(statement.where)}" if statement.where is not None else ''
+            return f"UPDATE {_quote(statement.table)}{alias} SET {assignments}{where}"
+        if kind is Delete:
+            alias = f" AS {_quote(statement.alias)}" if statement.alias else ''
+            where = f" WHERE {self.expr(statement.where)}" if statement.where is not None else ''
+            return f"DELETE FROM {_quote(statement.table)}{alias}{where}"
+        if kind is CreateIndex:
+            unique = 'UNIQUE ' if statement.unique else ''
+            return (f"CREATE {unique}INDEX {_quote(statement.name)} ON {_quote(statement.table)} "
+                    f"({', '.join(map(_quote, statement.columns))})")
+        if kind is DropIndex:
+            return f"DROP INDEX {_quote(statement.name)}"
+        if kind is Analyze:
+            return f"ANALYZE {_quote(statement.table)}" if statement.table else 'ANALYZE'
+        if kind is Explain:
+            if statement.analyze or not isinstance(statement.statement, Select):
+                raise SQLError("The sqlite backend only runs EXPLAIN on SELECT statements")
+            return f"EXPLAIN QUERY PLAN {self.select(statement.statement)}"
+        if kind in (CreateView, RefreshView, DropView):
+            raise SQLError("The sqlite backend does not support materialized views")
+        return ''
+
+class SQLiteStatement:
+    # A statement translated for SQLite, run again with new values for its placeholders
+    def __init__(self, database: 'SQLiteDatabase', statement: Any):
+        self.database = database
+        self.statement = statement
+        translator = Translator(database.tables, statement)
+        self.sql = translator.statement(statement)
+        self.slots = translator.slots
+        # Result-row class of a SELECT, made on its first run
+        self.row_class: Optional[type] = None
+
+    def bind(self, params: Any) -> List[Any]:
+        values = []
+        for kind, value in self.slots:
+            if kind == 'param':
+                try:
+                    value = params[value]
+                except (KeyError, IndexError, TypeError):
+                    raise SQLError(f"No value bound for parameter {value!r}")
+            elif kind == 'host':
+                value = host_value(value, params)
+            values.append(value)
+        return values
+
+    def execute(self, params: Any = None) -> Any:
+        return self.database.execute_prepared(self, params)
+
+def _rows(cursor: sqlite3.Cursor, cls: type) -> Iterator[Any]:
+    with _errors():
+        for row in cursor:
+            yield cls(*row)
+
+class SQLiteDatabase:
+    def __init__(self, path: Optional[str] = None):
+        # A database file at `path`, else an in-memory database
+        self.path = path
+        self.connection = sqlite3.connect(path or ':memory:', isolation_level=None,
+                                          detect_types=sqlite3.PARSE_DECLTYPES,
+                                          cached_statements=DEFAULT_CACHE_SIZE, check_same_thread=False)
+        for name in _PYTHON_FUNCTIONS:
+            function = SCALAR_FUNCTIONS[name]
+            self.connection.create_function(name, -1, function, deterministic=True)
+        for name, function in _CONVERSIONS.values():
+            self.connection.create_function(name, 1, function, deterministic=True)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA case_sensitive_like = ON')
+        if path is not None:
+            self.connection.execute('PRAGMA journal_mode = WAL')
+        # Column definitions per table, kept in CATALOG_TABLE; these Tables hold no rows
+        self.tables: Dict[str, Table] = {}
+        self.row_classes: Dict[Tuple[str, ...], type] = {}
+        self.statement_cache = StatementCache()
+        # SELECT results that may still be read; any other statement first
+        # has them take all their rows (see cursor.py)
+        self.cursors: List['weakref.ref[Cursor]'] = []
+        self._cursors_limit = 32
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (name TEXT PRIMARY KEY, columns TEXT)")
+        for name, columns in self.connection.execute(f"SELECT name, columns FROM {CATALOG_TABLE}"):
+            self.tables[name] = Table(name, [self._column_def(column) for column in json.loads(columns)])
+
+    @staticmethod
+    def _column_def(column: Dict[str, Any]) -> ColumnDef:
+        references = column.pop('references')
+        return ColumnDef(**column, references=tuple(references) if references else None)
+
+    def create_table(self, name: str, columns: Sequence[ColumnDef]) -> Table:
+        if name in self.tables or name == CATALOG_TABLE:
+            raise SQLError(f"Table '{name}' already exists")
+        for column in columns:
+            if column.references:
+                parent, parent_column = column.references
+                if parent != name and parent not in self.tables:
+                    raise SQLError(f"FOREIGN KEY {name}.{column.name} references unknown table '{parent}'")
+        table = Table(name, columns)
+        definition = json.dumps([asdict(column) for column in columns])
+        with _errors():
+            # With a primary key the rows are stored in key order, and an
+            # INTEGER key cannot turn into an automatic row id when NULL
+            clustered = ' WITHOUT ROWID' if any(column.primary_key for column in columns) else ''
+            self.connection.execute(f"CREATE TABLE {_quote(name)} ({', '.join(map(_column_sql, columns))}){clustered}")
+            self.connection.execute(f"INSERT INTO {CATALOG_TABLE} VALUES (?, ?)", (name, definition))
+        self.tables[name] = table
+        # Names in cached statements may have been host variables until now
+        self.statement_cache.clear()
+        return table
+
+    def table(self, name: str) -> Table:
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise SQLError(f"Unknown table '{name}'")
+
+    def row_class(self, names: Sequence[str]) -> type:
+        key = tuple(names)
+        cls = self.row_classes.get(key)
+        if cls is None:
+            cls = self.row_classes[key] = build_row_class(key)
+        return cls
+
+    # --- Statements -------------------------------------------------------------
+
+    def execute(self, sql: str, params: Any = None) -> Any:
+        return self.execute_prepared(self.prepare(sql), params)
+
+    def prepare(self, sql: str) -> SQLiteStatement:
+        cache = self.statement_cache
+        if len(sql) > MAX_CACHED_LENGTH:
+            cache.misses += 1
+            return SQLiteStatement(self, parse(sql))
+        prepared = cache.get(sql)
+        if prepared is None:
+            key = normalize(sql)
+            prepared = cache.get(key) if key != sql else None
+            if prepared is None:
+                cache.misses += 1
+                prepared = SQLiteStatement(self, parse(sql))
+                cache.put(key, prepared, DEFAULT_CACHE_SIZE)
+            if key != sql:
+                cache.put(sql, prepared, DEFAULT_CACHE_SIZE)
+        return prepared
+
+    def execute_prepared(self, prepared: SQLiteStatement, params: Any = None) -> Any:
+        statement = prepared.statement
+        kind = type(statement)
+        connection = self.connection
+        if kind is not Select and kind is not Explain and self.cursors:
+            self.materialize_cursors()
+        if kind is CreateTable:
+            return self.create_table(statement.name, statement.columns)
+        if kind is Copy:
+            return self._copy(statement, params)
+        if kind is Begin:
+            if connection.in_transaction:
+                raise SQLError("A transaction is already in progress")
+            connection.execute('BEGIN')
+            return None
+        if kind in (Commit, Rollback):
+            if not connection.in_transaction:
+                raise SQLError(f"{kind.__name__.upper()} without BEGIN TRANSACTION")
+            connection.execute(kind.__name__.upper())
+            return None
+        with _errors():
+            cursor = connection.execute(prepared.sql, prepared.bind(params))
+            if kind is Explain:
+                return _explain(cursor.fetchall())
+            if kind is not Select:
+                return cursor.rowcount if kind in (Insert, Update, Delete) else None
+            cls = prepared.row_class
+            if cls is None:
+                cls = prepared.row_class = self.row_class(_result_names(cursor.description))
+            return self._cursor(cursor, prepared.sql, prepared.bind(params), cls)
+
+    def _cursor(self, first: sqlite3.Cursor, sql: str, args: Any, cls: type) -> Cursor:
+        # The already started `first` serves the first run; a cursor that
+        # dropped rows runs the statement again, as the native engine does
+        runs: List[Any] = [first]
+
+        def run() -> Iterator:
+            if runs:
+                return _rows(runs.pop(), cls)
+            with _errors():
+                return _rows(connection.execute(sql, args), cls)
+        connection = self.connection
+        cursor = Cursor(run)
+        cursors = self.cursors
+        cursors.append(weakref.ref(cursor))
+        if len(cursors) > self._cursors_limit:
+            # Forget the results that are gone or hold all their rows
+            live = []
+            for ref in cursors:
+                result = ref()
+                if result is not None and not result.settled:
+                    live.append(ref)
+            self.cursors = live
+            self._cursors_limit = max(32, 2 * len(live))
+        return cursor
+
+    def materialize_cursors(self):
+        for ref in self.cursors:
+            cursor = ref()
+            if cursor is not None:
+                cursor.materialize()
+        self.cursors = []
+
+    def _copy(self, statement: Copy, params: Any) -> int:
+        # COPY ... FROM reads the file as the native engine does (see bulk.py)
+        # and inserts each batch with one prepared INSERT, all or nothing
+        table = self.table(statement.table)
+        path = constant(statement.path, params)
+        if not isinstance(path, str):
+            raise SQLError("COPY FROM expects a file name")
+        count = 0
+        connection = self.connection
+        connection.execute('SAVEPOINT pcsj_copy')
+        try:
+            with _errors():
+                for batch in read_copy(path, table, statement.columns, statement.options):
+                    names = list(batch)
+                    sql = (f"INSERT INTO {_quote(table.name)} ({', '.join(map(_quote, names))}) "
+                           f"VALUES ({', '.join('?' * len(names))})")
+                    rows = zip(*(batch[name] for name in names))
+                    count += connection.executemany(sql, rows).rowcount
+        except Exception:
+            connection.execute('ROLLBACK TO pcsj_copy')
+            connection.execute('RELEASE pcsj_copy')
+            raise
+        connection.execute('RELEASE pcsj_copy')
+        return count
+
+    def close(self):
+        self.connection.close()
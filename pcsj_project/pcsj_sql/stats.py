@@ -0,0 +1,75 @@
+"""Table statistics gathered by ANALYZE, and selectivity estimates built on them."""
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+HISTOGRAM_BUCKETS = 32
+
+# Guesses for predicates the statistics cannot answer
+DEFAULT_EQ_SELECTIVITY = 0.1
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+DEFAULT_LIKE_SELECTIVITY = 0.1
+DEFAULT_NULL_FRACTION = 0.05
+
+class ColumnStats:
+    __slots__ = ('distinct', 'null_fraction', 'min', 'max', 'bounds')
+
+    def __init__(self, values: List[Any], row_count: int):
+        present = sorted(v for v in values if v is not None)
+        self.null_fraction = (row_count - len(present)) / row_count if row_count else 0.0
+        self.distinct = len(set(present))
+        self.min = present[0] if present else None
+        self.max = present[-1] if present else None
+        # Equi-depth histogram: bucket boundaries holding the same number of values each
+        if present:
+            last = len(present) - 1
+            self.bounds = [present[last * k // HISTOGRAM_BUCKETS] for k in range(HISTOGRAM_BUCKETS + 1)]
+        else:
+            self.bounds = []
+
+    def __repr__(self) -> str:
+        return f"ColumnStats(distinct={self.distinct}, nulls={self.null_fraction:.2f}, min={self.min!r}, max={self.max!r})"
+
+    def fraction_below(self, value: Any, inclusive: bool = False) -> float:
+        # Share of the non-NULL values < value (<= when inclusive), from the histogram
+        bounds = self.bounds
+        if not bounds:
+            return 0.0
+        try:
+            position = (bisect_right if inclusive else bisect_left)(bounds, value)
+        except TypeError:
+            return DEFAULT_RANGE_SELECTIVITY
+        if position == 0:
+            return 0.0
+        if position > HISTOGRAM_BUCKETS:
+            return 1.0
+        low, high = bounds[position - 1], bounds[position]
+        within = 0.5
+        if isinstance(value, (int, float)) and isinstance(low, (int, float)) and high != low:
+            within = min(max((value - low) / (high - low), 0.0), 1.0)
+        return (position - 1 + within) / HISTOGRAM_BUCKETS
+
+    def eq_selectivity(self) -> float:
+        return (1 - self.null_fraction) / self.distinct if self.distinct else 0.0
+
+    def range_selectivity(self, low: Any = None, high: Any = None,
+                          low_inclusive: bool = True, high_inclusive: bool = True) -> float:
+        upper = 1.0 if high is None else self.fraction_below(high, high_inclusive)
+        lower = 0.0 if low is None else self.fraction_below(low, not low_inclusive)
+        return max(upper - lower, 0.0) * (1 - self.null_fraction)
+
+class TableStats:
+    def __init__(self, row_count: int, columns: Dict[str, ColumnStats]):
+        self.row_count = row_count
+        self.columns = columns
+
+    def __repr__(self) -> str:
+        return f"TableStats({self.row_count} rows, {len(self.columns)} columns)"
+
+    def column(self, name: str) -> Optional[ColumnStats]:
+        return self.columns.get(name)
+
+def analyze_table(table: Any) -> TableStats:
+    row_count = len(table)
+    return TableStats(row_count, {name: ColumnStats(list(table.column_values(name)), row_count)
+                                  for name in table.column_names})
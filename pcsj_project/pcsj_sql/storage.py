@@ -0,0 +1,569 @@
+"""Column-wise storage for PCSJ `table` declarations."""
+
+import sys
+from array import array
+from itertools import compress, islice, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from .errors import IntegrityError, SQLError
+from .index import HashIndex
+from .nodes import ColumnDef
+
+# Fixed-width PCSJ types live in typed arrays; everything else (string,
+# datetime, ...) is kept in a plain list of Python objects.
+TYPECODES = {'int': 'q', 'float': 'd', 'bool': 'b'}
+
+# Python types a column of each PCSJ type stores as given, so a batch made
+# of only these needs no per-value coercion
+_STORED_AS_IS = {'int': {int}, 'float': {float, int}, 'bool': {bool}, 'string': {str}}
+# Range of the 64-bit slots of an int column
+_INT_MIN, _INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+def _coerce(column: ColumnDef, value: Any) -> Any:
+    kind = column.type
+    if kind == 'int':
+        if isinstance(value, int) and not isinstance(value, bool) or isinstance(value, float) and value.is_integer():
+            value = int(value)
+            if not _INT_MIN <= value <= _INT_MAX:
+                raise SQLError(f"Value {value} is out of range for int column '{column.name}'")
+            return value
+    elif kind == 'float':
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            try:
+                return float(value)
+            except OverflowError as error:
+                raise SQLError(f"Value {value} is out of range for float column '{column.name}'") from error
+    elif kind == 'bool':
+        if isinstance(value, bool) or value in (0, 1):
+            return bool(value)
+    elif kind == 'string':
+        if isinstance(value, str):
+            return value
+    else:
+        return value
+    raise SQLError(f"Column '{column.name}' expects {kind}, got {type(value).__name__} {value!r}")
+
+class Column:
+    def __init__(self, definition: ColumnDef):
+        self.definition = definition
+        self.name = definition.name
+        self.typecode = TYPECODES.get(definition.type)
+        self.data = array(self.typecode) if self.typecode else []
+        # NULL flags for typed columns, created on the first NULL
+        self.nulls: Optional[bytearray] = None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def coerce(self, value: Any) -> Any:
+        if value is None:
+            if self.definition.not_null or self.definition.primary_key:
+                raise SQLError(f"Column '{self.name}' cannot be NULL")
+            return None
+        return _coerce(self.definition, value)
+
+    def coerce_many(self, values: Sequence[Any]) -> Sequence[Any]:
+        # coerce() for a whole batch: a typed array (or list) when every value
+        # already has a stored type, else value by value
+        if isinstance(values, array) and values.typecode == self.typecode:
+            return values
+        kinds = set(map(type, values))
+        stored = _STORED_AS_IS.get(self.definition.type)
+        if type(None) not in kinds and (stored is None or kinds <= stored):
+            if not self.typecode:
+                return list(values)
+            try:
+                return array(self.typecode, values)
+            except OverflowError:
+                pass # A value out of the column's range: coerce() names it
+        return [self.coerce(value) for value in values]
+
+    def append(self, value: Any):
+        if self.typecode is None:
+            self.data.append(value)
+            return
+        if value is None:
+            self._null_flags()[len(self.data)] = 1
+            self.data.append(0)
+            return
+        self.data.append(value)
+        if self.nulls is not None:
+            self.nulls.append(0)
+
+    def extend(self, values: Sequence[Any]):
+        # append() for a batch from coerce_many()
+        if self.typecode is None:
+            self.data.extend(values)
+            return
+        start = len(self.data)
+        if not isinstance(values, array) and None in values:
+            if self.nulls is None:
+                self.nulls = bytearray(start)
+            self.nulls.extend([value is None for value in values])
+            self.data.extend([0 if value is None else value for value in values])
+            return
+        self.data.extend(values)
+        if self.nulls is not None:
+            self.nulls.extend(bytes(len(self.data) - start))
+
+    def _null_flags(self) -> bytearray:
+        if self.nulls is None:
+            self.nulls = bytearray(len(self.data))
+        self.nulls.append(0)
+        return self.nulls
+
+    def get(self, rid: int) -> Any:
+        if self.nulls is not None and self.nulls[rid]:
+            return None
+        if self.typecode == 'b':
+            return bool(self.data[rid])
+        return self.data[rid]
+
+    def set(self, rid: int, value: Any):
+        if self.typecode is None:
+            self.data[rid] = value
+            return
+        if value is None:
+            if self.nulls is None:
+                self.nulls = bytearray(len(self.data))
+            self.nulls[rid] = 1
+            self.data[rid] = 0
+            return
+        self.data[rid] = value
+        if self.nulls is not None:
+            self.nulls[rid] = 0
+
+    def values(self) -> Iterable[Any]:
+        # Every physical slot, NULLs as None; no copy when the column has no NULLs
+        data = map(bool, self.data) if self.typecode == 'b' else self.data
+        if self.nulls is None or 1 not in self.nulls:
+            return data
+        return [None if null else value for value, null in zip(data, self.nulls)]
+
+    def nbytes(self) -> int:
+        if self.typecode is not None:
+            size = self.data.itemsize * len(self.data)
+        else:
+            size = sys.getsizeof(self.data) + sum(sys.getsizeof(v) for v in self.data if v is not None)
+        return size + (len(self.nulls) if self.nulls is not None else 0)
+
+class Table:
+    # Whether changes reach the write-ahead log; the tables of a
+    # materialized view are rebuilt on recovery instead (see views.py)
+    logged = True
+
+    def __init__(self, name: str, columns: Sequence[ColumnDef], catalog: Any = None):
+        if not columns:
+            raise SQLError(f"Table '{name}' needs at least one column")
+        self.name = name
+        # The owning Database: resolves FOREIGN KEY targets and collects undo records
+        self.catalog = catalog
+        self.definitions = list(columns)
+        self.columns: Dict[str, Column] = {}
+        for definition in self.definitions:
+            if definition.name in self.columns:
+                raise SQLError(f"Duplicate column '{definition.name}' in table '{name}'")
+            self.columns[definition.name] = Column(definition)
+        self.column_names = [definition.name for definition in self.definitions]
+        # Row ids are physical slots; deleted slots stay behind as 0 in `live`
+        self.live = bytearray()
+        self.live_count = 0
+        # Counts changes, so a copy of the table's data can tell it is stale
+        # (see parallel.py)
+        self.version = 0
+        # Older versions of recently changed rows, for readers whose snapshot
+        # predates the change: rid -> [(transaction, values before), ...]
+        # (see mvcc.py)
+        self.versions: Dict[int, List[tuple]] = {}
+        # Versioned rows that were deleted or had an indexed column changed:
+        # the indexes may not lead to their older versions
+        self.moved: Set[int] = set()
+
+        self.indexes: Dict[str, Any] = {} # HashIndex or OrderedIndex
+        self.primary_key: Optional[str] = None
+        self.primary_index: Optional[HashIndex] = None
+        keys = [d.name for d in self.definitions if d.primary_key]
+        if len(keys) > 1:
+            raise SQLError(f"Table '{name}' declares more than one PRIMARY KEY")
+        if keys:
+            self.primary_key = keys[0]
+            self.primary_index = self.add_index(HashIndex(f"{name}_pkey", name, keys, unique=True))
+        for definition in self.definitions:
+            if definition.unique and not definition.primary_key:
+                self.add_index(HashIndex(f"{name}_{definition.name}_key", name, [definition.name], unique=True))
+        # (column, parent table, parent column), each backed by an index on both sides
+        self.foreign_keys: List[Tuple[str, str, str]] = []
+        # (child table, child column) pairs pointing at this table
+        self.referenced_by: List[Tuple[str, str]] = []
+        for definition in self.definitions:
+            if definition.references:
+                parent, parent_column = definition.references
+                self.foreign_keys.append((definition.name, parent, parent_column))
+                self.add_index(HashIndex(f"{name}_{definition.name}_fkey", name, [definition.name]))
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def __repr__(self) -> str:
+        return f"Table({self.name}, {self.live_count} rows)"
+
+    def column(self, name: str) -> Column:
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise SQLError(f"Unknown column '{name}' in table '{self.name}'")
+
+    # --- Indexes and constraints ------------------------------------------------
+
+    def add_index(self, index: Any) -> Any:
+        if index.name in self.indexes:
+            raise SQLError(f"Index '{index.name}' already exists on table '{self.name}'")
+        for name in index.columns:
+            self.column(name)
+        index.build((index.key(self.row_dict(rid)), rid) for rid in self.rids())
+        self.indexes[index.name] = index
+        return index
+
+    def index_on(self, column_names: Sequence[str], unique: bool = False) -> Optional[Any]:
+        # An index whose key is exactly these columns
+        wanted = tuple(column_names)
+        for index in self.indexes.values():
+            if index.columns == wanted and (index.unique or not unique):
+                return index
+        return None
+
+    def ordered_rids(self, column_names: Sequence[str], descending: bool = False) -> Optional[List[int]]:
+        # Live row ids sorted by these columns (NULLs first) if an ordered
+        # index covers them as a prefix, else None
+        wanted = tuple(column_names)
+        for index in self.indexes.values():
+            if index.kind == 'ordered' and index.columns[:len(wanted)] == wanted:
+                return index.scan(descending)
+        return None
+
+    def lookup(self, key: Any) -> Optional[int]:
+        # Point lookup by primary key
+        if self.primary_index is None:
+            raise SQLError(f"Table '{self.name}' has no PRIMARY KEY")
+        rids = self.primary_index.lookup(key)
+        return rids[0] if rids else None
+
+    def _parent_index(self, parent: str, parent_column: str) -> Any:
+        index = self.catalog.table(parent).index_on([parent_column], unique=True)
+        if index is None:
+            raise SQLError(f"FOREIGN KEY {self.name}.{parent_column} must reference a PRIMARY KEY or UNIQUE column of '{parent}'")
+        return index
+
+    def _check_references(self, row: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        for column, parent, parent_column in self.foreign_keys:
+            if changed is not None and column not in changed:
+                continue
+            value = row[column]
+            if value is None:
+                continue
+            index = self._parent_index(parent, parent_column)
+            if value not in index:
+                raise IntegrityError(f"FOREIGN KEY violation: {self.name}.{column} = {value!r} has no match in {parent}({parent_column})")
+            parent_table = self.catalog.table(parent)
+            if parent_table.versions:
+                # The parent row must not be one a concurrent transaction may still roll back
+                for rid in index.lookup(value):
+                    self.catalog.check_write(parent_table, rid, modify=False)
+
+    def _check_referencing_rows(self, old: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        # Rows of child tables still pointing at this row block its delete or key change
+        for child_name, child_column in self.referenced_by:
+            child = self.catalog.table(child_name)
+            for column, parent, parent_column in child.foreign_keys:
+                if parent != self.name or column != child_column:
+                    continue
+                if changed is not None and parent_column not in changed:
+                    continue
+                if old[parent_column] is None:
+                    continue
+                index = child.index_on([child_column])
+                if index.lookup(old[parent_column]):
+                    raise IntegrityError(f"FOREIGN KEY violation: {child_name}.{child_column} still references {self.name}({parent_column}) = {old[parent_column]!r}")
+                if child.versions:
+                    self.catalog.check_pending_keys(child, {child_column: old[parent_column]}, [index])
+
+    def _index_add(self, row: Dict[str, Any], rid: int):
+        for index in self.indexes.values():
+            index.add(index.key(row), rid)
+
+    def _index_remove(self, row: Dict[str, Any], rid: int):
+        for index in self.indexes.values():
+            index.remove(index.key(row), rid)
+
+    def _log(self, entry: tuple):
+        if self.catalog is not None:
+            self.catalog.record(entry)
+
+    def _changing(self):
+        # Query results still being read from this table take their rows
+        # now, before the change (see cursor.py)
+        catalog = self.catalog
+        if catalog is not None and catalog.cursors:
+            catalog.materialize_cursors(self.name)
+        self.version += 1
+
+    # --- Mutations --------------------------------------------------------------
+
+    def _normalize(self, values: Any, column_names: Optional[Sequence[str]] = None) -> List[Any]:
+        # Accept a dict, or a sequence in table order (or in `column_names` order)
+        if isinstance(values, Mapping):
+            unknown = set(values) - set(self.columns)
+            if unknown:
+                raise SQLError(f"Unknown column '{sorted(unknown)[0]}' in table '{self.name}'")
+            values = [values.get(name) for name in self.column_names]
+        elif column_names is not None:
+            if len(values) != len(column_names):
+                raise SQLError(f"INSERT into '{self.name}' has {len(column_names)} columns but {len(values)} values")
+            by_name = dict(zip(column_names, values))
+            return self._normalize(by_name)
+        elif len(values) != len(self.column_names):
+            raise SQLError(f"Table '{self.name}' has {len(self.column_names)} columns but {len(values)} values were given")
+        return [self.columns[name].coerce(value) for name, value in zip(self.column_names, values)]
+
+    def insert(self, values: Any, column_names: Optional[Sequence[str]] = None) -> int:
+        self._changing()
+        row = self._normalize(values, column_names)
+        as_dict = dict(zip(self.column_names, row))
+        rid = len(self.live)
+        for index in self.indexes.values():
+            index.check(index.key(as_dict))
+        unique = [index for index in self.indexes.values() if index.unique]
+        if self.versions and unique:
+            self.catalog.check_pending_keys(self, as_dict, unique)
+        if self.foreign_keys:
+            self._check_references(as_dict)
+        for name, value in zip(self.column_names, row):
+            self.columns[name].append(value)
+        self.live.append(1)
+        self.live_count += 1
+        self._index_add(as_dict, rid)
+        self._log(('insert', self, rid))
+        return rid
+
+    def restore(self, rid: int, row: Sequence[Any]):
+        # Put a logged row back in slot `rid` while replaying a write-ahead
+        # log. Slots before it that no committed insert used stay dead, so
+        # row ids match the ones logged; the values were checked when logged.
+        self._changing()
+        while len(self.live) < rid:
+            for column in self.columns.values():
+                column.append(None if column.typecode is None else 0)
+            self.live.append(0)
+        if rid == len(self.live):
+            for name, value in zip(self.column_names, row):
+                self.columns[name].append(value)
+            self.live.append(1)
+        else:
+            for name, value in zip(self.column_names, row):
+                self.columns[name].set(rid, value)
+            self.live[rid] = 1
+        self.live_count += 1
+        self._index_add(dict(zip(self.column_names, row)), rid)
+
+    def insert_many(self, rows: Iterable[Any], column_names: Optional[Sequence[str]] = None) -> List[int]:
+        # Rows as dicts, or as sequences in table order (or in `column_names` order)
+        rows = rows if isinstance(rows, list) else list(rows)
+        if len(rows) < 2:
+            # A single row gains nothing from the batch path
+            return [self.insert(row, column_names) for row in rows]
+        if isinstance(rows[0], Mapping):
+            names = set().union(*rows)
+            unknown = names - set(self.columns)
+            if unknown:
+                raise SQLError(f"Unknown column '{sorted(unknown)[0]}' in table '{self.name}'")
+            data = {name: [row.get(name) for row in rows] for name in names}
+        else:
+            names = list(column_names) if column_names is not None else self.column_names
+            width = len(names)
+            bad = next((row for row in rows if len(row) != width), None)
+            if bad is not None:
+                if column_names is not None:
+                    raise SQLError(f"INSERT into '{self.name}' has {width} columns but {len(bad)} values")
+                raise SQLError(f"Table '{self.name}' has {width} columns but {len(bad)} values were given")
+            data = dict(zip(names, zip(*rows)))
+        return list(self.insert_columns(data))
+
+    def insert_columns(self, data: Mapping[str, Sequence[Any]]) -> range:
+        # Append a batch of rows given column by column (columns left out are
+        # NULL). Every constraint is checked for the whole batch before
+        # anything is stored; the row ids of the new rows are returned.
+        self._changing()
+        unknown = set(data) - set(self.columns)
+        if unknown:
+            raise SQLError(f"Unknown column '{sorted(unknown)[0]}' in table '{self.name}'")
+        counts = {len(values) for values in data.values()}
+        if len(counts) > 1:
+            raise SQLError(f"Columns of a batch for '{self.name}' have different lengths")
+        count = counts.pop() if counts else 0
+        start = len(self.live)
+        if not count:
+            return range(start, start)
+        values = {name: self.columns[name].coerce_many(data[name] if name in data else [None] * count)
+                  for name in self.column_names}
+        keys = {index.name: self._batch_keys(index, values) for index in self.indexes.values()}
+        for index in self.indexes.values():
+            index.check_many(keys[index.name])
+        unique = [index for index in self.indexes.values() if index.unique]
+        if self.versions and unique:
+            for position in range(count):
+                row = {name: column[position] for name, column in values.items()}
+                self.catalog.check_pending_keys(self, row, unique)
+        if self.foreign_keys:
+            self._check_batch_references(values)
+        for name in self.column_names:
+            self.columns[name].extend(values[name])
+        self.live.extend(b'\1' * count)
+        self.live_count += count
+        rids = range(start, start + count)
+        for index in self.indexes.values():
+            index.add_many(keys[index.name], rids)
+        if self.catalog is not None:
+            self.catalog.record_many(zip(repeat('insert'), repeat(self), rids))
+        return rids
+
+    def _batch_keys(self, index: Any, values: Mapping[str, Sequence[Any]]) -> List[Any]:
+        # index.key() of every row of a batch
+        if len(index.columns) == 1:
+            return list(values[index.columns[0]])
+        return list(zip(*(values[name] for name in index.columns)))
+
+    def _check_batch_references(self, values: Mapping[str, Sequence[Any]]):
+        # _check_references() once per distinct value of each FOREIGN KEY
+        # column; a table referencing itself may also point into the batch
+        for column, parent, parent_column in self.foreign_keys:
+            wanted = set(values[column])
+            wanted.discard(None)
+            if parent == self.name:
+                wanted.difference_update(values[parent_column])
+            for value in wanted:
+                self._check_references({column: value})
+
+    def load(self, state: Dict[str, Any]):
+        # Take over storage and indexes saved by a checkpoint (see wal.py)
+        for name, (data, nulls) in state['columns'].items():
+            column = self.column(name)
+            column.data, column.nulls = data, nulls
+        self.live = state['live']
+        self.live_count = state['live_count']
+        self.indexes = state['indexes']
+        if self.primary_key is not None:
+            self.primary_index = self.indexes[f"{self.name}_pkey"]
+        self.version += 1
+
+    def is_live(self, rid: int) -> bool:
+        return 0 <= rid < len(self.live) and self.live[rid] == 1
+
+    def update(self, rid: int, changes: Mapping[str, Any]):
+        self._changing()
+        if rid in self.versions:
+            self.catalog.check_write(self, rid)
+        if not self.is_live(rid):
+            raise SQLError(f"Row {rid} of table '{self.name}' does not exist")
+        coerced = {name: self.column(name).coerce(value) for name, value in changes.items()}
+        old = self.row_dict(rid)
+        new = {**old, **coerced}
+        changed = [name for name in coerced if old[name] != coerced[name]]
+        if not changed:
+            return
+        touched = [index for index in self.indexes.values() if any(name in index.columns for name in changed)]
+        for index in touched:
+            index.check(index.key(new), rid)
+        unique = [index for index in touched if index.unique]
+        if self.versions and unique:
+            self.catalog.check_pending_keys(self, new, unique, rid)
+        if self.foreign_keys:
+            self._check_references(new, changed)
+        if self.referenced_by:
+            self._check_referencing_rows(old, changed)
+        for index in touched:
+            index.remove(index.key(old), rid)
+        for name in changed:
+            self.columns[name].set(rid, new[name])
+        for index in touched:
+            index.add(index.key(new), rid)
+        self._log(('update', self, rid, {name: old[name] for name in changed}))
+
+    def delete(self, rid: int):
+        self._changing()
+        if rid in self.versions:
+            self.catalog.check_write(self, rid)
+        if not self.is_live(rid):
+            raise SQLError(f"Row {rid} of table '{self.name}' does not exist")
+        old = self.row_dict(rid)
+        if self.referenced_by:
+            self._check_referencing_rows(old)
+        self.live[rid] = 0
+        self.live_count -= 1
+        self._index_remove(old, rid)
+        self._log(('delete', self, rid))
+
+    def undo(self, entry: tuple):
+        # Reverse one undo record; constraints held before the change, so no checks
+        self._changing()
+        action, _, rid = entry[:3]
+        row = self.row_dict(rid)
+        if action == 'insert':
+            self._index_remove(row, rid)
+            self.live[rid] = 0
+            self.live_count -= 1
+        elif action == 'update':
+            old = {**row, **entry[3]}
+            self._index_remove(row, rid)
+            for name, value in entry[3].items():
+                self.columns[name].set(rid, value)
+            self._index_add(old, rid)
+        elif action == 'delete':
+            self.live[rid] = 1
+            self.live_count += 1
+            self._index_add(row, rid)
+
+    def get(self, rid: int, column_names: Optional[Sequence[str]] = None) -> tuple:
+        names = column_names or self.column_names
+        return tuple(self.columns[name].get(rid) for name in names)
+
+    def row_dict(self, rid: int) -> Dict[str, Any]:
+        return {name: self.columns[name].get(rid) for name in self.column_names}
+
+    def rids(self) -> Iterator[int]:
+        return compress(range(len(self.live)), self.live)
+
+    def column_values(self, name: str) -> Iterable[Any]:
+        # Values of one column for the live rows only
+        values = self.column(name).values()
+        if self.live_count == len(self.live):
+            return values
+        return compress(values, self.live)
+
+    def column_chunks(self, name: str, size: int) -> Iterator[Sequence[Any]]:
+        # column_values() in slices of at most `size` values, for batch scans.
+        # Typed columns with no NULLs and no deleted rows are sliced straight
+        # from their arrays.
+        column = self.column(name)
+        if column.typecode in ('q', 'd') and self.live_count == len(self.live) \
+                and (column.nulls is None or 1 not in column.nulls):
+            data = column.data
+            for start in range(0, len(data), size):
+                yield data[start:start + size]
+            return
+        values = iter(self.column_values(name))
+        while True:
+            chunk = list(islice(values, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def scan(self, column_names: Optional[Sequence[str]] = None) -> Iterator[tuple]:
+        # Tuples of the requested columns; columns not asked for are never read
+        names = column_names or self.column_names
+        return zip(*(self.column_values(name) for name in names))
+
+    def project(self, column_names: Sequence[str]) -> Dict[str, List[Any]]:
+        return {name: list(self.column_values(name)) for name in column_names}
+
+    def memory_usage(self) -> int:
+        return sum(column.nbytes() for column in self.columns.values()) + len(self.live)
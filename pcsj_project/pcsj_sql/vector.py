@@ -0,0 +1,325 @@
+"""Column batches and batch-at-a-time evaluation of bound expressions.
+
+Batch-capable operators pass `Batch` objects (one sequence per layout slot)
+instead of single rows, so expressions are evaluated a column at a time
+rather than with one tree walk per row: most run as a comprehension
+generated by the expression compiler, the rest with map() and set lookups.
+When NumPy is installed, numeric columns read from typed storage arrays
+become ndarrays, and comparisons, floating-point arithmetic and selections
+made only of those run inside NumPy. Values leave a batch as plain Python
+objects either way.
+"""
+
+import operator
+from array import array
+from functools import partial
+from itertools import compress, repeat
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .compiler import CompiledExpressions
+from .expressions import SCALAR_FUNCTIONS, _arithmetic, _compare, _like_regex, evaluate, in_list, truthy
+from .nodes import Between, BinaryOp, ColumnRef, FuncCall, InList, IsNull, Like, Literal, Name, OuterRef, Param, UnaryOp
+
+try:
+    import numpy as np
+except ImportError: # optional: batches then hold lists and typed arrays
+    np = None
+
+DEFAULT_BATCH_SIZE = 4096
+
+_DTYPES = {'q': 'int64', 'd': 'float64'}
+
+# Operators that map straight onto Python (and NumPy) functions when no NULLs are involved
+_FAST = {
+    '=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    '+': operator.add, '-': operator.sub, '*': operator.mul,
+}
+_COMPARISONS = {'=', '!=', '<', '<=', '>', '>='}
+# Expressions whose values are always True, False or None
+_BOOLEAN = (Between, InList, IsNull, Like)
+
+class Const:
+    # The value of an expression that is the same for every row of the batch
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+def is_ndarray(values: Any) -> bool:
+    return np is not None and isinstance(values, np.ndarray)
+
+def to_list(values: Any) -> Sequence[Any]:
+    # A column as Python values (NumPy scalars would leak into results otherwise)
+    return values.tolist() if is_ndarray(values) else values
+
+def from_storage(chunk: Any) -> Any:
+    # A slice of a typed storage array, or of a mapped column file; numeric
+    # ones become ndarrays over the same memory when NumPy is there
+    if np is not None:
+        if isinstance(chunk, array) and chunk.typecode in _DTYPES:
+            return np.frombuffer(chunk, dtype=_DTYPES[chunk.typecode])
+        if isinstance(chunk, memoryview) and chunk.format in _DTYPES:
+            return np.frombuffer(chunk, dtype=_DTYPES[chunk.format])
+    return chunk
+
+class Batch:
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, columns: List[Any], length: int):
+        self.columns = columns
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple], width: int) -> 'Batch':
+        columns = [list(column) for column in zip(*rows)] if width else []
+        return cls(columns, len(rows))
+
+    def rows(self):
+        if not self.columns:
+            return repeat((), self.length)
+        return zip(*[to_list(column) for column in self.columns])
+
+    def take(self, positions: Sequence[int]) -> 'Batch':
+        # The rows at `positions` (a selection vector)
+        if len(positions) == self.length:
+            return self
+        columns = []
+        for column in self.columns:
+            if is_ndarray(column):
+                columns.append(column[positions])
+            else:
+                columns.append([column[i] for i in positions])
+        return Batch(columns, len(positions))
+
+def _numeric_scalar(value: Any) -> bool:
+    # Constants NumPy compares exactly with int64/float64 columns
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, float) or isinstance(value, int) and -2 ** 63 <= value < 2 ** 63
+
+def _has_null(values: Any) -> bool:
+    return not is_ndarray(values) and not isinstance(values, array) and None in values
+
+def _and3(left: Any, right: Any):
+    if left is not None and not truthy(left) or right is not None and not truthy(right):
+        return False
+    return None if left is None or right is None else True
+
+def _or3(left: Any, right: Any):
+    if truthy(left) or truthy(right):
+        return True
+    return None if left is None or right is None else False
+
+def _not3(value: Any):
+    return None if value is None else not truthy(value)
+
+def _negate(value: Any):
+    return None if value is None else -value
+
+class BatchEvaluator:
+    # Evaluates bound expressions over whole batches. `env` is the row
+    # resolver used for the parts that only make sense row by row
+    # (subqueries), and for outer references and host variables. `compiled`
+    # is the statement's cache of generated code.
+    def __init__(self, env: Any, params: Any = None, compiled: Optional[Dict[tuple, Any]] = None):
+        self.env = env
+        self.params = params
+        self.compiled = CompiledExpressions(env, params, compiled)
+
+    def column(self, expr: Any, batch: Batch) -> Any:
+        # One value per row of the batch, as a list, typed array or ndarray
+        if type(expr) is ColumnRef:
+            return batch.columns[expr.index]
+        if self._numpy_kind(expr, batch) is None:
+            values = self.compiled.batch_column(expr, batch)
+            if values is not None:
+                return values
+        values = self.evaluate(expr, batch)
+        if type(values) is Const:
+            return [values.value] * batch.length
+        return values
+
+    def selection(self, predicate: Any, batch: Batch) -> List[int]:
+        # Positions of the rows for which the predicate is true
+        if self._numpy_kind(predicate, batch) != 'b':
+            positions = self.compiled.batch_selection(predicate, batch)
+            if positions is not None:
+                return positions
+        values = self.evaluate(predicate, batch)
+        if type(values) is Const:
+            return list(range(batch.length)) if truthy(values.value) else []
+        if is_ndarray(values):
+            if values.dtype == bool:
+                return np.flatnonzero(values).tolist()
+            values = values.tolist()
+        if not isinstance(predicate, _BOOLEAN) and not (type(predicate) is BinaryOp and
+                                                        (predicate.op in _COMPARISONS or predicate.op in ('AND', 'OR'))) \
+                and not (type(predicate) is UnaryOp and predicate.op == 'NOT'):
+            values = map(truthy, values)
+        return list(compress(range(batch.length), values))
+
+    def _numpy_kind(self, expr: Any, batch: Batch) -> Optional[str]:
+        # The dtype kind ('b', 'i' or 'f') of `expr` when NumPy can evaluate
+        # all of it over this batch, otherwise None
+        if np is None:
+            return None
+        kind = type(expr)
+        if kind is ColumnRef:
+            column = batch.columns[expr.index]
+            return column.dtype.kind if is_ndarray(column) else None
+        if kind in (Literal, Param, Name, OuterRef):
+            value = self.evaluate(expr, batch).value
+            if not _numeric_scalar(value):
+                return None
+            return 'f' if isinstance(value, float) else 'i'
+        if kind is BinaryOp:
+            left = self._numpy_kind(expr.left, batch)
+            right = self._numpy_kind(expr.right, batch)
+            if left is None or right is None:
+                return None
+            if expr.op in ('AND', 'OR'):
+                return 'b' if left == right == 'b' else None
+            if 'b' in (left, right):
+                return None
+            if expr.op in _COMPARISONS:
+                return 'b'
+            # Integer results could overflow int64
+            return 'f' if expr.op in _FAST and 'f' in (left, right) else None
+        if kind is UnaryOp and expr.op == '-':
+            operand = self._numpy_kind(expr.operand, batch)
+            return operand if operand in ('i', 'f') else None
+        if kind is Between and self._numpy_kind(expr.operand, batch) in ('i', 'f'):
+            bounds = (expr.low, expr.high)
+            if all(type(bound) is Literal and _numeric_scalar(bound.value) for bound in bounds):
+                return 'b'
+        return None
+
+    def evaluate(self, expr: Any, batch: Batch) -> Any:
+        kind = type(expr)
+        if kind is ColumnRef:
+            return batch.columns[expr.index]
+        if kind is Literal:
+            return Const(expr.value)
+        if kind is Param:
+            return Const(evaluate(expr, self.env, self.params))
+        if kind is OuterRef or kind is Name:
+            # Fixed for the whole batch: a row of an enclosing query or a PCSJ variable
+            return Const(self.env(expr))
+        if kind is BinaryOp:
+            return self._binary(expr, batch)
+        if kind is UnaryOp:
+            value = self.evaluate(expr.operand, batch)
+            function = _not3 if expr.op == 'NOT' else _negate
+            if type(value) is Const:
+                return Const(function(value.value))
+            if is_ndarray(value) and expr.op != 'NOT':
+                return -value
+            return list(map(function, to_list(value)))
+        if kind is FuncCall and expr.name in SCALAR_FUNCTIONS:
+            args = [self.evaluate(arg, batch) for arg in expr.args]
+            function = SCALAR_FUNCTIONS[expr.name]
+            if all(type(arg) is Const for arg in args):
+                return Const(function(*[arg.value for arg in args]))
+            return list(map(function, *[repeat(arg.value, batch.length) if type(arg) is Const else to_list(arg)
+                                        for arg in args]))
+        if kind is IsNull:
+            value = self.evaluate(expr.operand, batch)
+            if type(value) is Const:
+                return Const((value.value is None) != expr.negated)
+            if is_ndarray(value) or isinstance(value, array):
+                return Const(expr.negated) # typed storage slices hold no NULLs
+            if expr.negated:
+                return [item is not None for item in value]
+            return [item is None for item in value]
+        if kind is InList and all(type(item) in (Literal, Param) for item in expr.items):
+            value = self.evaluate(expr.operand, batch)
+            items = [self.evaluate(item, batch).value for item in expr.items]
+            member = partial(in_list, set(items) if all(_hashable(i) for i in items) else items, expr.negated)
+            if type(value) is Const:
+                return Const(member(value.value))
+            return list(map(member, to_list(value)))
+        if kind is Between and type(expr.low) is Literal and type(expr.high) is Literal \
+                and expr.low.value is not None and expr.high.value is not None:
+            low = BinaryOp('>=', expr.operand, expr.low)
+            high = BinaryOp('<=', expr.operand, expr.high)
+            inside = self._binary(BinaryOp('AND', low, high), batch)
+            if not expr.negated:
+                return inside
+            if type(inside) is Const:
+                return Const(_not3(inside.value))
+            return ~inside if is_ndarray(inside) else list(map(_not3, inside))
+        if kind is Like:
+            value = self.evaluate(expr.operand, batch)
+            pattern = self.evaluate(expr.pattern, batch)
+            if type(pattern) is Const and type(value) is not Const:
+                if pattern.value is None:
+                    return Const(None)
+                match = _like_regex(pattern.value).match
+                negated = expr.negated
+                return [None if item is None else (match(str(item)) is None) == negated for item in to_list(value)]
+        return self._row_by_row(expr, batch)
+
+    def _row_by_row(self, expr: Any, batch: Batch) -> List[Any]:
+        env = self.env
+        params = self.params
+        values = []
+        for row in batch.rows():
+            env.row = row
+            values.append(evaluate(expr, env, params))
+        return values
+
+    def _binary(self, expr: BinaryOp, batch: Batch) -> Any:
+        op = expr.op
+        left = self.evaluate(expr.left, batch)
+        right = self.evaluate(expr.right, batch)
+        if op in ('AND', 'OR'):
+            if is_ndarray(left) and is_ndarray(right) and left.dtype == bool and right.dtype == bool:
+                return (left & right) if op == 'AND' else (left | right)
+            function = _and3 if op == 'AND' else _or3
+        elif op in _FAST:
+            vectorized = self._numpy(op, _FAST[op], left, right)
+            if vectorized is not None:
+                return vectorized
+            nulls = any(side.value is None if type(side) is Const else _has_null(side) for side in (left, right))
+            if not nulls:
+                function = _FAST[op]
+            else:
+                function = partial(_compare if op in _COMPARISONS else _arithmetic, op)
+        else:
+            function = partial(_arithmetic, op)
+        if type(left) is Const and type(right) is Const:
+            return Const(function(left.value, right.value))
+        length = batch.length
+        lefts = repeat(left.value, length) if type(left) is Const else to_list(left)
+        rights = repeat(right.value, length) if type(right) is Const else to_list(right)
+        return list(map(function, lefts, rights))
+
+    @staticmethod
+    def _numpy(op: str, function: Callable, left: Any, right: Any) -> Optional[Any]:
+        # NumPy handles comparisons of numeric columns, and arithmetic whose
+        # result is floating point (integer results could overflow int64)
+        if np is None or not (is_ndarray(left) or is_ndarray(right)):
+            return None
+        for side in (left, right):
+            if type(side) is Const and not _numeric_scalar(side.value):
+                return None
+            if type(side) is not Const and not is_ndarray(side):
+                return None
+        if op not in _COMPARISONS:
+            floating = any(is_ndarray(side) and side.dtype.kind == 'f' or type(side) is Const and isinstance(side.value, float)
+                           for side in (left, right))
+            if not floating:
+                return None
+        # Overflow to inf and inf - inf = nan are the results Python gives too, not warnings
+        with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+            return function(left.value if type(left) is Const else left, right.value if type(right) is Const else right)
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
\ No newline at end of file
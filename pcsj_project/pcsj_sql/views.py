@@ -0,0 +1,410 @@
+"""Materialized views, maintained incrementally as their tables change.
+
+`CREATE MATERIALIZED VIEW name AS SELECT ...` runs the query once and keeps
+its rows in a table that queries read like any other. A view whose query
+filters, projects, inner joins (each table once) and aggregates (COUNT, SUM,
+AVG, MIN and MAX, with DISTINCT, GROUP BY and HAVING) is kept up to date by
+every statement that changes one of its tables:
+
+- The changed rows of the table form a delta: each row put in counts +1, and
+  each row taken out counts -1 (an UPDATE is both).
+- The view's query runs over the delta in place of the table, joined to the
+  other tables as they are now. Its rows are grouped by the view's GROUP BY
+  values, or by the whole result row when there is no aggregation.
+- Each group keeps its row count and the state of its aggregates, which the
+  delta's rows adjust. Only the groups that changed rewrite their rows in the
+  view.
+
+So a statement costs time in proportion to the rows it changes, not to the
+size of the tables, provided the join columns of the other tables are
+indexed (primary and foreign keys always are). The exception is deleting a
+group's MIN or MAX value: that group is read again. Other queries (ORDER BY,
+LIMIT, subqueries, outer, semi and anti joins, window functions, CTEs) keep
+their rows until `REFRESH MATERIALIZED VIEW` runs them again.
+
+The rows and group state are stored in ordinary tables, so a failed
+statement or a ROLLBACK undoes its changes to views along with its own.
+Other transactions see each view as of their snapshot (see mvcc.py). Two
+transactions that change the same group conflict like two writers of one
+row. For a view that joins tables, any two transactions that change its
+tables conflict, since each one's delta is joined to tables the other may
+be changing.
+"""
+
+from dataclasses import replace
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .expressions import evaluate, host_value, truthy
+from .index import HashIndex
+from .nodes import (
+    BinaryOp, ColumnDef, ColumnRef, Exists, InSubquery, IsNull, Join, Literal, Name, Param, Select, SelectItem,
+    Star, Subquery, TableRef, WindowFunction,
+)
+from .planner import _and, _is_aggregate, map_children, plan_query, walk
+from .storage import Table
+
+# Column of a delta table holding +1 or -1 for each row
+SIGN = '#sign'
+# Columns of a view's state table: the group's values as a tuple, its row
+# count, its aggregates' states, and the row ids of its rows in the view
+_STATE_COLUMNS = ['#key', '#rows', '#state', '#rids']
+
+def row_changes(entries: Iterable[tuple]) -> Iterator[Tuple[tuple, int]]:
+    # (row, +1 or -1) for the undo records of one table's changes, read
+    # right after they were made
+    for entry in entries:
+        action, table, rid = entry[:3]
+        row = table.get(rid)
+        if action == 'insert':
+            yield row, 1
+        elif action == 'delete':
+            yield row, -1
+        else:
+            old = dict(zip(table.column_names, row))
+            old.update(entry[3])
+            yield tuple(old[name] for name in table.column_names), -1
+            yield row, 1
+
+def delta_table(table: Table, changes: List[Tuple[tuple, int]]) -> Table:
+    # The changed rows of `table` with their signs, without its constraints
+    definitions = [ColumnDef(d.name, d.type) for d in table.definitions] + [ColumnDef(SIGN, 'int')]
+    delta = Table(f"{table.name}#delta", definitions)
+    rows = [row + (sign,) for row, sign in changes]
+    delta.insert_columns(dict(zip(delta.column_names, zip(*rows))))
+    return delta
+
+def _view_table(name: str, columns: Sequence[str]) -> Table:
+    table = Table(name, [ColumnDef(column, 'any') for column in columns])
+    table.logged = False
+    return table
+
+class MaterializedView:
+    def __init__(self, database: Any, name: str, select: Select, params: Any = None):
+        self.name = name
+        self.select = select
+        # Host variables and parameters keep the values they had when the view was created
+        if isinstance(params, dict):
+            used = {node.name for node in walk(select) if type(node) is Param} \
+                | {node.parts[0] for node in walk(select) if type(node) is Name}
+            params = {key: value for key, value in params.items() if key in used}
+        elif params is not None:
+            params = list(params)
+        self.params = params
+        plan = plan_query(database, select, params)
+        self.table = _view_table(name, [column for _, column in plan.layout])
+        # (alias, table) of each FROM item; None when the view is only refreshed
+        self.sources = _maintainable(select, database)
+        self.state: Optional[Table] = None
+        # A one-row table every change to a joining view updates, so two
+        # transactions that change its tables conflict
+        self.stamp: Optional[Table] = None
+        if self.sources is None:
+            self.table.insert_many(list(database.query_rows(select, params)))
+        else:
+            self._prepare(select)
+            self.populate(database)
+        for table in (self.table, self.state, self.stamp):
+            if table is not None:
+                table.catalog = database
+
+    @property
+    def incremental(self) -> bool:
+        return self.sources is not None
+
+    def reads(self) -> List[str]:
+        # Names of the tables whose changes the view takes
+        return [table.name for _, table in self.sources] if self.sources is not None else []
+
+    def _prepare(self, select: Select):
+        # Split the query into the rows it reads (`core`: the group values,
+        # then the aggregates' arguments) and what the view makes of each group
+        sources = self.sources
+        aggregates: List[Any] = []
+        for expr in [item.expr for item in select.items] + [select.having]:
+            for node in walk(expr):
+                if _is_aggregate(node) and node not in aggregates:
+                    aggregates.append(node)
+        self.aggregates = aggregates
+        self.grouped = bool(aggregates or select.group_by)
+        self.distinct = select.distinct
+        if self.grouped:
+            keys = list(select.group_by)
+            aliases = {item.alias: item.expr for item in select.items if item.alias}
+            for position, expr in enumerate(keys):
+                # GROUP BY may name a select-list position or alias, as in the planner
+                if type(expr) is Literal and isinstance(expr.value, int) and 1 <= expr.value <= len(select.items):
+                    keys[position] = select.items[expr.value - 1].expr
+                elif type(expr) is Name and len(expr.parts) == 1 and expr.column in aliases \
+                        and not any(expr.column in table.columns for _, table in sources):
+                    keys[position] = aliases[expr.column]
+            qualified = [self._qualify(expr) for expr in keys]
+            width = len(keys)
+
+            def rewrite(expr: Any) -> Any:
+                # The expression over a group's values and aggregate results
+                if _is_aggregate(expr):
+                    return ColumnRef(width + aggregates.index(expr))
+                if self._qualify(expr) in qualified:
+                    return ColumnRef(qualified.index(self._qualify(expr)))
+                return map_children(expr, rewrite)
+            self.outputs = [rewrite(item.expr) for item in select.items]
+            self.having = rewrite(select.having) if select.having is not None else None
+        else:
+            keys = []
+            for item in select.items:
+                if type(item.expr) is Star:
+                    keys.extend(Name((alias, column)) for alias, table in sources
+                                if item.expr.qualifier in (None, alias) for column in table.column_names)
+                else:
+                    keys.append(item.expr)
+            self.outputs = self.having = None
+        self.keys = keys
+        core = list(keys)
+        # Slot of each aggregate's argument in a core row; None for COUNT(*)
+        self.arguments: List[Optional[int]] = []
+        for call in aggregates:
+            if call.star:
+                self.arguments.append(None)
+            else:
+                self.arguments.append(len(core))
+                core.append(call.args[0])
+        self.core = Select([SelectItem(expr) for expr in core], select.source, select.where)
+        self.state = _view_table(f"{self.name}#state", _STATE_COLUMNS)
+        # '#key' holds (group key,): an index skips tuples holding a NULL,
+        # and a group key may hold one
+        self.groups = self.state.add_index(HashIndex(f"{self.name}#key", self.state.name, ['#key'], unique=True))
+        if len(sources) > 1:
+            self.stamp = _view_table(f"{self.name}#stamp", ['changes'])
+            self.stamp.insert([0])
+
+    def _qualify(self, expr: Any) -> Any:
+        # `expr` with bare column names qualified by their FROM item, so
+        # `dept` and `e.dept` compare equal
+        if type(expr) is Name:
+            if len(expr.parts) == 1:
+                owners = [alias for alias, table in self.sources if expr.column in table.columns]
+                if len(owners) == 1:
+                    return Name((owners[0], expr.column))
+            return expr
+        return map_children(expr, self._qualify)
+
+    # --- Maintenance ------------------------------------------------------------
+
+    def populate(self, database: Any):
+        # Fill an empty view from the whole of its tables
+        self._apply(database, database.query_rows(
+            replace(self.core, items=self.core.items + [SelectItem(Literal(1))]), self.params))
+
+    def refresh(self, database: Any):
+        # Run the query again and replace the view's rows
+        for table in (self.table, self.state):
+            if table is not None:
+                for rid in list(table.rids()):
+                    table.delete(rid)
+        if not self.incremental:
+            self.table.insert_many(list(database.query_rows(self.select, self.params)))
+            return
+        self._stamp()
+        self.populate(database)
+
+    def _stamp(self):
+        if self.stamp is not None:
+            self.stamp.update(0, {'changes': self.stamp.get(0)[0] + 1})
+
+    def apply_changes(self, database: Any, table: Table, delta: Table):
+        # Take the changes to `table` held in `delta` (see delta_table)
+        self._stamp()
+        alias = next(alias for alias, source in self.sources if source.name == table.name)
+        select = replace(self.core, items=self.core.items + [SelectItem(Name((alias, SIGN)))],
+                         source=_substitute(self.core.source, table.name, delta.name))
+        self._apply(database, database.query_rows(select, self.params, {delta.name: delta}))
+
+    def _apply(self, database: Any, rows: Iterable[tuple]):
+        # Adjust the groups of core rows that end in their sign
+        width = len(self.keys)
+        touched: Dict[tuple, List[tuple]] = {}
+        for row in rows:
+            key = row[:width]
+            group = touched.get(key)
+            if group is None:
+                touched[key] = [row]
+            else:
+                group.append(row)
+        if self.grouped and not self.keys:
+            # The one group of an aggregate without GROUP BY always has a row
+            touched.setdefault((), [])
+        state, view = self.state, self.table
+        # [key, state rid, row count, aggregate states, view rids] per group
+        groups = []
+        for key, group in touched.items():
+            rid = self.groups.entries.get((key,))
+            if rid is None:
+                count, states, rids = 0, tuple(map(_initial, self.aggregates)), ()
+            else:
+                count, states, rids = state.get(rid, _STATE_COLUMNS[1:])
+            count += sum(row[-1] for row in group)
+            if self.aggregates:
+                states, lost = self._fold(states, group)
+                if lost and count:
+                    states = self._recompute(database, key)
+            groups.append([key, rid, count, states, rids])
+        added: List[tuple] = []
+        for entry in groups:
+            key, _, count, states, rids = entry
+            values, copies = self._rows(key, count, states)
+            for rid in rids[copies:]:
+                view.delete(rid)
+            rids = rids[:copies]
+            if rids and self.outputs is not None and view.get(rids[0]) != values:
+                view.update(rids[0], dict(zip(view.column_names, values)))
+            added.extend([values] * (copies - len(rids)))
+            entry[4] = rids
+            entry.append(copies - len(rids))
+        new_rids = iter(view.insert_many(added))
+        inserts = []
+        for key, rid, count, states, rids, missing in groups:
+            if missing:
+                rids += tuple(next(new_rids) for _ in range(missing))
+            if not count and (self.keys or not self.grouped):
+                if rid is not None:
+                    state.delete(rid)
+            elif rid is None:
+                inserts.append(((key,), count, states, rids))
+            else:
+                state.update(rid, dict(zip(_STATE_COLUMNS[1:], (count, states, rids))))
+        state.insert_many(inserts)
+
+    def _fold(self, states: tuple, rows: List[tuple]) -> Tuple[tuple, bool]:
+        # The aggregates' states after `rows`, and whether a MIN or MAX lost its value
+        folded, lost = [], False
+        for call, state, slot in zip(self.aggregates, states, self.arguments):
+            if slot is not None:
+                state, stale = _fold(call, state, [(row[slot], row[-1]) for row in rows])
+                lost = lost or stale
+            folded.append(state)
+        return tuple(folded), lost
+
+    def _recompute(self, database: Any, key: tuple) -> tuple:
+        # The aggregates' states for one group, from its rows in the tables
+        terms = [IsNull(expr) if value is None else BinaryOp('=', expr, Literal(value))
+                 for expr, value in zip(self.keys, key)]
+        select = replace(self.core, where=_and([term for term in [self.core.where] + terms if term is not None]))
+        rows = [row + (1,) for row in database.query_rows(select, self.params)]
+        return self._fold(tuple(map(_initial, self.aggregates)), rows)[0]
+
+    def _rows(self, key: tuple, count: int, states: tuple) -> Tuple[Optional[tuple], int]:
+        # A group's row in the view, and how many copies of it the view holds
+        if self.outputs is None:
+            return key, min(count, 1) if self.distinct else count
+        if not count and self.keys:
+            return None, 0
+        row = key + tuple(_result(call, state, count) for call, state in zip(self.aggregates, states))
+
+        def resolve(node: Any) -> Any:
+            return row[node.index] if type(node) is ColumnRef else host_value(node, self.params)
+        if self.having is not None and not truthy(evaluate(self.having, resolve, self.params)):
+            return None, 0
+        return tuple(evaluate(expr, resolve, self.params) for expr in self.outputs), 1
+
+def _maintainable(select: Select, database: Any) -> Optional[List[Tuple[str, Table]]]:
+    # The (alias, table) FROM items of a query a view can maintain, else None
+    if select.ctes or select.order_by or select.limit is not None or select.offset is not None \
+            or select.source is None:
+        return None
+    exprs = [item.expr for item in select.items] + [select.where, select.having] + select.group_by
+    if select.distinct and (select.group_by or any(_is_aggregate(node) for node in walk(exprs))):
+        return None
+    sources: List[Tuple[str, Table]] = []
+    pending = [select.source]
+    while pending:
+        source = pending.pop()
+        if type(source) is Join:
+            if source.kind not in ('INNER', 'CROSS'):
+                return None
+            exprs.append(source.condition)
+            pending += [source.right, source.left]
+        elif type(source) is TableRef and source.name not in database.views:
+            sources.append((source.alias or source.name, database.table(source.name)))
+        else:
+            return None
+    names = [table.name for _, table in sources]
+    if len(set(names)) < len(names):
+        return None
+    if any(type(node) in (Subquery, InSubquery, Exists, WindowFunction) for node in walk(exprs)):
+        return None
+    return sources
+
+def _substitute(source: Any, name: str, replacement: str) -> Any:
+    # The FROM tree with table `name` read from `replacement` under the same alias
+    if type(source) is Join:
+        return replace(source, left=_substitute(source.left, name, replacement),
+                       right=_substitute(source.right, name, replacement))
+    if source.name == name:
+        return TableRef(replacement, source.alias or source.name)
+    return source
+
+# --- Aggregate state --------------------------------------------------------------
+# COUNT(*) keeps no state (it is the group's row count); COUNT(x) a count of
+# non-NULL values; SUM, AVG, MIN and MAX (value, count of non-NULL values);
+# DISTINCT aggregates the number of rows holding each value.
+
+def _initial(call: Any) -> Any:
+    if call.star:
+        return None
+    if call.distinct:
+        return {}
+    return 0 if call.name == 'COUNT' else (None, 0)
+
+def _fold(call: Any, state: Any, changes: List[Tuple[Any, int]]) -> Tuple[Any, bool]:
+    # `state` after the (value, sign) pairs of `changes`, and whether it
+    # lost a MIN or MAX value and must be computed again from the group
+    present = [(value, sign) for value, sign in changes if value is not None]
+    if call.distinct:
+        # A new dict, so the state table can undo the change
+        state = dict(state)
+        for value, sign in present:
+            count = state.get(value, 0) + sign
+            if count:
+                state[value] = count
+            else:
+                del state[value]
+        return state, False
+    if call.name == 'COUNT':
+        return state + sum(sign for _, sign in present), False
+    value, count = state
+    count += sum(sign for _, sign in present)
+    if not count:
+        return (None, 0), False
+    if call.name in ('SUM', 'AVG'):
+        # Summed on its own first, so a row taken out and put back adds nothing
+        change = sum(item * sign for item, sign in present)
+        return (change if value is None else value + change, count), False
+    lost = False
+    for item, sign in present:
+        if sign > 0:
+            if value is None or (item < value if call.name == 'MIN' else item > value):
+                value = item
+        elif item == value:
+            lost = True
+    return (value, count), lost
+
+def _result(call: Any, state: Any, rows: int) -> Any:
+    if call.star:
+        return rows
+    if call.distinct:
+        values = list(state)
+        if call.name == 'COUNT':
+            return len(values)
+        if not values:
+            return None
+        if call.name == 'SUM':
+            return sum(values)
+        if call.name == 'AVG':
+            return sum(values) / len(values)
+        return min(values) if call.name == 'MIN' else max(values)
+    if call.name == 'COUNT':
+        return state
+    value, count = state
+    if call.name == 'AVG':
+        return value / count if count else None
+    return value
@@ -0,0 +1,206 @@
+"""Durable database files: a write-ahead log plus periodic checkpoints.
+
+A durable database lives in two files. `path` holds a checkpoint: every
+table, column by column, with its indexes, as of one log sequence number
+(LSN). `path-wal` is the log: one record per committed transaction or
+catalog change since then, each framed with its length and a CRC so a
+record torn by a crash ends the log instead of corrupting it.
+
+Opening a database loads the checkpoint and replays only the log records
+after its LSN. A checkpoint is written to a temporary file and renamed over
+the old one before the log is emptied, so a crash at any point leaves
+either the old checkpoint with the whole log or the new one.
+
+Commits are written according to the `wal_sync` setting:
+
+- 'commit': written and fsynced before COMMIT returns (the default);
+- 'group': buffered, then written with one fsync per `wal_group_size`
+  commits or after `wal_group_delay` seconds, whichever comes first, so a
+  crash loses at most the last group;
+- 'off': written at once but never fsynced, which survives the process
+  dying but not the machine.
+"""
+
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+from .columnar import MappedTable
+from .errors import SQLError
+
+# Suffix of the log file next to a database file
+WAL_SUFFIX = '-wal'
+# Log size (bytes) past which a commit writes a checkpoint, unless `checkpoint_size` changes
+DEFAULT_CHECKPOINT_SIZE = 64 * 1024 * 1024
+# Commits written together under wal_sync = 'group', and the longest one waits (seconds)
+DEFAULT_GROUP_SIZE = 64
+DEFAULT_GROUP_DELAY = 0.01
+
+CHECKPOINT_FORMAT = 1
+# Length and CRC32 of the pickled record that follows
+_FRAME = struct.Struct('<II')
+
+def frame(record: tuple) -> bytes:
+    payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+def read_log(path: str) -> Tuple[List[tuple], int]:
+    # Every intact record of the log at `path`, and the length of the file
+    # they fill; anything after that is the torn tail of an interrupted write
+    records: List[tuple] = []
+    if not os.path.exists(path):
+        return records, 0
+    with open(path, 'rb') as file:
+        data = file.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        start, end = offset + _FRAME.size, offset + _FRAME.size + length
+        if end > len(data) or zlib.crc32(data[start:end]) != crc:
+            break
+        records.append(pickle.loads(data[start:end]))
+        offset = end
+    return records, offset
+
+def changes(entries: List[tuple]) -> List[tuple]:
+    # Redo records for a transaction's undo log, read at commit: the values
+    # rows ended up with, by table name and row id
+    redo = []
+    for entry in entries:
+        action, table, rid = entry[:3]
+        if not table.logged:
+            continue
+        if action == 'insert':
+            redo.append(('insert', table.name, rid, table.get(rid)))
+        elif action == 'update':
+            redo.append(('update', table.name, rid, {name: table.columns[name].get(rid) for name in entry[3]}))
+        else:
+            redo.append(('delete', table.name, rid))
+    return redo
+
+def _sync_directory(path: str):
+    # Make a rename or a new file in `path`'s directory durable
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class WriteAheadLog:
+    def __init__(self, path: str, lsn: int, length: int):
+        self.path = path
+        existed = os.path.exists(path)
+        self.file = open(path, 'r+b' if existed else 'w+b')
+        # Drop a torn tail left by a crash before appending after it
+        self.file.truncate(length)
+        self.file.seek(length)
+        if not existed:
+            _sync_directory(path)
+        # LSN of the last record appended
+        self.lsn = lsn
+        # Framed records not written yet (wal_sync = 'group')
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        self.timer: Optional[threading.Timer] = None
+        # Flushes the timer thread may run concurrently with appends
+        self.lock = threading.Lock()
+        self.syncs = 0
+
+    @property
+    def size(self) -> int:
+        return self.file.tell() + self.pending_size
+
+    def append(self, record: tuple, sync: str = 'commit', group_size: int = DEFAULT_GROUP_SIZE,
+               group_delay: float = DEFAULT_GROUP_DELAY) -> int:
+        with self.lock:
+            self.lsn += 1
+            data = frame((self.lsn,) + record)
+            self.pending.append(data)
+            self.pending_size += len(data)
+            lsn = self.lsn
+            if sync == 'group' and len(self.pending) < group_size:
+                if self.timer is None:
+                    self.timer = threading.Timer(group_delay, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return lsn
+        self.flush(fsync=sync != 'off')
+        return lsn
+
+    def flush(self, fsync: bool = True):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.pending:
+                self.file.write(b''.join(self.pending))
+                self.pending = []
+                self.pending_size = 0
+                self.file.flush()
+                if fsync:
+                    os.fsync(self.file.fileno())
+                    self.syncs += 1
+
+    def reset(self):
+        # Empty the log once a checkpoint holds everything in it
+        self.flush()
+        with self.lock:
+            self.file.seek(0)
+            self.file.truncate()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def write_checkpoint(path: str, database: Any, lsn: int):
+    # Every table of `database` with its storage and indexes, as of `lsn`
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        # Materialized views are kept as their definitions and run again on recovery
+        tables = [table for table in database.tables.values() if table.logged]
+        header = {'format': CHECKPOINT_FORMAT, 'lsn': lsn, 'tables': len(tables),
+                  'index_tables': database.index_tables,
+                  'views': [(view.name, view.select, view.params) for view in database.views.values()]}
+        pickle.dump(header, file, pickle.HIGHEST_PROTOCOL)
+        for table in tables:
+            if isinstance(table, MappedTable):
+                # Its rows stay in their own file; only indexes made by CREATE INDEX are kept
+                indexes = {name: index for name, index in table.indexes.items() if name in database.index_tables}
+                pickle.dump({'name': table.name, 'mapped': table.path, 'indexes': indexes}, file,
+                            pickle.HIGHEST_PROTOCOL)
+                continue
+            # One pickle per table, so loading keeps only one table's memo at a time
+            pickle.dump({
+                'name': table.name,
+                'definitions': table.definitions,
+                'columns': {name: (column.data, column.nulls) for name, column in table.columns.items()},
+                'live': table.live,
+                'live_count': table.live_count,
+                'indexes': table.indexes,
+            }, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    _sync_directory(path)
+
+def read_checkpoint(path: str) -> Tuple[Optional[dict], Iterator[dict]]:
+    # The checkpoint header (None when there is no checkpoint yet) and its tables
+    if not os.path.exists(path):
+        return None, iter(())
+    file = open(path, 'rb')
+    header = pickle.load(file)
+    if header.get('format') != CHECKPOINT_FORMAT:
+        file.close()
+        raise SQLError(f"Unsupported checkpoint format in '{path}'")
+
+    def tables() -> Iterator[dict]:
+        with file:
+            for _ in range(header['tables']):
+                yield pickle.load(file)
+    return header, tables()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+GROUP BY benchmark for the pcsj_sql Hash Aggregate.
+Aggregates N rows into about N/2 groups under each work_mem setting and
+reports wall time, spill files and, with --memory, the peak memory the query
+allocated (traced with tracemalloc, in a second run, since tracing is slow).
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database
+
+# HAVING keeps the result small, so the group table dominates memory
+QUERY = ("SELECT k, COUNT(*), SUM(amount), AVG(amount), MIN(amount), MAX(amount), COUNT(DISTINCT flag) "
+         "FROM facts GROUP BY k HAVING COUNT(*) > 3")
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql hash aggregation benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows in the table")
+    parser.add_argument("--work-mem", type=int, nargs="+", default=[0, 64 << 20, 8 << 20],
+                        help="work_mem settings in bytes to compare (0: no limit)")
+    parser.add_argument("--memory", action="store_true", help="Also report peak traced memory")
+    return parser
+
+def build(rows: int) -> Database:
+    db = Database()
+    db.execute("table facts { id: int PRIMARY KEY, k: int, amount: float, flag: int }")
+    groups = max(rows // 2, 1)
+    db.table("facts").insert_many([(i, i * 7919 % groups, float(i % 100), i % 3) for i in range(rows)])
+    return db
+
+def main():
+    args = setup_argparse().parse_args()
+    start = time.perf_counter()
+    db = build(args.rows)
+    print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.2f}s")
+    for work_mem in args.work_mem:
+        db.settings['work_mem'] = work_mem or None
+        start = time.perf_counter()
+        result = list(db.execute(QUERY))
+        elapsed = time.perf_counter() - start
+        plan_lines = [line for line in db.execute("EXPLAIN ANALYZE " + QUERY).splitlines() if 'Hash Aggregate' in line]
+        spilled = plan_lines[0].split(' spilled: ')[1].split('  ')[0] if ' spilled: ' in plan_lines[0] else 'no spill'
+        line = f"work_mem={work_mem or 'unlimited':>10}: {elapsed:7.2f}s  {len(result)} rows  {spilled}"
+        if args.memory:
+            tracemalloc.start()
+            list(db.execute(QUERY))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            line += f"  peak {peak / (1 << 20):.1f} MiB"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Join benchmark for the pcsj_sql planner.
+Builds two tables of N rows each, joins them on an equality key with every
+join method forced in turn, and reports wall time and result size. Nested
+loops are quadratic, so they only run for small N unless asked for.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database
+
+METHODS = {
+    'hash': 'enable_hashjoin',
+    'merge': 'enable_mergejoin',
+    'index': 'enable_indexnestloop',
+    'nestloop': 'enable_nestloop',
+}
+
+QUERY = "SELECT COUNT(*), SUM(o.amount) FROM customers c JOIN orders o ON o.customer_id = c.id WHERE c.region < 8"
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql join method benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows in each table")
+    parser.add_argument("--methods", nargs="+", choices=sorted(METHODS), help="Join methods to time")
+    parser.add_argument("--explain", action="store_true", help="Print each plan")
+    return parser
+
+def build(rows: int) -> Database:
+    db = Database()
+    db.execute("table customers { id: int PRIMARY KEY, region: int }")
+    db.execute("table orders { id: int PRIMARY KEY, customer_id: int, amount: float }")
+    db.table("customers").insert_many([(i, i % 10) for i in range(rows)])
+    # Every order belongs to a pseudo-random customer
+    db.table("orders").insert_many([(i, i * 7919 % rows, float(i % 100)) for i in range(rows)])
+    db.execute("ANALYZE")
+    return db
+
+def main() -> None:
+    args = setup_argparse().parse_args()
+    methods = args.methods or [m for m in METHODS if m != 'nestloop' or args.rows <= 5000]
+    start = time.perf_counter()
+    db = build(args.rows)
+    print(f"loaded 2 x {args.rows} rows in {time.perf_counter() - start:.2f}s")
+
+    print(f"{'method':>9} {'seconds':>9} {'rows':>9}")
+    for method in methods:
+        for name, setting in METHODS.items():
+            db.settings[setting] = name == method
+        if args.explain:
+            print(db.execute("EXPLAIN " + QUERY))
+        start = time.perf_counter()
+        result = db.execute(QUERY)[0]
+        elapsed = time.perf_counter() - start
+        print(f"{method:>9} {elapsed:>9.3f} {result.count:>9}")
+
+if __name__ == "__main__":
+    main()
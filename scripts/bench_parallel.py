@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for PCSJ process-pool offload.
+Runs the same CPU-bound PCSJ function through parallelMap with 1 to N workers
+and reports wall time and speedup relative to a single worker.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_interpreter import PCSJInterpreter
+from pcsj_parallel import parallel_map, get_pool, shutdown_pool
+
+# The function is exec'd into the interpreter env, like translated PCSJ code
+WORKLOAD = """
+def countPrimes(limit):
+    count = 0
+    for n in range(2, limit):
+        d = 2
+        while d * d <= n:
+            if n % d == 0:
+                break
+            d += 1
+        else:
+            count += 1
+    return count
+"""
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="PCSJ parallel scaling benchmark")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Largest pool size to try")
+    parser.add_argument("--tasks", type=int, default=64, help="Number of function calls")
+    parser.add_argument("--size", type=int, default=20000, help="Work per call")
+    return parser
+
+def main() -> None:
+    args = setup_argparse().parse_args()
+    env = PCSJInterpreter().env
+    exec(WORKLOAD, env)
+    items = [args.size] * args.tasks
+
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+    sizes = sorted({2 ** i for i in range(args.max_workers.bit_length()) if 2 ** i <= args.max_workers} | {args.max_workers})
+    baseline = None
+    for workers in sizes:
+        get_pool(workers) # Pool start-up is not part of the measurement
+        start = time.perf_counter()
+        parallel_map(env['countPrimes'], items, workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>9.3f} {baseline / elapsed:>8.2f}")
+    shutdown_pool()
+
+if __name__ == "__main__":
+    main()
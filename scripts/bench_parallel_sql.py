@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for parallel queries in pcsj_sql.
+Runs a filtered scan and a GROUP BY over one large table with 1 to N
+parallel workers, and reports wall time and speedup relative to a serial run,
+checking that every run returns the same rows.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_parallel import get_pool, shutdown_pool
+from pcsj_sql import Database
+
+QUERIES = {
+    "filtered scan": "SELECT id, amount FROM orders WHERE amount > 990.0 AND customer_id % 7 = 3",
+    "group by": "SELECT customer_id % 100 AS bucket, COUNT(*), SUM(amount), MAX(amount) FROM orders "
+                "WHERE amount > 100.0 GROUP BY customer_id % 100",
+}
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql parallel query benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows in the orders table")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Largest worker count to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration; the best is reported")
+    return parser
+
+def main():
+    args = setup_argparse().parse_args()
+    db = Database()
+    db.execute("table orders { id: int PRIMARY KEY, customer_id: int, amount: float }")
+    db.table("orders").insert_many([(i, i * 7919 % 10_000, float(i % 1000)) for i in range(args.rows)])
+    # Start the pool before timing, so its startup is not counted
+    get_pool()
+    counts = [None] + list(range(2, max(args.max_workers, 2) + 1))
+    for label, sql in QUERIES.items():
+        baseline = expected = None
+        for workers in counts:
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = [r.as_tuple() for r in db.execute(sql, parallel_workers=workers)]
+                best = min(best, time.perf_counter() - start)
+            if expected is None:
+                baseline, expected = best, rows
+            elif rows != expected:
+                print(f"MISMATCH in {label} with {workers} workers")
+            print(f"{label:<14} workers={workers or 1:<3} {best:8.3f}s  speedup {baseline / best:5.2f}x  {len(rows)} rows")
+    shutdown_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+ORDER BY benchmark for the pcsj_sql Sort.
+Sorts N rows on a string key and on mixed-direction keys under each work_mem
+setting, reporting wall time and spilled runs, then times the same orders
+with a LIMIT, which only keep the top rows in a heap.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database
+
+QUERIES = {
+    "string key": "SELECT id FROM facts ORDER BY name",
+    "mixed keys": "SELECT id FROM facts ORDER BY k, amount DESC",
+}
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql sort benchmark")
+    parser.add_argument("--rows", type=int, default=500_000, help="Rows in the table")
+    parser.add_argument("--work-mem", type=int, nargs="+", default=[0, 16 << 20],
+                        help="work_mem settings in bytes to compare (0: no limit)")
+    parser.add_argument("--limit", type=int, default=10, help="LIMIT of the top-N runs")
+    return parser
+
+def build(rows: int) -> Database:
+    db = Database()
+    db.execute("table facts { id: int PRIMARY KEY, k: int, amount: float, name: string }")
+    db.table("facts").insert_many([(i, i * 7919 % 1000, float(i * 31 % 997), f"n{i * 104729 % rows}")
+                                   for i in range(rows)])
+    return db
+
+def main():
+    args = setup_argparse().parse_args()
+    start = time.perf_counter()
+    db = build(args.rows)
+    print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.2f}s")
+    for work_mem in args.work_mem:
+        db.settings['work_mem'] = work_mem or None
+        for label, sql in QUERIES.items():
+            start = time.perf_counter()
+            count = len(list(db.execute(sql)))
+            elapsed = time.perf_counter() - start
+            plan_lines = [line for line in db.execute("EXPLAIN ANALYZE " + sql).splitlines() if 'Sort' in line]
+            spilled = plan_lines[0].split(' spilled: ')[1].split('  ')[0] if ' spilled: ' in plan_lines[0] else 'no spill'
+            print(f"work_mem={work_mem or 'unlimited':>10} {label:<11} {elapsed:7.2f}s  {count} rows  {spilled}")
+    for label, sql in QUERIES.items():
+        start = time.perf_counter()
+        rows = list(db.execute(f"{sql} LIMIT {args.limit}"))
+        print(f"top {args.limit:<17} {label:<11} {time.perf_counter() - start:7.2f}s  {len(rows)} rows")
+
+if __name__ == "__main__":
+    main()
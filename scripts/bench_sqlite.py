@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Backend comparison for pcsj_sql: the native engine against the sqlite3 backend.
+Loads the same two tables into both, then times a join with GROUP BY, a
+filtered scan, and repeated single-row UPDATEs and point SELECTs through host
+variables, checking that both backends return the same rows.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database, SQLiteDatabase
+
+QUERIES = {
+    "join + group by": ("SELECT c.region, COUNT(*) AS orders, SUM(o.amount) AS total FROM orders o "
+                        "JOIN customers c ON c.id = o.customer_id GROUP BY c.region ORDER BY c.region"),
+    "filtered scan": "SELECT id, amount FROM orders WHERE amount > 990 AND customer_id < 100 ORDER BY id",
+}
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql native vs sqlite3 backend benchmark")
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows in the orders table")
+    parser.add_argument("--customers", type=int, default=10_000, help="Rows in the customers table")
+    parser.add_argument("--statements", type=int, default=20_000, help="Point statements timed per backend")
+    return parser
+
+def build(database: type, args: argparse.Namespace):
+    db = database()
+    db.execute("table customers { id: int PRIMARY KEY, region: string }")
+    db.execute("table orders { id: int PRIMARY KEY, customer_id: int REFERENCES customers(id), amount: float }")
+    db.execute("INSERT INTO customers VALUES " + ", ".join(f"({i}, 'r{i % 16}')" for i in range(args.customers)))
+    for start in range(0, args.rows, 10_000):
+        rows = ", ".join(f"({i}, {i * 7919 % args.customers}, {i % 1000}.5)"
+                         for i in range(start, min(start + 10_000, args.rows)))
+        db.execute("INSERT INTO orders VALUES " + rows)
+    return db
+
+def main():
+    args = setup_argparse().parse_args()
+    results = {}
+    for database in (Database, SQLiteDatabase):
+        name = database.__name__
+        start = time.perf_counter()
+        db = build(database, args)
+        print(f"{name:<15} load {args.rows:,} rows: {time.perf_counter() - start:.2f}s")
+        for label, sql in QUERIES.items():
+            start = time.perf_counter()
+            rows = [r.as_tuple() for r in db.execute(sql)]
+            print(f"{name:<15} {label:<16} {time.perf_counter() - start:8.3f}s  {len(rows)} rows")
+            results.setdefault(label, []).append(rows)
+        start = time.perf_counter()
+        for i in range(args.statements):
+            db.execute("UPDATE orders SET amount = amount + 1 WHERE id = target", {"target": i % args.rows})
+        print(f"{name:<15} point UPDATE     {(time.perf_counter() - start) / args.statements * 1e6:8.1f}us")
+        start = time.perf_counter()
+        for i in range(args.statements):
+            db.execute("SELECT amount FROM orders WHERE id = target", {"target": i % args.rows})[0]
+        print(f"{name:<15} point SELECT     {(time.perf_counter() - start) / args.statements * 1e6:8.1f}us")
+    for label, (native, sqlite) in results.items():
+        if native != sqlite:
+            print(f"MISMATCH in {label}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Concurrent transaction stress test for pcsj_sql.
+Many async tasks move money between random accounts, yielding to each other
+between statements so their transactions interleave. A transfer that hits a
+serialization conflict rolls back and retries. Auditor tasks sum all
+balances inside their own transactions while transfers run; every sum, and
+the final total, must equal the starting total.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database, SerializationError
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql concurrent transfer benchmark")
+    parser.add_argument("--accounts", type=int, default=1000, help="Accounts in the table")
+    parser.add_argument("--tasks", type=int, default=200, help="Concurrent transfer tasks")
+    parser.add_argument("--transfers", type=int, default=50, help="Transfers per task")
+    parser.add_argument("--auditors", type=int, default=4, help="Concurrent tasks summing balances")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser
+
+class Counters:
+    def __init__(self):
+        self.committed = 0
+        self.retries = 0
+        self.audits = 0
+        self.bad_audits = 0
+
+async def transfer(db: Database, rng: random.Random, accounts: int, counters: Counters):
+    params = {"fromId": rng.randrange(accounts), "toId": rng.randrange(accounts), "amount": rng.randint(1, 50)}
+    while True:
+        db.execute("BEGIN TRANSACTION")
+        try:
+            balance = db.execute("SELECT balance FROM accounts WHERE id = fromId", params)[0].balance
+            await asyncio.sleep(0)
+            if balance >= params["amount"]:
+                db.execute("UPDATE accounts SET balance = balance - amount WHERE id = fromId", params)
+                await asyncio.sleep(0)
+                db.execute("UPDATE accounts SET balance = balance + amount WHERE id = toId", params)
+            db.execute("COMMIT")
+            counters.committed += 1
+            return
+        except SerializationError:
+            db.execute("ROLLBACK")
+            counters.retries += 1
+            await asyncio.sleep(0)
+
+async def worker(db: Database, rng: random.Random, args: argparse.Namespace, counters: Counters):
+    for _ in range(args.transfers):
+        await transfer(db, rng, args.accounts, counters)
+
+async def auditor(db: Database, total: int, done: asyncio.Event, counters: Counters):
+    while not done.is_set():
+        db.execute("BEGIN TRANSACTION")
+        first = db.execute("SELECT SUM(balance) AS total FROM accounts")[0].total
+        await asyncio.sleep(0)
+        second = db.execute("SELECT SUM(balance) AS total FROM accounts WHERE id >= 0")[0].total
+        db.execute("COMMIT")
+        counters.audits += 1
+        counters.bad_audits += first != total or second != total
+        await asyncio.sleep(0)
+
+async def run(args: argparse.Namespace) -> int:
+    db = Database()
+    db.execute("table accounts { id: int PRIMARY KEY, balance: int }")
+    db.table("accounts").insert_many([(i, 1000) for i in range(args.accounts)])
+    total = 1000 * args.accounts
+    counters = Counters()
+    done = asyncio.Event()
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    auditors = [asyncio.create_task(auditor(db, total, done, counters)) for _ in range(args.auditors)]
+    await asyncio.gather(*(worker(db, random.Random(rng.random()), args, counters) for _ in range(args.tasks)))
+    done.set()
+    await asyncio.gather(*auditors)
+    elapsed = time.perf_counter() - start
+    final = db.execute("SELECT SUM(balance) AS total, MIN(balance) AS low FROM accounts")[0]
+    versions = len(db.table("accounts").versions)
+    print(f"{counters.committed:,} transfers in {elapsed:.2f}s ({counters.committed / elapsed:,.0f}/s), "
+          f"{counters.retries:,} retries after conflicts")
+    print(f"{counters.audits:,} audits, {counters.bad_audits} inconsistent; "
+          f"final total {final.total:,} (expected {total:,}), lowest balance {final.low}, {versions} row versions left")
+    ok = final.total == total and final.low >= 0 and counters.bad_audits == 0 and versions == 0
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+def main():
+    args = setup_argparse().parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Materialized view benchmark for pcsj_sql: keeping a grouped join view up to
+date as small batches of rows are inserted, against running its query again
+after every batch. Checks that the view matches the query at the end.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database
+
+QUERY = ("SELECT c.region, COUNT(*) AS orders, SUM(o.amount) AS total, MAX(o.amount) AS largest "
+         "FROM orders o JOIN customers c ON c.id = o.customer_id GROUP BY c.region")
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql materialized view maintenance benchmark")
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows in the orders table")
+    parser.add_argument("--customers", type=int, default=10_000, help="Rows in the customers table")
+    parser.add_argument("--batches", type=int, default=200, help="Batches of new orders inserted")
+    parser.add_argument("--batch-size", type=int, default=10, help="Orders per batch")
+    return parser
+
+def build(args: argparse.Namespace) -> Database:
+    db = Database()
+    db.execute("table customers { id: int PRIMARY KEY, region: string }")
+    db.execute("table orders { id: int PRIMARY KEY, customer_id: int, amount: float }")
+    db.execute("INSERT INTO customers VALUES " + ", ".join(f"({i}, 'r{i % 16}')" for i in range(args.customers)))
+    for start in range(0, args.rows, 10_000):
+        rows = ", ".join(f"({i}, {i * 7919 % args.customers}, {i % 1000}.5)"
+                         for i in range(start, min(start + 10_000, args.rows)))
+        db.execute("INSERT INTO orders VALUES " + rows)
+    return db
+
+def insert_batch(db: Database, args: argparse.Namespace, batch: int):
+    start = args.rows + batch * args.batch_size
+    db.execute("INSERT INTO orders VALUES " + ", ".join(
+        f"({i}, {i * 7919 % args.customers}, {i % 2000}.25)" for i in range(start, start + args.batch_size)))
+
+def main():
+    args = setup_argparse().parse_args()
+    db = build(args)
+    start = time.perf_counter()
+    db.execute(f"CREATE MATERIALIZED VIEW regions AS {QUERY}")
+    print(f"create view           {time.perf_counter() - start:8.3f}s")
+    start = time.perf_counter()
+    for batch in range(args.batches):
+        insert_batch(db, args, batch)
+    maintained = time.perf_counter() - start
+    view = sorted(r.as_tuple() for r in db.execute("SELECT * FROM regions"))
+
+    db = build(args)
+    start = time.perf_counter()
+    for batch in range(args.batches):
+        insert_batch(db, args, batch)
+        result = sorted(r.as_tuple() for r in db.execute(QUERY))
+    recomputed = time.perf_counter() - start
+    per_batch = 1e3 / args.batches
+    print(f"maintained view       {maintained * per_batch:8.2f}ms per batch of {args.batch_size}")
+    print(f"query after each      {recomputed * per_batch:8.2f}ms per batch of {args.batch_size}")
+    if view != result:
+        print("MISMATCH between the view and its query")
+
+if __name__ == "__main__":
+    main()
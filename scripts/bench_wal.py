@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Durable database benchmark for pcsj_sql.
+Loads a table into a database file, times the checkpoint and the reopen,
+then measures single-row UPDATE commits under each `wal_sync` policy and
+the time to recover from the log those commits left behind.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "pcsj_project"))
+
+from pcsj_sql import Database
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="pcsj_sql write-ahead log benchmark")
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows loaded into the table")
+    parser.add_argument("--commits", type=int, default=2000, help="Commits measured per fsync policy")
+    parser.add_argument("--group-size", type=int, default=64, help="Commits per fsync under wal_sync = 'group'")
+    parser.add_argument("--dir", help="Directory for the database files (default: a temporary one)")
+    return parser
+
+def run(args: argparse.Namespace, directory: str):
+    path = os.path.join(directory, "bench.db")
+    db = Database(path)
+    db.settings["wal_sync"] = "off"
+    db.execute("table accounts { id: int PRIMARY KEY, balance: float, owner: string }")
+    start = time.perf_counter()
+    db.table("accounts").insert_many([(i, 100.0, f"owner{i}") for i in range(args.rows)])
+    print(f"load {args.rows:,} rows: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    db.close()
+    print(f"checkpoint: {time.perf_counter() - start:.2f}s, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    start = time.perf_counter()
+    db = Database(path)
+    print(f"open from checkpoint: {time.perf_counter() - start:.3f}s")
+    db.settings["wal_group_size"] = args.group_size
+    for policy in ("commit", "group", "off"):
+        db.settings["wal_sync"] = policy
+        syncs = db.wal.syncs
+        start = time.perf_counter()
+        for i in range(args.commits):
+            db.execute("UPDATE accounts SET balance = balance + 1 WHERE id = x", {"x": i % args.rows})
+        db.wal.flush(fsync=policy != "off")
+        elapsed = time.perf_counter() - start
+        print(f"wal_sync={policy:<6} {args.commits / elapsed:>10,.0f} commits/s, {db.wal.syncs - syncs:,} fsyncs")
+
+    # Leave the log unreplayed, as a crash would
+    log = db.wal.size
+    start = time.perf_counter()
+    recovered = Database(path)
+    elapsed = time.perf_counter() - start
+    total = recovered.execute("SELECT SUM(balance) AS total FROM accounts")[0].total
+    print(f"recover {log / 1e6:.1f} MB of log: {elapsed:.3f}s, total balance {total:,.0f} "
+          f"(expected {100.0 * args.rows + 3 * args.commits:,.0f})")
+    recovered.close()
+
+def main():
+    args = setup_argparse().parse_args()
+    if args.dir:
+        run(args, args.dir)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            run(args, directory)
+
+if __name__ == "__main__":
+    main()
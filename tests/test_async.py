@@ -0,0 +1,30 @@
+import asyncio
+from pcsj_interpreter import PCSJInterpreter
+
+def test_for_await_translation():
+    interpreter = PCSJInterpreter()
+    code = interpreter._convert_async_iteration(
+        'async function* numbers(n) {\n'
+        'for await (const line of fs.lines("data.txt")) {\n')
+    assert 'async def numbers(n) {' in code
+    assert 'async for line in fs.lines("data.txt"):' in code
+
+def test_fs_lines_streams_file(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("a\nb\nc\n")
+    fs = PCSJInterpreter().env['fs']
+
+    async def collect():
+        return [line async for line in fs.lines(str(path))]
+
+    assert asyncio.run(collect()) == ["a", "b", "c"]
+
+def test_fs_chunks():
+    interpreter = PCSJInterpreter()
+    interpreter.builtins._mock_files["mem.txt"] = "abcdefg"
+    fs = interpreter.env['fs']
+
+    async def collect():
+        return [chunk async for chunk in fs.chunks("mem.txt", 3)]
+
+    assert asyncio.run(collect()) == ["abc", "def", "g"]
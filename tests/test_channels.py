@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from pcsj_channels import Channel, ChannelClosed, select, merge, fanOut
+
+def test_send_blocks_when_full():
+    async def scenario():
+        channel = Channel(2)
+        produced = []
+
+        async def producer():
+            for i in range(5):
+                await channel.send(i)
+                produced.append(i)
+            channel.close()
+
+        task = asyncio.ensure_future(producer())
+        await asyncio.sleep(0.01)
+        assert produced == [0, 1]  # Backpressure: buffer full, producer waits
+        received = [item async for item in channel]
+        await task
+        return received
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+def test_closed_channel():
+    async def scenario():
+        channel = Channel(1)
+        await channel.send("last")
+        channel.close()
+        assert await channel.receive() == "last"
+        with pytest.raises(ChannelClosed):
+            await channel.receive()
+        with pytest.raises(ChannelClosed):
+            await channel.send("late")
+
+    asyncio.run(scenario())
+
+def test_select_and_merge():
+    async def scenario():
+        a, b = Channel(1), Channel(1)
+
+        async def later():
+            await asyncio.sleep(0.01)
+            await b.send("from b")
+
+        task = asyncio.ensure_future(later())
+        channel, value = await select(a, b)
+        await task
+        assert channel is b and value == "from b"
+
+        inputs = [Channel(4) for _ in range(3)]
+        for i, source in enumerate(inputs):
+            await source.send(i)
+            source.close()
+        return sorted([item async for item in merge(*inputs)])
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+
+def test_select_passes_on_a_wakeup_it_did_not_use():
+    async def scenario():
+        a, b = Channel(2), Channel(2)
+        first = asyncio.ensure_future(select(a, b))
+        direct = asyncio.ensure_future(a.receive())
+        second = asyncio.ensure_future(select(b))
+        await asyncio.sleep(0)
+        # `a` wakes the first selector, which may then take from `b` instead;
+        # the receiver waiting on `a` must still get its item
+        a.trySend("a1")
+        b.trySend("b1")
+        b.trySend("b2")
+        (_, one), item, (_, two) = await asyncio.wait_for(asyncio.gather(first, direct, second), 1)
+        return item, sorted([one, two])
+
+    assert asyncio.run(scenario()) == ("a1", ["b1", "b2"])
+
+def test_fan_out_shares_work():
+    async def scenario():
+        source = Channel(4)
+        outputs = fanOut(source, 3)
+
+        async def producer():
+            for i in range(30):
+                await source.send(i)
+            source.close()
+
+        async def consume(channel):
+            return [item async for item in channel]
+
+        results = await asyncio.gather(producer(), *(consume(c) for c in outputs))
+        return sorted(item for part in results[1:] for item in part)
+
+    assert asyncio.run(scenario()) == list(range(30))
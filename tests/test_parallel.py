@@ -0,0 +1,58 @@
+import array
+import asyncio
+import pcsj_parallel
+from pcsj_interpreter import PCSJInterpreter
+from pcsj_parallel import spawn, parallel_map
+
+def _pcsj_env(source):
+    # Functions defined the way the interpreter defines them: exec() into an env
+    env = PCSJInterpreter().env
+    exec(source, env)
+    return env
+
+def test_parallel_map_runs_exec_defined_functions():
+    env = _pcsj_env(
+        "def fib(n):\n"
+        "    return n if n < 2 else fib(n - 1) + fib(n - 2)\n")
+    assert parallel_map(env['fib'], range(10), workers=2) == [0, 1, 1, 2, 3, 5, 8, 13, 21, 34]
+
+def test_spawn_is_awaitable():
+    env = _pcsj_env(
+        "SCALE = 3\n"
+        "def scaled(a, b):\n"
+        "    return (a + b) * SCALE\n")
+
+    async def run():
+        return await spawn(env['scaled'], 2, 5)
+
+    assert asyncio.run(run()) == 21
+
+def test_spawn_shares_large_typed_arrays(monkeypatch):
+    monkeypatch.setattr(pcsj_parallel, 'SHARED_MEMORY_THRESHOLD', 64)
+    env = _pcsj_env(
+        "def total(values):\n"
+        "    return sum(values)\n")
+    values = array.array('d', range(1000))
+    assert spawn(env['total'], values).result() == sum(range(1000))
+
+def test_parallel_map_shares_large_items(monkeypatch):
+    monkeypatch.setattr(pcsj_parallel, 'SHARED_MEMORY_THRESHOLD', 64)
+    env = _pcsj_env(
+        "def measure(value):\n"
+        "    return (type(value).__name__, len(value), sum(value))\n")
+    items = [array.array('q', range(100)), bytes(range(100)), b"small"]
+    assert parallel_map(env['measure'], items, workers=2) == [
+        ('memoryview', 100, 4950), ('bytes', 100, 4950), ('bytes', 5, sum(b"small"))]
+
+def test_parallel_for_translation():
+    interpreter = PCSJInterpreter()
+    code = interpreter._convert_parallel_for(
+        "parallel for (item of items) :\n"
+        "    work(item)\n"
+        "print('done')")
+    assert code.split('\n') == [
+        "def _pcsj_parallel_body_0(item):",
+        "    work(item)",
+        "parallel_for(_pcsj_parallel_body_0, items)",
+        "print('done')",
+    ]
@@ -0,0 +1,542 @@
+import threading
+import time
+import pytest
+from pcsj_interpreter import PCSJInterpreter
+from pcsj_sql import Database, IntegrityError, SQLError, SQLiteDatabase
+
+def _company(database=Database):
+    db = database()
+    db.execute("""
+    table departments { id: int PRIMARY KEY, name: string, budget: float };
+    """)
+    db.execute("""
+    table employees {
+        id: int PRIMARY KEY,
+        name: string,
+        department_id: int FOREIGN KEY REFERENCES departments(id),
+        salary: float
+    };
+    """)
+    db.execute("table projects { id: int PRIMARY KEY, name: string, department_id: int, start_date: datetime, end_date: datetime }")
+    db.execute('INSERT INTO departments VALUES (1, "Engineering", 1000000), (2, "Marketing", 500000), (3, "Sales", 750000)')
+    db.execute('INSERT INTO employees VALUES (1, "John Doe", 1, 85000), (2, "Jane Smith", 1, 95000), '
+               '(3, "Bob Johnson", 2, 75000), (4, "Alice Brown", 3, 90000)')
+    db.execute('INSERT INTO projects VALUES (1, "Website Redesign", 2, "2023-01-01", "2023-06-30"), '
+               '(2, "Mobile App", 1, "2023-02-15", "2023-12-31"), (3, "Sales Portal", 3, "2023-03-01", "2023-08-31")')
+    return db
+
+def test_join_with_order_by():
+    rows = _company().execute("""
+        SELECT d.name as department, e.name as employee, e.salary
+        FROM departments d JOIN employees e ON d.id = e.department_id
+        ORDER BY d.name, e.salary DESC""")
+    assert [(r.department, r.employee, r.salary) for r in rows] == [
+        ("Engineering", "Jane Smith", 95000.0), ("Engineering", "John Doe", 85000.0),
+        ("Marketing", "Bob Johnson", 75000.0), ("Sales", "Alice Brown", 90000.0)]
+
+def test_in_subquery_with_group_by_having():
+    rows = _company().execute("""
+        SELECT d.name, d.budget FROM departments d
+        WHERE d.id IN (SELECT department_id FROM employees GROUP BY department_id HAVING AVG(salary) > 80000)""")
+    assert sorted(r.name for r in rows) == ["Engineering", "Sales"]
+
+def test_cte_and_scalar_functions():
+    rows = _company().execute("""
+        WITH project_duration AS (SELECT name, DATEDIFF(end_date, start_date) as duration_days FROM projects)
+        SELECT name, duration_days FROM project_duration WHERE duration_days > 180 ORDER BY 2""")
+    assert [(r.name, r.duration_days) for r in rows] == [("Sales Portal", 183), ("Mobile App", 319)]
+
+def test_correlated_subqueries_and_left_join():
+    db = _company()
+    rows = db.execute("""
+        SELECT d.name, (SELECT COUNT(*) FROM employees e WHERE e.department_id = d.id) AS staff
+        FROM departments d WHERE NOT EXISTS (SELECT 1 FROM projects p WHERE p.department_id = d.id AND p.name LIKE '%App%')
+        ORDER BY staff DESC, d.name""")
+    assert [(r.name, r.staff) for r in rows] == [("Marketing", 1), ("Sales", 1)]
+    rows = db.execute("""
+        SELECT d.name, p.name AS project FROM departments d
+        LEFT JOIN projects p ON p.department_id = d.id AND p.id > 1 ORDER BY d.id""")
+    assert [(r.name, r.project) for r in rows] == [("Engineering", "Mobile App"), ("Marketing", None), ("Sales", "Sales Portal")]
+
+def test_aggregates_distinct_limit_and_host_variables():
+    db = _company()
+    rows = db.execute("SELECT department_id, COUNT(*) AS n, MAX(salary) FROM employees GROUP BY 1 ORDER BY n DESC, department_id LIMIT 2")
+    assert [r.as_tuple() for r in rows] == [(1, 2, 95000.0), (2, 1, 75000.0)]
+    assert [r.department_id for r in db.execute("SELECT DISTINCT department_id FROM employees ORDER BY 1 DESC")] == [3, 2, 1]
+    minimum = {"minimum": 88000}
+    assert [r.name for r in db.execute("SELECT name FROM employees WHERE salary > minimum ORDER BY name", minimum)] == [
+        "Alice Brown", "Jane Smith"]
+    empty = db.execute("SELECT COUNT(*), SUM(budget) FROM departments WHERE budget > 1000000000")
+    assert empty[0].as_tuple() == (0, None)
+    with pytest.raises(SQLError):
+        db.execute("SELECT name, COUNT(*) FROM employees GROUP BY department_id")
+
+def test_explain_shows_pushdown_pruning_and_index_choice():
+    db = _company()
+    db.table("departments").insert_many([(i, f"dept{i}", 1000.0) for i in range(4, 200)])
+    plan = db.execute("EXPLAIN SELECT e.name FROM departments d JOIN employees e ON d.id = e.department_id WHERE d.id = 2")
+    assert "Index Scan using departments_pkey" in plan
+    assert "Nested Loop on (d.id = e.department_id)" in plan
+    scan = db.plan("SELECT name FROM employees WHERE salary > 80000")
+    while scan.children:
+        scan = scan.children[0]
+    assert scan.columns == ["name", "salary"] and scan.predicate is not None
+
+def test_analyze_statistics_drive_index_selection():
+    db = Database()
+    db.execute("table events { id: int PRIMARY KEY, kind: int, score: float }")
+    db.table("events").insert_many([(i, i % 4, float(i)) for i in range(4000)])
+    db.execute("CREATE INDEX events_score ON events(score)")
+    db.execute("ANALYZE events")
+    stats = db.stats["events"]
+    assert stats.row_count == 4000 and stats.columns["kind"].distinct == 4
+    assert stats.columns["score"].range_selectivity(3900.0, None) == pytest.approx(0.025, abs=0.01)
+    assert "Index Scan using events_score" in db.execute("EXPLAIN SELECT id FROM events WHERE score >= 3990")
+    assert "Seq Scan on events" in db.execute("EXPLAIN SELECT id FROM events WHERE score >= 10")
+    top = db.execute("SELECT id FROM events ORDER BY score DESC LIMIT 2")
+    assert [r.id for r in top] == [3999, 3998]
+    assert "backward" in db.execute("EXPLAIN SELECT id FROM events ORDER BY score DESC LIMIT 2")
+
+def test_join_order_starts_from_the_selective_side():
+    db = Database()
+    db.execute("table big { id: int PRIMARY KEY, small_id: int }")
+    db.execute("table small { id: int PRIMARY KEY, tag: string }")
+    db.table("small").insert_many([(i, f"t{i}") for i in range(10)])
+    db.table("big").insert_many([(i, i % 10) for i in range(2000)])
+    plan = db.plan("SELECT big.id FROM big JOIN small ON big.small_id = small.id WHERE small.tag = 't3'")
+    join = plan.children[0]
+    assert join.label == "Nested Loop" and join.children[0].table.name == "small"
+    assert len(db.execute("SELECT big.id FROM big JOIN small ON big.small_id = small.id WHERE small.tag = 't3'")) == 200
+
+def test_explain_analyze_reports_actual_rows():
+    text = _company().execute("EXPLAIN ANALYZE SELECT name FROM employees WHERE salary > 80000")
+    assert "actual rows=3 loops=1" in text and "Execution time" in text
+
+def test_query_statements_are_translated():
+    code = PCSJInterpreter()._convert_sql_statements(
+        "WITH t AS (SELECT id FROM x)\nquery ids =\n    SELECT id FROM t;\nANALYZE;")
+    assert code == ("ids = sql_database.execute('WITH t AS (SELECT id FROM x) SELECT id FROM t', locals())\n"
+                    "sql_database.execute('ANALYZE', locals())")
+
+@pytest.mark.parametrize("database", [Database, SQLiteDatabase])
+def test_result_rows_take_any_column_name_but_their_own_methods(database):
+    db = database()
+    db.execute("table t { id: int PRIMARY KEY, validator: string, from_dicts: int, class: int }")
+    db.execute("INSERT INTO t VALUES (1, 'v', 2, 3)")
+    row = db.execute("SELECT *, id AS from_columns FROM t")[0]
+    assert row.as_dict() == {"id": 1, "validator": "v", "from_dicts": 2, "class": 3, "from_columns": 1}
+    for sql in ("table u { as_dict: int }", "table u { __hidden: int }", "SELECT id AS as_tuple FROM t"):
+        with pytest.raises(SQLError, match="result rows use it"):
+            db.execute(sql)
+
+@pytest.mark.parametrize("database", [Database, SQLiteDatabase])
+def test_null_items_leave_in_lists_unknown(database):
+    db = database()
+    db.execute("table n { id: int PRIMARY KEY, x: float, y: float }")
+    db.execute("INSERT INTO n VALUES (1, 1.0, NULL), (2, 2.0, NULL), (3, NULL, 2.0), (4, 3.0, 3.0)")
+    def ids(sql, params=None):
+        return [row.id for row in db.execute(sql, params or {})]
+    assert ids("SELECT id FROM n WHERE x NOT IN (1.0, NULL)") == []
+    assert ids("SELECT id FROM n WHERE NOT (x IN (1.0, NULL)) ORDER BY id") == []
+    assert ids("SELECT id FROM n WHERE x IN (1.0, NULL) ORDER BY id") == [1]
+    assert ids("SELECT id FROM n WHERE x NOT IN (1.0, :p) ORDER BY id", {"p": None}) == []
+    assert ids("SELECT id FROM n WHERE x NOT IN (1.0, y) ORDER BY id") == []
+    assert ids("SELECT id FROM n WHERE x NOT IN (1.0, 5.0) ORDER BY id") == [2, 4]
+    values = [row.as_tuple() for row in db.execute(
+        "SELECT id, x IN (2.0, NULL) AS hit, x NOT IN (1.0, y) AS miss FROM n ORDER BY id")]
+    assert values == [(1, None, False), (2, True, None), (3, None, None), (4, None, False)]
+
+def _join_tables():
+    db = Database()
+    db.execute("table a { id: int PRIMARY KEY, k: int, v: int }")
+    db.execute("table b { id: int PRIMARY KEY, k: int, w: int }")
+    db.table("a").insert_many([(i, [None, 1, 2, 3, 4][i % 5], i % 7) for i in range(50)])
+    db.table("b").insert_many([(i, [None, 1, 2, 6][i % 4], i % 5) for i in range(30)])
+    db.execute("CREATE INDEX b_k ON b(k)")
+    return db
+
+JOIN_METHODS = ['enable_nestloop', 'enable_hashjoin', 'enable_mergejoin', 'enable_indexnestloop']
+
+@pytest.mark.parametrize("sql", [
+    "SELECT a.id, b.id FROM a JOIN b ON a.k = b.k AND a.v > b.w",
+    "SELECT a.id, b.id FROM a LEFT JOIN b ON a.k = b.k AND b.w > 1",
+    "SELECT a.id FROM a SEMI JOIN b ON a.k = b.k AND a.v < b.w",
+])
+def test_join_methods_agree(sql):
+    db = _join_tables()
+    results = []
+    labels = set()
+    for method in JOIN_METHODS:
+        for setting in JOIN_METHODS:
+            db.settings[setting] = setting == method
+        labels.add(db.plan(sql).children[0].label)
+        results.append(sorted(r.as_tuple() for r in db.execute(sql)))
+    assert len(labels) == 4
+    assert all(result == results[0] for result in results)
+    # NULL keys never match; LEFT keeps those rows padded, the others drop them
+    ids = {row[0] for row in results[0]}
+    assert (0 in ids) == ("LEFT" in sql)
+
+def test_join_method_choice_and_semi_join_scope():
+    db = Database()
+    db.execute("table facts { id: int PRIMARY KEY, dim: int }")
+    db.execute("table dims { id: int, name: string }")
+    db.table("facts").insert_many([(i, i % 500) for i in range(3000)])
+    db.table("dims").insert_many([(i, f"d{i}") for i in range(500)])
+    assert "Hash Join" in db.execute("EXPLAIN SELECT dims.name FROM facts JOIN dims ON facts.dim = dims.id")
+    plan = db.execute("EXPLAIN SELECT dims.name FROM dims JOIN facts ON facts.id = dims.id WHERE dims.name = 'd3'")
+    assert "Index Nested Loop" in plan and "facts_pkey" in plan
+    rows = db.execute("SELECT * FROM dims SEMI JOIN facts ON facts.dim = dims.id AND facts.id > 2990 ORDER BY id")
+    assert [r.as_tuple() for r in rows] == [(i, f"d{i}") for i in range(491, 500)]
+    with pytest.raises(SQLError):
+        db.execute("SELECT facts.id FROM dims SEMI JOIN facts ON facts.dim = dims.id")
+
+def test_batch_execution_matches_across_batch_sizes(monkeypatch):
+    import pcsj_sql.vector as vector
+    db = Database()
+    db.execute("table m { id: int PRIMARY KEY, g: int, x: float, s: string }")
+    db.table("m").insert_many([(i, [None, 1, 2][i % 3], [None, 0.5, 2.0, 7.25][i % 4], ["a", None, "ab"][i % 3])
+                               for i in range(200)])
+    db.execute("DELETE FROM m WHERE id % 9 = 0")
+    queries = [
+        "SELECT g, COUNT(*), COUNT(x), SUM(x), AVG(x), MIN(s), MAX(x) FROM m WHERE x * 2 > 1 OR s LIKE 'a%' GROUP BY g ORDER BY g",
+        "SELECT id, x + id, -x FROM m WHERE x IS NOT NULL AND id NOT BETWEEN 20 AND 150 ORDER BY id",
+        "SELECT id FROM m WHERE g IN (1, 2) AND id > (SELECT AVG(id) FROM m) ORDER BY id DESC LIMIT 5 OFFSET 2",
+    ]
+    expected = None
+    for numpy_enabled in (True, False):
+        if not numpy_enabled:
+            monkeypatch.setattr(vector, "np", None)
+        for size in (1, 7, 4096):
+            db.settings["batch_size"] = size
+            results = [[r.as_tuple() for r in db.execute(sql)] for sql in queries]
+            expected = expected or results
+            assert results == expected
+    assert expected[0][0] == (None, 44, 33, 114.0, 3.4545454545454546, "a", 7.25)
+    assert [r[0] for r in expected[2]] == [196, 194, 193, 191, 190]
+    assert all(type(value) in (int, float, str, type(None)) for row in expected[1] for value in row)
+
+@pytest.mark.filterwarnings("error")
+def test_float_overflow_in_batches_does_not_warn():
+    db = Database()
+    db.execute("table f { id: int PRIMARY KEY, x: float }")
+    db.table("f").insert_many([(1, 1e308), (2, -1e308), (3, 1.0)])
+    assert [r.id for r in db.execute("SELECT id FROM f WHERE x * 10 > 0 ORDER BY id")] == [1, 3]
+    values = [r.y for r in db.execute("SELECT x * 10 + x * -10 AS y FROM f ORDER BY id")]
+    assert values[0] != values[0] and values[2] == 0.0
+
+def test_compiled_expressions_match_the_interpreter():
+    from pcsj_sql.compiler import CompiledExpressions
+    from pcsj_sql.expressions import evaluate
+    from pcsj_sql.nodes import Between, BinaryOp, ColumnRef, FuncCall, Like, Literal, Param
+    from pcsj_sql.vector import Batch
+    a, s = ColumnRef(0, "a"), ColumnRef(1, "s")
+    exprs = [
+        BinaryOp("OR", BinaryOp(">", BinaryOp("*", a, Literal(2)), Param("p")), Like(s, Literal("b%"))),
+        BinaryOp("AND", Between(a, Literal(1), Param("q")), BinaryOp("/", Literal(10), a)),
+        FuncCall("COALESCE", [BinaryOp("%", a, Param("p")), Literal(-1)]),
+    ]
+    rows = [(None, "b"), (0, None), (1, "a"), (4, "bc"), (7, None)]
+    for params in ({"p": 3, "q": 5}, {"p": None, "q": None}):
+        compiled = CompiledExpressions(None, params)
+        batch = Batch([list(column) for column in zip(*rows)], len(rows))
+        for expr in exprs:
+            expected = [evaluate(expr, lambda node, row=row: row[node.index], params) for row in rows]
+            run = compiled.row_function(expr)
+            assert [run(row) for row in rows] == expected
+            assert compiled.batch_column(expr, batch) == expected
+    # One generated comprehension per expression, with NULL checks only where needed
+    sources = [factory.source for key, factory in compiled.cache.items() if key[1] == "batch"]
+    assert all(source.count(" for ") == 1 for source in sources)
+    db = _company()
+    minimum = {"minimum": None}
+    assert db.execute("SELECT name FROM employees WHERE salary > minimum OR id = 3", minimum)[0].name == "Bob Johnson"
+
+def test_hash_aggregate_spills_past_work_mem():
+    db = Database()
+    db.execute("table f { id: int PRIMARY KEY, k: int, v: float, tag: string }")
+    db.table("f").insert_many([(i, i * 37 % 6000 if i % 13 else None, [None, 0.5, 2.0][i % 3], "abc"[i % 3])
+                               for i in range(9000)])
+    sql = ("SELECT k, COUNT(*), COUNT(v), SUM(v), AVG(v), MIN(tag), MAX(v), COUNT(DISTINCT tag) "
+           "FROM f GROUP BY k HAVING COUNT(*) > 1")
+    in_memory = sorted((r.as_tuple() for r in db.execute(sql)), key=repr)
+    db.settings["work_mem"] = 20000
+    assert sorted((r.as_tuple() for r in db.execute(sql)), key=repr) == in_memory
+    assert "spilled: " in db.execute("EXPLAIN ANALYZE " + sql)
+    assert len(in_memory) == 2539 and (None, 693, 462, 577.5, 1.25, "a", 2.0, 3) in in_memory
+
+def test_sort_keeps_the_top_rows_and_merges_spilled_runs():
+    db = Database()
+    db.execute("table s { id: int PRIMARY KEY, k: int, name: string }")
+    db.table("s").insert_many([(i, i * 7 % 50 if i % 11 else None, ["b", "a", "ab", None][i % 4]) for i in range(5000)])
+    rows = [r.as_tuple() for r in db.execute("SELECT id, k, name FROM s")]
+    expected = sorted(rows, key=lambda r: r[0])
+    expected.sort(key=lambda r: (r[1] is not None, r[1]))
+    expected.sort(key=lambda r: (r[2] is not None, r[2]), reverse=True)
+    sql = "SELECT id, k, name FROM s ORDER BY name DESC, k, id"
+    assert [r.as_tuple() for r in db.execute(sql)] == expected
+    top = db.execute(sql + " LIMIT 5 OFFSET 2")
+    assert [r.as_tuple() for r in top] == expected[2:7]
+    assert "top 5 + 2" in db.execute("EXPLAIN " + sql + " LIMIT 5 OFFSET 2")
+    db.settings["work_mem"] = 20000
+    assert [r.as_tuple() for r in db.execute(sql)] == expected
+    assert "spilled: " in db.execute("EXPLAIN ANALYZE " + sql)
+
+def test_window_functions_share_sorts():
+    db = Database()
+    db.execute("table sc { id: int PRIMARY KEY, g: string, v: int }")
+    db.table("sc").insert_many([(1, "a", 10), (2, "a", 30), (3, "b", 20), (4, "a", 30), (5, "b", None), (6, "a", 5)])
+    rows = db.execute("""
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY g ORDER BY v DESC, id) AS rn,
+               RANK() OVER (PARTITION BY g ORDER BY v DESC) AS rk,
+               SUM(v) OVER (PARTITION BY g ORDER BY v DESC) AS running,
+               SUM(v) OVER (PARTITION BY g ORDER BY v DESC, id ROWS BETWEEN 1 PRECEDING AND CURRENT ROW) AS pair,
+               LAG(id) OVER (PARTITION BY g ORDER BY v DESC, id) AS prev, COUNT(*) OVER () AS total
+        FROM sc ORDER BY g, rn""")
+    assert [r.as_tuple() for r in rows] == [
+        (2, 1, 1, 60, 30, None, 6), (4, 2, 1, 60, 60, 2, 6), (1, 3, 3, 70, 40, 4, 6), (6, 4, 4, 75, 15, 1, 6),
+        (3, 1, 1, 20, 20, None, 6), (5, 2, 2, 20, 20, 3, 6)]
+    plan = db.execute("EXPLAIN SELECT id, ROW_NUMBER() OVER (ORDER BY v, id), RANK() OVER (ORDER BY v), "
+                      "LEAD(v, 1, 0) OVER (ORDER BY v) FROM sc ORDER BY v")
+    assert plan.count("WindowAgg") == 2 and "(presorted)" in plan and "Sort" not in plan.replace("WindowAgg", "")
+    with pytest.raises(SQLError):
+        db.execute("SELECT RANK(v) OVER (ORDER BY v) FROM sc")
+
+def test_subqueries_are_decorrelated_and_shared_ctes_materialized():
+    db = _company()
+    db.execute('INSERT INTO employees VALUES (5, "Eve Adams", NULL, 70000), (6, "Carl Stone", 1, 60000)')
+    plan = db.execute("EXPLAIN SELECT name FROM departments d WHERE NOT EXISTS "
+                      "(SELECT 1 FROM employees WHERE department_id = d.id AND salary > 80000)")
+    assert "Anti Join" in plan and "SubPlan" not in plan
+    assert [r.name for r in db.execute("SELECT name FROM departments d WHERE NOT EXISTS "
+                                       "(SELECT 1 FROM employees WHERE department_id = d.id AND salary > 80000)")] == ["Marketing"]
+    sql = ("SELECT e.name, (SELECT COUNT(*) FROM projects p WHERE p.department_id = e.department_id) AS projects "
+           "FROM employees e WHERE salary >= (SELECT AVG(salary) FROM employees e2 WHERE e2.department_id = e.department_id) "
+           "ORDER BY e.name")
+    assert "SubPlan" not in db.execute("EXPLAIN " + sql)
+    assert [r.as_tuple() for r in db.execute(sql)] == [
+        ("Alice Brown", 1), ("Bob Johnson", 1), ("Jane Smith", 1), ("John Doe", 1)]
+    rows = db.execute("SELECT name FROM departments WHERE id IN "
+                      "(SELECT department_id FROM employees GROUP BY department_id HAVING COUNT(*) > 1)")
+    assert [r.name for r in rows] == ["Engineering"]
+    # NOT IN keeps its NULL semantics: the NULL department_id makes it unknown
+    assert db.execute("SELECT name FROM departments WHERE id NOT IN (SELECT department_id FROM employees)") == []
+    cte = ("WITH paid AS (SELECT department_id, SUM(salary) AS total FROM employees GROUP BY department_id) "
+           "SELECT a.department_id FROM paid a JOIN paid b ON a.total < b.total GROUP BY a.department_id")
+    plan = db.execute("EXPLAIN " + cte)
+    assert plan.count("CTE Scan on paid") == 2 and plan.count("Hash Aggregate group by: department_id") == 1
+    assert {r.department_id for r in db.execute(cte)} == {None, 2, 3}
+
+def test_statement_cache_reuses_plans_until_the_catalog_changes():
+    db = _company()
+    cache = db.statement_cache
+    sql = "SELECT name FROM employees WHERE salary > floor ORDER BY name"
+    assert [r.name for r in db.execute(sql, {"floor": 90000})] == ["Jane Smith"]
+    prepared = db.prepare(sql)
+    plan = prepared.plan
+    hits = cache.hits
+    # Layout and comments do not matter, and the plan is bound to new values
+    rows = db.execute("SELECT name  FROM employees -- by salary\n WHERE salary > floor ORDER BY name", {"floor": 80000})
+    assert [r.name for r in rows] == ["Alice Brown", "Jane Smith", "John Doe"]
+    assert cache.hits == hits + 1 and prepared.plan is plan
+    assert prepared.execute({"floor": 94000})[0].name == "Jane Smith"
+    db.execute("CREATE INDEX emp_salary ON employees (salary)")
+    assert [r.name for r in db.execute(sql, {"floor": 90000})] == ["Jane Smith"]
+    assert prepared.plan is not plan and cache.invalidations == 1
+    update = db.prepare("UPDATE employees SET salary = salary + raise WHERE id = who")
+    assert update.execute({"raise": 1000, "who": 3}) == 1 and update.plan is not None
+    assert db.execute("SELECT salary FROM employees WHERE id = 3")[0].salary == 76000
+    db.settings["statement_cache_size"] = 0
+    db.statement_cache.clear()
+    db.execute(sql, {"floor": 0})
+    assert len(cache.entries) == 0
+
+def test_sqlite_backend_matches_the_native_engine(tmp_path):
+    native, sqlite = _company(), _company(SQLiteDatabase)
+    for sql in [
+        "SELECT d.name AS department, COUNT(*), AVG(e.salary) FROM departments d JOIN employees e ON d.id = e.department_id "
+        "GROUP BY d.name HAVING COUNT(*) > 0 ORDER BY 1",
+        "SELECT name, salary / 7, RANK() OVER (PARTITION BY department_id ORDER BY salary DESC) AS r FROM employees ORDER BY id",
+        "SELECT d.*, (SELECT MAX(salary) FROM employees e WHERE e.department_id = d.id) FROM departments d ORDER BY d.id",
+        "WITH spans AS (SELECT name, DATEDIFF(end_date, start_date) AS days FROM projects) SELECT * FROM spans WHERE days > low",
+        "SELECT e.name FROM employees e SEMI JOIN projects p ON p.department_id = e.department_id WHERE e.name LIKE 'J%'",
+    ]:
+        assert [r.as_dict() for r in sqlite.execute(sql, {"low": 180})] == [r.as_dict() for r in native.execute(sql, {"low": 180})]
+    raise_by, who = 500, 3
+    assert sqlite.execute("UPDATE employees SET salary = salary + raise_by WHERE id = who", locals()) == 1
+    assert sqlite.execute("SELECT salary FROM employees WHERE id = ?", [3])[0].salary == 75500.0
+    with pytest.raises(IntegrityError):
+        sqlite.execute('INSERT INTO employees VALUES (5, "Eve", 9, 1000)')
+    with pytest.raises(SQLError, match="expects int"):
+        sqlite.execute('INSERT INTO departments VALUES ("x", "Legal", 1)')
+    with pytest.raises(SQLError, match="Unknown column or variable 'bonus'"):
+        sqlite.execute("SELECT bonus FROM employees")
+
+    path = str(tmp_path / "company.db")
+    db = SQLiteDatabase(path)
+    db.execute("table flags { id: int PRIMARY KEY, on_call: bool }")
+    db.execute("BEGIN TRANSACTION")
+    db.execute("INSERT INTO flags VALUES (1, true), (2, false)")
+    db.execute("COMMIT")
+    db.close()
+    db = SQLiteDatabase(path)
+    assert db.tables["flags"].definitions[1].type == "bool"
+    assert [r.as_tuple() for r in db.execute("SELECT * FROM flags ORDER BY id")] == [(1, True), (2, False)]
+    db.close()
+
+@pytest.mark.parametrize("database", [Database, SQLiteDatabase])
+def test_column_types_see_values_as_given(database):
+    db = database()
+    db.execute("table v { id: int PRIMARY KEY, s: string, x: float, on: bool }")
+    db.execute("INSERT INTO v VALUES (7, 'a', 2, 1.0)")
+    db.execute("UPDATE v SET x = x + 1, id = 8.0 WHERE id = 7")
+    assert [r.as_tuple() for r in db.execute("SELECT * FROM v")] == [(8, "a", 3.0, True)]
+    for position, (column, value) in enumerate([("id", "5"), ("s", 7), ("x", "2.5"), ("on", "1")]):
+        row = dict(zip("abcd", [1, "b", 1.5, True]), **{"abcd"[position]: value})
+        with pytest.raises(SQLError, match=f"{column}' expects"):
+            db.execute("INSERT INTO v VALUES (a, b, c, d)", row)
+        with pytest.raises(SQLError, match=f"{column}' expects"):
+            db.execute(f"UPDATE v SET {column} = value", {"value": value})
+    assert [r.id for r in db.execute("SELECT id FROM v WHERE id = key", {"key": "8"})] == []
+    assert [r.id for r in db.execute("SELECT id FROM v WHERE s = key", {"key": "a"})] == [8]
+
+def test_query_results_are_lazy_cursors(monkeypatch):
+    from pcsj_sql import cursor as cursor_module
+    monkeypatch.setattr(cursor_module, "CURSOR_KEEP_ROWS", 100)
+    monkeypatch.setattr(cursor_module, "_CHUNK_ROWS", 50)
+    for database in (Database, SQLiteDatabase):
+        db = database()
+        db.execute("table numbers { id: int PRIMARY KEY, n: int }")
+        db.execute("INSERT INTO numbers VALUES " + ", ".join(f"({i}, {i})" for i in range(1000)))
+        result = db.execute("SELECT id, n FROM numbers ORDER BY id")
+        assert result[0].id == 0 and not result.complete
+        # Iterating keeps memory flat, and the dropped rows are produced again
+        kept, seen = 0, []
+        for row in result:
+            seen.append(row.n)
+            kept = max(kept, len(result._rows))
+        assert seen == list(range(1000)) and kept <= 150
+        assert [row.n for row in result] == seen and len(result) == 1000
+        # A result still being read takes its rows before the table changes
+        pending = db.execute("SELECT n FROM numbers WHERE id < 200 ORDER BY id")
+        rows = iter(pending)
+        assert next(rows).n == 0 and not pending.complete
+        db.execute("UPDATE numbers SET n = n + 10")
+        assert [row.n for row in rows] == list(range(1, 200))
+        assert [row.n for row in pending] == list(range(200))
+        assert db.execute("SELECT n FROM numbers WHERE id = 1")[0].n == 11
+
+def test_parallel_scans_and_aggregates_match_a_serial_run():
+    db = Database()
+    db.execute("table readings { id: int PRIMARY KEY, sensor: int, value: int, label: string }")
+    db.execute("INSERT INTO readings VALUES " + ", ".join(
+        f"({i}, {i % 7}, {'NULL' if i % 11 == 0 else i % 50}, 'l{i % 3}')" for i in range(3000)))
+    db.execute("DELETE FROM readings WHERE id % 13 = 0")
+    db.settings["parallel_min_rows"] = 100
+    queries = [
+        "SELECT sensor, COUNT(*), COUNT(value), SUM(value), MIN(value), MAX(value), AVG(value), "
+        "COUNT(DISTINCT value) FROM readings GROUP BY sensor HAVING COUNT(*) > 1",
+        "SELECT id, value * 2 AS doubled FROM readings WHERE label = 'l1' AND value > limit",
+        "SELECT COUNT(*), SUM(value) FROM readings WHERE sensor = 99",
+    ]
+    for sql in queries:
+        serial = [r.as_tuple() for r in db.execute(sql, {"limit": 20})]
+        parallel = [r.as_tuple() for r in db.execute(sql, {"limit": 20}, parallel_workers=2)]
+        assert parallel == serial
+    # The table is copied to shared memory once, and again after it changes
+    from pcsj_sql.parallel import _shared
+    table = db.table("readings")
+    shared = _shared[table]
+    db.execute(queries[1], {"limit": 20}, parallel_workers=2)
+    assert _shared[table] is shared
+    db.execute("UPDATE readings SET value = 49 WHERE id < 100")
+    serial = [r.as_tuple() for r in db.execute(queries[0])]
+    assert [r.as_tuple() for r in db.execute(queries[0], parallel_workers=2)] == serial
+    assert _shared[table] is not shared and not shared.shared
+    plan = db.execute("EXPLAIN " + queries[0], parallel_workers=2)
+    assert "Gather workers: 2" in plan
+    # Tables under parallel_min_rows are scanned serially
+    db.settings["parallel_min_rows"] = 10_000
+    plan = db.execute("EXPLAIN " + queries[0], parallel_workers=2)
+    assert "Gather" not in plan
+
+def test_gather_runs_at_most_its_workers_at_once(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from pcsj_sql import parallel
+    db = Database()
+    db.execute("table readings { id: int PRIMARY KEY, value: int }")
+    db.table("readings").insert_many([(i, i % 50) for i in range(5000)])
+    db.settings["parallel_min_rows"] = 100
+    lock, running = threading.Lock(), [0, 0]
+
+    def counted(*args):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.005)
+        try:
+            return parallel._run_morsel(*args)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    class WidePool(ThreadPoolExecutor):
+        # More threads than the query's workers
+        def submit(self, fn, *args):
+            return super().submit(counted, *args)
+
+    with WidePool(8) as pool:
+        monkeypatch.setattr(parallel, "get_pool", lambda: pool)
+        rows = db.execute("SELECT value, COUNT(*) FROM readings WHERE value > 3 GROUP BY value", parallel_workers=2)
+        assert len(rows) == 46
+    assert running == [0, 2]
+
+def test_materialized_views_follow_their_tables(tmp_path):
+    path = str(tmp_path / "views.db")
+    db = Database(path)
+    db.execute("table staff { id: int PRIMARY KEY, team: int, pay: float }")
+    db.execute("table teams { id: int PRIMARY KEY, name: string }")
+    db.execute("INSERT INTO teams VALUES (1, 'red'), (2, 'blue')")
+    db.execute("INSERT INTO staff VALUES (1, 1, 10.0), (2, 1, 30.0), (3, 2, 5.0), (4, NULL, 1.0)")
+    views = {
+        "totals": "SELECT team, COUNT(*) AS n, SUM(pay) AS total, MAX(pay) AS top FROM staff GROUP BY team",
+        "named": "SELECT t.name, s.pay FROM staff s JOIN teams t ON t.id = s.team WHERE s.pay > 2",
+        "recent": "SELECT id FROM staff ORDER BY id DESC LIMIT 2",
+    }
+    for name, sql in views.items():
+        db.execute(f"CREATE MATERIALIZED VIEW {name} AS {sql}")
+
+    def check(db, stale=()):
+        for name, sql in views.items():
+            if name not in stale:
+                expected = sorted(map(repr, (r.as_tuple() for r in db.execute(sql))))
+                assert sorted(map(repr, (r.as_tuple() for r in db.execute(f"SELECT * FROM {name}")))) == expected
+    db.execute("INSERT INTO staff VALUES (5, 2, 50.0), (6, NULL, 2.0)")
+    db.execute("UPDATE staff SET team = 2 WHERE id = 2")
+    db.execute("DELETE FROM staff WHERE id = 5")
+    db.execute("UPDATE teams SET name = 'green' WHERE id = 1")
+    db.execute("BEGIN TRANSACTION")
+    db.execute("DELETE FROM staff WHERE team = 2")
+    db.execute("ROLLBACK")
+    # A batch insert inside a transaction reaches the views once per row
+    db.execute("BEGIN TRANSACTION")
+    db.execute("INSERT INTO staff VALUES (8, 1, 4.0), (9, 2, 6.0)")
+    db.execute("COMMIT")
+    assert db.execute("SELECT n, total FROM totals WHERE team = 1")[0].as_tuple() == (2, 14.0)
+    # Only views without ORDER BY, LIMIT or window functions follow each change
+    check(db, stale=["recent"])
+    assert [r.id for r in db.execute("SELECT id FROM recent")] == [4, 3]
+    db.execute("REFRESH MATERIALIZED VIEW recent")
+    check(db)
+    with pytest.raises(SQLError, match="Cannot change materialized view"):
+        db.execute("DELETE FROM totals")
+    db.close()
+    # Views are rebuilt from a checkpoint, and follow the changes replayed from the log
+    db = Database(path)
+    check(db)
+    db.execute("INSERT INTO staff VALUES (7, 1, 70.0)")
+    db = Database(path)
+    check(db, stale=["recent"])
+    db.execute("DROP MATERIALIZED VIEW named")
+    with pytest.raises(SQLError, match="Unknown table"):
+        db.execute("SELECT * FROM named")
@@ -0,0 +1,73 @@
+import sys
+import pytest
+from pcsj_interpreter import PCSJInterpreter
+
+FIELDS = {"id": str, "name": str, "price": float, "stock": int, "available": bool}
+
+def _product_schema():
+    interpreter = PCSJInterpreter()
+    return interpreter.env['schema_creator']("ProductSchema", FIELDS)
+
+def test_schema_instances_have_no_dict():
+    ProductSchema = _product_schema()
+    product = ProductSchema("p1", "Lamp", 19.5, 3, True)
+    assert not hasattr(product, '__dict__')
+    assert product.price == 19.5
+    assert repr(product) == "ProductSchema(id='p1', name='Lamp', price=19.5, stock=3, available=True)"
+
+def test_schema_constructor_checks_arity():
+    ProductSchema = _product_schema()
+    with pytest.raises(TypeError) as exc_info:
+        ProductSchema("p1")
+    assert "expected 5 arguments, got 1" in str(exc_info.value)
+
+@pytest.mark.parametrize("field", ["validator", "from_dicts", "_pcsj_fields", "__init__"])
+def test_schema_rejects_reserved_field_names(field):
+    with pytest.raises(TypeError, match="reserved for the schema class"):
+        PCSJInterpreter().env['schema_creator']("Bad", {"id": int, field: str})
+
+def test_from_dict_and_from_dicts():
+    ProductSchema = _product_schema()
+    product = ProductSchema.from_dict({"id": "p1", "price": 2.0})
+    assert product.price == 2.0 and product.name is None
+    rows = [{"id": f"p{i}", "stock": i} for i in range(3)]
+    assert [p.stock for p in ProductSchema.from_dicts(rows)] == [0, 1, 2]
+    rows = [("p1", "Lamp", 19.5, 3, True), ["p2", None, 2.0, 0, False]]
+    for validate in (False, True):
+        assert [(p.id, p.stock) for p in ProductSchema.from_dicts(rows, validate=validate)] == [("p1", 3), ("p2", 0)]
+    with pytest.raises(TypeError, match="expected 5 values, got 1"):
+        ProductSchema.from_dicts([("p1",)])
+
+def test_from_columns():
+    ProductSchema = _product_schema()
+    products = ProductSchema.from_columns({"id": ["a", "b"], "price": [1.0, 2.0]})
+    assert [(p.id, p.price, p.stock) for p in products] == [("a", 1.0, None), ("b", 2.0, None)]
+    with pytest.raises(ValueError):
+        ProductSchema.from_columns({"id": ["a"], "price": []})
+
+def test_schema_rows_are_smaller_than_dicts():
+    ProductSchema = _product_schema()
+    row = {"id": "p1", "name": "Lamp", "price": 19.5, "stock": 3, "available": True}
+    product = ProductSchema.from_dict(row)
+    assert sys.getsizeof(product) * 2 < sys.getsizeof(row)
+
+def test_validator_reports_every_bad_row():
+    from pcsj_schema import SchemaValidationError
+    ProductSchema = _product_schema()
+    rows = [
+        {"id": "p1", "price": 1.0, "stock": 1},
+        {"id": "p2", "price": "free", "stock": 2},
+        {"id": 3, "price": 2, "stock": True},
+    ]
+    with pytest.raises(SchemaValidationError) as exc_info:
+        ProductSchema.from_dicts(rows, validate=True)
+    assert exc_info.value.errors == [(1, "price", "free"), (2, "id", 3), (2, "stock", True)]
+
+def test_validator_columns_and_single_rows():
+    from pcsj_schema import SchemaValidationError
+    ProductSchema = _product_schema()
+    ProductSchema.validator.validate_columns({"id": ["a", None], "price": [1, 2.5]})
+    with pytest.raises(SchemaValidationError):
+        ProductSchema.from_columns({"stock": [1, 2.0]}, validate=True)
+    ProductSchema.validator.validate(ProductSchema("p1", "Lamp", 19.5, 3, True))
+    assert ProductSchema.validator.check_values(("p1", "Lamp", 19.5, "3", True)) == [("stock", "3")]
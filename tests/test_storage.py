@@ -0,0 +1,358 @@
+import asyncio
+import sys
+import pytest
+from pcsj_interpreter import PCSJInterpreter
+from pcsj_sql import Database, IntegrityError, SerializationError, SQLError
+
+def _employees(rows=3):
+    db = Database()
+    db.execute("""
+    table employees {
+        id: int PRIMARY KEY,
+        name: string,
+        salary: float,
+        dept_id: int,
+        active: bool
+    };
+    """)
+    table = db.table("employees")
+    for i in range(rows):
+        table.insert((i, f"emp{i}", 1000.0 * i, i % 3, i % 2 == 0))
+    return db, table
+
+def test_table_declaration_and_insert():
+    db, table = _employees(0)
+    db.execute('INSERT INTO employees VALUES (1, "John", 50000, 1, true), (2, "Jane", 60000.5, 1, false)')
+    assert list(table.scan()) == [(1, "John", 50000.0, 1, True), (2, "Jane", 60000.5, 1, False)]
+    assert table.columns["salary"].data.typecode == "d"
+    assert isinstance(table.columns["name"].data, list)
+
+def test_insert_coerces_and_rejects_types():
+    db, table = _employees(0)
+    with pytest.raises(SQLError):
+        table.insert((1, "x", "lots", 1, True))
+    with pytest.raises(SQLError):
+        table.insert((None, "x", 1.0, 1, True))
+    # Rejected before any column grows, so later rows stay aligned
+    with pytest.raises(SQLError, match="out of range"):
+        table.insert((1, "x", 1.0, 2 ** 63, True))
+    with pytest.raises(SQLError):
+        table.insert((True, "x", 1.0, 1, True))
+    assert {len(column) for column in table.columns.values()} == {0}
+    rid = table.insert({"id": 7, "name": "Nul"})
+    assert table.get(rid) == (7, "Nul", None, None, None)
+    assert len(table) == 1
+
+def test_projection_reads_only_requested_columns():
+    _, table = _employees(10)
+    for name in ("id", "dept_id", "active"):
+        table.columns[name].values = None  # Any access to these would fail
+    assert table.project(["name", "salary"])["salary"][:3] == [0.0, 1000.0, 2000.0]
+    assert list(table.scan(["name"]))[-1] == ("emp9",)
+
+def test_update_and_delete():
+    _, table = _employees(4)
+    table.update(1, {"salary": 5.0})
+    table.delete(2)
+    assert list(table.scan(["id", "salary"])) == [(0, 0.0), (1, 5.0), (3, 3000.0)]
+    assert len(table) == 3
+
+def test_columns_use_less_memory_than_dicts():
+    _, table = _employees(10000)
+    rows = [dict(zip(table.column_names, row)) for row in table.scan()]
+    dict_bytes = sys.getsizeof(rows) + sum(sys.getsizeof(row) for row in rows)
+    assert table.memory_usage() * 2 < dict_bytes
+
+def test_interpreter_registers_table_declarations():
+    interpreter = PCSJInterpreter()
+    code = "table parent {\n    id: int PRIMARY KEY,\n    name: string\n};\nprint(1)"
+    declarations = list(interpreter._find_table_definitions(code))
+    assert len(declarations) == 1
+    interpreter.database.execute(declarations[0])
+    assert interpreter.database.table("parent").column_names == ["id", "name"]
+
+def _parent_child():
+    db = Database()
+    db.execute("table parent { id: int PRIMARY KEY, name: string };")
+    db.execute("""
+    table child {
+        id: int PRIMARY KEY,
+        parent_id: int FOREIGN KEY REFERENCES parent(id),
+        value: string
+    };
+    """)
+    db.execute('INSERT INTO parent VALUES (1, "parent1")')
+    return db
+
+def test_primary_key_rejects_duplicates_atomically():
+    db = Database()
+    db.execute("table test { id: int PRIMARY KEY };")
+    with pytest.raises(IntegrityError):
+        db.execute("INSERT INTO test VALUES (1), (1)")
+    assert len(db.table("test")) == 0  # The failed statement left nothing behind
+    db.execute("INSERT INTO test VALUES (1)")
+    assert db.table("test").lookup(1) is not None
+
+def test_foreign_keys_are_checked_through_indexes():
+    db = _parent_child()
+    db.execute('INSERT INTO child VALUES (1, 1, "child1")')
+    with pytest.raises(IntegrityError):
+        db.execute('INSERT INTO child VALUES (2, 99, "orphan")')
+    with pytest.raises(IntegrityError):
+        db.execute("DELETE FROM parent WHERE id = 1")
+    with pytest.raises(IntegrityError):
+        db.execute("UPDATE child SET parent_id = 5 WHERE id = 1")
+
+def test_update_by_primary_key_uses_host_variables():
+    db = Database()
+    db.execute("table accounts { id: int PRIMARY KEY, balance: float };")
+    db.execute("INSERT INTO accounts VALUES (1, 1000), (2, 500)")
+    accounts = db.table("accounts")
+    params = {"fromId": 1, "toId": 2, "amount": 200}
+    db.execute("BEGIN TRANSACTION")
+    db.execute("UPDATE accounts SET balance = balance - amount WHERE id = fromId", params)
+    db.execute("UPDATE accounts SET balance = balance + amount WHERE id = toId", params)
+    db.execute("COMMIT")
+    assert list(accounts.scan()) == [(1, 800.0), (2, 700.0)]
+
+def test_rollback_restores_rows_and_indexes():
+    db = _parent_child()
+    db.execute("BEGIN TRANSACTION")
+    db.execute('INSERT INTO parent VALUES (2, "parent2")')
+    db.execute('UPDATE parent SET id = 3, name = "renamed" WHERE id = 1')
+    db.execute("DELETE FROM parent WHERE id = 2")
+    db.execute("ROLLBACK")
+    parent = db.table("parent")
+    assert list(parent.scan()) == [(1, "parent1")]
+    assert parent.lookup(1) == 0 and parent.lookup(2) is None and parent.lookup(3) is None
+    db.execute('INSERT INTO child VALUES (1, 1, "child1")')
+
+def test_sql_statements_are_translated():
+    interpreter = PCSJInterpreter()
+    code = interpreter._convert_sql_statements(
+        "    UPDATE accounts\n    SET balance = balance - amount\n    WHERE id = fromId;\n    COMMIT;")
+    assert code == ("    sql_database.execute('UPDATE accounts SET balance = balance - amount WHERE id = fromId', locals())\n"
+                    "    sql_database.execute('COMMIT', locals())")
+
+def test_where_primary_key_probes_the_index(monkeypatch):
+    db = Database()
+    db.execute("table accounts { id: int PRIMARY KEY, balance: float };")
+    db.execute("INSERT INTO accounts VALUES (1, 1000), (2, 500)")
+    monkeypatch.setattr(db.table("accounts"), "rids", lambda: pytest.fail("full scan"))
+    assert db.execute("DELETE FROM accounts WHERE id = :id AND balance > 0", {"id": 2}) == 1
+
+def test_ordered_index_serves_ranges_and_prefixes(monkeypatch):
+    db, table = _employees(20)
+    db.execute("CREATE INDEX employees_dept_salary ON employees(dept_id, salary)")
+    index = table.indexes["employees_dept_salary"]
+    assert index.kind == "ordered" and len(index) == 20
+    monkeypatch.setattr(table, "rids", lambda: pytest.fail("full scan"))
+    assert db.execute("UPDATE employees SET active = false WHERE dept_id = 1 AND salary >= 7000 AND salary < 13000") == 2
+    assert db.execute("DELETE FROM employees WHERE dept_id = 2 AND salary BETWEEN 0 AND 5000") == 2
+    assert sorted(index.range((0,))) == [0, 3, 6, 9, 12, 15, 18]
+    assert index.range((0,), 9000.0, None, low_inclusive=False) == [12, 15, 18]
+
+def test_ordered_index_prefix_keeps_nulls_in_later_columns(monkeypatch):
+    db = Database()
+    db.execute("table t { id: int PRIMARY KEY, a: int, b: int }")
+    db.execute("INSERT INTO t VALUES (1, 2, NULL), (2, 2, 5), (3, 3, NULL), (4, 3, 1), (5, 4, NULL)")
+    db.execute("CREATE INDEX t_a_b ON t(a, b)")
+    monkeypatch.setattr(db.table("t"), "rids", lambda: pytest.fail("full scan"))
+    assert [r.id for r in db.execute("SELECT id FROM t WHERE a = 2 ORDER BY id")] == [1, 2]
+    assert [r.id for r in db.execute("SELECT id FROM t WHERE a = 4 ORDER BY b")] == [5]
+    assert [r.id for r in db.execute("SELECT id FROM t WHERE a = 2 AND b > 0")] == [2]
+    assert db.execute("UPDATE t SET a = 9 WHERE a = 2") == 2
+    assert db.execute("DELETE FROM t WHERE a = 3") == 2
+    monkeypatch.undo()
+    assert [r.as_tuple() for r in db.execute("SELECT * FROM t ORDER BY id")] == [(1, 9, None), (2, 9, 5), (5, 4, None)]
+
+def test_ordered_index_follows_updates_and_rollback():
+    db, table = _employees(5)
+    db.execute("CREATE INDEX by_salary ON employees(salary)")
+    db.execute("BEGIN TRANSACTION")
+    db.execute("UPDATE employees SET salary = 99 WHERE id = 4")
+    table.insert((5, "late", None, 0, True))
+    assert table.ordered_rids(["salary"]) == [5, 0, 4, 1, 2, 3]
+    db.execute("ROLLBACK")
+    assert table.ordered_rids(["salary"], descending=True) == [4, 3, 2, 1, 0]
+    db.execute("DROP INDEX by_salary")
+    assert table.ordered_rids(["salary"]) is None
+    with pytest.raises(SQLError):
+        db.execute("DROP INDEX employees_pkey")
+
+def test_unique_ordered_index_rejects_duplicates():
+    db, table = _employees(3)
+    db.execute("CREATE UNIQUE INDEX by_name ON employees(name)")
+    with pytest.raises(IntegrityError):
+        db.execute('INSERT INTO employees VALUES (9, "emp1", 1.0, 0, true)')
+    db.execute("CREATE UNIQUE INDEX by_dept ON employees(dept_id, active)")
+    with pytest.raises(IntegrityError):
+        db.execute('INSERT INTO employees VALUES (8, "x", 1.0, 0, true)')
+    with pytest.raises(IntegrityError):
+        db.execute("CREATE UNIQUE INDEX by_active ON employees(active)")
+    assert len(table) == 3 and "by_active" not in db.index_tables
+
+def test_concurrent_transactions_read_snapshots_and_first_committer_wins():
+    db, table = _employees(4)
+    db.execute("CREATE INDEX by_salary ON employees(salary)")
+    seen = {}
+
+    async def reader(started, changed):
+        db.execute("BEGIN TRANSACTION")
+        seen["before"] = db.execute("SELECT SUM(salary) AS total FROM employees")[0].total
+        started.set()
+        await changed.wait()
+        # The writer committed meanwhile, but this snapshot predates it
+        seen["after"] = db.execute("SELECT SUM(salary) AS total FROM employees")[0].total
+        seen["range"] = [r.id for r in db.execute("SELECT id FROM employees WHERE salary >= 2000 ORDER BY salary")]
+        seen["gone"] = [r.name for r in db.execute("SELECT name FROM employees WHERE id = 3")]
+        with pytest.raises(SerializationError):
+            db.execute("UPDATE employees SET salary = 0 WHERE id = 1")
+        db.execute("ROLLBACK")
+
+    async def writer(started, changed):
+        await started.wait()
+        db.execute("BEGIN TRANSACTION")
+        db.execute("UPDATE employees SET salary = salary + 5000 WHERE id = 1")
+        db.execute("DELETE FROM employees WHERE id = 3")
+        assert db.execute("SELECT COUNT(*) AS n FROM employees")[0].n == 3
+        db.execute("COMMIT")
+        changed.set()
+
+    async def main():
+        started, changed = asyncio.Event(), asyncio.Event()
+        await asyncio.gather(reader(started, changed), writer(started, changed))
+
+    asyncio.run(main())
+    assert seen == {"before": 6000.0, "after": 6000.0, "range": [2, 3], "gone": ["emp3"]}
+    assert db.execute("SELECT SUM(salary) AS total FROM employees")[0].total == 8000.0
+    # Old versions are dropped once no open snapshot needs them
+    assert table.versions == {} and not db.open_transactions
+
+def test_uncommitted_changes_are_invisible_and_hold_their_keys():
+    db, table = _employees(3)
+
+    async def holder(changed, checked):
+        db.execute("BEGIN TRANSACTION")
+        db.execute("DELETE FROM employees WHERE id = 2")
+        db.execute("UPDATE employees SET name = 'held' WHERE id = 1")
+        changed.set()
+        await checked.wait()
+        db.execute("ROLLBACK")
+
+    async def other(changed, checked):
+        await changed.wait()
+        assert [r.name for r in db.execute("SELECT name FROM employees ORDER BY id")] == ["emp0", "emp1", "emp2"]
+        with pytest.raises(SerializationError):
+            db.execute("UPDATE employees SET salary = 1 WHERE id = 1")
+        # Rolling the delete back would bring key 2 back
+        with pytest.raises(SerializationError):
+            db.execute('INSERT INTO employees VALUES (2, "dup", 1.0, 0, true)')
+        checked.set()
+
+    async def main():
+        changed, checked = asyncio.Event(), asyncio.Event()
+        await asyncio.gather(holder(changed, checked), other(changed, checked))
+
+    asyncio.run(main())
+    assert list(table.scan(["id", "name"])) == [(0, "emp0"), (1, "emp1"), (2, "emp2")]
+    assert table.versions == {} and table.lookup(2) == 2
+
+def test_durable_database_recovers_from_checkpoint_and_log_tail(tmp_path):
+    path = str(tmp_path / "company.db")
+    db = Database(path)
+    db.execute("table depts { id: int PRIMARY KEY, name: string }")
+    db.execute("table staff { id: int PRIMARY KEY, name: string, salary: float, dept_id: int REFERENCES depts(id) }")
+    db.execute("CREATE INDEX by_salary ON staff(salary)")
+    db.execute('INSERT INTO depts VALUES (1, "Eng"), (2, "Ops")')
+    db.execute('INSERT INTO staff VALUES (1, "Ann", 10.0, 1), (2, "Bob", NULL, 2)')
+    db.close()
+
+    db = Database(path)
+    assert db.wal.size == 0
+    db.execute("BEGIN TRANSACTION")
+    db.execute("UPDATE staff SET salary = 30.0 WHERE id = 1")
+    db.execute('INSERT INTO staff VALUES (3, "Cy", 20.0, 1)')
+    db.execute("COMMIT")
+    db.execute("BEGIN TRANSACTION")
+    db.execute('INSERT INTO staff VALUES (4, "Dee", 1.0, 2)')
+    db.execute("ROLLBACK")
+    db.execute('INSERT INTO staff VALUES (5, "Eve", 5.0, 2)')
+    db.execute("DELETE FROM staff WHERE id = 2")
+    expected = db.execute("SELECT id, name, salary FROM staff ORDER BY salary")
+    # A crash: no checkpoint, and half a record at the end of the log
+    with open(path + "-wal", "ab") as log:
+        log.write(b"\x40\x00\x00\x00torn")
+
+    db = Database(path)
+    assert db.execute("SELECT id, name, salary FROM staff ORDER BY salary") == expected
+    assert [r.id for r in db.execute("SELECT id FROM staff WHERE salary > 4 ORDER BY salary")] == [5, 3, 1]
+    assert db.table("staff").lookup(5) == 4
+    with pytest.raises(IntegrityError):
+        db.execute('INSERT INTO staff VALUES (6, "Fay", 1.0, 9)')
+    db.execute('INSERT INTO staff VALUES (6, "Fay", 1.0, 1)')
+    db.close()
+    assert len(Database(path).table("staff")) == 4
+
+def test_mapped_table_file_reads_columns_in_place(tmp_path):
+    db, table = _employees(6)
+    table.delete(2)
+    table.update(4, {"name": "Zoë", "salary": None})
+    path = str(tmp_path / "employees.col")
+    db.save_table("employees", path)
+
+    other = Database()
+    mapped = other.attach_table(path)
+    assert len(mapped) == 5 and isinstance(mapped.columns["salary"].data, memoryview)
+    expected = db.execute("SELECT id, name, salary, active FROM employees ORDER BY id")
+    assert other.execute("SELECT id, name, salary, active FROM employees ORDER BY id") == expected
+    assert [r.name for r in other.execute("SELECT name FROM employees WHERE id = 4")] == ["Zoë"]
+    assert [r.id for r in other.execute("SELECT id FROM employees WHERE id > 1 ORDER BY id DESC")] == [5, 4, 3]
+    assert other.execute("SELECT SUM(salary) AS total FROM employees WHERE dept_id = 0")[0].total == 3000.0
+    # The footer carries ANALYZE statistics, and rows cannot change
+    assert other.stats["employees"].row_count == 5
+    with pytest.raises(SQLError):
+        other.execute('INSERT INTO employees VALUES (9, "x", 1.0, 0, true)')
+    other.execute("table badges { id: int PRIMARY KEY, owner: int REFERENCES employees(id) }")
+    with pytest.raises(IntegrityError):
+        other.execute("INSERT INTO badges VALUES (1, 2)")
+
+def test_multi_row_insert_checks_the_batch_before_storing_it():
+    db, table = _employees(2)
+    db.execute("CREATE INDEX by_name ON employees(name)")
+    db.execute('INSERT INTO employees VALUES (5, "e", 1, 0, true), (3, "c", NULL, 1, false), (4, "d", 2.5, 2, true)')
+    assert [r.id for r in db.execute("SELECT id FROM employees WHERE name < 'emp' ORDER BY name")] == [3, 4, 5]
+    assert table.get(table.lookup(3)) == (3, "c", None, 1, False)
+    for values in ('(7, "x", 1, 0, true), (7, "y", 1, 0, true)', '(8, "x", 1, 0, true), (0, "y", 1, 0, true)'):
+        with pytest.raises(IntegrityError):
+            db.execute(f"INSERT INTO employees VALUES {values}")
+    with pytest.raises(SQLError):
+        db.execute('INSERT INTO employees VALUES (9, "x", "lots", 0, true), (10, "y", 1, 0, true)')
+    assert len(table) == 5 and len(table.live) == 5
+
+def test_copy_from_csv_and_jsonl_files(tmp_path):
+    db, table = _employees(0)
+    db.execute("table badges { id: int PRIMARY KEY, owner: int REFERENCES employees(id) }")
+    (tmp_path / "staff.csv").write_text('id,name,salary,dept_id,active\n1,"Ann, Jr.",10.5,1,true\n2,Bob,,2,F\n3,Cy,7,,yes\n')
+    assert db.execute(f"COPY employees FROM '{tmp_path / 'staff.csv'}' WITH (HEADER)") == 3
+    assert list(table.scan()) == [(1, "Ann, Jr.", 10.5, 1, True), (2, "Bob", None, 2, False), (3, "Cy", 7.0, None, True)]
+    (tmp_path / "more.jsonl").write_text('{"id": 4, "name": "Dee", "active": false}\n\n[5, "Eve", 3, 0, true]\n')
+    path = str(tmp_path / "more.jsonl")
+    assert db.execute("COPY employees FROM path", {"path": path}) == 2
+    assert table.get(table.lookup(4)) == (4, "Dee", None, None, False)
+    (tmp_path / "badges.txt").write_text("1;1\n2;9\n")
+    with pytest.raises(IntegrityError):
+        db.execute(f"COPY badges FROM '{tmp_path / 'badges.txt'}' WITH (FORMAT CSV, DELIMITER ';')")
+    (tmp_path / "bad.csv").write_text("6,Fay,x,0,true\n")
+    with pytest.raises(SQLError, match="line 1"):
+        db.execute(f"COPY employees FROM '{tmp_path / 'bad.csv'}'")
+    # Values outside an int or float column's range fail the batch the same way
+    huge = {"int.csv": f"6,Fay,1.0,{2 ** 63},true\n7,Gus,1.0,0,true\n",
+            "int.jsonl": f'[6, "Fay", 1.0, {2 ** 64}, true]\n[7, "Gus", 1.0, 0, true]\n',
+            "float.jsonl": f'[6, "Fay", {10 ** 400}, 0, true]\n[7, "Gus", 1.0, 0, true]\n'}
+    for name, text in huge.items():
+        (tmp_path / name).write_text(text)
+        with pytest.raises(SQLError, match="out of range"):
+            db.execute(f"COPY employees FROM '{tmp_path / name}'")
+    assert len(table) == 5 and len(db.table("badges")) == 0
+    assert {len(column) for column in table.columns.values()} == {5}